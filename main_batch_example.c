@@ -0,0 +1,50 @@
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "%headername%"
+
+/*
+ * Chaque cycle lit netlist_LANES vecteurs d'entrée (un par instance, dans
+ * l'ordre des instances) et affiche netlist_LANES lignes de sortie.
+ */
+int main(int argc, char *argv[]) {
+	static Input_netlist_batch batch_input;
+	static Output_netlist_batch batch_output;
+	Output_netlist output;
+	Input_netlist input;
+	Rom_netlist rom;
+	State_netlist_batch *state = netlist_batch_create();
+	if (state == NULL)
+		return 1;
+        if (argc > 1) {
+		int mapped = map_rom(argv[1], &rom);
+		if (mapped < 0)
+			return 1;
+		if (mapped == 0) {
+			FILE * fp = fopen(argv[1], "r");
+			if(fp == NULL) {
+				printf("ROM file not found");
+				return 1;
+			}
+			fscan_rom(fp, &rom);
+		}
+	} else {
+			printf("ROM file not provided. If there is a ROM component in the netlist, the program may segfault. Specify /dev/zero as ROM file to disable this warning");
+	}
+	while (1) {
+		for (size_t lane = 0; lane < netlist_LANES; lane++) {
+			if (!prompt_netlist_input(&input)) {
+				netlist_batch_free(state);
+				return 0;
+			}
+			set_netlist_batch_input(&batch_input, lane, &input);
+		}
+		simulateNetlist_batch(state, &batch_input, &batch_output, &rom);
+		for (size_t lane = 0; lane < netlist_LANES; lane++) {
+			get_netlist_batch_output(&batch_output, lane, &output);
+			print_netlist_output(&output);
+		}
+	};
+	return 0;
+};
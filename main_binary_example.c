@@ -0,0 +1,78 @@
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "%headername%"
+
+/*
+ * Usage: ./sim ROM_FILE [INPUT_FILE] [-c]
+ *
+ * Reads packed Input_netlist records from INPUT_FILE (memory-mapped) or from
+ * stdin, and writes packed Output_netlist records to stdout. With -c, only
+ * the cycles where an output changed are written, as Change_netlist records.
+ */
+int main(int argc, char *argv[]) {
+	Rom_netlist rom;
+	bool changes_only = false;
+	const char *input_file = NULL;
+	const char *rom_file = NULL;
+	for (int i = 1; i < argc; i++) {
+		if (strcmp(argv[i], "-c") == 0)
+			changes_only = true;
+		else if (rom_file == NULL)
+			rom_file = argv[i];
+		else
+			input_file = argv[i];
+	}
+	if (rom_file == NULL) {
+		fprintf(stderr, "Usage: %s ROM_FILE [INPUT_FILE] [-c]\n", argv[0]);
+		return 1;
+	}
+	int mapped = map_rom(rom_file, &rom);
+	if (mapped < 0)
+		return 1;
+	if (mapped == 0) {
+		FILE * fp = fopen(rom_file, "r");
+		if (fp == NULL) {
+			fprintf(stderr, "ROM file not found\n");
+			return 1;
+		}
+		fscan_rom(fp, &rom);
+		fclose(fp);
+	}
+
+	State_netlist *state = netlist_create();
+	uint64_t cycles;
+	if (input_file != NULL) {
+		int fd = open(input_file, O_RDONLY);
+		struct stat st;
+		if (fd < 0 || fstat(fd, &st) < 0) {
+			perror(input_file);
+			return 1;
+		}
+		size_t n = sizeof(Input_netlist) ? st.st_size / sizeof(Input_netlist) : 0;
+		const Input_netlist *inputs = NULL;
+		if (n > 0) {
+			inputs = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+			if (inputs == MAP_FAILED) {
+				perror("mmap");
+				return 1;
+			}
+			madvise((void *) inputs, st.st_size, MADV_SEQUENTIAL);
+		}
+		cycles = run_netlist_mapped(state, inputs, n, STDOUT_FILENO, &rom, changes_only);
+		if (cycles != n) {
+			perror("write");
+			return 1;
+		}
+	} else {
+		cycles = run_netlist_binary(state, STDIN_FILENO, STDOUT_FILENO, &rom, changes_only);
+	}
+	fprintf(stderr, "%llu cycles simulated\n", (unsigned long long) cycles);
+	netlist_free(state);
+	return 0;
+}
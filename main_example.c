@@ -0,0 +1 @@
+nl-transpiler/netlistSimulator/main_example.c
\ No newline at end of file
@@ -0,0 +1,66 @@
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "%headername%"
+
+/*
+ * Usage: ./sim ROM_FILE N [INTERVAL]
+ *
+ * Simulates N cycles with all the inputs at 0, without returning to main
+ * between two cycles. With INTERVAL, the outputs are printed every INTERVAL
+ * cycles. The outputs of the last cycle are printed at the end.
+ */
+static int observe(uint64_t cycle, const Output_netlist *output, void *data) {
+	(void) data;
+	printf("cycle %" PRIu64 ": ", cycle);
+	print_netlist_output((Output_netlist *) output);
+	return 0;
+}
+
+int main(int argc, char *argv[]) {
+	Output_netlist output;
+	Input_netlist input = {0};
+	Rom_netlist rom;
+	if (argc < 3) {
+		fprintf(stderr, "Usage: %s ROM_FILE N [INTERVAL]\n", argv[0]);
+		return 1;
+	}
+	int mapped = map_rom(argv[1], &rom);
+	if (mapped < 0)
+		return 1;
+	if (mapped == 0) {
+		FILE * fp = fopen(argv[1], "r");
+		if(fp == NULL) {
+			printf("ROM file not found");
+			return 1;
+		}
+		fscan_rom(fp, &rom);
+	}
+	RunOptions_netlist options = {0};
+	if (argc > 3) {
+		options.interval = strtoull(argv[3], NULL, 10);
+		options.observe = observe;
+	}
+	/*
+	 * To stop on a halt flag (an output named halt):
+	 *	Stop_netlist stop = {0};
+	 *	stop.mask.halt = 1;
+	 *	stop.value.halt = 1;
+	 *	options.stop = &stop;
+	 *	options.n_stop = 1;
+	 */
+	State_netlist *state = netlist_create();
+	/*
+	 * To resume from a checkpoint file and append a checkpoint to it every
+	 * million cycles:
+	 *	netlist_load_checkpoint(state, "run.ck", 0);
+	 *	options.checkpoint_path = "run.ck";
+	 *	options.checkpoint_interval = 1000000;
+	 */
+	uint64_t cycles = simulateNetlist_run(state, strtoull(argv[2], NULL, 10), &input, &output, &rom, &options);
+	printf("%" PRIu64 " cycles\n", cycles);
+	print_netlist_output(&output);
+	netlist_free(state);
+	return 0;
+}
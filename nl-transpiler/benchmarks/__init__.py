@@ -0,0 +1,6 @@
+"""
+Benchmarks du simulateur. Ces modules ne sont pas installés avec le paquet, il
+faut les lancer depuis le dossier `nl-transpiler`, par exemple:
+
+    python -m benchmarks.bench_parser
+"""
@@ -0,0 +1,81 @@
+"""
+Compare le temps de compilation du code généré en un seul fichier
+(`transpile2CFiles`) et découpé en morceaux compilés en parallèle
+(`transpile2CChunks` et `build.compileSources`).
+
+    python -m benchmarks.bench_chunks [--sizes 5000 20000 ...] [--chunk-size N] [-j JOBS]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from netlistSimulator import build
+from netlistSimulator.netlist2C import transpile2CChunks, transpile2CFiles
+
+from .netlists import rippleAdder
+
+FORM = {"short_name": "netlist", "filename": "bench", "functionName": "simulateNetlist"}
+CFLAGS = ("-O2", "-fPIC")
+
+
+def single(netlist, directory, chunk_size, jobs):
+    source = os.path.join(directory, "bench.c")
+    with open(os.path.join(directory, "bench.h"), "w") as h, open(source, "w") as c:
+        transpile2CFiles(netlist, h, c, FORM, helper_functions=False)
+    return [source]
+
+
+def chunked(netlist, directory, chunk_size, jobs):
+    return transpile2CChunks(
+        netlist, directory, FORM, chunk_size, helper_functions=False
+    )
+
+
+def measure(generate, netlist, chunk_size, jobs):
+    """
+    Renvoie la durée (en s) de la compilation du code produit par `generate`
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sources = generate(netlist, directory, chunk_size, jobs)
+        start = time.perf_counter()
+        build.compileSources(
+            sources,
+            os.path.join(directory, "libbench.so"),
+            cflags=CFLAGS,
+            ldflags=("-shared",),
+            jobs=jobs,
+        )
+        return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[5_000, 20_000],
+        help="Number of equations of the generated netlists",
+    )
+    argparser.add_argument("--chunk-size", type=int, default=2_000)
+    argparser.add_argument(
+        "-j", "--jobs", type=int, help="Parallel compilations (default: CPUs)"
+    )
+    args = argparser.parse_args()
+
+    print(f"{'equations':>10} {'single (s)':>11} {'chunks':>7} {'chunked (s)':>12}")
+    for n in args.sizes:
+        netlist = rippleAdder(n // 5)
+        t_single = measure(single, netlist, args.chunk_size, args.jobs)
+        t_chunked = measure(chunked, netlist, args.chunk_size, args.jobs)
+        n_chunks = -(-n // args.chunk_size)
+        print(f"{n:>10} {t_single:>11.1f} {n_chunks:>7} {t_chunked:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Mesure l'effet du partage des cônes combinatoires isomorphes
+(`buildSimulator(share_cones=...)`): lignes du source C, taille de la
+bibliothèque, durée de la construction (transpilation et compilation) et
+temps par cycle, sans et avec partage.
+
+    python -m benchmarks.bench_cones [--cycles N] [--activity A]
+
+Nécessite `numpy`.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from netlistSimulator.simulator import SHORT_NAME, buildSimulator
+
+from .bench_events import inputs
+from .bench_trace import measure
+from .netlists import counterBank, redundantNetlist, rippleAdder
+
+NETLISTS = {
+    "ripple adder (256 bits)": lambda: rippleAdder(256),
+    "counter bank (256 x 16 bits)": lambda: counterBank(256),
+    "redundant (2000 blocks)": lambda: redundantNetlist(2000, seed=1),
+}
+
+
+def build(netlist, share_cones):
+    """
+    Construit le simulateur dans un dossier temporaire. Renvoie le
+    simulateur, la durée de la construction (en s), le nombre de lignes du
+    source C et la taille de la bibliothèque (en octets)
+    """
+    directory = tempfile.mkdtemp(prefix="bench_cones-")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = buildSimulator(netlist, directory=directory, share_cones=share_cones)
+    duration = time.perf_counter() - start
+    with open(os.path.join(directory, f"{SHORT_NAME}.c")) as f:
+        lines = sum(1 for _ in f)
+    size = sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.endswith(".so")
+    )
+    return sim, duration, lines, size
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--cycles", type=int, default=20_000)
+    argparser.add_argument(
+        "--activity",
+        type=float,
+        default=0.5,
+        help="Probability that an input changes at each cycle",
+    )
+    args = argparser.parse_args()
+
+    print(
+        f"{'netlist':>30} {'cones':>6} {'C lines':>8} {'library (B)':>12} {'build (s)':>10} {'ns/cycle':>9}"
+    )
+    for name, netlist in NETLISTS.items():
+        netlist = netlist()
+        values = None
+        for share_cones in (None, True):
+            sim, duration, lines, size = build(netlist, share_cones)
+            if values is None:
+                values = inputs(sim, args.cycles, args.activity)
+            t = measure(sim, values)
+            mode = "shared" if share_cones else "none"
+            print(
+                f"{name:>30} {mode:>6} {lines:>8} {size:>12} {duration:>10.2f} {t:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare l'écriture du code C construit entièrement en mémoire puis écrit d'un
+coup, et l'écriture au fil de l'eau dans les fichiers (ce que fait
+`transpile2CFiles`): temps et pic de mémoire Python de la seule phase
+d'écriture (mesuré avec `tracemalloc`, la netlist étant déjà analysée et ses
+fragments générés).
+
+    python -m benchmarks.bench_emit [--sizes 10000 100000 ...]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from netlistSimulator.netlist2C import generator, utils
+
+from .netlists import randomNetlist
+
+FORM = {"short_name": "netlist", "filename": "bench", "functionName": "simulateNetlist"}
+
+
+def _assemble(netlist, fragments, h, c):
+    generator._assemble(
+        generator._CWriter(h, FORM),
+        generator._CWriter(c, FORM),
+        netlist.inputs,
+        netlist.outputs,
+        fragments,
+        helper_functions=True,
+        less_verbose=True,
+    )
+
+
+def inMemory(netlist, fragments, directory):
+    h = io.StringIO()
+    c = io.StringIO()
+    _assemble(netlist, fragments, h, c)
+    with open(os.path.join(directory, "bench.h"), "w") as f:
+        f.write(h.getvalue())
+    with open(os.path.join(directory, "bench.c"), "w") as f:
+        f.write(c.getvalue())
+
+
+def streaming(netlist, fragments, directory):
+    with open(os.path.join(directory, "bench.h"), "w") as h, open(
+        os.path.join(directory, "bench.c"), "w"
+    ) as c:
+        _assemble(netlist, fragments, h, c)
+
+
+def measure(emit, netlist, fragments, directory):
+    """
+    Renvoie le couple (durée en s, pic de mémoire en Mio) de `emit`. La durée
+    est mesurée sans `tracemalloc`, qui ralentit beaucoup l'exécution
+    """
+    start = time.perf_counter()
+    emit(netlist, fragments, directory)
+    duration = time.perf_counter() - start
+    tracemalloc.start()
+    emit(netlist, fragments, directory)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak / (1 << 20)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 300_000],
+        help="Number of equations of the generated netlists",
+    )
+    args = argparser.parse_args()
+
+    print(
+        f"{'equations':>10} {'emitted':>8} {'C (MiB)':>8} {'memory (s)':>11} {'peak (MiB)':>11}"
+        f" {'stream (s)':>11} {'peak (MiB)':>11}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for n in args.sizes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                netlist = generator.getAST(randomNetlist(n))
+            fragments = [
+                generator._getExpr(eq) for eq in utils.getOrderedNetList(netlist)
+            ]
+            t_mem, p_mem = measure(inMemory, netlist, fragments, directory)
+            t_str, p_str = measure(streaming, netlist, fragments, directory)
+            size = os.path.getsize(os.path.join(directory, "bench.c")) / (1 << 20)
+            print(
+                f"{n:>10} {len(fragments):>8} {size:>8.1f} {t_mem:>11.2f} {p_mem:>11.1f}"
+                f" {t_str:>11.2f} {p_str:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
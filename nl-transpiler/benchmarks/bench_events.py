@@ -0,0 +1,95 @@
+"""
+Compare le temps par cycle de la simulation complète (`transpile2CFiles`)
+et guidée par les évènements (`transpile2CEvents`), selon l'activité des
+entrées: la proportion des cycles où chaque entrée change de valeur.
+
+    python -m benchmarks.bench_events [--cycles N] [--activity 0 0.01 ...] [--partition-size N]
+
+Nécessite `numpy`.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from netlistSimulator.netlist2C.events import DEFAULT_PARTITION_SIZE
+from netlistSimulator.simulator import buildSimulator
+
+from .netlists import counterBank, randomNetlist, rippleAdder
+
+NETLISTS = {
+    "counter bank (256 x 16 bits)": lambda: counterBank(256),
+    "ripple adder (2000 bits)": lambda: rippleAdder(2_000),
+    "random (10000 eqs, 1 bit)": lambda: randomNetlist(10_000, width=1, seed=1),
+    "random (10000 eqs, 8 bits)": lambda: randomNetlist(10_000, width=8, seed=1),
+}
+
+
+def inputs(sim, n_cycles, activity, seed=0):
+    """
+    Entrées aléatoires de `n_cycles` cycles, chaque entrée changeant de
+    valeur avec une probabilité `activity` à chaque cycle
+    """
+    rng = np.random.default_rng(seed)
+    values = sim.inputs(n_cycles)
+    for name in values.dtype.names:
+        column = values[name]
+        top = np.iinfo(column.dtype).max
+        drawn = rng.integers(0, top, n_cycles, dtype=column.dtype, endpoint=True)
+        # Chaque cycle reprend la valeur du dernier cycle où l'entrée a changé
+        changes = rng.random(n_cycles) < activity
+        changes[0] = True
+        column[:] = drawn[
+            np.maximum.accumulate(np.where(changes, np.arange(n_cycles), 0))
+        ]
+    return values
+
+
+def measure(sim, values):
+    """
+    Renvoie la durée (en ns) d'un cycle
+    """
+    out = np.empty(len(values), dtype=sim.output_dtype)
+    sim.reset()
+    sim.step(len(values), values, out)  # Chauffe
+    sim.reset()
+    start = time.perf_counter()
+    sim.step(len(values), values, out)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--cycles", type=int, default=20_000)
+    argparser.add_argument(
+        "--activity",
+        type=float,
+        nargs="+",
+        default=[0, 0.001, 0.01, 0.1, 1],
+        help="Probabilities that an input changes at each cycle",
+    )
+    argparser.add_argument("--partition-size", type=int, default=DEFAULT_PARTITION_SIZE)
+    args = argparser.parse_args()
+
+    print(
+        f"{'netlist':>28} {'activity':>9} {'full (ns)':>10} {'events (ns)':>12} {'speedup':>8}"
+    )
+    for name, netlist in NETLISTS.items():
+        netlist = netlist()
+        with contextlib.redirect_stdout(io.StringIO()):
+            full = buildSimulator(netlist)
+            events = buildSimulator(netlist, events=args.partition_size)
+        for activity in args.activity:
+            values = inputs(full, args.cycles, activity)
+            t_full = measure(full, values)
+            t_events = measure(events, values)
+            print(
+                f"{name:>28} {activity:>9} {t_full:>10.0f} {t_events:>12.0f} {t_full / t_events:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Mesure la mémoire occupée par l'AST (`NetList`) de grandes netlists: la
+mémoire gardée après le parsing (par équation) et le pic pendant le
+parsing, mesurés avec `tracemalloc`.
+
+    python -m benchmarks.bench_memory [--sizes 10000 100000 ...]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from netlistSimulator.netlist2C import parser
+
+from .netlists import randomNetlist, redundantNetlist
+
+"""
+Netlists d'environ `n` équations
+"""
+NETLISTS = {
+    "random (8 bits)": lambda n: randomNetlist(n, width=8, seed=1),
+    "redundant (constants)": lambda n: redundantNetlist(n // 14, seed=1),
+}
+
+
+def measure(netlist):
+    """
+    Renvoie le quadruplet (nombre d'équations, octets gardés par l'AST, pic
+    en octets, durée du parsing en secondes)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    ast = parser.parse(netlist)
+    duration = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(ast.equations), retained, peak, duration
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="Approximate number of equations of the generated netlists",
+    )
+    args = argparser.parse_args()
+
+    parser.parse(randomNetlist(1))  # Construction (ou chargement) du parser
+    print(
+        f"{'netlist':>22} {'equations':>10} {'retained (MB)':>14} {'bytes/eq':>9} {'peak (MB)':>10} {'time (s)':>9}"
+    )
+    for name, netlist in NETLISTS.items():
+        for n in args.sizes:
+            n_eqs, retained, peak, duration = measure(netlist(n))
+            print(
+                f"{name:>22} {n_eqs:>10} {retained / 1e6:>14.1f} {retained / n_eqs:>9.0f} {peak / 1e6:>10.1f} {duration:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare les deux algorithmes de parsing (LALR et Earley) sur des netlists
+générées de 1k à 1M équations.
+
+    python -m benchmarks.bench_parser [--sizes 1000 10000 ...] [--earley-max N]
+"""
+
+import argparse
+import time
+
+from netlistSimulator.netlist2C import parser
+
+from .netlists import randomNetlist
+
+
+def timeParse(netlist, algorithm):
+    start = time.perf_counter()
+    parser.parse(netlist, algorithm)
+    return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Number of equations of the generated netlists",
+    )
+    argparser.add_argument(
+        "--earley-max",
+        type=int,
+        default=10_000,
+        help="Skip the Earley parser above this number of equations",
+    )
+    args = argparser.parse_args()
+
+    start = time.perf_counter()
+    parser.parse(randomNetlist(1), "lalr")  # Construction (ou chargement) du parser
+    print(f"LALR parser setup: {time.perf_counter() - start:.3f}s")
+
+    print(f"{'equations':>10} {'lalr (s)':>10} {'earley (s)':>11} {'speedup':>8}")
+    for n in args.sizes:
+        netlist = randomNetlist(n)
+        lalr = timeParse(netlist, "lalr")
+        if n <= args.earley_max:
+            earley = timeParse(netlist, "earley")
+            print(f"{n:>10} {lalr:>10.3f} {earley:>11.3f} {earley / lalr:>7.1f}x")
+        else:
+            print(f"{n:>10} {lalr:>10.3f} {'-':>11} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Mesure le temps du tri topologique (`utils.getOrderedNetList`) en fonction de
+la taille de la netlist, sur une longue chaîne combinatoire (pire cas pour la
+profondeur) et sur un graphe aléatoire.
+
+    python -m benchmarks.bench_scheduler [--sizes 1000 10000 ...]
+"""
+
+import argparse
+import random
+import time
+
+from netlistSimulator.netlist2C import AST as ast
+from netlistSimulator.netlist2C import utils
+
+
+def chainNetList(n_eqs):
+    """
+    `w_k = NOT w_{k-1}` : une chaîne de dépendances de profondeur `n_eqs`
+    """
+    prev = ast.Var(1, "i")
+    inputs = [prev]
+    wires = [prev]
+    eqs = []
+    for k in range(n_eqs):
+        w = ast.Var(1, f"w_{k}")
+        eqs.append(ast.Eq(w, ast.Expression(ast.Exprs.NOT, [prev], [])))
+        wires.append(w)
+        prev = w
+    return ast.NetList(inputs, [prev], wires, eqs)
+
+
+def randomNetList(n_eqs, seed=0):
+    """
+    Graphe aléatoire de portes AND/XOR à deux entrées, avec quelques registres
+    """
+    rng = random.Random(seed)
+    inputs = [ast.Var(8, f"i_{k}") for k in range(16)]
+    wires = list(inputs)
+    eqs = []
+    for k in range(n_eqs):
+        w = ast.Var(8, f"w_{k}")
+        if rng.randrange(16) == 0:
+            expr = ast.Expression(ast.Exprs.REG, [rng.choice(wires)], [])
+        else:
+            t = rng.choice((ast.Exprs.AND, ast.Exprs.XOR))
+            expr = ast.Expression(t, [rng.choice(wires), rng.choice(wires)], [])
+        eqs.append(ast.Eq(w, expr))
+        wires.append(w)
+    return ast.NetList(inputs, wires[-16:], wires, eqs)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Number of equations of the generated netlists",
+    )
+    args = argparser.parse_args()
+
+    print(f"{'equations':>10} {'chain (s)':>10} {'random (s)':>11} {'us/eq':>7}")
+    for n in args.sizes:
+        times = []
+        for netlist in (chainNetList(n), randomNetList(n)):
+            start = time.perf_counter()
+            ordered = utils.getOrderedNetList(netlist)
+            times.append(time.perf_counter() - start)
+            assert len(ordered) <= n
+        print(
+            f"{n:>10} {times[0]:>10.3f} {times[1]:>11.3f} {max(times) / n * 1e6:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare les RAMs creuses (`buildSimulator(sparse_ram=...)`) aux tableaux de
+l'état: taille de l'état, mémoire des pages allouées et temps par cycle,
+pour des accès à un petit nombre d'adresses dispersées dans toute la RAM.
+
+    python -m benchmarks.bench_sparse [--cycles N] [--addresses K]
+
+Nécessite `numpy`.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from netlistSimulator.netlist2C import checkpoint
+from netlistSimulator.simulator import buildSimulator
+
+from .netlists import ramPort
+
+"""
+Tailles d'adresse mesurées. Au-delà de 24 bits, l'état dense ne se compile
+plus raisonnablement
+"""
+DENSE_ADDRESS_SIZES = (16, 20, 24)
+SPARSE_ADDRESS_SIZES = (16, 20, 24, 32, 40)
+
+
+def accesses(sim, addr_size, n_cycles, n_addresses, seed=0):
+    """
+    Entrées de `n_cycles` cycles lisant et écrivant (une fois sur deux) à
+    `n_addresses` adresses tirées au hasard
+    """
+    rng = np.random.default_rng(seed)
+    addresses = rng.integers(0, 1 << addr_size, n_addresses, dtype=np.uint64)
+    return sim.inputs(
+        n_cycles,
+        ra=rng.choice(addresses, n_cycles),
+        wa=rng.choice(addresses, n_cycles),
+        we=rng.integers(0, 2, n_cycles),
+        d=rng.integers(0, 256, n_cycles),
+    )
+
+
+def measure(sim, values):
+    """
+    Renvoie la durée (en ns) d'un cycle
+    """
+    out = np.empty(len(values), dtype=sim.output_dtype)
+    sim.step(len(values) // 10, values, out)  # Chauffe
+    sim.reset()
+    start = time.perf_counter()
+    sim.step(len(values), values, out)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--cycles", type=int, default=1_000_000)
+    argparser.add_argument(
+        "--addresses",
+        type=int,
+        default=1000,
+        help="Number of distinct addresses accessed",
+    )
+    args = argparser.parse_args()
+
+    print(
+        f"{'address bits':>12} {'mode':>7} {'state (B)':>12} {'pages':>7} {'pages (B)':>10} {'ns/cycle':>9}"
+    )
+    modes = [(a, "dense") for a in DENSE_ADDRESS_SIZES]
+    modes += [(a, "sparse") for a in SPARSE_ADDRESS_SIZES]
+    for addr_size, mode in sorted(modes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = buildSimulator(
+                ramPort(addr_size),
+                sparse_ram=0 if mode == "sparse" else None,
+            )
+        values = accesses(sim, addr_size, args.cycles, args.addresses)
+        t = measure(sim, values)
+        pages = sum(sim.ramPages().values())
+        page_bytes = pages << checkpoint.PAGE_BITS
+        print(
+            f"{addr_size:>12} {mode:>7} {sim.state_size:>12} {pages:>7} {page_bytes:>10} {t:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Suite de benchmarks: chaque netlist de `SUITE` est transpilée et compilée
+(`buildSimulator` avec un `Profile`), puis simulée. La durée de chaque étape
+(`parse`, `optimize`, `schedule`, `emit`, `compile`) et le nombre de cycles
+simulés par seconde sont écrits dans un fichier JSON, avec le commit et la
+machine, pour comparer deux versions:
+
+    python -m benchmarks.bench_suite [--output results.json] [--only NOM ...] [--cycles N]
+    python -m benchmarks.bench_suite --compare old.json new.json [--threshold 0.1]
+
+Nécessite `numpy`.
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from netlistSimulator import build
+from netlistSimulator.netlist2C import Profile, parser
+from netlistSimulator.simulator import buildSimulator
+
+from .bench_events import inputs
+from .netlists import (
+    counterBank,
+    layeredNetlist,
+    lookaheadAdder,
+    multiplier,
+    randomNetlist,
+    registerFile,
+    rippleAdder,
+    toyCPU,
+    toyProgram,
+)
+
+"""
+Netlists de la suite: le nom associé au couple `(netlist, ROMs)`, où les
+ROMs sont un dictionnaire label -> contenu ou `None`
+"""
+SUITE = {
+    "ripple adder (1024 bits)": lambda: (rippleAdder(1024), None),
+    "lookahead adder (1024 bits)": lambda: (lookaheadAdder(1024), None),
+    "multiplier (32 bits)": lambda: (multiplier(32), None),
+    "register file (256 x 8 bits)": lambda: (registerFile(8), None),
+    "toy CPU": lambda: (toyCPU(), {"instr": toyProgram(100)}),
+    "counter bank (64 x 16 bits)": lambda: (counterBank(64), None),
+    "random DAG (200 levels x 10)": lambda: (layeredNetlist(200, 10, seed=1), None),
+    "random DAG (10 levels x 1000)": lambda: (layeredNetlist(10, 1000, seed=1), None),
+}
+
+"""
+Mesures comparées par `--compare`, et si une valeur plus grande est meilleure
+"""
+METRICS = {
+    "parse": False,
+    "optimize": False,
+    "schedule": False,
+    "emit": False,
+    "compile": False,
+    "cycles_per_second": True,
+}
+
+"""
+Durée (en s) en dessous de laquelle les écarts entre les étapes ne sont pas
+signalés par `--compare`: ils ne sont que du bruit
+"""
+NOISE_FLOOR = 0.05
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(cflags):
+    """
+    Description de la version mesurée et de la machine
+    """
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "compiler": build.defaultCompiler(),
+        "cflags": list(cflags),
+    }
+
+
+def throughput(sim, values, n_cycles, repeat):
+    """
+    Meilleur nombre de cycles simulés par seconde sur `repeat` mesures de
+    `n_cycles` cycles (après un cycle de chauffe)
+    """
+    best = 0.0
+    for _ in range(repeat):
+        sim.reset()
+        sim.step(1, values)
+        sim.reset()
+        start = time.perf_counter()
+        sim.step(n_cycles, values)
+        best = max(best, n_cycles / (time.perf_counter() - start))
+    return best
+
+
+def measure(netlist, roms, n_cycles, repeat, cflags):
+    """
+    Construit le simulateur de `netlist` et renvoie le dictionnaire de ses
+    mesures: durée de chaque étape (en s), compteurs des étapes et cycles
+    simulés par seconde
+    """
+    profile = Profile()
+    with tempfile.TemporaryDirectory(prefix="bench_suite-") as directory:
+        sim = buildSimulator(
+            netlist, directory=directory, cflags=cflags, profile=profile
+        )
+    for label, content in (roms or {}).items():
+        sim.loadRom(label, content)
+    values = inputs(sim, n_cycles, 0.5) if sim.input_dtype.names else None
+    result = {"stages": {}, "counters": {}}
+    for stage in profile.stages:
+        result["stages"][stage.name] = (
+            result["stages"].get(stage.name, 0.0) + stage.seconds
+        )
+        result["counters"].update(stage.counters)
+    result["cycles_per_second"] = throughput(sim, values, n_cycles, repeat)
+    return result
+
+
+def run(args):
+    parser.parse(randomNetlist(1), "lalr")  # Construction (ou chargement) du parser
+    results = {"environment": environment(args.cflags), "cycles": args.cycles}
+    results["netlists"] = {}
+    print(
+        f"{'netlist':>30} {'equations':>9} {'parse':>7} {'sched.':>7} {'emit':>7} {'compile':>8} {'cycles/s':>12}"
+    )
+    for name, make in SUITE.items():
+        if args.only and not any(fnmatch.fnmatch(name, p) for p in args.only):
+            continue
+        netlist, roms = make()
+        result = measure(netlist, roms, args.cycles, args.repeat, args.cflags)
+        results["netlists"][name] = result
+        stages = result["stages"]
+        print(
+            f"{name:>30} {result['counters'].get('equations', 0):>9}"
+            f" {stages.get('parse', 0) + stages.get('ast', 0):>7.3f}"
+            f" {stages.get('schedule', 0):>7.3f} {stages.get('emit', 0):>7.3f}"
+            f" {stages.get('compile', 0):>8.2f} {result['cycles_per_second']:>12.0f}"
+        )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+def _metric(result, name):
+    if name == "cycles_per_second":
+        return result[name]
+    return result["stages"].get(name)
+
+
+def compare(old_path, new_path, threshold):
+    """
+    Affiche le rapport entre les mesures de deux fichiers de résultats pour
+    les netlists présentes dans les deux. Renvoie 1 si une mesure est
+    dégradée de plus de `threshold` (une proportion), 0 sinon
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for label, results in (("old", old), ("new", new)):
+        env = results["environment"]
+        dirty = " (dirty)" if env.get("dirty") else ""
+        print(f"{label}: {env.get('commit')}{dirty}, {env.get('date')}")
+    print(f"{'netlist':>30} {'metric':>18} {'old':>12} {'new':>12} {'change':>8}")
+    regressions = 0
+    for name, after in new["netlists"].items():
+        before = old["netlists"].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            a, b = _metric(before, metric), _metric(after, metric)
+            if not a or b is None:
+                continue
+            change = b / a - 1
+            worse = -change if higher_is_better else change
+            flag = ""
+            noise = metric != "cycles_per_second" and max(a, b) < NOISE_FLOOR
+            if worse > threshold and not noise:
+                flag = "  <- regression"
+                regressions += 1
+            print(
+                f"{name:>30} {metric:>18} {a:>12.4g} {b:>12.4g} {change:>+8.1%}{flag}"
+            )
+    if regressions:
+        print(f"{regressions} measures regressed by more than {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument(
+        "--output",
+        default="bench_suite.json",
+        help="File where the results are written (default: bench_suite.json)",
+    )
+    argparser.add_argument(
+        "--only",
+        nargs="+",
+        metavar="PATTERN",
+        help="Only run the netlists whose name matches one of these patterns",
+    )
+    argparser.add_argument("--cycles", type=int, default=20_000)
+    argparser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Keep the best of this many simulation measures",
+    )
+    argparser.add_argument(
+        "--cflags",
+        default="-O2",
+        help='Options of the C compiler (default: "-O2")',
+    )
+    argparser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Compare two results files instead of running the benchmarks",
+    )
+    argparser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change reported as a regression by --compare (default: 0.1)",
+    )
+    args = argparser.parse_args()
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    args.cflags = shlex.split(args.cflags)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
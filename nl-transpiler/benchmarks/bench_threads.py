@@ -0,0 +1,88 @@
+"""
+Compare le temps par cycle de la simulation sur un seul thread
+(`transpile2CFiles`) et répartie sur plusieurs threads
+(`transpile2CThreads`), sur de grandes netlists larges.
+
+    python -m benchmarks.bench_threads [--cycles N] [--threads 2 4 ...]
+
+Le gain n'est possible qu'avec autant de cœurs libres que de threads: avec
+moins de processeurs que de threads, le code généré calcule tout sur le
+thread appelant, et la ligne est marquée `serial` (elle mesure alors le
+surcoût du découpage). Nécessite `numpy`.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+from netlistSimulator.simulator import buildSimulator
+
+from .bench_events import inputs
+from .netlists import counterBank, randomNetlist, rippleAdder
+
+NETLISTS = {
+    "counter bank (256 x 16 bits)": lambda: counterBank(256),
+    "random (20000 eqs, 8 bits)": lambda: randomNetlist(20_000, width=8, seed=1),
+    "ripple adder (2000 bits)": lambda: rippleAdder(2_000),
+}
+
+
+def usableCpus():
+    """
+    Nombre de processeurs utilisables par ce processus
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def measure(sim, values):
+    """
+    Renvoie la durée (en ns) d'un cycle
+    """
+    out = np.empty(len(values), dtype=sim.output_dtype)
+    sim.step(len(values) // 10, values, out)  # Chauffe
+    sim.reset()
+    start = time.perf_counter()
+    sim.step(len(values), values, out)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--cycles", type=int, default=2_000)
+    argparser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[2, 4],
+        help="Numbers of threads to compare with the single threaded simulation",
+    )
+    args = argparser.parse_args()
+
+    cpus = usableCpus()
+    print(f"{cpus} usable CPUs ({os.cpu_count()} online)")
+    print(f"{'netlist':>30} {'threads':>8} {'ns/cycle':>10} {'speedup':>8}")
+    for name, netlist in NETLISTS.items():
+        netlist = netlist()
+        with contextlib.redirect_stdout(io.StringIO()):
+            single = buildSimulator(netlist)
+        values = inputs(single, args.cycles, 1)
+        t_single = measure(single, values)
+        print(f"{name:>30} {1:>8} {t_single:>10.0f} {1:>7.2f}x")
+        for threads in args.threads:
+            with contextlib.redirect_stdout(io.StringIO()):
+                sim = buildSimulator(netlist, threads=threads)
+            t = measure(sim, values)
+            note = "  serial" if threads > os.cpu_count() else ""
+            if not note and threads > cpus:
+                note = "  (more threads than usable CPUs)"
+            print(f"{name:>30} {threads:>8} {t:>10.0f} {t_single / t:>7.2f}x{note}")
+
+
+if __name__ == "__main__":
+    main()
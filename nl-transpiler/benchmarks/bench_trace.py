@@ -0,0 +1,90 @@
+"""
+Mesure le surcoût des traces (`buildSimulator(trace=...)`) sur le temps par
+cycle: netlist transpilée sans trace, avec des nappes tracées mais sans
+fichier ouvert, et avec une trace VCD ou binaire ouverte.
+
+    python -m benchmarks.bench_trace [--cycles N] [--activity A]
+
+Nécessite `numpy`.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from netlistSimulator.simulator import buildSimulator
+
+from .bench_events import inputs
+from .netlists import counterBank, randomNetlist
+
+"""
+Netlists et motifs des nappes tracées (quelques nappes de chaque netlist)
+"""
+NETLISTS = {
+    "counter bank (16 x 16 bits)": (lambda: counterBank(16), ["k[0-7]_c"]),
+    "counter bank (256 x 16 bits)": (lambda: counterBank(256), ["k[0-7]_c"]),
+    "random (20000 eqs, 8 bits)": (
+        lambda: randomNetlist(20_000, width=8, seed=1),
+        ["w_1999?"],
+    ),
+}
+
+
+def measure(sim, values, trace=None, binary=False):
+    """
+    Renvoie la durée (en ns) d'un cycle, en écrivant la trace dans le
+    fichier `trace` si il est donné
+    """
+    out = np.empty(len(values), dtype=sim.output_dtype)
+    sim.step(len(values) // 10, values, out)  # Chauffe
+    sim.reset()
+    if trace is not None:
+        sim.openTrace(trace, binary)
+    start = time.perf_counter()
+    sim.step(len(values), values, out)
+    sim.closeTrace()
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argparser.add_argument("--cycles", type=int, default=20_000)
+    argparser.add_argument(
+        "--activity",
+        type=float,
+        default=0.1,
+        help="Probability that an input changes at each cycle",
+    )
+    args = argparser.parse_args()
+
+    print(
+        f"{'netlist':>30} {'signals':>8} {'mode':>8} {'ns/cycle':>10} {'overhead':>9} {'bytes':>10}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace")
+        for name, (netlist, patterns) in NETLISTS.items():
+            netlist = netlist()
+            with contextlib.redirect_stdout(io.StringIO()):
+                plain = buildSimulator(netlist)
+                traced = buildSimulator(netlist, trace=patterns)
+            n = len(traced.trace_signals)
+            values = inputs(plain, args.cycles, args.activity)
+            t_plain = measure(plain, values)
+            print(f"{name:>30} {0:>8} {'none':>8} {t_plain:>10.0f} {1:>8.2f}x")
+            t = measure(traced, values)
+            print(f"{name:>30} {n:>8} {'closed':>8} {t:>10.0f} {t / t_plain:>8.2f}x")
+            for mode, binary in (("vcd", False), ("binary", True)):
+                t = measure(traced, values, path, binary)
+                size = os.path.getsize(path)
+                print(
+                    f"{name:>30} {n:>8} {mode:>8} {t:>10.0f} {t / t_plain:>8.2f}x {size:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+Générateurs de netlists synthétiques pour les benchmarks
+"""
+
+import random
+
+
+def _format(inputs, outputs, wires, eqs):
+    """
+    Assemble une netlist à partir de ses morceaux. `wires` est une liste de
+    couples `(label, taille)`
+    """
+    typed = ", ".join(f"{w}:{l}" if l != 1 else w for w, l in wires)
+    return (
+        f"INPUT {', '.join(inputs)}\n"
+        f"OUTPUT {', '.join(outputs)}\n"
+        f"VAR {typed}\n"
+        "IN\n" + "\n".join(eqs) + "\n"
+    )
+
+
+def rippleAdder(n_bits):
+    """
+    Additionneur à propagation de retenue sur `n_bits` bits (5 équations par
+    bit). La chaîne de dépendances est aussi longue que l'additionneur.
+    """
+    inputs = []
+    outputs = []
+    wires = [("c_0", 1)]
+    eqs = ["c_0 = 0"]
+    for i in range(n_bits):
+        a, b, c = f"a_{i}", f"b_{i}", f"c_{i}"
+        inputs += [a, b]
+        outputs.append(f"s_{i}")
+        for w in (a, b, f"t_{i}", f"s_{i}", f"u_{i}", f"v_{i}", f"c_{i + 1}"):
+            wires.append((w, 1))
+        eqs += [
+            f"t_{i} = XOR {a} {b}",
+            f"s_{i} = XOR t_{i} {c}",
+            f"u_{i} = AND {a} {b}",
+            f"v_{i} = AND t_{i} {c}",
+            f"c_{i + 1} = OR u_{i} v_{i}",
+        ]
+    outputs.append(f"c_{n_bits}")
+    return _format(inputs, outputs, wires, eqs)
+
+
+def counterBank(n_counters, width=16):
+    """
+    Banc de `n_counters` compteurs de `width` bits: seul le compteur dont le
+    numéro est l'entrée `sel` est incrémenté (quand `en` vaut 1). Presque
+    tout le circuit est inactif à chaque cycle.
+    """
+    bits = max(1, (n_counters - 1).bit_length())
+    inputs = ["sel", "en"]
+    wires = [("sel", bits), ("en", 1)]
+    eqs = []
+    outputs = []
+    for i in range(n_counters):
+        p = f"k{i}_"
+        # Décodage de `sel == i`
+        last = "en"
+        for j in range(bits):
+            eqs.append(f"{p}s{j} = SELECT {j} sel")
+            wires.append((f"{p}s{j}", 1))
+            bit = f"{p}s{j}"
+            if not i >> j & 1:
+                eqs.append(f"{p}n{j} = NOT {bit}")
+                wires.append((f"{p}n{j}", 1))
+                bit = f"{p}n{j}"
+            eqs.append(f"{p}e{j} = AND {last} {bit}")
+            wires.append((f"{p}e{j}", 1))
+            last = f"{p}e{j}"
+        # Incrémentation, bit par bit
+        carry = last
+        for j in range(width):
+            eqs += [
+                f"{p}q{j} = SELECT {j} {p}c",
+                f"{p}d{j} = XOR {p}q{j} {carry}",
+                f"{p}r{j} = AND {p}q{j} {carry}",
+            ]
+            wires += [(f"{p}q{j}", 1), (f"{p}d{j}", 1), (f"{p}r{j}", 1)]
+            carry = f"{p}r{j}"
+        high = f"{p}d0"
+        for j in range(1, width):
+            eqs.append(f"{p}t{j} = CONCAT {high} {p}d{j}")
+            wires.append((f"{p}t{j}", j + 1))
+            high = f"{p}t{j}"
+        eqs.append(f"{p}c = REG {high}")
+        wires.append((f"{p}c", width))
+        outputs.append(f"{p}c")
+    return _format(inputs, outputs, wires, eqs)
+
+
+def randomNetlist(n_eqs, n_inputs=16, width=8, seed=0):
+    """
+    Netlist aléatoire de `n_eqs` équations sur des bus de `width` bits. Chaque
+    équation lit des fils déjà définis, le graphe est donc acyclique. Quelques
+    registres rebouclent sur la logique.
+    """
+    rng = random.Random(seed)
+    inputs = [f"i_{i}" for i in range(n_inputs)]
+    wires = [(i, width) for i in inputs]
+    defined = list(inputs)
+    eqs = []
+    binops = ("AND", "OR", "XOR", "NAND")
+    for k in range(n_eqs):
+        w = f"w_{k}"
+        match rng.randrange(8):
+            case 0:
+                eqs.append(f"{w} = NOT {rng.choice(defined)}")
+            case 1:
+                eqs.append(
+                    f"{w} = MUX {rng.choice(defined)} {rng.choice(defined)} {rng.choice(defined)}"
+                )
+            case 2:
+                eqs.append(f"{w} = REG {rng.choice(defined)}")
+            case _:
+                eqs.append(
+                    f"{w} = {rng.choice(binops)} {rng.choice(defined)} {rng.choice(defined)}"
+                )
+        wires.append((w, width))
+        defined.append(w)
+    outputs = [f"w_{k}" for k in range(max(0, n_eqs - n_inputs), n_eqs)]
+    return _format(inputs, outputs, wires, eqs)
+
+
+def redundantNetlist(n_blocks, width=8, seed=0):
+    """
+    Netlist pleine de logique redondante, comme celles produites par un
+    frontend HDL: chaînes de `COPY`, opérandes constants, doubles `NOT`,
+    allers-retours `CONCAT`/`SELECT` et calculs dupliqués (`n_blocks` blocs
+    d'une dizaine d'équations). `width` vaut au plus 32
+    """
+    if width > 32:
+        raise ValueError(f"width must be at most 32 (got {width})")
+    rng = random.Random(seed)
+    inputs = [f"i_{i}" for i in range(4)]
+    wires = [(i, width) for i in inputs]
+    defined = list(inputs)
+    eqs = []
+    outputs = []
+    zero = "0" * width
+    ones = "1" * width
+    for k in range(n_blocks):
+        a, b = rng.choice(defined), rng.choice(defined)
+        p = f"b{k}_"
+        block = [
+            (f"{p}c0", width, f"COPY {a}"),
+            (f"{p}c1", width, f"COPY {p}c0"),
+            (f"{p}k", width, f"OR {p}c1 {zero}"),
+            (f"{p}n0", width, f"NOT {b}"),
+            (f"{p}n1", width, f"NOT {p}n0"),
+            (f"{p}x", width, f"AND {p}k {ones}"),
+            (f"{p}y", width, f"XOR {p}x {p}n1"),
+            (f"{p}y2", width, f"XOR {p}n1 {p}x"),
+            (f"{p}cat", 2 * width, f"CONCAT {p}y {p}y2"),
+            (f"{p}s", 1, f"SELECT {2 * width - 1} {p}cat"),
+            (f"{p}lo", width, f"SLICE 0 {width - 1} {p}cat"),
+            (f"{p}m", width, f"MUX {p}s {p}lo {p}y2"),
+            (f"{p}dead", width, f"NAND {p}m {p}c1"),
+            (f"{p}r", width, f"REG {p}m"),
+        ]
+        for w, l, e in block:
+            eqs.append(f"{w} = {e}")
+            wires.append((w, l))
+        defined += [f"{p}m", f"{p}r"]
+        outputs.append(f"{p}r")
+    outputs += [f"b{k}_m" for k in range(max(0, n_blocks - 4), n_blocks)]
+    return _format(inputs, outputs, wires, eqs)
+
+
+def ramPort(addr_size, width=8):
+    """
+    Une RAM de `addr_size` bits d'adresse et de mots de `width` bits, lue
+    et écrite directement depuis les entrées (`ra`, `we`, `wa`, `d`)
+    """
+    return _format(
+        ["ra", "we", "wa", "d"],
+        ["o"],
+        [("ra", addr_size), ("we", 1), ("wa", addr_size), ("d", width), ("o", width)],
+        [f"o = RAM {addr_size} {width} ra we wa d"],
+    )
+
+
+class _Builder:
+    """
+    Netlist construite équation par équation, pour les générateurs dont les
+    nappes intermédiaires sont nombreuses
+    """
+
+    def __init__(self):
+        self.inputs = []
+        self.outputs = []
+        self.wires = []
+        self.eqs = []
+
+    def input(self, label, length=1):
+        self.inputs.append(label)
+        self.wires.append((label, length))
+        return label
+
+    def eq(self, label, length, expr):
+        """
+        Ajoute l'équation `label = expr` (une nappe de `length` bits) et
+        renvoie `label`
+        """
+        self.wires.append((label, length))
+        self.eqs.append(f"{label} = {expr}")
+        return label
+
+    def add(self, prefix, x, y, carry=None):
+        """
+        Additionneur complet des bits `x`, `y` et `carry` (demi-additionneur
+        sans `carry`), dont les nappes commencent par `prefix`. Renvoie le
+        couple `(somme, retenue)`
+        """
+        t = self.eq(f"{prefix}t", 1, f"XOR {x} {y}")
+        u = self.eq(f"{prefix}u", 1, f"AND {x} {y}")
+        if carry is None:
+            return t, u
+        s = self.eq(f"{prefix}s", 1, f"XOR {t} {carry}")
+        v = self.eq(f"{prefix}v", 1, f"AND {t} {carry}")
+        return s, self.eq(f"{prefix}c", 1, f"OR {u} {v}")
+
+    def bits(self, prefix, bus, length):
+        """
+        Les bits de la nappe `bus` de `length` bits (du poids faible au poids
+        fort)
+        """
+        return [self.eq(f"{prefix}{j}", 1, f"SELECT {j} {bus}") for j in range(length)]
+
+    def concat(self, label, bits):
+        """
+        Nappe `label` formée des bits `bits` (du poids faible au poids fort)
+        """
+        if len(bits) == 1:
+            return self.eq(label, 1, f"COPY {bits[0]}")
+        high = bits[0]
+        for j in range(1, len(bits)):
+            name = label if j == len(bits) - 1 else f"{label}_{j}"
+            high = self.eq(name, j + 1, f"CONCAT {high} {bits[j]}")
+        return high
+
+    def text(self):
+        return _format(self.inputs, self.outputs, self.wires, self.eqs)
+
+
+def lookaheadAdder(n_bits, block=4):
+    """
+    Additionneur à anticipation de retenue sur `n_bits` bits, par blocs de
+    `block` bits: dans un bloc, chaque retenue est calculée directement à
+    partir des bits de génération et de propagation et de la retenue
+    d'entrée du bloc, et les blocs sont chaînés. Mêmes entrées et sorties que
+    `rippleAdder`
+    """
+    b = _Builder()
+    b.eq("c_0", 1, "0")
+    for i in range(n_bits):
+        b.input(f"a_{i}")
+        b.input(f"b_{i}")
+        b.eq(f"p_{i}", 1, f"XOR a_{i} b_{i}")
+        b.eq(f"g_{i}", 1, f"AND a_{i} b_{i}")
+    for start in range(0, n_bits, block):
+        for k in range(start, min(start + block, n_bits)):
+            # c_{k+1} = g_k | p_k g_{k-1} | ... | p_k ... p_start c_start
+            acc = f"g_{k}"
+            prod = f"p_{k}"
+            for t in range(k - 1, start - 2, -1):
+                n = k - t
+                low = f"g_{t}" if t >= start else f"c_{start}"
+                term = b.eq(f"l_{k}_{n}", 1, f"AND {prod} {low}")
+                name = f"c_{k + 1}" if t < start else f"o_{k}_{n}"
+                acc = b.eq(name, 1, f"OR {acc} {term}")
+                if t >= start:
+                    prod = b.eq(f"m_{k}_{n}", 1, f"AND {prod} p_{t}")
+        for k in range(start, min(start + block, n_bits)):
+            b.outputs.append(b.eq(f"s_{k}", 1, f"XOR p_{k} c_{k}"))
+    b.outputs.append(f"c_{n_bits}")
+    return b.text()
+
+
+def multiplier(n_bits):
+    """
+    Multiplieur en tableau de deux entrées `a` et `b` de `n_bits` bits: les
+    produits partiels de chaque bit de `b` sont ajoutés un à un par des
+    additionneurs à propagation de retenue. Le produit est la sortie `p`
+    """
+    b = _Builder()
+    a_bits = b.bits("x", b.input("a", n_bits), n_bits)
+    b_bits = b.bits("y", b.input("b", n_bits), n_bits)
+    acc = [b.eq(f"pp0_{j}", 1, f"AND {a_bits[j]} {b_bits[0]}") for j in range(n_bits)]
+    for i in range(1, n_bits):
+        carry = None
+        for j in range(n_bits):
+            x = b.eq(f"pp{i}_{j}", 1, f"AND {a_bits[j]} {b_bits[i]}")
+            position = i + j
+            if position < len(acc):
+                acc[position], carry = b.add(f"f{i}_{j}_", acc[position], x, carry)
+            elif carry is None:
+                acc.append(x)
+            else:
+                s, carry = b.add(f"f{i}_{j}_", x, carry)
+                acc.append(s)
+        if carry is not None:
+            acc.append(carry)
+    b.outputs.append(b.concat("p", acc))
+    return b.text()
+
+
+def registerFile(addr_size, width=8, read_ports=2):
+    """
+    Banc de `1 << addr_size` registres de `width` bits à `read_ports` ports
+    de lecture (`ra0`, `ra1`, ... vers `o0`, `o1`, ...) et un port
+    d'écriture (`we`, `wa`, `d`): une RAM par port de lecture, toutes
+    écrites en même temps
+    """
+    b = _Builder()
+    we = b.input("we")
+    wa = b.input("wa", addr_size)
+    d = b.input("d", width)
+    for k in range(read_ports):
+        ra = b.input(f"ra{k}", addr_size)
+        b.outputs.append(
+            b.eq(f"o{k}", width, f"RAM {addr_size} {width} {ra} {we} {wa} {d}")
+        )
+    return b.text()
+
+
+"""
+Instructions de `toyCPU`
+"""
+TOY_LI, TOY_ADD, TOY_NAND, TOY_JNZ = range(4)
+
+
+def toyInstruction(op, rd=0, rs=0, rt=0, imm=0):
+    """
+    Mot de la ROM de `toyCPU` pour l'instruction `op` (une des `TOY_*`)
+    """
+    return op | rd << 2 | rs << 4 | rt << 6 | imm << 8
+
+
+def toyCPU(width=8, pc_size=8):
+    """
+    Petit processeur dont le programme est dans la ROM `instr` (lue à
+    l'adresse `pc`), avec 4 registres de `width` bits. Les instructions
+    (voir `toyInstruction`) ont un code sur 2 bits, les numéros des
+    registres `rd`, `rs` et `rt` sur 2 bits chacun et une constante `imm`
+    sur les bits de poids fort:
+      - `TOY_LI`: `rd = imm`
+      - `TOY_ADD`: `rd = rs + rt`
+      - `TOY_NAND`: `rd = NAND rs rt`
+      - `TOY_JNZ`: saute à l'adresse `imm` si `rs` n'est pas nul
+    Le processeur n'a pas d'entrée, ses sorties sont `pc` et `res` (la
+    valeur calculée par l'instruction). Voir `toyProgram`
+    """
+    imm_size = max(width, pc_size)
+    size = 8 + imm_size
+    b = _Builder()
+    instr = b.eq("instr", size, f"ROM {pc_size} {size} pc")
+    op = b.eq("op", 2, f"SLICE 0 1 {instr}")
+    rd = b.eq("rd", 2, f"SLICE 2 3 {instr}")
+    rs = b.eq("rs", 2, f"SLICE 4 5 {instr}")
+    rt = b.eq("rt", 2, f"SLICE 6 7 {instr}")
+    imm = b.eq("imm", width, f"SLICE 8 {8 + width - 1} {instr}")
+    target = b.eq("target", pc_size, f"SLICE 8 {8 + pc_size - 1} {instr}")
+    op0 = b.eq("op0", 1, f"SELECT 0 {op}")
+    op1 = b.eq("op1", 1, f"SELECT 1 {op}")
+
+    # Registres: une RAM par port de lecture
+    we = b.eq("we", 1, f"NAND {op0} {op1}")
+    x = b.eq("x", width, f"RAM 2 {width} {rs} {we} {rd} res")
+    y = b.eq("y", width, f"RAM 2 {width} {rt} {we} {rd} res")
+
+    # Unité de calcul
+    x_bits = b.bits("xb", x, width)
+    y_bits = b.bits("yb", y, width)
+    carry = None
+    sums = []
+    for j in range(width):
+        s, carry = b.add(f"add{j}_", x_bits[j], y_bits[j], carry)
+        sums.append(s)
+    total = b.concat("sum", sums)
+    nand = b.eq("nand", width, f"NAND {x} {y}")
+    low = b.eq("res_lo", width, f"MUX {op0} {imm} {total}")
+    b.outputs.append(b.eq("res", width, f"MUX {op1} {low} {nand}"))
+
+    # Compteur de programme
+    nz = x_bits[0]
+    for j in range(1, width):
+        nz = b.eq(f"nz{j}", 1, f"OR {nz} {x_bits[j]}")
+    jump = b.eq("jump", 1, f"AND {b.eq('jnz', 1, f'AND {op0} {op1}')} {nz}")
+    pc_bits = b.bits("pcb", "pc", pc_size)
+    incremented = [b.eq("inc0_s", 1, f"NOT {pc_bits[0]}")]
+    carry = pc_bits[0]
+    for j in range(1, pc_size):
+        s, carry = b.add(f"inc{j}_", pc_bits[j], carry)
+        incremented.append(s)
+    following = b.concat("next", incremented)
+    target_or_next = b.eq("new_pc", pc_size, f"MUX {jump} {following} {target}")
+    b.outputs.append(b.eq("pc", pc_size, f"REG {target_or_next}"))
+    return b.text()
+
+
+def toyProgram(n=100):
+    """
+    Programme de `toyCPU` qui boucle indéfiniment: `r2` reçoit la somme des
+    entiers de 1 à `n` (modulo `1 << width`), puis tout recommence
+    """
+    return [
+        toyInstruction(TOY_LI, rd=0, imm=n),
+        toyInstruction(TOY_LI, rd=1, imm=255),
+        toyInstruction(TOY_LI, rd=2, imm=0),
+        toyInstruction(TOY_ADD, rd=2, rs=2, rt=0),  # Boucle
+        toyInstruction(TOY_ADD, rd=0, rs=0, rt=1),
+        toyInstruction(TOY_JNZ, rs=0, imm=3),
+        toyInstruction(TOY_JNZ, rs=1, imm=0),
+    ]
+
+
+def layeredNetlist(depth, width, n_inputs=16, bus=8, seed=0):
+    """
+    Netlist aléatoire de `depth` niveaux de `width` équations sur des bus de
+    `bus` bits: chaque équation lit une nappe du niveau précédent et des
+    nappes prises au hasard dans les niveaux antérieurs, les entrées ou les
+    registres. Le chemin le plus long traverse donc tous les niveaux. Le
+    dernier niveau est sorti et recopié dans des registres
+    """
+    rng = random.Random(seed)
+    b = _Builder()
+    previous = [b.input(f"i_{i}", bus) for i in range(n_inputs)]
+    previous += [f"r_{i}" for i in range(width)]
+    defined = list(previous)
+    binops = ("AND", "OR", "XOR", "NAND")
+    for k in range(depth):
+        level = []
+        for i in range(width):
+            first = rng.choice(previous)
+            match rng.randrange(6):
+                case 0:
+                    expr = f"NOT {first}"
+                case 1:
+                    expr = f"MUX {first} {rng.choice(defined)} {rng.choice(defined)}"
+                case _:
+                    expr = f"{rng.choice(binops)} {first} {rng.choice(defined)}"
+            level.append(b.eq(f"l{k}_{i}", bus, expr))
+        defined += level
+        previous = level
+    for i, w in enumerate(previous):
+        b.eq(f"r_{i}", bus, f"REG {w}")
+    b.outputs += previous
+    return b.text()
@@ -1,25 +1,503 @@
 import argparse
+import contextlib
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
 
-from .netlist2C import transpile2C
+from . import buildcache, runner, vcd
+from .netlist2C import (
+    Profile,
+    transpile2CBatchFiles,
+    transpile2CChunks,
+    transpile2CEvents,
+    transpile2CFiles,
+    transpile2CThreads,
+)
+from .netlist2C.cones import DEFAULT_MIN_SIZE
+from .netlist2C.events import DEFAULT_PARTITION_SIZE
+from .netlist2C import hotspots as timers
+from .netlist2C.incremental import defaultCacheFile
+from .netlist2C.options import checkOptions
+from .netlist2C.parser import PARSER_ALGORITHMS
+from .netlist2C.passes import DEFAULT_PASSES, PASSES
+from .netlist2C.sparse import DEFAULT_THRESHOLD
+
+
+def _add_optimize_argument(parser):
+    parser.add_argument(
+        "--optimize",
+        nargs="?",
+        const=",".join(DEFAULT_PASSES),
+        metavar="PASSES",
+        help=f"Optimize the netlist before generating C code, with the given comma separated passes (default: {','.join(DEFAULT_PASSES)})",
+    )
+
+
+def _get_passes(parser, args):
+    optimize = args.optimize.split(",") if args.optimize else None
+    for name in optimize or ():
+        if name not in PASSES:
+            parser.error(
+                f"unknown optimization pass {name} (available: {', '.join(PASSES)})"
+            )
+    return optimize
+
+
+def _check_options(parser, **options):
+    """
+    Vérifie que les options de génération `options` peuvent être utilisées
+    ensemble (voir `netlist2C.options`), en les nommant comme sur la ligne
+    de commande
+    """
+    try:
+        checkOptions(options, _flag)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def _flag(name):
+    if name == "rom_contents":
+        return "--embed-rom"
+    return "--" + name.replace("_", "-")
+
+
+def _add_events_argument(parser):
+    parser.add_argument(
+        "--events",
+        nargs="?",
+        type=int,
+        const=DEFAULT_PARTITION_SIZE,
+        metavar="PARTITION_SIZE",
+        help=f"Event-driven simulation: only re-evaluate the partitions of PARTITION_SIZE equations whose inputs changed (default: {DEFAULT_PARTITION_SIZE})",
+    )
+
+
+def _add_threads_argument(parser):
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="Spread each cycle over THREADS threads, synchronized at each wide enough level of the circuit (compile with -pthread)",
+    )
+
+
+def _add_trace_argument(parser):
+    parser.add_argument(
+        "--trace",
+        action="append",
+        metavar="PATTERN",
+        help="Trace the signals whose name matches PATTERN (shell-style wildcards, can be repeated)",
+    )
+
+
+def _add_sparse_ram_argument(parser):
+    parser.add_argument(
+        "--sparse-ram",
+        nargs="?",
+        type=int,
+        const=DEFAULT_THRESHOLD,
+        metavar="ADDRESS_BITS",
+        help=f"Back the RAMs with more than ADDRESS_BITS address bits (default: {DEFAULT_THRESHOLD}) by pages allocated on first write",
+    )
+
+
+def vcdCommand(argv):
+    """
+    Sous-commande `nl-transpile vcd`: convertit une trace binaire en VCD
+    """
+    parser = argparse.ArgumentParser(
+        prog="nl-transpile vcd",
+        description="Convert a binary signal trace to a VCD file",
+    )
+    parser.add_argument("trace", help="Binary trace file")
+    parser.add_argument("output", help="VCD file to write")
+    args = parser.parse_args(argv)
+    try:
+        changes = vcd.traceToVcd(args.trace, args.output)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Wrote {changes} value changes")
+    return 0
+
+
+def hotspotsCommand(argv):
+    """
+    Sous-commande `nl-transpile hotspots`: affiche le rapport des compteurs
+    d'un simulateur instrumenté, relié aux nappes de la netlist
+    """
+    parser = argparse.ArgumentParser(
+        prog="nl-transpile hotspots",
+        description="Show the time spent in each group of equations of an instrumented simulator",
+    )
+    parser.add_argument(
+        "report", help=f"Report written at exit (file given by ${timers.REPORT_VARIABLE})"
+    )
+    parser.add_argument("map", help="Group map written by nl-transpile --hotspots")
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of groups shown (default: 20)"
+    )
+    args = parser.parse_args(argv)
+    try:
+        with open(args.report) as f:
+            unit, cycles, ticks = timers.readReport(f)
+        with open(args.map) as f:
+            groups = timers.readGroupMap(f)
+        rows = timers.mapReport(groups, ticks, cycles)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+    print(f"{cycles} cycles, unit: {unit}")
+    print(f"{'group':>20} {'share':>7} {unit + '/cycle':>12} {'equations':>10}  wires")
+    for row in rows[: args.top]:
+        labels = row["labels"]
+        wires = ", ".join(labels[:4]) + (", ..." if len(labels) > 4 else "")
+        print(
+            f"{row['name']:>20} {row['share']:>7.1%} {row['ticks_per_cycle']:>12.1f} {len(labels):>10}  {wires}"
+        )
+    return 0
+
+
+def run(argv):
+    """
+    Sous-commande `nl-transpile run`: transpile, compile (ou reprend dans le
+    cache de constructions) et lance le simulateur
+    """
+    parser = argparse.ArgumentParser(
+        prog="nl-transpile run",
+        description="Build the simulator of a netlist (or reuse a cached build) and run it",
+    )
+    parser.add_argument("netlist", help="Netlist file to simulate")
+    parser.add_argument(
+        "args",
+        nargs=argparse.REMAINDER,
+        help="Arguments of the simulator (the ROM file)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_ALGORITHMS,
+        default="lalr",
+        help="Parsing algorithm (earley is much slower, kept for reference)",
+    )
+    _add_optimize_argument(parser)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Split the simulation function in files of CHUNK_SIZE equations, compiled in parallel",
+    )
+    _add_events_argument(parser)
+    _add_threads_argument(parser)
+    _add_trace_argument(parser)
+    parser.add_argument(
+        "--trace-file",
+        help="File where the traced signals are written (default: the netlist name with a .vcd extension)",
+    )
+    parser.add_argument(
+        "--trace-binary",
+        action="store_true",
+        help="Write the trace in the compact binary format (see nl-transpile vcd)",
+    )
+    _add_sparse_ram_argument(parser)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of parallel compilations (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--cflags",
+        default="-O2",
+        help="Compilation flags, as a single string (default: -O2)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=buildcache.DEFAULT_MAX_SIZE >> 20,
+        metavar="MIB",
+        help=f"Size limit of the build cache in MiB, the least recently used builds are removed (default: {buildcache.DEFAULT_MAX_SIZE >> 20})",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print the transpilation messages when the simulator is built",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s"
+    )
+    optimize = _get_passes(parser, args)
+    _check_options(
+        parser,
+        chunk_size=args.chunk_size,
+        events=args.events,
+        threads=args.threads,
+        optimize=optimize,
+        trace=args.trace,
+        sparse_ram=args.sparse_ram,
+    )
+    if not args.trace and (args.trace_file is not None or args.trace_binary):
+        parser.error("--trace-file and --trace-binary need --trace")
+    with open(args.netlist) as f:
+        nl = f.read()
+    try:
+        executable = runner.buildExecutable(
+            nl,
+            cache=buildcache.BuildCache(max_size=args.cache_size << 20),
+            cflags=shlex.split(args.cflags),
+            parser_algorithm=args.parser,
+            optimize=optimize,
+            chunk_size=args.chunk_size,
+            events=args.events,
+            threads=args.threads,
+            trace=args.trace,
+            sparse_ram=args.sparse_ram,
+            jobs=args.jobs,
+        )
+    except subprocess.CalledProcessError as e:
+        parser.exit(1, f"{shlex.join(e.cmd)} failed\n")
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    env = None
+    if args.trace:
+        env = dict(os.environ)
+        env[runner.TRACE_FILE_VARIABLE] = (
+            args.trace_file
+            or os.path.splitext(os.path.basename(args.netlist))[0] + ".vcd"
+        )
+        if args.trace_binary:
+            env[runner.TRACE_BINARY_VARIABLE] = "1"
+    sys.stdout.flush()
+    return subprocess.run([executable] + args.args, env=env).returncode
 
 
 def main():
-    parser = argparse.ArgumentParser()
+    if sys.argv[1:2] == ["run"]:
+        sys.exit(run(sys.argv[2:]))
+    if sys.argv[1:2] == ["vcd"]:
+        sys.exit(vcdCommand(sys.argv[2:]))
+    if sys.argv[1:2] == ["hotspots"]:
+        sys.exit(hotspotsCommand(sys.argv[2:]))
+    parser = argparse.ArgumentParser(
+        epilog="Use `nl-transpile run NETLIST [ROM_FILE]` to build and run the simulator directly, `nl-transpile vcd TRACE OUTPUT` to convert a binary trace, `nl-transpile hotspots REPORT MAP` to show the report of an instrumented simulator"
+    )
     parser.add_argument("netlist", help="Netlist file to transpile")
     parser.add_argument("outname", help="The simulation C file name")
+    parser.add_argument(
+        "--parser",
+        choices=PARSER_ALGORITHMS,
+        default="lalr",
+        help="Parsing algorithm (earley is much slower, kept for reference)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-generate the equations that changed since the last run",
+    )
+    parser.add_argument(
+        "--lanes",
+        type=int,
+        help="Generate a batch simulator running LANES (a multiple of 64) independent instances at once",
+    )
+    parser.add_argument(
+        "--library",
+        action="store_true",
+        help="Also generate the API used by netlistSimulator.simulator (compile with -shared -fPIC)",
+    )
+    parser.add_argument(
+        "--binary-io",
+        action="store_true",
+        help="Also generate functions streaming binary input and output records (see main_binary_example.c)",
+    )
+    parser.add_argument(
+        "--embed-rom",
+        metavar="ROM_FILE",
+        help="Embed the ROM contents (hexadecimal format) in the generated code, in OUTNAME_roms.h",
+    )
+    _add_optimize_argument(parser)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Split the simulation function in files of CHUNK_SIZE equations (OUTNAME_chunk_K.c), to be compiled in parallel (see nl-build)",
+    )
+    _add_events_argument(parser)
+    _add_threads_argument(parser)
+    _add_trace_argument(parser)
+    _add_sparse_ram_argument(parser)
+    parser.add_argument(
+        "--share-cones",
+        nargs="?",
+        type=int,
+        const=DEFAULT_MIN_SIZE,
+        metavar="MIN_SIZE",
+        help=f"Compute the repeated combinational cones of at least MIN_SIZE equations (default: {DEFAULT_MIN_SIZE}) with one C function per cone shape",
+    )
+    parser.add_argument(
+        "--hotspots",
+        type=timers.parseGroups,
+        metavar="GROUPS",
+        help=f"Count the time spent in each group of equations: GROUPS is a number of consecutive equations, prefix (label prefix before the first _) or prefix:SEPARATOR. The groups are described in OUTNAME_hotspots.json, the report is written at exit to ${timers.REPORT_VARIABLE}",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Write the duration, counters and peak memory of each transpilation stage as JSON to FILE (default: standard output)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=("debug", "info", "warning", "error"),
+        default="warning",
+        help="Show the transpilation messages of this level and above (default: warning, info shows the stages)",
+    )
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+    optimize = _get_passes(parser, args)
+    _check_options(
+        parser,
+        incremental=args.incremental,
+        lanes=args.lanes,
+        chunk_size=args.chunk_size,
+        events=args.events,
+        threads=args.threads,
+        optimize=optimize,
+        trace=args.trace,
+        sparse_ram=args.sparse_ram,
+        share_cones=args.share_cones,
+        hotspots=args.hotspots,
+        library=args.library,
+        binary_io=args.binary_io,
+        rom_contents=args.embed_rom,
+    )
     with open(args.netlist) as f:
         nl = f.read()
-        form = {
-            "short_name": "netlist",
-            "filename": args.outname,
-            "functionName": "simulateNetlist",
-        }
-        h_file, c_file = transpile2C(nl, less_verbose=True)
-        with open(args.outname + ".h", "w") as h:
-            h.write(h_file.format(**form))
-        with open(args.outname + ".c", "w") as c:
-            c.write(c_file.format(**form))
+    profile = Profile(memory=args.profile is not None)
+    _transpileNetlist(args, nl, optimize, profile)
+    if args.profile is not None:
+        report = json.dumps(profile.asDict(), indent=2)
+        if args.profile == "-":
+            print(report)
+        else:
+            with open(args.profile, "w") as f:
+                f.write(report + "\n")
+
+
+def _transpileNetlist(args, nl, optimize, profile):
+    """
+    Transpile la netlist `nl` avec les options `args` de `nl-transpile`, en
+    enregistrant les étapes dans `profile`
+    """
+    form = {
+        "short_name": "netlist",
+        "filename": args.outname,
+        "functionName": "simulateNetlist",
+    }
+    if args.chunk_size is not None:
+        with contextlib.ExitStack() as stack:
+            roms = {}
+            if args.embed_rom is not None:
+                roms["rom_contents"] = stack.enter_context(open(args.embed_rom))
+            sources = transpile2CChunks(
+                nl,
+                os.path.dirname(args.outname) or ".",
+                dict(form, filename=os.path.basename(args.outname)),
+                args.chunk_size,
+                less_verbose=True,
+                parser_algorithm=args.parser,
+                library=args.library,
+                binary_io=args.binary_io,
+                optimize=optimize,
+                profile=profile,
+                **roms,
+            )
+        # La sortie standard peut recevoir le profil (`--profile -`)
+        print(f"Wrote {len(sources)} source files", file=sys.stderr)
+        return
+    paths = [args.outname + ".h", args.outname + ".c"]
+    if args.embed_rom is not None:
+        paths.append(args.outname + "_roms.h")
+    if args.hotspots is not None:
+        paths.append(args.outname + "_hotspots.json")
+    try:
+        with contextlib.ExitStack() as stack:
+            roms = {}
+            if args.embed_rom is not None:
+                roms["rom_contents"] = stack.enter_context(open(args.embed_rom))
+                roms["rom_output"] = stack.enter_context(open(paths[2], "w"))
+            hotspot_map = None
+            if args.hotspots is not None:
+                hotspot_map = stack.enter_context(open(paths[-1], "w"))
+            if args.lanes is not None:
+                transpile2CBatchFiles(
+                    nl,
+                    stack.enter_context(open(paths[0], "w")),
+                    stack.enter_context(open(paths[1], "w")),
+                    form,
+                    args.lanes,
+                    less_verbose=True,
+                    parser_algorithm=args.parser,
+                    optimize=optimize,
+                    profile=profile,
+                )
+                return
+            if args.events is not None:
+                transpile2CEvents(
+                    nl,
+                    stack.enter_context(open(paths[0], "w")),
+                    stack.enter_context(open(paths[1], "w")),
+                    form,
+                    args.events,
+                    less_verbose=True,
+                    parser_algorithm=args.parser,
+                    library=args.library,
+                    binary_io=args.binary_io,
+                    optimize=optimize,
+                    profile=profile,
+                    **roms,
+                )
+                return
+            if args.threads is not None:
+                transpile2CThreads(
+                    nl,
+                    stack.enter_context(open(paths[0], "w")),
+                    stack.enter_context(open(paths[1], "w")),
+                    form,
+                    args.threads,
+                    less_verbose=True,
+                    parser_algorithm=args.parser,
+                    library=args.library,
+                    binary_io=args.binary_io,
+                    optimize=optimize,
+                    profile=profile,
+                    **roms,
+                )
+                return
+            # Le code est écrit au fur et à mesure de la génération
+            transpile2CFiles(
+                nl,
+                stack.enter_context(open(paths[0], "w")),
+                stack.enter_context(open(paths[1], "w")),
+                form,
+                less_verbose=True,
+                parser_algorithm=args.parser,
+                cache_file=defaultCacheFile(args.netlist) if args.incremental else None,
+                library=args.library,
+                binary_io=args.binary_io,
+                optimize=optimize,
+                trace=args.trace,
+                sparse_ram=args.sparse_ram,
+                share_cones=args.share_cones,
+                hotspots=args.hotspots,
+                hotspot_map=hotspot_map,
+                profile=profile,
+                **roms,
+            )
+    except BaseException:
+        # Pas de fichiers à moitié écrits, plus récents que la netlist
+        for path in paths:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        raise
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+"""
+Compilation en parallèle du code généré découpé en morceaux (voir
+`transpile2CChunks`): chaque fichier source est compilé séparément, par
+`jobs` compilateurs à la fois, puis les objets sont liés ensemble.
+
+    nl-build -o sim main.c sim.c sim_chunk_*.c [-j 8] [--cflags="-O2"]
+"""
+
+import argparse
+import os
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def defaultCompiler():
+    """
+    Compilateur C: la variable d'environnement `CC`, ou `cc`
+    """
+    return os.environ.get("CC", "cc")
+
+
+def compileSources(
+    sources, output, compiler=None, cflags=("-O2",), ldflags=(), jobs=None
+):
+    """
+    Compile chaque fichier de `sources` en objet (à côté du fichier source,
+    avec l'extension `.o`), `jobs` à la fois (par défaut autant que de
+    processeurs), puis lie les objets dans `output`. Les options `cflags`
+    sont passées à la compilation et à l'édition de liens, `ldflags`
+    seulement à l'édition de liens (par exemple `("-shared",)`).
+
+    Lève `subprocess.CalledProcessError` si une compilation échoue, une fois
+    les autres terminées.
+    """
+    compiler = shlex.split(compiler or defaultCompiler())
+    objects = [os.path.splitext(source)[0] + ".o" for source in sources]
+
+    def compileOne(source, obj):
+        subprocess.run(
+            compiler + list(cflags) + ["-c", "-o", obj, source],
+            check=True,
+        )
+
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+        # Chaque tâche attend un compilateur lancé dans son propre processus.
+        # En cas d'erreur, la sortie du `with` attend la fin des autres
+        list(pool.map(compileOne, sources, objects))
+    subprocess.run(
+        compiler + list(cflags) + ["-o", output] + objects + list(ldflags),
+        check=True,
+    )
+    return output
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Compile C sources in parallel and link them (for code generated with nl-transpile --chunk-size)"
+    )
+    argparser.add_argument("sources", nargs="+", help="C source files")
+    argparser.add_argument("-o", "--output", required=True, help="Output file")
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of parallel compilations (default: number of CPUs)",
+    )
+    argparser.add_argument(
+        "--cflags",
+        default="-O2",
+        help="Compilation (and link) flags, as a single string (default: -O2)",
+    )
+    argparser.add_argument(
+        "--ldflags", default="", help="Link flags, as a single string"
+    )
+    args = argparser.parse_args()
+    try:
+        compileSources(
+            args.sources,
+            args.output,
+            cflags=shlex.split(args.cflags),
+            ldflags=shlex.split(args.ldflags),
+            jobs=args.jobs,
+        )
+    except subprocess.CalledProcessError as e:
+        argparser.exit(1, f"{shlex.join(e.cmd)} failed\n")
+
+
+if __name__ == "__main__":
+    main()
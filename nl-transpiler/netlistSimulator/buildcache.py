@@ -0,0 +1,170 @@
+"""
+Cache des programmes et bibliothèques compilés, adressé par le contenu: la
+clef d'une construction est un hachage du texte de la netlist, de la version
+du générateur (le code source de `netlist2C`) et des options de compilation
+(compilateur, options, passes d'optimisation, ...). Quand la clef est déjà
+dans le cache, ni la génération du C ni la compilation ne sont refaites.
+
+Chaque construction est un dossier `{key}` dans le cache (par défaut
+`builds` dans le dossier de `utils.getCacheDir()`). Le cache est limité en
+taille: au-delà, les constructions utilisées le moins récemment (la date de
+modification de leur dossier, mise à jour à chaque utilisation) sont
+supprimées.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from . import netlist2C
+from .netlist2C import utils
+
+DEFAULT_MAX_SIZE = 512 << 20
+
+_TMP_PREFIX = ".tmp-"
+
+
+@functools.lru_cache(maxsize=None)
+def generatorVersion():
+    """
+    Hachage du code source du générateur: toute modification du générateur
+    invalide les constructions en cache
+    """
+    digest = hashlib.sha256()
+    package = os.path.dirname(netlist2C.__file__)
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(package, name), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def cacheKey(netlist_string, **options):
+    """
+    Clef de la construction de `netlist_string` avec les `options` (des
+    valeurs sérialisables en JSON)
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            {"generator": generatorVersion(), "options": options}, sort_keys=True
+        ).encode()
+    )
+    digest.update(b"\0")
+    digest.update(netlist_string.encode())
+    return digest.hexdigest()[:32]
+
+
+def _size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class BuildCache:
+    """
+    Cache de constructions dans `directory`, limité à `max_size` octets
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        if directory is None:
+            directory = os.path.join(utils.getCacheDir(), "builds")
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Renvoie le dossier de la construction `key`, ou `None` si elle n'est
+        pas dans le cache
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def build(self, key, builder):
+        """
+        Renvoie le dossier de la construction `key`, en la faisant si elle
+        n'est pas dans le cache: `builder` est appelé avec un dossier vide,
+        où il écrit les fichiers à garder. Si `builder` lève une exception,
+        rien n'est ajouté au cache
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=self.directory)
+        try:
+            builder(tmp)
+            # Le dossier n'apparaît dans le cache qu'une fois complet
+            try:
+                os.rename(tmp, self.path(key))
+            except OSError:
+                # Construite entre temps par un autre processus
+                if not os.path.isdir(self.path(key)):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=(key,))
+        return self.path(key)
+
+    def entries(self):
+        """
+        Liste des couples (clef, taille en octets) des constructions, de la
+        moins récemment utilisée à la plus récente
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if name.startswith(_TMP_PREFIX):
+                continue
+            try:
+                used = os.stat(self.path(name)).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((used, name))
+        entries.sort()
+        return [(key, _size(self.path(key))) for _, key in entries]
+
+    def evict(self, keep=()):
+        """
+        Supprime les constructions les moins récemment utilisées (sauf
+        celles de `keep`) jusqu'à ce que le cache tienne dans `max_size`.
+        Renvoie la liste des clefs supprimées
+        """
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        removed = []
+        for key, size in entries:
+            if total <= self.max_size:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def clear(self):
+        """
+        Vide le cache
+        """
+        for key, _ in self.entries():
+            shutil.rmtree(self.path(key), ignore_errors=True)
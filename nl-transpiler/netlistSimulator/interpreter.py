@@ -0,0 +1,601 @@
+"""
+Interpréteur de netlists en Python, qui ne nécessite pas de compilateur C:
+pour les machines sans `gcc`, et comme référence pour vérifier le code
+généré.
+
+La netlist est compilée une fois en un tableau d'instructions: chaque
+équation, dans l'ordre de `utils.getOrderedNetList`, reçoit un niveau (1 de
+plus que le plus haut niveau de ses dépendances, les entrées, les
+constantes et les registres étant au niveau 0), puis les instructions sont
+triées par niveau et par opération. Les instructions consécutives de même
+niveau et de même opération sont indépendantes: elles sont évaluées
+ensemble par une seule opération NumPy sur les lignes du tableau des
+valeurs des nappes.
+
+`Interpreter` a la même interface que `simulator.Simulator`. Avec `lanes`,
+il simule `lanes` instances indépendantes du circuit à la fois (une colonne
+du tableau des valeurs par instance): les entrées et les sorties ont alors
+une dimension de plus.
+
+Les valeurs des nappes sont toujours masquées à leur taille, alors que le
+code C peut garder des bits de poids fort sans effet sur les sorties: les
+sorties sont les mêmes, mais pas forcément les octets des registres et des
+RAMs dans `snapshot`, qui a sinon la disposition de la structure
+`State_netlist` du code C. Les points de reprise ont le format du module
+`netlist2C.checkpoint`, et peuvent être relus par le code C.
+
+Nécessite `numpy`.
+"""
+
+import copy
+import os
+import struct
+
+import numpy as np
+
+from . import records
+from .netlist2C import AST as ast
+from .netlist2C import checkpoint, generator, utils
+
+"""
+En-tête d'une trame de points de reprise (`CheckpointHeader_netlist`)
+"""
+_HEADER = struct.Struct("=IIQQQQ")
+_PAGE_ID = struct.Struct("=II")
+
+# Opérations du tableau d'instructions
+_NOT, _AND, _OR, _XOR, _NAND, _NXOR, _MUX, _CONCAT, _EXTRACT, _REG, _RAM, _ROM = range(
+    12
+)
+_OPS = {
+    ast.Exprs.NOT: _NOT,
+    ast.Exprs.AND: _AND,
+    ast.Exprs.OR: _OR,
+    ast.Exprs.XOR: _XOR,
+    ast.Exprs.NAND: _NAND,
+    ast.Exprs.NXOR: _NXOR,
+    ast.Exprs.MUX: _MUX,
+    ast.Exprs.CONCAT: _CONCAT,
+    ast.Exprs.SNIP: _EXTRACT,
+    ast.Exprs.SLICE: _EXTRACT,
+    ast.Exprs.SELECT: _EXTRACT,
+    ast.Exprs.COPY: _EXTRACT,
+    ast.Exprs.REG: _REG,
+    ast.Exprs.RAM: _RAM,
+    ast.Exprs.ROM: _ROM,
+}
+
+"""
+Tableau d'instructions: l'opération, la ligne du résultat et celles des
+arguments dans le tableau des valeurs, et un décalage et un masque. Pour
+`_REG`, `a` est le numéro du registre, pour `_RAM` et `_ROM`, `b` est le
+numéro de la mémoire
+"""
+INSTRUCTION_DTYPE = np.dtype(
+    [
+        ("level", np.int64),
+        ("op", np.int64),
+        ("dst", np.int64),
+        ("a", np.int64),
+        ("b", np.int64),
+        ("c", np.int64),
+        ("shift", np.uint64),
+        ("mask", np.uint64),
+    ]
+)
+
+
+def _mask(length):
+    return (1 << length) - 1
+
+
+def _ctype(length):
+    return np.dtype(utils.cTypeFromBusSize(length).value[:-2])
+
+
+def _instruction(expr, dst, row):
+    """
+    Champs `(op, dst, a, b, c, shift, mask)` de l'instruction qui calcule
+    `expr` dans la ligne `dst`. `row` donne la ligne d'un argument
+    """
+    a = [row(arg) for arg in expr.args] + [0] * (3 - len(expr.args))
+    length = expr.out_length
+    match expr.type:
+        case ast.Exprs.CONCAT:
+            return (_CONCAT, dst, a[0], a[1], 0, expr.args[0].length, 0)
+        case ast.Exprs.SNIP | ast.Exprs.SLICE:
+            return (_EXTRACT, dst, a[0], 0, 0, expr.static_args[0], _mask(length))
+        case ast.Exprs.SELECT:
+            return (_EXTRACT, dst, a[0], 0, 0, expr.static_args[0], 1)
+        case ast.Exprs.COPY:
+            return (_EXTRACT, dst, a[0], 0, 0, 0, _mask(length))
+        case _:
+            return (_OPS[expr.type], dst, a[0], a[1], a[2], 0, _mask(length))
+
+
+class Interpreter:
+    """
+    Interpréteur de la netlist `netlist_string`, avec l'interface de
+    `simulator.Simulator`. `parser_algorithm` et `optimize` sont ceux de
+    `transpile2CFiles`. Avec `lanes`, simule `lanes` instances indépendantes
+    à la fois: les tableaux d'entrées et de sorties ont la forme
+    `(n_cycles, lanes)`.
+    """
+
+    def __init__(
+        self, netlist_string, lanes=None, parser_algorithm="lalr", optimize=None
+    ):
+        netlist = generator.getAST(netlist_string, parser_algorithm)
+        generator.optimizeNetList(netlist, optimize)
+        ordered_eqns = utils.getOrderedNetList(netlist)
+        self.lanes = lanes
+        inputs = sorted(netlist.inputs, key=lambda x: x.label)
+        outputs = sorted(netlist.outputs, key=lambda x: x.label)
+        self.input_dtype = records.structDtype((v.label, v.length) for v in inputs)
+        self.output_dtype = records.structDtype((v.label, v.length) for v in outputs)
+
+        # Lignes du tableau des valeurs: entrées, équations puis constantes
+        rows = {}
+        for v in inputs:
+            rows[v.label] = len(rows)
+        for eq in ordered_eqns:
+            rows[eq.var.label] = len(rows)
+        constants = {}
+
+        def row(arg):
+            if isinstance(arg, ast.Var):
+                return rows[arg.label]
+            value = arg.value & _mask(arg.length)
+            if value not in constants:
+                constants[value] = len(rows) + len(constants)
+            return constants[value]
+
+        # Variables d'état, dans l'ordre de la structure `State_netlist`
+        self._states = []
+        self._regs = []  # (nom, ligne de l'argument, taille)
+        self._rams = []  # (état, lignes des arguments, taille des mots)
+        self.roms = {}
+        self._rom_labels = []
+        levels = {}
+        program = []
+        for eq in ordered_eqns:
+            expr = eq.expr
+            dst = rows[eq.var.label]
+            levels[eq.var.label] = 1 + max(
+                (levels.get(v.label, 0) for v in expr.getDeps()), default=-1
+            )
+            fields = _instruction(expr, dst, row)
+            match expr.type:
+                case ast.Exprs.REG:
+                    name = f"REG_{eq.var.label}"
+                    self._states.append(
+                        (utils.cTypeFromBusSize(expr.args[0].length).value, name, None)
+                    )
+                    fields = (_REG, dst, len(self._regs), 0, 0, 0, 0)
+                    self._regs.append((name, row(expr.args[0]), expr.args[0].length))
+                case ast.Exprs.RAM:
+                    state = (
+                        utils.cTypeFromBusSize(expr.static_args[1]).value,
+                        f"RAM_{eq.var.label}",
+                        expr.static_args[0],
+                    )
+                    self._states.append(state)
+                    fields = fields[:3] + (len(self._rams),) + fields[4:]
+                    self._rams.append(
+                        (state, [row(arg) for arg in expr.args], expr.static_args[1])
+                    )
+                case ast.Exprs.ROM:
+                    fields = fields[:3] + (len(self._rom_labels),) + fields[4:]
+                    label = eq.var.label
+                    self._rom_labels.append(label)
+                    self.roms[label] = np.zeros(
+                        1 << expr.static_args[0], dtype=_ctype(expr.static_args[1])
+                    )
+            program.append((levels[eq.var.label],) + fields)
+        self.roms = dict(sorted(self.roms.items()))
+
+        # Le tableau d'instructions, trié par niveau puis par opération, et
+        # ses blocs d'instructions évaluées ensemble
+        self.program = np.array(program, dtype=INSTRUCTION_DTYPE)
+        self.program.sort(order=["level", "op"], kind="stable")
+        bounds = np.flatnonzero(
+            (np.diff(self.program["level"]) != 0) | (np.diff(self.program["op"]) != 0)
+        )
+        self._blocks = []
+        for block in np.split(self.program, bounds + 1):
+            if len(block):
+                self._blocks.append(
+                    (
+                        int(block["op"][0]),
+                        block["dst"],
+                        block["a"],
+                        block["b"],
+                        block["c"],
+                        block["shift"][:, None],
+                        block["mask"][:, None],
+                    )
+                )
+
+        n_lanes = lanes or 1
+        self._values = np.zeros((len(rows) + len(constants), n_lanes), dtype=np.uint64)
+        self._values[len(rows) :] = np.array(list(constants), dtype=np.uint64)[:, None]
+        self._inputs = [(v.label, rows[v.label], _mask(v.length)) for v in inputs]
+        self._outputs = [(v.label, rows[v.label]) for v in outputs]
+        self._output_sizes = dict((v.label, v.length) for v in outputs)
+        self._layout = int(checkpoint.layoutDigest(self._states), 16)
+
+        # Même disposition que `State_netlist`
+        fields = [("cycle", np.uint64)]
+        for t, name, addr_size in self._states:
+            t = np.dtype(t[:-2])
+            if addr_size is None:
+                fields.append((name, t))
+            else:
+                fields.append((name, t, (1 << addr_size,)))
+                fields.append(
+                    (
+                        checkpoint.dirtyName(name),
+                        np.uint8,
+                        (checkpoint.pageCount(addr_size),),
+                    )
+                )
+        self.state_dtype = np.dtype(fields, align=True)
+        self.state_size = self.state_dtype.itemsize * n_lanes
+        self._state = np.zeros(n_lanes, dtype=self.state_dtype)
+        self._reg_values = np.zeros((len(self._regs), n_lanes), dtype=np.uint64)
+        self._reg_rows = np.array([r for _, r, _ in self._regs], dtype=np.int64)
+        self._checkpoint_path = None
+        self._auto = None
+
+    def clone(self):
+        """
+        Renvoie un nouvel `Interpreter` de la même netlist, dont l'état est
+        une copie de celui-ci. Les ROMs sont partagées
+        """
+        other = copy.copy(self)
+        other._state = self._state.copy()
+        other._reg_values = self._reg_values.copy()
+        other._values = self._values.copy()
+        other._checkpoint_path = None
+        other._auto = None
+        return other
+
+    def loadRom(self, label, values):
+        """
+        Copie `values` au début de la ROM `label`, le reste est mis à 0
+        """
+        rom = self.roms[label]
+        values = np.asarray(values)
+        if len(values) > len(rom):
+            raise ValueError(
+                f"ROM {label} has {len(rom)} words, got {len(values)} values"
+            )
+        rom[: len(values)] = values
+        rom[len(values) :] = 0
+
+    def invalidate(self):
+        """
+        Pour la compatibilité avec `simulator.Simulator`: rien n'est gardé
+        d'un cycle à l'autre à part l'état
+        """
+
+    def inputs(self, n_cycles, **values):
+        """
+        Renvoie un tableau d'entrées pour `n_cycles` cycles (de forme
+        `(n_cycles, lanes)` avec `lanes`), les nappes données en argument
+        nommé étant remplies avec la valeur (ou le tableau de valeurs)
+        correspondante, les autres à 0
+        """
+        if self.lanes is None:
+            return records.packRecords(self.input_dtype, n_cycles, **values)
+        inputs = np.zeros((n_cycles, self.lanes), dtype=self.input_dtype)
+        for label, v in values.items():
+            inputs[label] = v
+        return inputs
+
+    def _shape(self, n_cycles):
+        return (n_cycles,) if self.lanes is None else (n_cycles, self.lanes)
+
+    def _cycle(self, inputs, out):
+        """
+        Simule un cycle: `inputs` et `out` sont les entrées et les sorties
+        du cycle (un enregistrement, ou un tableau d'un enregistrement par
+        instance)
+        """
+        v = self._values
+        for label, r, mask in self._inputs:
+            v[r] = inputs[label] & mask
+        for op, dst, a, b, c, shift, mask in self._blocks:
+            match op:
+                case 0:  # _NOT
+                    v[dst] = ~v[a] & mask
+                case 1:  # _AND
+                    v[dst] = v[a] & v[b]
+                case 2:  # _OR
+                    v[dst] = v[a] | v[b]
+                case 3:  # _XOR
+                    v[dst] = v[a] ^ v[b]
+                case 4:  # _NAND
+                    v[dst] = ~(v[a] & v[b]) & mask
+                case 5:  # _NXOR
+                    v[dst] = ~(v[a] ^ v[b]) & mask
+                case 6:  # _MUX
+                    v[dst] = np.where(v[a] == 0, v[b], v[c])
+                case 7:  # _CONCAT
+                    v[dst] = (v[b] << shift) | v[a]
+                case 8:  # _EXTRACT
+                    v[dst] = (v[a] >> shift) & mask
+                case 9:  # _REG
+                    v[dst] = self._reg_values[a]
+                case 10:  # _RAM
+                    for d, ra, k, m in zip(dst, a, b, mask[:, 0]):
+                        ram = self._state[self._rams[k][0][1]]
+                        v[d] = ram[np.arange(len(ram)), v[ra].astype(np.intp)] & m
+                case 11:  # _ROM
+                    for d, ra, k, m in zip(dst, a, b, mask[:, 0]):
+                        rom = self.roms[self._rom_labels[k]]
+                        v[d] = rom[v[ra].astype(np.intp)].astype(np.uint64) & m
+
+        # Mises à jour de fin de cycle, avec les valeurs du cycle
+        self._reg_values[:] = v[self._reg_rows]
+        for (_, name, addr_size), (_, we, wa, wd), word_size in self._rams:
+            # Comme dans le code C, la RAM est écrite si un des bits de
+            # l'écriture (masqué à sa taille) est à 1
+            lanes = np.flatnonzero(v[we])
+            if len(lanes):
+                address = v[wa][lanes].astype(np.intp)
+                self._state[name][lanes, address] = v[wd][lanes] & _mask(word_size)
+                self._state[checkpoint.dirtyName(name)][
+                    lanes, address >> checkpoint.PAGE_BITS
+                ] = 1
+        self._state["cycle"] += 1
+        for label, r in self._outputs:
+            out[label] = v[r] if self.lanes is not None else v[r][0]
+
+    def step(self, n_cycles, inputs=None, out=None):
+        """
+        Simule `n_cycles` cycles et renvoie le tableau des sorties de chaque
+        cycle (de dtype `output_dtype`). Voir `simulator.Simulator.step`
+        """
+        if inputs is None:
+            inputs = np.zeros(self._shape(n_cycles), dtype=self.input_dtype)
+        inputs = np.asarray(inputs, dtype=self.input_dtype)
+        if len(inputs) < n_cycles:
+            raise ValueError(f"{n_cycles} cycles requested, got {len(inputs)} inputs")
+        if out is None:
+            out = np.empty(self._shape(n_cycles), dtype=self.output_dtype)
+        elif out.dtype != self.output_dtype or len(out) < n_cycles:
+            raise ValueError(
+                "out must be an array of output_dtype with at least n_cycles elements"
+            )
+        for i in range(n_cycles):
+            self._cycle(inputs[i], out[i])
+            if self._auto is not None and self.cycle % self._auto[1] == 0:
+                self.checkpoint(self._auto[0], append=True)
+        return out
+
+    def run(self, n_cycles, input=None, until=None, every=None, callback=None):
+        """
+        Simule au plus `n_cycles` cycles avec la même entrée à chaque cycle,
+        et renvoie le couple (nombre de cycles simulés, sorties du dernier
+        cycle). Voir `simulator.Simulator.run`. Avec `lanes`, la simulation
+        s'arrête quand une des conditions de `until` est vraie pour toutes
+        les instances.
+        """
+        if input is None:
+            input = {}
+        if isinstance(input, dict):
+            input = self.inputs(1, **input)[0]
+        else:
+            input = np.asarray(input, dtype=self.input_dtype)
+        output = np.zeros(self._shape(1), dtype=self.output_dtype)[0]
+
+        if isinstance(until, dict):
+            until = [until]
+        for values in until or ():
+            for label in values:
+                if label not in self._output_sizes:
+                    raise ValueError(f"Unknown output {label}")
+
+        def stopped():
+            return any(
+                np.all(
+                    [
+                        output[label] == value & _mask(self._output_sizes[label])
+                        for label, value in values.items()
+                    ]
+                )
+                for values in until or ()
+            )
+
+        cycles = 0
+        while cycles < n_cycles:
+            self._cycle(input, output)
+            cycles += 1
+            if callback is not None and cycles % (every or 1) == 0:
+                if callback(cycles, output.copy()):
+                    break
+            if stopped():
+                break
+            if self._auto is not None and self.cycle % self._auto[1] == 0:
+                self.checkpoint(self._auto[0], append=True)
+        return cycles, output
+
+    def reset(self):
+        """
+        Remet les registres et les RAMs à 0
+        """
+        self._state[...] = 0
+        self._reg_values[...] = 0
+        self._checkpoint_path = None
+
+    def _sync(self):
+        """
+        Recopie les registres dans `_state`
+        """
+        for k, (name, _, _) in enumerate(self._regs):
+            self._state[name] = self._reg_values[k]
+
+    def _load(self):
+        """
+        Relit les registres de `_state`, masqués à leur taille: le code C
+        peut y laisser des bits de poids fort
+        """
+        for k, (name, _, length) in enumerate(self._regs):
+            self._reg_values[k] = self._state[name] & np.uint64(_mask(length))
+
+    def snapshot(self):
+        """
+        Renvoie une copie de l'état sous forme d'un tableau d'octets, avec la
+        disposition de la structure `State_netlist` (une structure par
+        instance avec `lanes`)
+        """
+        self._sync()
+        return self._state.view(np.uint8).copy()
+
+    def restore(self, state):
+        """
+        Restaure un état renvoyé par `snapshot`
+        """
+        state = np.ascontiguousarray(state, dtype=np.uint8)
+        if state.size != self.state_size:
+            raise ValueError(
+                f"State has {self.state_size} bytes, got {state.size} bytes"
+            )
+        self._state[...] = state.view(self.state_dtype)
+        self._load()
+        self._checkpoint_path = None
+
+    @property
+    def cycle(self):
+        """
+        Nombre de cycles simulés depuis la création ou la remise à 0 de
+        l'état (restauré par `restore` et `loadCheckpoint`)
+        """
+        return int(self._state["cycle"][0])
+
+    def _single(self):
+        if self.lanes is not None:
+            raise ValueError("Checkpoints need a single instance (lanes=None)")
+        self._sync()
+        return self._state[0]
+
+    def checkpoint(self, path, append=False):
+        """
+        Écrit l'état dans le fichier de points de reprise `path`. Voir
+        `simulator.Simulator.checkpoint`
+        """
+        state = self._single()
+        # Comme le code C: une trame ajoutée à un fichier vide est complète
+        full = (
+            not append
+            or path != self._checkpoint_path
+            or not os.path.exists(path)
+            or os.path.getsize(path) == 0
+        )
+        body = bytearray()
+        for _, name, addr_size in self._states:
+            if addr_size is None:
+                body += state[name].tobytes()
+        rams = [state for state in self._states if state[2] is not None]
+        n_pages = 0
+        for k, (_, name, addr_size) in enumerate(rams):
+            words = 1 << min(addr_size, checkpoint.PAGE_BITS)
+            pages = state[name].reshape(-1, words)
+            if full:
+                needed = np.flatnonzero(pages.any(axis=1))
+            else:
+                needed = np.flatnonzero(state[checkpoint.dirtyName(name)])
+            for p in needed:
+                body += _PAGE_ID.pack(k, p) + pages[p].tobytes()
+            n_pages += len(needed)
+        frame = (
+            _HEADER.pack(
+                checkpoint.MAGIC,
+                full,
+                self._layout,
+                int(state["cycle"]),
+                n_pages,
+                len(body),
+            )
+            + body
+        )
+        if append:
+            with open(path, "ab") as f:
+                f.write(frame)
+        else:
+            tmp = f"{path}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(frame)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        for _, name, addr_size in rams:
+            state[checkpoint.dirtyName(name)] = 0
+        self._checkpoint_path = path
+
+    def loadCheckpoint(self, path, frames=None):
+        """
+        Restaure l'état depuis le fichier de points de reprise `path`. Voir
+        `simulator.Simulator.loadCheckpoint`
+        """
+        if frames is not None and frames < 1:
+            raise ValueError("At least one frame must be loaded")
+        state = self._single()
+        with open(path, "rb") as f:
+            data = f.read()
+        rams = [state for state in self._states if state[2] is not None]
+        offset = 0
+        applied = 0
+        while frames is None or applied < frames:
+            if len(data) - offset < _HEADER.size:
+                break
+            magic, full, layout, cycle, n_pages, size = _HEADER.unpack_from(
+                data, offset
+            )
+            if magic != checkpoint.MAGIC or layout != self._layout:
+                raise ValueError(f"{path} is not a checkpoint of this netlist")
+            offset += _HEADER.size
+            if size > len(data) - offset:
+                # Trame tronquée par une interruption pendant l'écriture
+                break
+            if full:
+                self._state[...] = 0
+            state["cycle"] = cycle
+            for _, name, addr_size in self._states:
+                if addr_size is None:
+                    t = state[name].dtype
+                    state[name] = np.frombuffer(data, t, 1, offset)[0]
+                    offset += t.itemsize
+            for _ in range(n_pages):
+                k, p = _PAGE_ID.unpack_from(data, offset)
+                offset += _PAGE_ID.size
+                if k >= len(rams) or p >= checkpoint.pageCount(rams[k][2]):
+                    raise ValueError(f"{path} is not a checkpoint of this netlist")
+                name, addr_size = rams[k][1:]
+                words = 1 << min(addr_size, checkpoint.PAGE_BITS)
+                page = np.frombuffer(data, state[name].dtype, words, offset)
+                state[name][p * words : (p + 1) * words] = page
+                offset += page.nbytes
+            applied += 1
+        for _, name, _ in rams:
+            state[checkpoint.dirtyName(name)] = 0
+        self._load()
+        self._checkpoint_path = path if frames is None else None
+        return applied
+
+    def autoCheckpoint(self, path, every):
+        """
+        Ajoute un point de reprise au fichier `path` tous les `every` cycles
+        pendant `step` et `run`. Voir `simulator.Simulator.autoCheckpoint`
+        """
+        if every is None:
+            self._auto = None
+            return
+        if every < 1:
+            raise ValueError("The checkpoint interval must be positive")
+        self.checkpoint(path, append=True)
+        self._auto = (path, every)
@@ -0,0 +1,34 @@
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "%headername%"
+
+int main(int argc, char *argv[]) {
+	Output_netlist output;
+	Input_netlist input;
+	Rom_netlist rom;
+	if (argc > 1) {
+		int mapped = map_rom(argv[1], &rom);
+		if (mapped < 0)
+			return 1;
+		if (mapped == 0) {
+			FILE * fp = fopen(argv[1], "r");
+			if(fp == NULL) {
+				printf("ROM file not found");
+				return 1;
+			}
+			fscan_rom(fp, &rom);
+		}
+	} else {
+		printf("ROM file not provided. If there is a ROM component in the netlist, the program may segfault. Specify /dev/zero as ROM file to disable this warning");
+	}
+	State_netlist *state = netlist_create();
+	while (1) {
+		if (!prompt_netlist_input(&input))
+			return 0;
+		simulateNetlist(state, &input, &output, &rom);
+		print_netlist_output(&output);
+	};
+	return 0;
+};
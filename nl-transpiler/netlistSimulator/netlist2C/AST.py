@@ -3,8 +3,14 @@ This module provides objects to represent a NetList and methods to check bus
 length coherence (and also size inference
 
 Objects are thought as non-mutable but this is not enforced
+
+Les équations d'une `NetList` sont rangées en colonnes dans une table
+`Equations` (tableaux d'entiers, nappes désignées par leur numéro et
+constantes partagées) ; les objets `Eq` et `Expression` qu'on en lit sont
+construits à la demande.
 """
 
+from array import array
 from enum import Enum
 
 
@@ -41,6 +47,8 @@ class Expression:
     Représente une instruction de la netlist
     """
 
+    __slots__ = ("args", "static_args", "type", "out_length")
+
     def __init__(self, instruction, args, sargs):
         self.args = args
         self.static_args = sargs  # Args that must be explicitely static
@@ -48,6 +56,19 @@ class Expression:
         self.out_length = None
         self.checkAndType()
 
+    @classmethod
+    def view(cls, instruction, args, sargs, out_length):
+        """
+        Construit une expression déjà vérifiée (lue dans une table
+        `Equations`), sans refaire le typage
+        """
+        e = cls.__new__(cls)
+        e.args = args
+        e.static_args = sargs
+        e.type = instruction
+        e.out_length = out_length
+        return e
+
     def checkAndType(self):
         s = get_signature(self.type)
         self._checkArgsNumber(s[0])
@@ -62,6 +83,7 @@ class Expression:
                     )
                 self.out_length = self.args[0].length
             case Exprs.MUX:
+                _typeConstant(self.args[0], max(1, _constantWidth(self.args[0])))
                 if not equalLengthTyping(self.args[1], self.args[2]):
                     raise WrongBusLength(
                         f"{self.type} keyword takes two buses of same size as last two arguments (provided: {self.args[1].label}[{self.args[1].length}] and {self.args[2].label}[{self.args[2].length}]"
@@ -80,12 +102,17 @@ class Expression:
                     case _:
                         raise Exception("Not reachable")
             case Exprs.ROM:
+                _typeConstant(self.args[0], self.static_args[0])
                 if self.args[0].length != self.static_args[0]:
                     raise WrongBusLength(
                         f"ROM read address doesn't have the right size (expected {self.static_args[0]})"
                     )
                 self.out_length = self.static_args[1]
             case Exprs.RAM:
+                _typeConstant(self.args[0], self.static_args[0])
+                _typeConstant(self.args[1], 1)
+                _typeConstant(self.args[2], self.static_args[0])
+                _typeConstant(self.args[3], self.static_args[1])
                 if self.args[0].length != self.static_args[0]:
                     raise WrongBusLength(
                         f"RAM read address doesn't have the right size (expected {self.static_args[0]}, provided {self.args[1].length}-bits-long bus)"
@@ -125,13 +152,17 @@ class Expression:
                 raise NotImplementedError(f"Check for {self.type} not implemented")
 
     def getDeps(self):
+        """
+        Renvoie les nappes dont dépend l'expression pendant le cycle courant,
+        sans doublons et dans l'ordre des arguments
+        """
         match self.type:
             case Exprs.REG:
-                return set()
+                return ()
             case Exprs.RAM:
-                return set((self.args[0],))
+                return tuple(a for a in self.args[:1] if isinstance(a, Var))
             case _:
-                return set(i for i in self.args if isinstance(i, Var))
+                return tuple(dict.fromkeys(i for i in self.args if isinstance(i, Var)))
 
     def _checkArgsNumber(self, n):
         if len(self.args) != n:
@@ -151,6 +182,8 @@ class Arg:
     Représente l'argument d'une instruction
     """
 
+    __slots__ = ("length",)
+
     def __init__(self, length):
         if length > 64:
             raise BusTooLong("Bus size must be <= 64")
@@ -162,6 +195,8 @@ class Cst(Arg):
     Représente une nappe de fil de valeur fixée
     """
 
+    __slots__ = ("value", "label")
+
     def __init__(self, length, value):
         self.value = value
         self.label = hex(value)
@@ -173,6 +208,8 @@ class Var(Arg):
     Représente une nappe de fils
     """
 
+    __slots__ = ("label",)
+
     def __init__(self, length, label):
         self.label = label
         super().__init__(length)
@@ -183,11 +220,23 @@ class Eq:
     Représente une instruction de la netlist
     """
 
+    __slots__ = ("var", "expr")
+
     def __init__(self, var, expr):
         self.var = var
         self.expr = expr
         self.check()
 
+    @classmethod
+    def view(cls, var, expr):
+        """
+        Construit une équation déjà vérifiée, sans refaire le typage
+        """
+        eq = cls.__new__(cls)
+        eq.var = var
+        eq.expr = expr
+        return eq
+
     def check(self):
         """
         Essaie d'inférer le type des arguments d'une instruction et vérifie que l'instruction est bien typée
@@ -210,16 +259,131 @@ class Eq:
             )
 
 
+class Equations:
+    """
+    Table compacte des équations d'une netlist, en colonnes :
+     - `ops`: numéro de l'instruction (`Exprs`) de chaque équation
+     - `outs`: numéro de la nappe définie par chaque équation
+     - `starts`: début des arguments de chaque équation dans `data`
+     - `data`: arguments statiques puis arguments de chaque équation, leur
+       nombre est donné par `SIGNATURES`. Un argument `i >= 0` est la nappe
+       `wires[i]`, un argument `i < 0` la constante `constants[-i - 1]`
+
+    Chaque nappe (objet `Var`) a un seul numéro, et les constantes sont
+    partagées : deux constantes de même taille et de même valeur sont le même
+    objet `Cst`.
+
+    La table se comporte comme une séquence d'objets `Eq`, dans l'ordre
+    d'ajout. Ces objets sont construits à chaque lecture : modifier une `Eq`
+    lue ne modifie pas la table.
+    """
+
+    __slots__ = (
+        "wires",
+        "constants",
+        "ops",
+        "outs",
+        "starts",
+        "data",
+        "_wire_ids",
+        "_constant_ids",
+    )
+
+    def __init__(self, eqs=()):
+        self.wires = []  # numéro -> Var
+        self.constants = []  # -numéro - 1 -> Cst
+        self.ops = array("B")
+        self.outs = array("i")
+        self.starts = array("q")
+        self.data = array("i")
+        self._wire_ids = {}  # Var -> numéro
+        self._constant_ids = {}  # (taille, valeur) -> numéro
+        for eq in eqs:
+            self.append(eq)
+
+    def wireId(self, var):
+        """
+        Numéro de la nappe `var`, qui est ajoutée à la table si besoin
+        """
+        i = self._wire_ids.get(var)
+        if i is None:
+            i = self._wire_ids[var] = len(self.wires)
+            self.wires.append(var)
+        return i
+
+    def _argId(self, arg):
+        if isinstance(arg, Var):
+            return self.wireId(arg)
+        key = (arg.length, arg.value)
+        i = self._constant_ids.get(key)
+        if i is None:
+            i = self._constant_ids[key] = len(self.constants)
+            self.constants.append(arg)
+        return -i - 1
+
+    def _arg(self, i):
+        return self.wires[i] if i >= 0 else self.constants[-i - 1]
+
+    def append(self, eq):
+        """
+        Ajoute l'équation (vérifiée) `eq` à la table
+        """
+        expr = eq.expr
+        self.ops.append(expr.type.value)
+        self.outs.append(self.wireId(eq.var))
+        self.starts.append(len(self.data))
+        self.data.extend(expr.static_args)
+        self.data.extend(self._argId(a) for a in expr.args)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, k):
+        t = _EXPRS[self.ops[k]]
+        n_args, n_sargs = SIGNATURES[t]
+        start = self.starts[k]
+        data = self.data
+        var = self.wires[self.outs[k]]
+        expr = Expression.view(
+            t,
+            [self._arg(i) for i in data[start + n_sargs : start + n_sargs + n_args]],
+            data[start : start + n_sargs].tolist(),
+            var.length,
+        )
+        return Eq.view(var, expr)
+
+    def __iter__(self):
+        for k in range(len(self.ops)):
+            yield self[k]
+
+
 class NetList:
     """
     Représente une netlist
+
+    Les entrées, les sorties et les nappes déclarées sont des listes (sans
+    doublons, dans l'ordre de la netlist) et les équations une table
+    `Equations`. On peut affecter à `equations` n'importe quel itérable
+    d'objets `Eq`, il est rangé dans une nouvelle table.
     """
 
+    __slots__ = ("inputs", "outputs", "vars", "_equations")
+
     def __init__(self, inputs, outputs, var, eqs):
-        self.inputs = set(inputs)
-        self.outputs = set(outputs)
-        self.vars = set(var)
-        self.equations = set(eqs)
+        self.inputs = list(dict.fromkeys(inputs))
+        self.outputs = list(dict.fromkeys(outputs))
+        self.vars = list(dict.fromkeys(var))
+        self.equations = eqs
+
+    @property
+    def equations(self):
+        return self._equations
+
+    @equations.setter
+    def equations(self, eqs):
+        if not isinstance(eqs, Equations):
+            eqs = Equations(eqs)
+        self._equations = eqs
 
 
 class Exprs(Enum):
@@ -244,6 +408,8 @@ class Exprs(Enum):
     COPY = 14
 
 
+_EXPRS = {e.value: e for e in Exprs}
+
 """
 Dictionnaire qui liste les arguments attendus par chaque expression
 sous la forme `(x, y)` où
@@ -310,6 +476,25 @@ def lengthSumTyping(a, b, tot):
     return binTyping(a, b, diff, diff)
 
 
+def _constantWidth(arg):
+    return arg.value.bit_length() if isinstance(arg, Cst) else 0
+
+
+def _typeConstant(arg, length):
+    """
+    Donne la taille `length` de son emplacement à l'argument `arg` si c'est
+    une constante dont la taille n'est pas encore connue (les constantes de
+    la netlist n'ont pas de taille propre)
+    """
+    if not isinstance(arg, Cst) or arg.length != -1:
+        return
+    if arg.value >> length:
+        raise BusTooShort(
+            f"Constant {arg.label} doesn't fit in a {length}-bit argument"
+        )
+    arg.length = length
+
+
 def numberOfTypedArgs(*a):
     n = 0
     for i in a:
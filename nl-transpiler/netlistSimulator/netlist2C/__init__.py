@@ -1,3 +1,17 @@
-from .generator import transpile2C
+from .batch import transpile2CBatch, transpile2CBatchFiles
+from .chunks import transpile2CChunks
+from .events import transpile2CEvents
+from .generator import transpile2C, transpile2CFiles
+from .profiling import Profile
+from .threads import transpile2CThreads
 
-__all__ = ["transpile2C"]
+__all__ = [
+    "transpile2C",
+    "transpile2CFiles",
+    "transpile2CChunks",
+    "transpile2CEvents",
+    "transpile2CThreads",
+    "transpile2CBatch",
+    "transpile2CBatchFiles",
+    "Profile",
+]
@@ -0,0 +1,421 @@
+"""
+Génération d'un simulateur "par lots": la fonction générée simule en une seule
+passe `lanes` instances indépendantes de la netlist (le même circuit avec des
+entrées différentes).
+
+Les nappes d'un seul fil sont codées en tranches de bits ("bit-slicing"): le
+fil de l'instance `l` est le bit `l % 64` du mot `l / 64` d'un tableau de
+`uint64_t`. Les portes logiques entre fils simples traitent ainsi 64 instances
+par opération. Les nappes plus larges sont stockées dans un tableau avec une
+case par instance ("struct of arrays"). Les registres et les RAMs ont un état
+par instance, les ROMs sont partagées.
+
+L'état de toutes les instances est dans la structure `State_{short_name}_batch`
+(`{short_name}_batch_create`, `_reset`, `_clone` et `_free`), comme
+`State_{short_name}` pour le mode par défaut: plusieurs lots peuvent être
+simulés en même temps. Elle contient aussi les tableaux des nappes
+intermédiaires (`WIRE_{label}`), trop gros pour la pile quand il y a beaucoup
+d'instances.
+"""
+
+import io
+import shutil
+import tempfile
+
+from . import AST as ast
+from . import generator, profiling, utils
+
+"""
+Instructions qui, entre fils simples, se calculent directement sur des mots de
+64 instances
+"""
+BITWISE = set(
+    (
+        ast.Exprs.NOT,
+        ast.Exprs.AND,
+        ast.Exprs.OR,
+        ast.Exprs.XOR,
+        ast.Exprs.NAND,
+        ast.Exprs.NXOR,
+        ast.Exprs.COPY,
+        ast.Exprs.MUX,
+    )
+)
+
+
+def _isSliced(arg):
+    return arg.length == 1
+
+
+def _arrayType(arg):
+    """
+    Type C du tableau représentant la nappe `arg`, et sa taille: la constante
+    `{short_name}_WORDS` ou `{short_name}_LANES`, dont on donne le suffixe
+    """
+    if _isSliced(arg):
+        return "uint64_t", "WORDS"
+    return utils.cTypeFromBusSize(arg.length).value, "LANES"
+
+
+def _field(name, arg, short_name):
+    """
+    Déclaration du champ `name` d'une structure, un tableau pour la nappe
+    `arg`
+    """
+    t, size = _arrayType(arg)
+    return f"\t{t} {name}[{short_name}_{size}];\n"
+
+
+def _declare(var):
+    t, _ = _arrayType(var)
+    return f"\t{t} *{var.label} = state->WIRE_{var.label};\n"
+
+
+def _wordRef(arg):
+    """
+    Mot de 64 instances d'un fil simple, dans une boucle sur `_word`
+    """
+    if isinstance(arg, ast.Cst):
+        return "UINT64_MAX" if arg.value & 1 else "(uint64_t) 0"
+    return f"{arg.label}[_word]"
+
+
+def _laneRef(arg):
+    """
+    Valeur d'une nappe pour l'instance `_lane`
+    """
+    if isinstance(arg, ast.Cst):
+        return arg.label
+    if _isSliced(arg):
+        return f"(({arg.label}[_lane >> 6] >> (_lane & 63)) & 1)"
+    return f"{arg.label}[_lane]"
+
+
+def _perLane(var, rhs, short_name):
+    """
+    Boucle calculant `var` instance par instance à partir de l'expression
+    `rhs` (qui utilise `_laneRef`)
+    """
+    if _isSliced(var):
+        return (
+            f"\tfor (size_t _word = 0; _word < {short_name}_WORDS; _word++) {{\n"
+            "\t\tuint64_t _acc = 0;\n"
+            "\t\tfor (size_t _bit = 0; _bit < 64; _bit++) {\n"
+            "\t\t\tsize_t _lane = (_word << 6) | _bit;\n"
+            f"\t\t\t_acc |= (uint64_t) (({rhs}) & 1) << _bit;\n"
+            "\t\t}\n"
+            f"\t\t{var.label}[_word] = _acc;\n"
+            "\t}\n"
+        )
+    t = utils.cTypeFromBusSize(var.length).value
+    return (
+        f"\tfor (size_t _lane = 0; _lane < {short_name}_LANES; _lane++)\n"
+        f"\t\t{var.label}[_lane] = ({t}) (({rhs}) & {utils.cMask(var.length)});\n"
+    )
+
+
+def _getBatchExpr(eq, short_name):
+    """
+    Équivalent de `generator._getExpr` pour le mode par lots: renvoie un
+    quadruplet `(valeur, champs, mise à jour, rom)` où la valeur et la mise à
+    jour de fin de cycle sont du code C à écrire tel quel, et les champs sont
+    les déclarations des champs de `State_{short_name}_batch` utilisés par
+    l'instruction. `short_name` est le nom court de la netlist
+    """
+    expr = eq.expr
+    var = eq.var
+    wire = _field(f"WIRE_{var.label}", var, short_name)
+    if expr.type in BITWISE and all(_isSliced(i) for i in [var] + expr.args):
+        if expr.type == ast.Exprs.MUX:
+            s, a, b = (_wordRef(i) for i in expr.args)
+            rhs = f"(~{s} & {a}) | ({s} & {b})"
+        else:
+            rhs = generator._getCombinational(expr, _wordRef)
+        return (
+            _declare(var)
+            + f"\tfor (size_t _word = 0; _word < {short_name}_WORDS; _word++)\n"
+            + f"\t\t{var.label}[_word] = {rhs};\n",
+            wire,
+            "",
+            None,
+        )
+
+    rhs = generator._getCombinational(expr, _laneRef)
+    if rhs is not None:
+        return _declare(var) + _perLane(var, rhs, short_name), wire, "", None
+
+    match expr.type:
+        case ast.Exprs.REG:
+            _, size = _arrayType(expr.args[0])
+            reg = f"state->REG_{var.label}"
+            if isinstance(expr.args[0], ast.Cst):
+                value = _wordRef(expr.args[0]) if _isSliced(var) else expr.args[0].label
+                update = (
+                    f"\tfor (size_t _i = 0; _i < {short_name}_{size}; _i++)\n"
+                    f"\t\t{reg}[_i] = {value};\n"
+                )
+            else:
+                update = f"\tmemcpy({reg}, {expr.args[0].label}, sizeof {reg});\n"
+            return (
+                _declare(var) + f"\tmemcpy({var.label}, {reg}, sizeof {reg});\n",
+                wire + _field(f"REG_{var.label}", expr.args[0], short_name),
+                update,
+                None,
+            )
+        case ast.Exprs.RAM:
+            read_addr, write_enable, write_addr, data = (_laneRef(i) for i in expr.args)
+            ram = f"state->RAM_{var.label}"
+            t = utils.cTypeFromBusSize(expr.static_args[1]).value
+            return (
+                _declare(var)
+                + _perLane(
+                    var,
+                    f"{ram}[_lane][{read_addr} & {utils.cMask(expr.args[0].length)}]",
+                    short_name,
+                ),
+                wire
+                + f"\t{t} RAM_{var.label}[{short_name}_LANES][1 << {expr.static_args[0]}];\n",
+                f"\tfor (size_t _lane = 0; _lane < {short_name}_LANES; _lane++)\n"
+                f"\t\tif (({write_enable} & {utils.cMask(expr.args[1].length)}) != 0) {ram}[_lane][{write_addr} & {utils.cMask(expr.args[2].length)}] = {data};\n",
+                None,
+            )
+        case ast.Exprs.ROM:
+            label = var.label
+            return (
+                _declare(var)
+                + _perLane(
+                    var,
+                    f"(roms->{label})[{_laneRef(expr.args[0])} & {utils.cMask(expr.args[0].length)}]",
+                    short_name,
+                ),
+                wire,
+                "",
+                (label, expr.static_args[0], expr.static_args[1]),
+            )
+        case _:
+            raise NotImplementedError()
+
+
+def _get_batch_struct(varset, label):
+    prefix = "typedef struct {{\n"
+    content = ""
+    for i in sorted(varset, key=lambda x: x.label):
+        content += _field(i.label, i, "{short_name}")
+    suffix = f"}}}} {label};\n"
+    return prefix + content + suffix
+
+
+def _get_lane_accessors(inputs, outputs):
+    content = "void set_{short_name}_batch_input(Input_{short_name}_batch *batch, size_t lane, const Input_{short_name} *input) {{\n"
+    for i in inputs:
+        if _isSliced(i):
+            content += (
+                f"\tbatch->{i.label}[lane >> 6] = (batch->{i.label}[lane >> 6] & ~((uint64_t) 1 << (lane & 63)))"
+                f" | ((uint64_t) (input->{i.label} & 1) << (lane & 63));\n"
+            )
+        else:
+            content += f"\tbatch->{i.label}[lane] = input->{i.label};\n"
+    content += "}}\n"
+    content += "void get_{short_name}_batch_output(const Output_{short_name}_batch *batch, size_t lane, Output_{short_name} *output) {{\n"
+    for i in outputs:
+        if _isSliced(i):
+            content += f"\toutput->{i.label} = (batch->{i.label}[lane >> 6] >> (lane & 63)) & 1;\n"
+        else:
+            content += f"\toutput->{i.label} = batch->{i.label}[lane];\n"
+    content += "}}\n"
+    return content
+
+
+def _get_batch_state_api():
+    """
+    Fonctions de gestion de `State_{short_name}_batch`: allocation d'un état
+    à 0, remise à 0, copie et libération (voir `generator._get_state_api`)
+    """
+    return (
+        "State_{short_name}_batch *{short_name}_batch_create(void) {{\n"
+        "\treturn calloc(1, sizeof(State_{short_name}_batch));\n"
+        "}}\n"
+        "void {short_name}_batch_reset(State_{short_name}_batch *state) {{\n"
+        "\tmemset(state, 0, sizeof *state);\n"
+        "}}\n"
+        "State_{short_name}_batch *{short_name}_batch_clone(const State_{short_name}_batch *state) {{\n"
+        "\tState_{short_name}_batch *copy = malloc(sizeof *copy);\n"
+        "\tif (copy != NULL)\n"
+        "\t\tmemcpy(copy, state, sizeof *copy);\n"
+        "\treturn copy;\n"
+        "}}\n"
+        "void {short_name}_batch_free(State_{short_name}_batch *state) {{\n"
+        "\tfree(state);\n"
+        "}}\n"
+    )
+
+
+def transpile2CBatch(
+    netlist_string,
+    lanes=64,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    optimize=None,
+    profile=None,
+):
+    """
+    Équivalent de `transpile2C` pour le mode par lots: renvoie les fichiers
+    header et source de `transpile2CBatchFiles`, construits en mémoire, avec
+    les mêmes placeholders que `transpile2C`
+    """
+    h_file = io.StringIO()
+    c_file = io.StringIO()
+    transpile2CBatchFiles(
+        netlist_string,
+        h_file,
+        c_file,
+        generator._PLACEHOLDERS,
+        lanes,
+        helper_functions=helper_functions,
+        less_verbose=less_verbose,
+        parser_algorithm=parser_algorithm,
+        optimize=optimize,
+        profile=profile,
+    )
+    return (
+        generator._withPlaceholders(h_file.getvalue()),
+        generator._withPlaceholders(c_file.getvalue()),
+    )
+
+
+def transpile2CBatchFiles(
+    netlist_string,
+    h_file,
+    c_file,
+    names,
+    lanes=64,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    optimize=None,
+    profile=None,
+):
+    """
+    Équivalent de `transpile2CFiles` pour le mode par lots, avec `lanes`
+    instances simulées simultanément (un multiple de 64). Le code est écrit
+    au fur et à mesure dans les fichiers texte `h_file` et `c_file`, `names`
+    donne la valeur des noms `short_name`, `filename` et `functionName`.
+
+    Le header définit, en plus des structures d'entrée, de sortie et de ROM
+    habituelles, les structures `Input_{short_name}_batch` et
+    `Output_{short_name}_batch` ainsi que la fonction
+    `{functionName}_batch`, qui prend l'état `State_{short_name}_batch` de
+    toutes les instances. Les fonctions `set_{short_name}_batch_input` et
+    `get_{short_name}_batch_output` permettent de remplir un lot à partir des
+    structures habituelles et d'en extraire les résultats.
+
+    `optimize` est le même que pour `transpile2C`.
+
+    Les étapes de la transpilation sont enregistrées dans `profile` (un
+    `profiling.Profile`, voir `transpile2CFiles`), qui est renvoyé
+    """
+    if lanes <= 0 or lanes % 64 != 0:
+        raise ValueError(f"The number of lanes must be a multiple of 64 (got {lanes})")
+    if profile is None:
+        profile = profiling.Profile()
+    netlist, ordered_eqns = generator.getScheduledNetList(
+        netlist_string, parser_algorithm, optimize, profile
+    )
+    profile.stage("emit")
+    inputs = sorted(netlist.inputs, key=lambda x: x.label)
+    outputs = sorted(netlist.outputs, key=lambda x: x.label)
+    h = generator._CWriter(h_file, names)
+    c = generator._CWriter(c_file, names)
+
+    c.template(
+        '#include <stdint.h>\n#include <stdlib.h>\n#include <string.h>\n#include "{filename}.h"\n\n'
+    )
+    if helper_functions:
+        c.write(
+            "#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n"
+            "#include <fcntl.h>\n#include <unistd.h>\n#include <sys/mman.h>\n#include <sys/stat.h>\n\n"
+        )
+    c.template(
+        "void {functionName}_batch(State_{short_name}_batch *state, const Input_{short_name}_batch *input, Output_{short_name}_batch *output, Rom_{short_name}* roms) {{\n"
+    )
+    for v in inputs:
+        t, _ = _arrayType(v)
+        c.write(f"\tconst {t} *{v.label} = input->{v.label};\n")
+
+    c.write("\n")
+
+    # Comme dans `generator._assemble`, les mises à jour sont écrites après
+    # le calcul, et les champs de l'état dans le header à la fin du parcours
+    roms = []
+    with tempfile.SpooledTemporaryFile(
+        generator.SPOOL_SIZE, mode="w+"
+    ) as fields, tempfile.SpooledTemporaryFile(
+        generator.SPOOL_SIZE, mode="w+"
+    ) as suffix:
+        for eq in ordered_eqns:
+            exp, field, update, r = _getBatchExpr(eq, names["short_name"])
+            if r is not None:
+                roms.append(r)
+            c.write(exp)
+            fields.write(field)
+            suffix.write(update)
+        c.write("\n")
+        suffix.seek(0)
+        shutil.copyfileobj(suffix, c)
+        c.write("\tstate->cycle++;\n\n")
+        for v in outputs:
+            c.write(
+                f"\tmemcpy(output->{v.label}, {v.label}, sizeof output->{v.label});\n"
+            )
+        c.write("\n}\n")
+        roms.sort()
+
+        c.template(_get_batch_state_api())
+        c.template(_get_lane_accessors(inputs, outputs))
+        if helper_functions:
+            c.template(generator._get_print_output(outputs))
+            c.template(generator._get_prompt_input(inputs, less_verbose))
+            c.template(generator._get_prompt_rom(roms, less_verbose))
+            c.template(generator._get_map_rom(roms))
+
+        h.template("#ifndef {filename}_H\n#include <stdint.h>\n#include <stddef.h>\n")
+        if helper_functions:
+            h.write(
+                "#include <stdlib.h>\n#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n"
+            )
+        h.template("\n#define {filename}_H\n")
+        h.template(
+            f"#define {{short_name}}_LANES {lanes}\n"
+            f"#define {{short_name}}_WORDS {lanes // 64}\n"
+        )
+        h.template(generator._get_struct(inputs, "Input_{short_name}"))
+        h.template(generator._get_struct(outputs, "Output_{short_name}"))
+        h.template(_get_batch_struct(inputs, "Input_{short_name}_batch"))
+        h.template(_get_batch_struct(outputs, "Output_{short_name}_batch"))
+        h.write("typedef struct {\n\tuint64_t cycle;\n")
+        fields.seek(0)
+        shutil.copyfileobj(fields, h)
+        h.template("}} State_{short_name}_batch;\n\n")
+    h.template(generator._get_rom_struct(roms))
+    h.template(
+        "void {functionName}_batch(State_{short_name}_batch *state, const Input_{short_name}_batch *input, Output_{short_name}_batch *output, Rom_{short_name}* roms);\n"
+        "State_{short_name}_batch *{short_name}_batch_create(void);\n"
+        "void {short_name}_batch_reset(State_{short_name}_batch *state);\n"
+        "State_{short_name}_batch *{short_name}_batch_clone(const State_{short_name}_batch *state);\n"
+        "void {short_name}_batch_free(State_{short_name}_batch *state);\n"
+        "void set_{short_name}_batch_input(Input_{short_name}_batch *batch, size_t lane, const Input_{short_name} *input);\n"
+        "void get_{short_name}_batch_output(const Output_{short_name}_batch *batch, size_t lane, Output_{short_name} *output);\n"
+    )
+    if helper_functions:
+        h.template(
+            "void print_{short_name}_output(Output_{short_name} *output);\n"
+            "bool prompt_{short_name}_input(Input_{short_name} *input);\n"
+            "void fscan_rom(FILE * f, Rom_{short_name} * roms);\n"
+            "int map_rom(const char *path, Rom_{short_name} * roms);\n"
+        )
+    h.write("\n#endif")
+
+    generator._countWritten(profile, h, c)
+    profile.finish()
+    return profile
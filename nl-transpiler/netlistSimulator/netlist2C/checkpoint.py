@@ -0,0 +1,292 @@
+"""
+Points de reprise (checkpoints) de l'état d'une simulation sur le disque.
+
+Un fichier de points de reprise est une suite de trames. Chaque trame
+contient un en-tête (`CheckpointHeader_{short_name}`: nombre magique,
+empreinte de la disposition de l'état, numéro du cycle, nombre de pages et
+taille de la suite de la trame), la valeur de tous les registres, puis des
+pages de RAM de `1 << PAGE_BITS` mots, chacune précédée du numéro de la RAM
+et du numéro de la page.
+
+Une trame complète remet l'état à 0 puis contient toutes les pages non
+nulles: une RAM presque vide prend peu de place. Une trame incrémentale ne
+contient que les pages écrites depuis le point de reprise précédent, qui
+sont marquées dans les tableaux `DIRTY_{label}` de l'état à chaque écriture
+dans la RAM. Le premier point de reprise d'un fichier est toujours complet.
+
+À la relecture, les trames sont appliquées dans l'ordre: on peut s'arrêter
+à une trame donnée pour repartir d'un point intermédiaire. Une dernière
+trame incomplète (simulation interrompue pendant l'écriture) est ignorée.
+Les fichiers utilisent la représentation des entiers de la machine.
+
+Les RAMs creuses (voir le module `sparse`) ont le même format de pages, mais
+seules leurs pages allouées sont parcourues.
+"""
+
+import hashlib
+
+from . import sparse
+
+"""
+Nombre de bits d'adresse d'une page de RAM: les pages font `1 << PAGE_BITS`
+mots (ou toute la RAM si elle est plus petite)
+"""
+PAGE_BITS = 8
+
+"""
+"NLCK" lu comme un entier de 32 bits petit-boutiste
+"""
+MAGIC = 0x4B434C4E
+
+
+def dirtyName(name):
+    """
+    Nom du tableau des pages modifiées de la RAM dont la variable d'état est
+    `name` (`RAM_{label}`)
+    """
+    return "DIRTY_" + name[len("RAM_") :]
+
+
+def pageCount(addr_size):
+    return 1 << max(addr_size - PAGE_BITS, 0)
+
+
+def _pageWords(addr_size):
+    return 1 << min(addr_size, PAGE_BITS)
+
+
+def layoutDigest(states):
+    """
+    Empreinte de la disposition de l'état: un point de reprise n'est relu
+    que par le code généré pour les mêmes registres et RAMs
+    """
+    return hashlib.sha256(repr(list(states)).encode()).hexdigest()[:16]
+
+
+def getCheckpointCode(states, on_load="", sparse_ram=None):
+    """
+    Fonctions C d'écriture et de relecture des points de reprise:
+      - `{short_name}_checkpoint(state, path, append, full)` écrit une trame
+        complète dans un nouveau fichier `path` (écrit à côté puis renommé,
+        pour ne jamais perdre le point de reprise précédent), ou, avec
+        `append`, ajoute une trame à la fin du fichier: incrémentale, sauf
+        si `full` est vrai ou si le fichier est vide. Les pages sont ensuite
+        marquées comme non modifiées. Renvoie 0, ou -1 en cas d'erreur
+        (avec `errno`)
+      - `{short_name}_load_checkpoint(state, path, max_frames)` applique les
+        `max_frames` premières trames du fichier (toutes si `max_frames`
+        vaut 0) et renvoie le nombre de trames appliquées, ou -1 si le
+        fichier ne peut pas être lu ou ne correspond pas à la netlist.
+        Les instructions `on_load` sont exécutées après la relecture
+    Les RAMs de plus de `sparse_ram` bits d'adresse sont creuses
+    """
+    regs = [(t, name) for t, name, addr_size in states if addr_size is None]
+    rams = [state for state in states if state[2] is not None]
+    is_sparse = lambda addr_size: sparse.isSparse(addr_size, sparse_ram)
+    reg_bytes = " + ".join(f"sizeof state->{name}" for _, name in regs) or "0"
+
+    def page(name, addr_size):
+        return f"state->{name} + ((size_t) p << {PAGE_BITS})", (
+            f"{_pageWords(addr_size)} * sizeof *state->{name}"
+        )
+
+    def needed(name, addr_size):
+        data, size = page(name, addr_size)
+        return f"(full ? !{{short_name}}_page_is_zero({data}, {size}) : state->{dirtyName(name)}[p])"
+
+    # Pour les RAMs creuses, `page` et `dirty` sont ceux de `sparse.forEachPage`
+    sparse_size = lambda addr_size: f"{_pageWords(addr_size)} * sizeof *page"
+    sparse_needed = lambda addr_size: (
+        f"(full ? !{{short_name}}_page_is_zero(page, {sparse_size(addr_size)}) : *dirty)"
+    )
+
+    content = (
+        "static int {short_name}_page_is_zero(const void *page, size_t size) {{\n"
+        "\tconst uint8_t *p = page;\n"
+        "\tfor (size_t i = 0; i < size; i++)\n"
+        "\t\tif (p[i]) return 0;\n"
+        "\treturn 1;\n"
+        "}}\n"
+        "static void {short_name}_clean(State_{short_name} *state) {{\n"
+    )
+    for t, name, addr_size in rams:
+        if is_sparse(addr_size):
+            content += sparse.forEachPage(t, name, addr_size, "*dirty = 0;")
+            continue
+        content += (
+            f"\tmemset(state->{dirtyName(name)}, 0, sizeof state->{dirtyName(name)});\n"
+        )
+    content += (
+        "}}\n"
+        "int {short_name}_checkpoint(State_{short_name} *state, const char *path, int append, int full) {{\n"
+        "\tchar *tmp = NULL;\n"
+        "\tFILE *f;\n"
+        "\tif (append) {{\n"
+        '\t\tf = fopen(path, "ab");\n'
+        "\t\tif (f == NULL || fseek(f, 0, SEEK_END) != 0) goto error;\n"
+        "\t\tfull = full || ftell(f) == 0;\n"
+        "\t}} else {{\n"
+        "\t\ttmp = malloc(strlen(path) + 5);\n"
+        "\t\tif (tmp == NULL) return -1;\n"
+        '\t\tsprintf(tmp, "%s.tmp", path);\n'
+        '\t\tf = fopen(tmp, "wb");\n'
+        "\t\tfull = 1;\n"
+        "\t}}\n"
+        "\tif (f == NULL) goto error;\n"
+        "\tCheckpointHeader_{short_name} h = {{{short_name}_CHECKPOINT_MAGIC, full, {short_name}_LAYOUT, state->cycle, 0, "
+        + reg_bytes
+        + "}};\n"
+    )
+    for t, name, addr_size in rams:
+        if is_sparse(addr_size):
+            content += sparse.forEachPage(
+                t,
+                name,
+                addr_size,
+                f"if {sparse_needed(addr_size)} {{{{\n"
+                "\th.n_pages++;\n"
+                f"\th.size += 2 * sizeof(uint32_t) + {sparse_size(addr_size)};\n"
+                "}}",
+            )
+            continue
+        _, size = page(name, addr_size)
+        content += (
+            f"\tfor (size_t p = 0; p < {pageCount(addr_size)}; p++)\n"
+            f"\t\tif {needed(name, addr_size)} {{{{\n"
+            "\t\t\th.n_pages++;\n"
+            f"\t\t\th.size += 2 * sizeof(uint32_t) + {size};\n"
+            "\t\t}}\n"
+        )
+    content += "\tint ok = fwrite(&h, sizeof h, 1, f) == 1;\n"
+    for _, name in regs:
+        content += (
+            f"\tok = ok && fwrite(&state->{name}, sizeof state->{name}, 1, f) == 1;\n"
+        )
+    for k, (t, name, addr_size) in enumerate(rams):
+        if is_sparse(addr_size):
+            content += sparse.forEachPage(
+                t,
+                name,
+                addr_size,
+                f"if {sparse_needed(addr_size)} {{{{\n"
+                f"\tuint32_t id[2] = {{{{{k}, p}}}};\n"
+                f"\tok = fwrite(id, sizeof id, 1, f) == 1 && fwrite(page, {sparse_size(addr_size)}, 1, f) == 1;\n"
+                "}}",
+                cond="ok && ",
+            )
+            continue
+        data, size = page(name, addr_size)
+        content += (
+            f"\tfor (size_t p = 0; ok && p < {pageCount(addr_size)}; p++)\n"
+            f"\t\tif {needed(name, addr_size)} {{{{\n"
+            f"\t\t\tuint32_t id[2] = {{{{{k}, p}}}};\n"
+            f"\t\t\tok = fwrite(id, sizeof id, 1, f) == 1 && fwrite({data}, {size}, 1, f) == 1;\n"
+            "\t\t}}\n"
+        )
+    content += (
+        "\tok = fclose(f) == 0 && ok;\n"
+        "\tif (ok && tmp != NULL)\n"
+        "\t\tok = rename(tmp, path) == 0;\n"
+        "\tif (!ok && tmp != NULL)\n"
+        "\t\tremove(tmp);\n"
+        "\tfree(tmp);\n"
+        "\tif (!ok) return -1;\n"
+        "\t{short_name}_clean(state);\n"
+        "\treturn 0;\n"
+        "error:\n"
+        "\tif (f != NULL) fclose(f);\n"
+        "\tfree(tmp);\n"
+        "\treturn -1;\n"
+        "}}\n"
+        "int64_t {short_name}_load_checkpoint(State_{short_name} *state, const char *path, uint64_t max_frames) {{\n"
+        '\tFILE *f = fopen(path, "rb");\n'
+        "\tif (f == NULL) return -1;\n"
+        "\tif (fseek(f, 0, SEEK_END) != 0) {{\n"
+        "\t\tfclose(f);\n"
+        "\t\treturn -1;\n"
+        "\t}}\n"
+        "\tlong size = ftell(f);\n"
+        "\trewind(f);\n"
+        "\tint64_t frames = 0;\n"
+        "\tCheckpointHeader_{short_name} h;\n"
+        "\twhile ((max_frames == 0 || (uint64_t) frames < max_frames) && fread(&h, sizeof h, 1, f) == 1) {{\n"
+        "\t\tif (h.magic != {short_name}_CHECKPOINT_MAGIC || h.layout != {short_name}_LAYOUT) {{\n"
+        "\t\t\tframes = -1;\n"
+        "\t\t\tbreak;\n"
+        "\t\t}}\n"
+        # Trame tronquée par une interruption pendant l'écriture
+        "\t\tif (h.size > (uint64_t) (size - ftell(f)))\n"
+        "\t\t\tbreak;\n"
+        "\t\tif (h.full)\n"
+        + (
+            # Libère aussi les pages des RAMs creuses
+            "\t\t\t{short_name}_reset(state);\n"
+            if any(is_sparse(addr_size) for _, _, addr_size in rams)
+            else "\t\t\tmemset(state, 0, sizeof *state);\n"
+        )
+        + "\t\tstate->cycle = h.cycle;\n"
+        "\t\tint ok = 1;\n"
+    )
+    for _, name in regs:
+        content += (
+            f"\t\tok = ok && fread(&state->{name}, sizeof state->{name}, 1, f) == 1;\n"
+        )
+    content += (
+        "\t\tfor (uint64_t i = 0; ok && i < h.n_pages; i++) {{\n"
+        "\t\t\tuint32_t id[2];\n"
+        "\t\t\tok = fread(id, sizeof id, 1, f) == 1;\n"
+        "\t\t\tsize_t p = ok ? id[1] : 0;\n"
+        "\t\t\tswitch (ok ? id[0] : UINT32_MAX) {{\n"
+    )
+    for k, (_, name, addr_size) in enumerate(rams):
+        if is_sparse(addr_size):
+            label = name[len("RAM_") :]
+            content += (
+                f"\t\t\tcase {k}:\n"
+                f"\t\t\t\tok = p < {pageCount(addr_size)} && fread(sparse_page_{label}(state, p), {_pageWords(addr_size)} * sizeof *state->{name}[0]->page[0], 1, f) == 1;\n"
+                "\t\t\t\tbreak;\n"
+            )
+            continue
+        data, size = page(name, addr_size)
+        content += (
+            f"\t\t\tcase {k}:\n"
+            f"\t\t\t\tok = p < {pageCount(addr_size)} && fread({data}, {size}, 1, f) == 1;\n"
+            "\t\t\t\tbreak;\n"
+        )
+    content += (
+        "\t\t\tdefault:\n"
+        "\t\t\t\tok = 0;\n"
+        "\t\t\t}}\n"
+        "\t\t}}\n"
+        "\t\tif (!ok) {{\n"
+        "\t\t\tframes = -1;\n"
+        "\t\t\tbreak;\n"
+        "\t\t}}\n"
+        "\t\tframes++;\n"
+        "\t}}\n"
+        "\tfclose(f);\n"
+        "\t{short_name}_clean(state);\n" + on_load + "\treturn frames;\n"
+        "}}\n"
+    )
+    return content
+
+
+def getCheckpointHeader(states):
+    """
+    Déclarations du header pour `getCheckpointCode`
+    """
+    return (
+        f"#define {{short_name}}_PAGE_BITS {PAGE_BITS}\n"
+        f"#define {{short_name}}_CHECKPOINT_MAGIC {MAGIC:#x}\n"
+        f"#define {{short_name}}_LAYOUT UINT64_C(0x{layoutDigest(states)})\n"
+        "typedef struct {{\n"
+        "\tuint32_t magic;\n"
+        "\tuint32_t full;\n"
+        "\tuint64_t layout;\n"
+        "\tuint64_t cycle;\n"
+        "\tuint64_t n_pages;\n"
+        "\tuint64_t size;\n"
+        "}} CheckpointHeader_{short_name};\n"
+        "int {short_name}_checkpoint(State_{short_name} *state, const char *path, int append, int full);\n"
+        "int64_t {short_name}_load_checkpoint(State_{short_name} *state, const char *path, uint64_t max_frames);\n"
+    )
@@ -0,0 +1,220 @@
+"""
+Découpage de la fonction de simulation en plusieurs fichiers sources, pour
+les très grosses netlists: une seule fonction de plusieurs centaines de
+milliers d'instructions est très longue à compiler, et ne se compile pas en
+parallèle.
+
+Les équations, dans l'ordre topologique, sont réparties en morceaux
+consécutifs. Chaque morceau est une fonction `{functionName}_chunk_{k}` dans
+son propre fichier `{filename}_chunk_{k}.c`. Les nappes calculées dans un
+morceau et lues dans un autre (ou en sortie) passent par la structure
+`Wires_{short_name}`, qui contient aussi les entrées. Les nappes qui ne
+servent que dans leur morceau restent des variables locales.
+
+Les variables d'état (registres et RAMs) sont dans la structure
+`State_{short_name}`, passée à chaque morceau. La mise à jour d'un
+état est faite à la fin du premier morceau où la valeur de l'état a été lue
+et où ses arguments sont connus : comme seule l'équation du registre ou de
+la RAM lit l'état, le résultat est le même que si toutes les mises à jour
+étaient faites à la fin du cycle.
+"""
+
+import os
+
+from . import generator, profiling, utils
+from .roms import readHexRom, writeRomArrays
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _updateArgs(eq):
+    """
+    Nappes lues par la mise à jour de fin de cycle de l'équation
+    """
+    return [v.label for v in utils.getRegisterArgs(eq.expr)]
+
+
+def _partition(ordered_eqns, chunk_size):
+    """
+    Répartit les équations en morceaux de `chunk_size` équations. Renvoie la
+    liste des morceaux, et pour chaque morceau la liste des équations dont la
+    mise à jour de l'état y est faite
+    """
+    chunks = [
+        ordered_eqns[i : i + chunk_size]
+        for i in range(0, len(ordered_eqns), chunk_size)
+    ]
+    where = {eq.var.label: k for k, chunk in enumerate(chunks) for eq in chunk}
+    updates = [[] for _ in chunks]
+    for k, chunk in enumerate(chunks):
+        for eq in chunk:
+            if eq.expr.type in utils.REG_TYPES:
+                place = max([k] + [where.get(l, 0) for l in _updateArgs(eq)])
+                updates[place].append(eq)
+    return chunks, updates
+
+
+def transpile2CChunks(
+    netlist_string,
+    directory,
+    names,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    optimize=None,
+    profile=None,
+):
+    """
+    Équivalent de `transpile2CFiles` qui répartit la fonction de simulation
+    en morceaux de `chunk_size` équations, chacun dans son fichier source.
+
+    Les fichiers sont écrits dans `directory`: `{filename}.h` (le même header
+    qu'avec `transpile2CFiles`), `{filename}.c` (la fonction de simulation,
+    qui appelle les morceaux, et les fonctions annexes),
+    `{filename}_chunks.h` (déclarations communes aux morceaux) et
+    `{filename}_chunk_{k}.c`. Si `rom_contents` est fourni, les tableaux des
+    ROMs sont écrits dans `{filename}_roms.h`.
+
+    Renvoie la liste des fichiers sources écrits, à compiler séparément (voir
+    `netlistSimulator.build`) puis à lier ensemble.
+
+    Les étapes de la transpilation sont enregistrées dans `profile` (un
+    `profiling.Profile`, voir `transpile2CFiles`)
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"The chunk size must be positive (got {chunk_size})")
+    if profile is None:
+        profile = profiling.Profile()
+    netlist, ordered_eqns = generator.getScheduledNetList(
+        netlist_string, parser_algorithm, optimize, profile
+    )
+    profile.stage("emit")
+    inputs = sorted(netlist.inputs, key=lambda x: x.label)
+    outputs = sorted(netlist.outputs, key=lambda x: x.label)
+    chunks, updates = _partition(ordered_eqns, chunk_size)
+
+    # Nappes lues par chaque morceau, et morceaux qui lisent chaque nappe
+    reads = []
+    readers = {}
+    for k, chunk in enumerate(chunks):
+        labels = set()
+        for eq in chunk:
+            labels.update(v.label for v in eq.expr.getDeps())
+        for eq in updates[k]:
+            labels.update(_updateArgs(eq))
+        reads.append(labels)
+        for label in labels:
+            readers.setdefault(label, set()).add(k)
+    output_labels = set(v.label for v in outputs)
+
+    variables = {v.label: v for v in inputs}
+    variables.update((eq.var.label, eq.var) for eq in ordered_eqns)
+    wires = set(v.label for v in inputs)  # Champs de `Wires_{short_name}`
+
+    def path(name):
+        return os.path.join(directory, name.format(**names))
+
+    sources = []
+    states = []
+    roms = []
+    for k, chunk in enumerate(chunks):
+        defined = set(eq.var.label for eq in chunk)
+        exports = sorted(
+            label
+            for label in defined
+            if label in output_labels or readers.get(label, {k}) - {k}
+        )
+        wires.update(exports)
+        fragments = [generator._getExpr(eq) for eq in chunk]
+        chunk_roms = sorted(r for _, _, _, r in fragments if r is not None)
+        roms += chunk_roms
+        states += [state for _, state, _, _ in fragments if state is not None]
+
+        source = path(f"{{filename}}_chunk_{k}.c")
+        sources.append(source)
+        with open(source, "w") as f:
+            c = generator._CWriter(f, names)
+            c.template('#include <stdint.h>\n#include "{filename}_chunks.h"\n')
+            if rom_contents is not None and chunk_roms:
+                c.template('#include "{filename}_roms.h"\n')
+            c.template(
+                f"\nvoid {{functionName}}_chunk_{k}(State_{{short_name}} *state, Wires_{{short_name}} *wires, Rom_{{short_name}}* roms) {{{{\n"
+            )
+            for label in sorted(reads[k] - defined):
+                t = utils.cTypeFromBusSize(variables[label].length).value
+                c.write(f"\t{t} {label} = wires->{label};\n")
+            if rom_contents is None:
+                for label, _, word_size in chunk_roms:
+                    t = utils.cTypeFromBusSize(word_size).value
+                    c.write(f"\t{t} *ROM_{label} = roms->{label};\n")
+            c.write("\n")
+            for exp, _, _, _ in fragments:
+                c.write(exp)
+            c.write("\n")
+            for eq in updates[k]:
+                c.write(generator._getExpr(eq)[2])
+            for label in exports:
+                c.write(f"\twires->{label} = {label};\n")
+            c.write("}\n")
+    roms.sort()
+
+    if rom_contents is not None:
+        with open(path("{filename}_roms.h"), "w") as f:
+            writeRomArrays(f, roms, readHexRom(rom_contents, roms))
+
+    with open(path("{filename}_chunks.h"), "w") as f:
+        h = generator._CWriter(f, names)
+        h.template(
+            "#ifndef {filename}_CHUNKS_H\n"
+            "#define {filename}_CHUNKS_H\n"
+            '#include "{filename}.h"\n\n'
+        )
+        h.template(
+            generator._get_struct(
+                [variables[label] for label in wires], "Wires_{short_name}"
+            )
+        )
+        for k in range(len(chunks)):
+            h.template(
+                f"void {{functionName}}_chunk_{k}(State_{{short_name}} *state, Wires_{{short_name}} *wires, Rom_{{short_name}}* roms);\n"
+            )
+        h.write("\n#endif")
+
+    main_source = path("{filename}.c")
+    with open(path("{filename}.h"), "w") as hf, open(main_source, "w") as cf:
+        h = generator._CWriter(hf, names)
+        c = generator._CWriter(cf, names)
+        generator._write_includes(c, helper_functions, binary_io)
+        c.template('#include "{filename}_chunks.h"\n\n')
+        c.template(
+            "void {functionName}(State_{short_name} *state, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms) {{\n"
+            "\tWires_{short_name} wires;\n"
+        )
+        for v in inputs:
+            c.write(f"\twires.{v.label} = input->{v.label};\n")
+        c.write("\n")
+        for k in range(len(chunks)):
+            c.template(f"\t{{functionName}}_chunk_{k}(state, &wires, roms);\n")
+        c.write("\tstate->cycle++;\n\n")
+        for v in outputs:
+            c.write(f"\toutput->{v.label} = wires.{v.label};\n")
+        c.write("\n}\n")
+        generator._write_api(
+            h,
+            c,
+            inputs,
+            outputs,
+            states,
+            roms,
+            helper_functions,
+            less_verbose,
+            library,
+            binary_io,
+        )
+    profile.count("sources", len(sources) + 1)
+    profile.finish()
+    return [main_source] + sources
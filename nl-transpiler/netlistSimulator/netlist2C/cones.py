@@ -0,0 +1,210 @@
+"""
+Partage des cônes combinatoires identiques.
+
+Les équations combinatoires sont réparties en cônes sans sortance: une
+nappe calculée par une instruction combinatoire, lue une seule fois et par
+une autre instruction combinatoire (et qui n'est ni une sortie ni une nappe
+à garder), fait partie du cône de la nappe qui la lit. Un cône est donc un
+arbre d'instructions dont la racine est lue plusieurs fois, par une
+instruction à état (registre, RAM, ROM) ou est une sortie, et dont les
+feuilles sont des nappes calculées ailleurs ou des constantes.
+
+Deux cônes sont isomorphes s'ils ont les mêmes instructions, arguments
+statiques, tailles et constantes, aux noms des nappes près (y compris
+quand une feuille est lue plusieurs fois). Chaque forme de cône d'au moins
+`min_size` équations qui apparaît assez souvent pour raccourcir le code est
+écrite une seule fois sous forme de fonction C `static inline`
+(`cone_{numéro}`, qui prend les feuilles en arguments), et chaque
+occurrence devient un appel. Le
+calcul est exactement celui des équations d'origine: les variables
+intermédiaires ont les mêmes types C.
+"""
+
+from . import AST as ast
+from . import utils
+from .passes import COMBINATIONAL
+
+"""
+Nombre minimal d'équations d'un cône partagé, par défaut
+"""
+DEFAULT_MIN_SIZE = 2
+
+
+class SharedCones:
+    """
+    Résultat de `shareCones`: les fonctions C des formes partagées et, pour
+    chaque occurrence, l'appel qui remplace ses équations
+    """
+
+    def __init__(self, functions, calls, hidden, n_equations):
+        self.functions = functions  # code C de chaque forme partagée
+        self.calls = calls  # label de la racine -> instruction C de l'appel
+        self.hidden = hidden  # labels des équations remplacées par un appel
+        self.n_equations = n_equations  # équations de la netlist ordonnée
+
+    def lines(self):
+        """
+        Couple (nombre de lignes de la fonction de simulation et des
+        fonctions des cônes, nombre de lignes sans partage): une ligne par
+        équation, appel ou accolade
+        """
+        after = self.n_equations - len(self.hidden) + sum(
+            f.count("\n") for f in self.functions
+        )
+        return after, self.n_equations
+
+    def report(self):
+        after, before = self.lines()
+        ratio = before / after if after else 1.0
+        return (
+            f"{len(self.functions)} shared cones, {len(self.calls)} instances "
+            f"covering {len(self.hidden) + len(self.calls)} equations: "
+            f"{before} -> {after} lines of C (shrink ratio {ratio:.2f})"
+        )
+
+    def code(self):
+        return "".join(self.functions)
+
+    def fragment(self, eq, getExpr):
+        """
+        Fragment (voir `generator._getExpr`, qui est `getExpr`) de
+        l'équation `eq`: l'appel si c'est la racine d'un cône partagé, `None`
+        si elle est calculée par l'appel d'un cône
+        """
+        label = eq.var.label
+        if label in self.calls:
+            return (self.calls[label], None, "", None)
+        if label in self.hidden:
+            return None
+        return getExpr(eq)
+
+    def fragments(self, ordered_eqns, getExpr):
+        """
+        Fragments des équations `ordered_eqns` (voir `fragment`), les cônes
+        partagés étant remplacés par leurs appels
+        """
+        for eq in ordered_eqns:
+            f = self.fragment(eq, getExpr)
+            if f is not None:
+                yield f
+
+
+def findCones(ordered_eqns, outputs, keep=()):
+    """
+    Répartit les équations combinatoires de `ordered_eqns` (dans l'ordre
+    topologique, voir `utils.getOrderedNetList`) en cônes sans sortance.
+    Renvoie un dictionnaire qui associe au label de la racine de chaque cône
+    ses équations, dans l'ordre topologique (la racine en dernier). Les
+    nappes `outputs` (des `Var`) et `keep` (des labels) sont toujours des
+    racines
+    """
+    uses = {}
+    consumer = {}
+    for eq in ordered_eqns:
+        for a in eq.expr.args:
+            if isinstance(a, ast.Var):
+                uses[a.label] = uses.get(a.label, 0) + 1
+                consumer[a.label] = eq
+    roots = set(keep)
+    roots.update(v.label for v in outputs)
+
+    root_of = {}
+    for eq in reversed(ordered_eqns):
+        if eq.expr.type not in COMBINATIONAL:
+            continue
+        label = eq.var.label
+        if (
+            uses.get(label) == 1
+            and label not in roots
+            and consumer[label].expr.type in COMBINATIONAL
+        ):
+            root_of[label] = root_of[consumer[label].var.label]
+        else:
+            root_of[label] = label
+    cones = {}
+    for eq in ordered_eqns:
+        if eq.var.label in root_of:
+            cones.setdefault(root_of[eq.var.label], []).append(eq)
+    return cones
+
+
+def _signature(members):
+    """
+    Forme canonique du cône `members` (ses équations, la racine en
+    dernier): parcours préfixe des instructions depuis la racine, à plat
+    (une liste de jetons, sans récursion), avec les feuilles numérotées dans
+    l'ordre du parcours. Renvoie la forme et la liste des feuilles (`Var`)
+    """
+    defs = {eq.var.label: eq for eq in members}
+    tokens = []
+    leaves = {}
+    stack = [members[-1].var]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, ast.Cst):
+            tokens.append(("C", v.length, v.value))
+            continue
+        eq = defs.get(v.label)
+        if eq is None:
+            leaves.setdefault(v.label, (len(leaves), v))
+            tokens.append(("L", leaves[v.label][0], v.length))
+            continue
+        expr = eq.expr
+        tokens.append(
+            (expr.type.value, tuple(expr.static_args), v.length, len(expr.args))
+        )
+        stack.extend(reversed(expr.args))
+    return tuple(tokens), [v for _, v in leaves.values()]
+
+
+def _function(k, members, leaves, getCombinational):
+    """
+    Fonction C `cone_{k}` qui calcule le cône `members` à partir de ses
+    feuilles `leaves`
+    """
+    names = {v.label: f"a{i}" for i, v in enumerate(leaves)}
+    ref = lambda x: names[x.label] if isinstance(x, ast.Var) else x.label
+    ctype = lambda v: utils.cTypeFromBusSize(v.length).value
+    params = ", ".join(f"{ctype(v)} a{i}" for i, v in enumerate(leaves))
+    root = members[-1]
+    content = f"static inline {ctype(root.var)} cone_{k}({params}) {{\n"
+    for i, eq in enumerate(members[:-1]):
+        names[eq.var.label] = f"t{i}"
+        content += f"\t{ctype(eq.var)} t{i} = {getCombinational(eq.expr, ref)};\n"
+    content += f"\treturn {getCombinational(root.expr, ref)};\n}}\n"
+    return content
+
+
+def shareCones(ordered_eqns, outputs, getCombinational, min_size=DEFAULT_MIN_SIZE, keep=()):
+    """
+    Cherche les cônes isomorphes des équations `ordered_eqns` (voir
+    `findCones` pour `outputs` et `keep`) et renvoie un `SharedCones`.
+    `getCombinational` est `generator._getCombinational`
+    """
+    shapes = {}  # forme -> liste des couples (cône, feuilles)
+    for members in findCones(ordered_eqns, outputs, keep).values():
+        if len(members) < min_size:
+            continue
+        signature, leaves = _signature(members)
+        shapes.setdefault(signature, []).append((members, leaves))
+
+    functions = []
+    calls = {}
+    hidden = set()
+    # Les formes sont numérotées dans l'ordre de leur première occurrence
+    for instances in shapes.values():
+        members = instances[0][0]
+        # Une fonction de n équations fait n + 2 lignes, chaque appel une
+        if len(instances) * len(members) <= len(instances) + len(members) + 2:
+            continue
+        k = len(functions)
+        leaves = instances[0][1]
+        functions.append(_function(k, members, leaves, getCombinational))
+        for members, leaves in instances:
+            root = members[-1].var
+            args = ", ".join(v.label for v in leaves)
+            calls[root.label] = (
+                f"\t{utils.cTypeFromBusSize(root.length).value} {root.label} = cone_{k}({args});\n"
+            )
+            hidden.update(eq.var.label for eq in members[:-1])
+    return SharedCones(functions, calls, hidden, len(ordered_eqns))
@@ -0,0 +1,244 @@
+"""
+Mode de génération guidé par les évènements, pour les circuits dont la
+plus grande partie est inactive à chaque cycle: au lieu de recalculer toutes
+les équations à chaque cycle, seules les parties du circuit dont une entrée
+a changé sont recalculées.
+
+Les équations, dans l'ordre topologique de `utils.getOrderedNetList`, sont
+réparties en partitions de `partition_size` équations consécutives. Le tri
+est un parcours en profondeur depuis chaque registre puis chaque sortie: les
+équations d'un même cône d'entrée (tout ce dont dépend un registre ou une
+sortie) sont consécutives, et une partition est un morceau de cône. Un
+registre est placé avec la première logique qui le lit.
+
+Les nappes qui sortent d'une partition (lues par une autre partition, par
+les mises à jour de fin de cycle, ou en sortie) et les entrées sont gardées
+d'un cycle à l'autre dans l'état, dans les champs `WIRE_{label}`. Le tableau
+`SETTLED` de l'état indique les partitions à jour. Une partition est marquée
+à recalculer quand:
+  - une nappe qu'elle lit, calculée par une partition précédente ou une
+    entrée, change de valeur
+  - un de ses registres change de valeur à la fin du cycle précédent
+  - une écriture dans une de ses RAMs modifie le mot à l'adresse de lecture
+Comme une partition ne lit que des nappes des partitions précédentes, un
+seul parcours des partitions dans l'ordre suffit.
+
+Un état à 0 (`{short_name}_create`, `{short_name}_reset`) n'a aucune
+partition à jour: tout est calculé au premier cycle. `{short_name}_invalidate`
+remet toutes les partitions à recalculer, par exemple après avoir modifié
+les ROMs (les lectures de ROM ne sont recalculées que quand leur adresse
+change).
+
+Le gain dépend de l'activité du circuit: quand peu de nappes changent d'un
+cycle à l'autre, la plupart des partitions sont sautées, mais quand presque
+tout change, les comparaisons s'ajoutent au calcul complet (voir
+`benchmarks/bench_events.py`).
+"""
+
+from . import AST as ast
+from . import checkpoint, generator, profiling, utils
+from .roms import readHexRom, writeRomArrays
+
+DEFAULT_PARTITION_SIZE = 128
+
+"""
+Nombre maximal de partitions lisant une nappe pour lequel les changements
+sont propagés sans branchement (voir `_store`)
+"""
+BRANCHLESS_READERS = 2
+
+"""
+Instructions de `{short_name}_invalidate`
+"""
+_INVALIDATE = "\tmemset(state->SETTLED, 0, sizeof state->SETTLED);\n"
+
+
+def _ref(arg):
+    """
+    Valeur d'un argument dans les mises à jour de fin de cycle
+    """
+    return f"state->WIRE_{arg.label}" if isinstance(arg, ast.Var) else arg.label
+
+
+def _settle(partitions):
+    return "".join(f" state->SETTLED[{k}] = 0;" for k in sorted(partitions))
+
+
+def _store(label, value, partitions, indent):
+    """
+    Garde la nouvelle valeur `value` de la nappe `label` dans l'état, en
+    marquant les `partitions` qui la lisent à recalculer si elle a changé.
+    Quand il y a peu de partitions, il n'y a pas de branchement (les
+    changements sont difficiles à prédire), sinon un seul test évite de
+    mettre à jour chaque partition
+    """
+    if len(partitions) > BRANCHLESS_READERS:
+        return (
+            f"{indent}if (state->WIRE_{label} != {value}) {{"
+            f" state->WIRE_{label} = {value};{_settle(partitions)} }}\n"
+        )
+    content = "".join(
+        f"{indent}state->SETTLED[{k}] &= state->WIRE_{label} == {value};\n"
+        for k in sorted(partitions)
+    )
+    return content + f"{indent}state->WIRE_{label} = {value};\n"
+
+
+def _update(eq, partition):
+    """
+    Mise à jour de fin de cycle de l'état de l'équation `eq` (un registre ou
+    une RAM), qui marque `partition` (où l'équation est calculée) à
+    recalculer quand la valeur lue change
+    """
+    expr = eq.expr
+    label = eq.var.label
+    if expr.type == ast.Exprs.REG:
+        value = _ref(expr.args[0])
+        return (
+            f"\tif (state->REG_{label} != {value}) {{{{"
+            f" state->REG_{label} = {value};{_settle([partition])} }}}}\n"
+        )
+    mask = utils.cMask(expr.args[1].length)
+    read_mask = utils.cMask(expr.args[0].length)
+    write_mask = utils.cMask(expr.args[2].length)
+    value = _ref(expr.args[3])
+    # Même condition d'écriture que `generator._getExpr`
+    return (
+        f"\tif(({_ref(expr.args[1])} & {mask}) != 0) {{{{\n"
+        f"\t\tsize_t address = {_ref(expr.args[2])} & {write_mask};\n"
+        f"\t\tif (state->RAM_{label}[address] != {value}) {{{{\n"
+        f"\t\t\tstate->RAM_{label}[address] = {value};\n"
+        f"\t\t\tstate->DIRTY_{label}[address >> {checkpoint.PAGE_BITS}] = 1;\n"
+        f"\t\t\tif (address == ({_ref(expr.args[0])} & {read_mask})){_settle([partition])}\n"
+        "\t\t}}\n"
+        "\t}}\n"
+    )
+
+
+def transpile2CEvents(
+    netlist_string,
+    h_file,
+    c_file,
+    names,
+    partition_size=DEFAULT_PARTITION_SIZE,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    rom_output=None,
+    optimize=None,
+    profile=None,
+):
+    """
+    Équivalent de `transpile2CFiles` qui génère une fonction de simulation
+    guidée par les évènements, avec des partitions de `partition_size`
+    équations. Le header et les fonctions annexes sont les mêmes, la
+    structure `State_{short_name}` contient en plus les nappes gardées d'un
+    cycle à l'autre.
+
+    Les étapes de la transpilation sont enregistrées dans `profile` (un
+    `profiling.Profile`, voir `transpile2CFiles`), qui est renvoyé
+    """
+    if partition_size <= 0:
+        raise ValueError(f"The partition size must be positive (got {partition_size})")
+    if profile is None:
+        profile = profiling.Profile()
+    netlist, ordered_eqns = generator.getScheduledNetList(
+        netlist_string, parser_algorithm, optimize, profile, registers_first=True
+    )
+    profile.stage("emit")
+    inputs = sorted(netlist.inputs, key=lambda x: x.label)
+    outputs = sorted(netlist.outputs, key=lambda x: x.label)
+    partitions = [
+        ordered_eqns[i : i + partition_size]
+        for i in range(0, len(ordered_eqns), partition_size)
+    ]
+    where = {eq.var.label: k for k, part in enumerate(partitions) for eq in part}
+
+    # Partitions qui lisent chaque nappe, et nappes gardées dans l'état
+    readers = {}
+    for k, part in enumerate(partitions):
+        for eq in part:
+            for v in eq.expr.getDeps():
+                if where.get(v.label) != k:
+                    readers.setdefault(v.label, set()).add(k)
+    kept = set(readers) | set(v.label for v in inputs + outputs)
+    for eq in ordered_eqns:
+        if eq.expr.type in utils.REG_TYPES:
+            kept.update(a.label for a in eq.expr.args if isinstance(a, ast.Var))
+    variables = {v.label: v for v in inputs}
+    variables.update((eq.var.label, eq.var) for eq in ordered_eqns)
+
+    h = generator._CWriter(h_file, names)
+    c = generator._CWriter(c_file, names)
+    fragments = [generator._getExpr(eq) for eq in ordered_eqns]
+    states = [state for _, state, _, _ in fragments if state is not None]
+    roms = sorted(r for _, _, _, r in fragments if r is not None)
+
+    generator._write_includes(c, helper_functions, binary_io)
+    if rom_contents is not None:
+        contents = readHexRom(rom_contents, roms)
+        if rom_output is not None:
+            writeRomArrays(rom_output, roms, contents)
+            c.template('#include "{filename}_roms.h"\n')
+        else:
+            writeRomArrays(c, roms, contents)
+        c.write("\n")
+    c.template(
+        "void {functionName}(State_{short_name} *state, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms) {{\n"
+    )
+    if rom_contents is None:
+        for label, _, word_size in roms:
+            t = utils.cTypeFromBusSize(word_size).value
+            c.write(f"\t{t} *ROM_{label} = roms->{label};\n")
+    for v in inputs:
+        c.write(_store(v.label, f"input->{v.label}", readers.get(v.label, ()), "\t"))
+    offset = 0
+    for k, part in enumerate(partitions):
+        defined = set(eq.var.label for eq in part)
+        reads = set(v.label for eq in part for v in eq.expr.getDeps()) - defined
+        c.write(f"\n\tif (!state->SETTLED[{k}]) {{\n\t\tstate->SETTLED[{k}] = 1;\n")
+        for label in sorted(reads):
+            t = utils.cTypeFromBusSize(variables[label].length).value
+            c.write(f"\t\t{t} {label} = state->WIRE_{label};\n")
+        for exp, _, _, _ in fragments[offset : offset + len(part)]:
+            c.write("\t" + exp)
+        for eq in part:
+            label = eq.var.label
+            if label in kept:
+                c.write(_store(label, label, readers.get(label, ()), "\t\t"))
+        c.write("\t}\n")
+        offset += len(part)
+    c.write("\n")
+    for eq in ordered_eqns:
+        if eq.expr.type in utils.REG_TYPES:
+            c.template(_update(eq, where[eq.var.label]))
+    c.write("\tstate->cycle++;\n\n")
+    for v in outputs:
+        c.write(f"\toutput->{v.label} = state->WIRE_{v.label};\n")
+    c.write("\n}\n")
+
+    extra_state = "".join(
+        f"\t{utils.cTypeFromBusSize(variables[label].length).value} WIRE_{label};\n"
+        for label in sorted(kept)
+    )
+    extra_state += f"\tuint8_t SETTLED[{max(len(partitions), 1)}];\n"
+    generator._write_api(
+        h,
+        c,
+        inputs,
+        outputs,
+        states,
+        roms,
+        helper_functions,
+        less_verbose,
+        library,
+        binary_io,
+        extra_state=extra_state,
+        invalidate=_INVALIDATE,
+    )
+    generator._countWritten(profile, h, c)
+    profile.finish()
+    return profile
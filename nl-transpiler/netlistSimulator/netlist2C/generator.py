@@ -1,181 +1,154 @@
 """
 Module qui transpile la netlist en C
 """
+import io
+import json
+import logging
+import shutil
+import tempfile
+
 from . import AST as ast
-from . import parser, utils
+from . import checkpoint, cones, incremental, parser, passes, profiling, sparse, utils
+from . import hotspots as timers
+from . import trace as tracer
+from .options import checkOptions
+from .roms import readHexRom, writeRomArrays
 
+log = logging.getLogger(__name__)
 
-def _getExpr(eq):
-    """
-    Renvoie un quadruplet de string représentant la valeur à assigner et des
-    instructions supplémentaire à ajouter en préambule et postambule de la
-    fonction C. Le dernière valeur contient les instructions ROMs
-    """
 
-    def full_exp_from_righthand_side(var, exp):
-        return f"\t{utils.cTypeFromBusSize(var.length).value} {var.label} = {exp};\n"
+def _getCombinational(expr, ref):
+    """
+    Renvoie l'expression C calculant une instruction combinatoire, ou `None`
+    si l'instruction a un état ou lit une mémoire (REG, RAM, ROM).
 
-    expr = eq.expr
+    `ref` donne l'expression C qui désigne la valeur d'un argument (son label
+    dans le cas général)
+    """
+    a = [ref(i) for i in expr.args]
     match expr.type:
         case ast.Exprs.NOT:
-            return (
-                full_exp_from_righthand_side(eq.var, f"~{expr.args[0].label}"),
-                "",
-                "",
-                None,
-            )
+            return f"~{a[0]}"
         case ast.Exprs.AND:
-            return (
-                full_exp_from_righthand_side(
-                    eq.var, f"{expr.args[0].label} & {expr.args[1].label}"
-                ),
-                "",
-                "",
-                None,
-            )
+            return f"{a[0]} & {a[1]}"
         case ast.Exprs.OR:
-            return (
-                full_exp_from_righthand_side(
-                    eq.var, f"{expr.args[0].label} | {expr.args[1].label}"
-                ),
-                "",
-                "",
-                None,
-            )
+            return f"{a[0]} | {a[1]}"
         case ast.Exprs.XOR:
-            return (
-                full_exp_from_righthand_side(
-                    eq.var, f"{expr.args[0].label} ^ {expr.args[1].label}"
-                ),
-                "",
-                "",
-                None,
-            )
+            return f"{a[0]} ^ {a[1]}"
         case ast.Exprs.NAND:
-            return (
-                full_exp_from_righthand_side(
-                    eq.var, f"~({expr.args[0].label} & {expr.args[1].label})"
-                ),
-                "",
-                "",
-                None,
-            )
+            return f"~({a[0]} & {a[1]})"
         case ast.Exprs.NXOR:
-            return (
-                full_exp_from_righthand_side(
-                    eq.var, f"~({expr.args[0].label} ^ {expr.args[1].label})"
-                ),
-                "",
-                "",
-                None,
-            )
+            return f"~({a[0]} ^ {a[1]})"
         case ast.Exprs.MUX:
-            mask = f"(({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.args[0].length}) - 1"
-            return (
-                full_exp_from_righthand_side(
-                    eq.var,
-                    f"({expr.args[0].label} & {mask}) == 0 ? {expr.args[1].label} : {expr.args[2].label}",
-                ),
-                "",
-                "",
-                None,
-            )
+            mask = utils.cMask(expr.args[0].length)
+            return f"({a[0]} & {mask}) == 0 ? {a[1]} : {a[2]}"
         case ast.Exprs.CONCAT:
             out_type = utils.cTypeFromBusSize(
                 expr.args[0].length + expr.args[1].length
             ).value
-            mask = f"(({utils.cTypeFromBusSize(expr.args[1].length).value}) 1 << {expr.args[1].length}) - 1"
-            return (
-                full_exp_from_righthand_side(
-                    eq.var,
-                    f"(({out_type}) ({expr.args[1].label} & {mask}) << {expr.args[0].length}) + ({out_type}) {expr.args[0].label}",
-                ),
-                "",
-                "",
-                None,
-            )
+            mask = utils.cMask(expr.args[1].length)
+            low_mask = utils.cMask(expr.args[0].length)
+            return f"(({out_type}) ({a[1]} & {mask}) << {expr.args[0].length}) + ({out_type}) ({a[0]} & {low_mask})"
         case ast.Exprs.SNIP:
-            mask = f"(((({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.static_args[1]-expr.static_args[0]}) - 1) << {expr.static_args[0]})"
-            return (
-                full_exp_from_righthand_side(
-                    eq.var,
-                    f"({utils.cTypeFromBusSize(expr.static_args[1]-expr.static_args[0]).value}) (({expr.args[0].label} & {mask}) >> {expr.static_args[0]})",
-                ),
-                "",
-                "",
-                None,
-            )
+            mask = f"({utils.cMask(expr.static_args[1]-expr.static_args[0], utils.cTypeFromBusSize(expr.args[0].length).value)} << {expr.static_args[0]})"
+            return f"({utils.cTypeFromBusSize(expr.static_args[1]-expr.static_args[0]).value}) (({a[0]} & {mask}) >> {expr.static_args[0]})"
         case ast.Exprs.SLICE:
-            mask = f"(((({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.static_args[1]-expr.static_args[0]+1}) - 1) << {expr.static_args[0]})"
-            return (
-                full_exp_from_righthand_side(
-                    eq.var,
-                    f"({utils.cTypeFromBusSize(expr.static_args[1]-expr.static_args[0]+1).value}) (({expr.args[0].label} & {mask}) >> {expr.static_args[0]})",
-                ),
-                "",
-                "",
-                None,
-            )
+            mask = f"({utils.cMask(expr.static_args[1]-expr.static_args[0]+1, utils.cTypeFromBusSize(expr.args[0].length).value)} << {expr.static_args[0]})"
+            return f"({utils.cTypeFromBusSize(expr.static_args[1]-expr.static_args[0]+1).value}) (({a[0]} & {mask}) >> {expr.static_args[0]})"
         case ast.Exprs.SELECT:
             mask = f"(({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.static_args[0]})"
-            return (
-                full_exp_from_righthand_side(
-                    eq.var,
-                    f"({utils.cTypeFromBusSize(1).value}) (({expr.args[0].label} & {mask}) >> {expr.static_args[0]})",
-                ),
-                "",
-                "",
-                None,
-            )
-        case ast.Exprs.REG:
-            return (
-                full_exp_from_righthand_side(eq.var, f"REG_{expr.args[0].label}"),
-                f"\tstatic {utils.cTypeFromBusSize(expr.args[0].length).value} REG_{expr.args[0].label} = 0;\n",
-                f"\tREG_{expr.args[0].label} = {expr.args[0].label};\n",
-                None,
-            )
+            return f"({utils.cTypeFromBusSize(1).value}) (({a[0]} & {mask}) >> {expr.static_args[0]})"
         case ast.Exprs.COPY:
+            return f"{a[0]}"
+    return None
+
+
+def _getExpr(eq, sparse_ram=None):
+    """
+    Renvoie un quadruplet `(valeur, état, postambule, rom)`:
+      - valeur: l'instruction C calculant la nappe
+      - état: le champ de la structure `State_{short_name}` gardant l'état
+        de l'instruction entre deux cycles, décrit par un triplet `(type C,
+        nom, taille d'adresse)` (la taille d'adresse vaut `None` pour un
+        registre), ou `None`
+      - postambule: les instructions à ajouter en fin de fonction C
+      - rom: la ROM lue par l'instruction (un triplet `(label, taille
+        d'adresse, taille de mot)`) ou `None`
+
+    Les RAMs de plus de `sparse_ram` bits d'adresse sont creuses (voir le
+    module `sparse`)
+    """
+
+    def full_exp_from_righthand_side(var, exp):
+        return f"\t{utils.cTypeFromBusSize(var.length).value} {var.label} = {exp};\n"
+
+    expr = eq.expr
+    rhs = _getCombinational(expr, lambda x: x.label)
+    if rhs is not None:
+        return (full_exp_from_righthand_side(eq.var, rhs), None, "", None)
+    match expr.type:
+        case ast.Exprs.REG:
             return (
-                full_exp_from_righthand_side(eq.var, f"{expr.args[0].label}"),
-                "",
-                "",
+                full_exp_from_righthand_side(eq.var, f"state->REG_{eq.var.label}"),
+                (
+                    utils.cTypeFromBusSize(expr.args[0].length).value,
+                    f"REG_{eq.var.label}",
+                    None,
+                ),
+                f"\tstate->REG_{eq.var.label} = {expr.args[0].label};\n",
                 None,
             )
         case ast.Exprs.RAM:
-            mask = f"(({utils.cTypeFromBusSize(expr.args[1].length).value}) 1 << {expr.args[1].length}) - 1"
-            read_mask = f"(({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.args[0].length}) - 1"
-            write_mask = f"(({utils.cTypeFromBusSize(expr.args[2].length).value}) 1 << {expr.args[2].length}) - 1"
-            label = expr.args[3].label
+            mask = utils.cMask(expr.args[1].length)
+            read_mask = utils.cMask(expr.args[0].length)
+            write_mask = utils.cMask(expr.args[2].length)
+            label = eq.var.label
             read_address = f"{expr.args[0].label} & {read_mask}"
             write_address = f"{expr.args[2].label} & {write_mask}"
-            ram_size = f"1 << {expr.static_args[0]}"
+            if sparse.isSparse(expr.static_args[0], sparse_ram):
+                sparse.checkAddressSize(label, expr.static_args[0])
+                return (
+                    full_exp_from_righthand_side(
+                        eq.var, sparse.readExpr(label, read_address)
+                    ),
+                    (
+                        utils.cTypeFromBusSize(expr.static_args[1]).value,
+                        f"RAM_{label}",
+                        expr.static_args[0],
+                    ),
+                    f"\tif(({expr.args[1].label} & {mask}) != 0) {sparse.writeStatement(label, write_address, expr.args[3].label)}\n",
+                    None,
+                )
             return (
-                full_exp_from_righthand_side(eq.var, f"RAM_{label}[{read_address}]"),
-                f"\tstatic {utils.cTypeFromBusSize(expr.static_args[1]).value} RAM_{label}[{ram_size}] = {{{{0}}}};\n",
-                f"\tif({expr.args[1].label} & {mask} != 0) RAM_{label}[{write_address}] = {expr.args[3].label};\n",
+                full_exp_from_righthand_side(
+                    eq.var, f"state->RAM_{label}[{read_address}]"
+                ),
+                (
+                    utils.cTypeFromBusSize(expr.static_args[1]).value,
+                    f"RAM_{label}",
+                    expr.static_args[0],
+                ),
+                f"\tif(({expr.args[1].label} & {mask}) != 0) {{ state->RAM_{label}[{write_address}] = {expr.args[3].label}; state->DIRTY_{label}[({write_address}) >> {checkpoint.PAGE_BITS}] = 1; }}\n",
                 None,
             )
         case ast.Exprs.ROM:
             label = eq.var.label
-            read_mask = f"(({utils.cTypeFromBusSize(expr.args[0].length).value}) 1 << {expr.args[0].length}) - 1"
+            read_mask = utils.cMask(expr.args[0].length)
             read_address = f"{expr.args[0].label} & {read_mask}"
             return (
-                full_exp_from_righthand_side(
-                    eq.var, f"(roms->{label})[{read_address}]"
-                ),
-                "",
+                full_exp_from_righthand_side(eq.var, f"ROM_{label}[{read_address}]"),
+                None,
                 "",
-                eq,
+                (label, expr.static_args[0], expr.static_args[1]),
             )
         case _:
-            raise NotImplementedError()
-    return "", "", ""  # pour faire marcher pylint
+            raise NotImplementedError(f"No C code for {expr.type}")
 
 
 def _get_struct(varset, label):
     prefix = "typedef struct {{\n"
     content = ""
-    for i in varset:
+    for i in sorted(varset, key=lambda x: x.label):
         content += f"\t{utils.cTypeFromBusSize(i.length).value} {i.label};\n"
     suffix = f"}}}} {label};\n"
     return prefix + content + suffix
@@ -184,8 +157,8 @@ def _get_struct(varset, label):
 def _get_rom_struct(roms):
     prefix = "typedef struct {{\n"
     content = ""
-    for i in roms:
-        content += f"\t{utils.cTypeFromBusSize(i.var.length).value}* {i.var.label};\n"
+    for label, _, word_size in roms:
+        content += f"\t{utils.cTypeFromBusSize(word_size).value}* {label};\n"
     suffix = f"}}}} Rom_{{short_name}};\n"
     return prefix + content + suffix
 
@@ -199,7 +172,7 @@ def _get_print_output(varset):
     outputs = []
     for i in varset:
         fmt_strs.append(f'"{i.label}=%" PRIx{utils.size_from_bus_size(i.length)} ')
-        outputs.append(f"output->{i.label} & (1 << {i.length}) - 1")
+        outputs.append(f"output->{i.label} & {utils.cMask(i.length)}")
     suffix = '\tprintf("\\n");\n}}\n'
     sep = '", " '
     return prefix + f'\tprintf({sep.join(fmt_strs)}, {", ".join(outputs)});\n' + suffix
@@ -218,21 +191,21 @@ def _get_prompt_input(varset, less_verbose):
             f'\trslt = scanf("%" SCNx{utils.size_from_bus_size(i.length)}, &input->{i.label});\n'
             "\tif (rslt != 1) return false;\n"
         )
-    content += "}}\n"
+    content += "\treturn true;\n}}\n"
     return content
 
 
 def _get_prompt_rom(roms, less_verbose):
     prefix = "void fscan_rom(FILE * f, Rom_{short_name} * roms) {{\n"
     content = ""
-    for e in roms:
-        content += f"\troms->{e.var.label} = calloc(1 << {e.expr.static_args[0]}, sizeof({utils.cTypeFromBusSize(e.expr.static_args[1]).value}));\n"
+    for label, addr_size, word_size in roms:
+        content += f"\troms->{label} = calloc(1 << {addr_size}, sizeof({utils.cTypeFromBusSize(word_size).value}));\n"
         if not less_verbose:
-            content += f'\tprintf("Scanning ROM {e.var.label}\\n");\n'
+            content += f'\tprintf("Scanning ROM {label}\\n");\n'
         content += (
-            f"\tfor(unsigned int i = 0; i < (1 << {e.expr.static_args[0]}); i++) {{{{\n"
-            f'\t\tif(1 != fscanf(f, "%" SCNx{utils.size_from_bus_size(e.expr.static_args[1])}, roms->{e.var.label} + i)) {{{{\n'
-            f'\t\t\tfprintf(stderr, "Scan for ROM {e.var.label} ended at line %d, before filling all the ROM, remaining will be filled with 0s.\\n", i);\n'
+            f"\tfor(unsigned int i = 0; i < (1 << {addr_size}); i++) {{{{\n"
+            f'\t\tif(1 != fscanf(f, "%" SCNx{utils.size_from_bus_size(word_size)}, roms->{label} + i)) {{{{\n'
+            f'\t\t\tfprintf(stderr, "Scan for ROM {label} ended at line %d, before filling all the ROM, remaining will be filled with 0s.\\n", i);\n'
             f"\t\t\tbreak;\n"
             f"\t\t}}}}\n"
             f"}}}}\n"
@@ -241,7 +214,475 @@ def _get_prompt_rom(roms, less_verbose):
     return prefix + content + suffix
 
 
-def transpile2C(netlist_string, helper_functions=True, less_verbose=False):
+def _get_state_struct(states, extra_state="", sparse_ram=None):
+    """
+    Structure `State_{short_name}` qui contient le numéro du cycle et les
+    variables d'état décrites par `states` (voir `_getExpr`): les registres
+    et les RAMs, avec pour chaque RAM les pages modifiées depuis le dernier
+    point de reprise (voir le module `checkpoint`). `extra_state` contient
+    les déclarations de champs supplémentaires propres à un mode de
+    génération (voir le module `events`). Les RAMs de plus de `sparse_ram`
+    bits d'adresse sont creuses (voir le module `sparse`)
+    """
+    prefix = sparse.getTypes(sparse.sparseRams(states, sparse_ram))
+    prefix += "typedef struct {{\n"
+    content = "\tuint64_t cycle;\n"
+    for t, name, addr_size in states:
+        if addr_size is None:
+            content += f"\t{t} {name};\n"
+        elif sparse.isSparse(addr_size, sparse_ram):
+            content += sparse.getStateFields(t, name, addr_size)
+        else:
+            content += f"\t{t} {name}[1 << {addr_size}];\n"
+            content += f"\tuint8_t {checkpoint.dirtyName(name)}[{checkpoint.pageCount(addr_size)}];\n"
+    content += extra_state
+    suffix = "}} State_{short_name};\n"
+    return prefix + content + suffix
+
+
+def _get_state_api(invalidate="", sparse_rams=()):
+    """
+    Fonctions de gestion de l'état: allocation d'un état à 0, remise à 0,
+    copie et libération. Chaque état est une instance indépendante du
+    circuit, plusieurs états peuvent être simulés en même temps (par exemple
+    dans des threads différents).
+
+    `{short_name}_invalidate` (les instructions `invalidate`) est à appeler
+    quand le contenu des ROMs change entre deux cycles: elle ne fait rien,
+    sauf pour les modes de génération qui gardent des valeurs calculées d'un
+    cycle à l'autre (voir le module `events`)
+
+    Les pages des RAMs creuses `sparse_rams` (voir le module `sparse`) sont
+    libérées par `{short_name}_reset` et `{short_name}_free`, et copiées par
+    `{short_name}_clone`
+    """
+    release = "\t{short_name}_release_pages(state);\n" if sparse_rams else ""
+    return (
+        (sparse.getStateCode(sparse_rams) if sparse_rams else "")
+        + "State_{short_name} *{short_name}_create(void) {{\n"
+        "\treturn calloc(1, sizeof(State_{short_name}));\n"
+        "}}\n"
+        "void {short_name}_reset(State_{short_name} *state) {{\n"
+        + release
+        + "\tmemset(state, 0, sizeof *state);\n"
+        "}}\n"
+        "State_{short_name} *{short_name}_clone(const State_{short_name} *state) {{\n"
+        "\tState_{short_name} *copy = malloc(sizeof *copy);\n"
+        "\tif (copy != NULL)\n"
+        "\t\tmemcpy(copy, state, sizeof *copy);\n"
+        + (
+            "\tif (copy != NULL && !{short_name}_copy_pages(copy, state)) {{\n"
+            "\t\tfree(copy);\n"
+            "\t\tcopy = NULL;\n"
+            "\t}}\n"
+            if sparse_rams
+            else ""
+        )
+        + "\treturn copy;\n"
+        "}}\n"
+        "void {short_name}_free(State_{short_name} *state) {{\n"
+        + release
+        + "\tfree(state);\n"
+        "}}\n"
+        "void {short_name}_invalidate(State_{short_name} *state) {{\n"
+        + (invalidate or "\t(void) state;\n")
+        + "}}\n"
+    )
+
+
+def _get_output_masks(outputs, prefix, indent):
+    """
+    Instructions ramenant chaque sortie à sa taille (les bits de poids fort
+    de la variable C ne sont pas forcément nuls, par exemple après un NOT)
+    """
+    return "".join(
+        f"{indent}{prefix}{v.label} &= ({utils.cTypeFromBusSize(v.length).value}) (UINT64_MAX >> {64 - v.length});\n"
+        for v in outputs
+    )
+
+
+def _get_binary_io(outputs):
+    """
+    Lecture et écriture d'enregistrements binaires, par blocs de
+    `{short_name}_BLOCK` cycles:
+      - `read_{short_name}_inputs` lit au plus `n` structures d'entrée depuis
+        le descripteur de fichier `fd`
+      - `run_{short_name}_binary` simule un cycle par structure d'entrée lue
+        sur `in_fd` et écrit les sorties sur `out_fd`
+      - `run_{short_name}_mapped` fait de même à partir d'un tableau
+        d'entrées (par exemple un fichier projeté en mémoire avec `mmap`)
+    Avec `changes_only`, seules les sorties qui diffèrent de celles du cycle
+    précédent sont écrites, sous la forme de structures
+    `Change_{short_name}` qui indiquent aussi le numéro du cycle. Les deux
+    fonctions renvoient le nombre de cycles simulés. Pour une netlist sans
+    entrées, les enregistrements d'entrée sont vides: `run_{short_name}_binary`
+    ne simule rien et seul le `n` de `run_{short_name}_mapped` compte.
+    """
+    changed = " || ".join(f"o->{v.label} != b->last.{v.label}" for v in outputs)
+    content = (
+        "static bool write_{short_name}_records(int fd, const void *buf, size_t size) {{\n"
+        "\tconst char *p = buf;\n"
+        "\twhile (size > 0) {{\n"
+        "\t\tssize_t w = write(fd, p, size);\n"
+        "\t\tif (w < 0) {{\n"
+        "\t\t\tif (errno == EINTR) continue;\n"
+        "\t\t\treturn false;\n"
+        "\t\t}}\n"
+        "\t\tp += w;\n"
+        "\t\tsize -= w;\n"
+        "\t}}\n"
+        "\treturn true;\n"
+        "}}\n"
+        "size_t read_{short_name}_inputs(int fd, Input_{short_name} *inputs, size_t n) {{\n"
+        "\tchar *p = (char *) inputs;\n"
+        "\tsize_t size = n * sizeof *inputs, done = 0;\n"
+        "\twhile (done < size) {{\n"
+        "\t\tssize_t r = read(fd, p + done, size - done);\n"
+        "\t\tif (r < 0 && errno == EINTR) continue;\n"
+        "\t\tif (r <= 0) break;\n"
+        "\t\tdone += r;\n"
+        "\t}}\n"
+        # Une netlist sans entrées a une structure d'entrée vide
+        "\treturn sizeof *inputs ? done / sizeof *inputs : 0;\n"
+        "}}\n"
+        # Tampons et position d'une simulation: rien n'est partagé entre deux
+        # appels, qui peuvent être faits en même temps sur des états différents
+        "typedef struct {{\n"
+        "\tInput_{short_name} inputs[{short_name}_BLOCK];\n"
+        "\tOutput_{short_name} outputs[{short_name}_BLOCK];\n"
+        "\tChange_{short_name} changes[{short_name}_BLOCK];\n"
+        "\tOutput_{short_name} last;\n"
+        "\tuint64_t cycle;\n"
+        "}} Block_{short_name};\n"
+        # Simule au plus {short_name}_BLOCK cycles et écrit leurs sorties
+        "static bool simulate_{short_name}_block(State_{short_name} *state, Block_{short_name} *b, const Input_{short_name} *inputs, size_t n, int fd, Rom_{short_name} *roms, bool changes_only) {{\n"
+        "\tsize_t n_changes = 0;\n"
+        "\tfor (size_t i = 0; i < n; i++, b->cycle++) {{\n"
+        "\t\tOutput_{short_name} *o = b->outputs + i;\n"
+        "\t\t{functionName}(state, (Input_{short_name} *) inputs + i, o, roms);\n"
+    )
+    content += _get_output_masks(outputs, "o->", "\t\t")
+    content += (
+        f"\t\tif (changes_only && (b->cycle == 0 || {changed or 'false'})) {{{{\n"
+        "\t\t\tb->changes[n_changes].cycle = b->cycle;\n"
+        "\t\t\tb->changes[n_changes++].output = *o;\n"
+        "\t\t\tb->last = *o;\n"
+        "\t\t}}\n"
+        "\t}}\n"
+        "\tif (changes_only)\n"
+        "\t\treturn write_{short_name}_records(fd, b->changes, n_changes * sizeof *b->changes);\n"
+        "\treturn write_{short_name}_records(fd, b->outputs, n * sizeof *b->outputs);\n"
+        "}}\n"
+        "uint64_t run_{short_name}_binary(State_{short_name} *state, int in_fd, int out_fd, Rom_{short_name} *roms, bool changes_only) {{\n"
+        "\tBlock_{short_name} *b = calloc(1, sizeof *b);\n"
+        "\tuint64_t total = 0;\n"
+        "\tsize_t n;\n"
+        "\tif (b == NULL) return 0;\n"
+        "\twhile ((n = read_{short_name}_inputs(in_fd, b->inputs, {short_name}_BLOCK)) > 0) {{\n"
+        "\t\tif (!simulate_{short_name}_block(state, b, b->inputs, n, out_fd, roms, changes_only)) break;\n"
+        "\t\ttotal += n;\n"
+        "\t}}\n"
+        "\tfree(b);\n"
+        "\treturn total;\n"
+        "}}\n"
+        "uint64_t run_{short_name}_mapped(State_{short_name} *state, const Input_{short_name} *inputs, size_t n, int out_fd, Rom_{short_name} *roms, bool changes_only) {{\n"
+        "\tBlock_{short_name} *b = calloc(1, sizeof *b);\n"
+        "\tsize_t i;\n"
+        "\tif (b == NULL) return 0;\n"
+        "\tfor (i = 0; i < n; i += {short_name}_BLOCK) {{\n"
+        "\t\tsize_t m = n - i < {short_name}_BLOCK ? n - i : {short_name}_BLOCK;\n"
+        "\t\tif (!simulate_{short_name}_block(state, b, inputs + i, m, out_fd, roms, changes_only)) break;\n"
+        "\t}}\n"
+        "\tfree(b);\n"
+        "\treturn i < n ? i : n;\n"
+        "}}\n"
+    )
+    return content
+
+
+def _get_run(outputs):
+    """
+    Fonction `{functionName}_run` qui simule au plus `n` cycles d'affilée,
+    avec la même entrée à chaque cycle, sans repasser par l'appelant. Les
+    options (`RunOptions_{short_name}`, ou `NULL`) donnent:
+      - des conditions d'arrêt: la simulation s'arrête après le premier
+        cycle où l'une des conditions est vraie. Une condition
+        (`Stop_{short_name}`) est vraie quand toutes les sorties, restreintes
+        aux bits de `mask`, sont égales à celles de `value`
+      - une fonction `observe`, appelée tous les `interval` cycles avec le
+        numéro du cycle (à partir de 1), les sorties et `data`. La
+        simulation s'arrête après ce cycle si elle renvoie une valeur non
+        nulle
+      - un fichier `checkpoint_path`, auquel un point de reprise est ajouté
+        (voir le module `checkpoint`) à chaque fois que le numéro du cycle
+        de l'état est un multiple de `checkpoint_interval`. La simulation
+        s'arrête si l'écriture échoue
+    Les sorties du dernier cycle sont écrites dans `output`, et la fonction
+    renvoie le nombre de cycles simulés.
+    """
+    matches = " && ".join(
+        f"((o->{v.label} ^ c->value.{v.label}) & c->mask.{v.label}) == 0"
+        for v in outputs
+    )
+    content = (
+        "static int {short_name}_stopped(const Output_{short_name} *o, const Stop_{short_name} *stop, size_t n_stop) {{\n"
+        "\tfor (size_t k = 0; k < n_stop; k++) {{\n"
+        "\t\tconst Stop_{short_name} *c = stop + k;\n"
+        f"\t\tif ({matches or '1'}) return 1;\n"
+        "\t}}\n"
+        "\treturn 0;\n"
+        "}}\n"
+        "uint64_t {functionName}_run(State_{short_name} *state, uint64_t n, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms, const RunOptions_{short_name} *options) {{\n"
+        "\tuint64_t i = 0;\n"
+        "\tint checkpoints = options != NULL && options->checkpoint_path != NULL && options->checkpoint_interval > 0;\n"
+        "\tif (options == NULL || (options->n_stop == 0 && (options->observe == NULL || options->interval == 0) && !checkpoints)) {{\n"
+        "\t\tfor (; i < n; i++)\n"
+        "\t\t\t{functionName}(state, input, output, roms);\n"
+        "\t}} else {{\n"
+        "\t\tuint64_t next = options->observe == NULL ? 0 : options->interval;\n"
+        "\t\twhile (i < n) {{\n"
+        "\t\t\t{functionName}(state, input, output, roms);\n"
+        "\t\t\ti++;\n"
+        "\t\t\tif (i == next) {{\n"
+        "\t\t\t\tOutput_{short_name} sample = *output;\n"
+    )
+    content += _get_output_masks(outputs, "sample.", "\t\t\t\t")
+    content += (
+        "\t\t\t\tnext += options->interval;\n"
+        "\t\t\t\tif (options->observe(i, &sample, options->data))\n"
+        "\t\t\t\t\tbreak;\n"
+        "\t\t\t}}\n"
+        "\t\t\tif (options->n_stop > 0 && {short_name}_stopped(output, options->stop, options->n_stop))\n"
+        "\t\t\t\tbreak;\n"
+        "\t\t\tif (checkpoints && state->cycle % options->checkpoint_interval == 0\n"
+        "\t\t\t\t\t&& {short_name}_checkpoint(state, options->checkpoint_path, 1, 0) < 0)\n"
+        "\t\t\t\tbreak;\n"
+        "\t\t}}\n"
+        "\t}}\n"
+    )
+    content += _get_output_masks(outputs, "output->", "\t")
+    content += "\treturn i;\n}}\n"
+    return content
+
+
+def _get_library_api(inputs, outputs, roms, trace=(), sparse_rams=(), hotspots=()):
+    """
+    Fonctions exportées par la bibliothèque partagée utilisée par
+    `netlistSimulator.simulator`: simulation de plusieurs cycles d'un coup,
+    copie de l'état dans un tableau d'octets, description de l'interface
+    (avec les nappes tracées `trace`)
+
+    Les pages des RAMs creuses `sparse_rams` ne sont pas dans la copie de
+    l'état (elles sont vides après `{short_name}_restore`, le simulateur
+    Python passe par un point de reprise) ; `{short_name}_ram_pages` donne
+    leur nombre de pages allouées. Les groupes d'équations dont le temps est
+    compté, `hotspots` (voir le module `hotspots`), sont décrits avec les
+    labels de leurs nappes
+    """
+    content = "size_t {functionName}_step(State_{short_name} *state, size_t n, Input_{short_name} *inputs, Output_{short_name} *outputs, Rom_{short_name}* roms) {{\n"
+    content += "\tfor (size_t i = 0; i < n; i++) {{\n"
+    content += "\t\t{functionName}(state, inputs + i, outputs + i, roms);\n"
+    content += _get_output_masks(outputs, "outputs[i].", "\t\t")
+    content += "\t}}\n\treturn n;\n}}\n"
+
+    content += (
+        "size_t {short_name}_state_size(void) {{\n"
+        "\treturn sizeof(State_{short_name});\n"
+        "}}\n"
+        "uint64_t {short_name}_cycle(const State_{short_name} *state) {{\n"
+        "\treturn state->cycle;\n"
+        "}}\n"
+        "void {short_name}_snapshot(const State_{short_name} *state, uint8_t *buf) {{\n"
+        "\tmemcpy(buf, state, sizeof *state);\n"
+    )
+    # Les pointeurs vers les pages ne sont pas copiés
+    for _, name, _ in sparse_rams:
+        content += f"\tmemset(buf + offsetof(State_{{short_name}}, {name}), 0, sizeof state->{name});\n"
+    content += (
+        "}}\n"
+        "void {short_name}_restore(State_{short_name} *state, const uint8_t *buf) {{\n"
+        + ("\t{short_name}_release_pages(state);\n" if sparse_rams else "")
+        + "\tmemcpy(state, buf, sizeof *state);\n"
+    )
+    for _, name, _ in sparse_rams:
+        content += (
+            f"\tmemset(state->{name}, 0, sizeof state->{name});\n"
+            f"\tstate->PAGES_{name[len('RAM_'):]} = 0;\n"
+        )
+    content += "}}\n"
+    if sparse_rams:
+        content += sparse.getLibraryCode(sparse_rams)
+
+    description = {
+        "inputs": [(v.label, v.length) for v in inputs],
+        "outputs": [(v.label, v.length) for v in outputs],
+        "roms": roms,
+        "trace": [(v.label, v.length) for v in trace],
+    }
+    if sparse_rams:
+        description["sparse_rams"] = sparse.interface(sparse_rams)
+    if hotspots:
+        description["hotspots"] = hotspots
+    interface = json.dumps(description)
+
+    # Le JSON (en ASCII) est aussi un littéral de chaîne C valide
+    literal = json.dumps(interface).replace("{", "{{").replace("}", "}}")
+    content += (
+        f"const char *{{short_name}}_interface(void) {{{{\n\treturn {literal};\n}}}}\n"
+    )
+    return content
+
+
+def _get_map_rom(roms):
+    """
+    Fonction `map_rom` qui projette en mémoire une image binaire de ROM (voir
+    `netlistSimulator.romimage`) et fait pointer les champs de la structure
+    `Rom_{short_name}` directement dans l'image, sans copie.
+
+    Renvoie 1 en cas de succès, 0 si le fichier n'est pas une image de ROM
+    (il faut alors utiliser `fscan_rom`) et -1 en cas d'erreur
+    """
+    content = (
+        "static const void *find_{short_name}_rom(const char *base, size_t size, const char *label, uint32_t addr_size, uint32_t word_size, size_t word_bytes) {{\n"
+        "\tuint32_t count;\n"
+        "\tmemcpy(&count, base + 12, sizeof count);\n"
+        "\tsize_t pos = 16;\n"
+        "\tfor (uint32_t i = 0; i < count; i++) {{\n"
+        "\t\tstruct {{ uint64_t offset; uint32_t addr_size, word_size, label_length, reserved; }} e;\n"
+        "\t\tif (pos + sizeof e > size) break;\n"
+        "\t\tmemcpy(&e, base + pos, sizeof e);\n"
+        "\t\tpos += sizeof e;\n"
+        "\t\tif (e.label_length > size - pos) break;\n"
+        "\t\tconst char *l = base + pos;\n"
+        "\t\tpos += ((size_t) e.label_length + 7) & ~(size_t) 7;\n"
+        "\t\tif (e.label_length != strlen(label) || memcmp(l, label, e.label_length) != 0) continue;\n"
+        "\t\tif (e.addr_size != addr_size || e.word_size != word_size) {{\n"
+        '\t\t\tfprintf(stderr, "ROM %s has %" PRIu32 " bits addresses and %" PRIu32 " bits words in the image, expected %" PRIu32 " and %" PRIu32 "\\n", label, e.addr_size, e.word_size, addr_size, word_size);\n'
+        "\t\t\treturn NULL;\n"
+        "\t\t}}\n"
+        "\t\tif (e.offset % word_bytes != 0 || e.offset > size || (size - e.offset) / word_bytes < ((size_t) 1 << addr_size)) {{\n"
+        '\t\t\tfprintf(stderr, "ROM %s data is out of the image\\n", label);\n'
+        "\t\t\treturn NULL;\n"
+        "\t\t}}\n"
+        "\t\treturn base + e.offset;\n"
+        "\t}}\n"
+        '\tfprintf(stderr, "ROM %s not found in the image\\n", label);\n'
+        "\treturn NULL;\n"
+        "}}\n"
+        "int map_rom(const char *path, Rom_{short_name} * roms) {{\n"
+        "\tint fd = open(path, O_RDONLY);\n"
+        "\tstruct stat st;\n"
+        "\tif (fd < 0 || fstat(fd, &st) < 0) {{\n"
+        "\t\tperror(path);\n"
+        "\t\tif (fd >= 0) close(fd);\n"
+        "\t\treturn -1;\n"
+        "\t}}\n"
+        "\tsize_t size = st.st_size;\n"
+        "\tif (size < 16) {{\n"
+        "\t\tclose(fd);\n"
+        "\t\treturn 0;\n"
+        "\t}}\n"
+        "\tconst char *base = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);\n"
+        "\tclose(fd);\n"
+        "\tif (base == MAP_FAILED) {{\n"
+        '\t\tperror("mmap");\n'
+        "\t\treturn -1;\n"
+        "\t}}\n"
+        '\tif (memcmp(base, "NLSIMROM", 8) != 0) {{\n'
+        "\t\tmunmap((void *) base, size);\n"
+        "\t\treturn 0;\n"
+        "\t}}\n"
+        "\tuint32_t version;\n"
+        "\tmemcpy(&version, base + 8, sizeof version);\n"
+        "\tif (version != 1) {{\n"
+        '\t\tfprintf(stderr, "Unsupported ROM image version %" PRIu32 "\\n", version);\n'
+        "\t\tgoto error;\n"
+        "\t}}\n"
+    )
+    for label, addr_size, word_size in roms:
+        t = utils.cTypeFromBusSize(word_size).value
+        content += (
+            f'\troms->{label} = ({t} *) find_{{short_name}}_rom(base, size, "{label}", {addr_size}, {word_size}, sizeof({t}));\n'
+            f"\tif (roms->{label} == NULL) goto error;\n"
+        )
+    content += (
+        "\treturn 1;\n"
+        "error:\n"
+        "\tmunmap((void *) base, size);\n"
+        "\treturn -1;\n"
+        "}}\n"
+    )
+    return content
+
+
+"""
+Valeurs des noms utilisées par `transpile2C`: des marqueurs qui ne peuvent
+pas apparaître dans le code généré, remplacés à la fin par les placeholders
+"""
+_PLACEHOLDERS = {
+    name: f"\0{name}\0" for name in ("short_name", "filename", "functionName")
+}
+
+
+def _withPlaceholders(code):
+    """
+    Remplace les marqueurs de `_PLACEHOLDERS` dans le code écrit par
+    placeholders compatibles avec `format`
+    """
+    code = code.replace("{", "{{").replace("}", "}}")
+    for name, marker in _PLACEHOLDERS.items():
+        code = code.replace(marker, f"{{{name}}}")
+    return code
+
+
+"""
+Taille au-delà de laquelle le corps de la fonction de simulation est écrit
+dans un fichier temporaire plutôt que gardé en mémoire
+"""
+SPOOL_SIZE = 1 << 20
+
+
+class _CWriter:
+    """
+    Écrit du code C au fur et à mesure dans le fichier texte `f`. `names`
+    donne la valeur des noms `short_name`, `filename` et `functionName`.
+
+    Les morceaux fixes (ceux des fonctions `_get_*`) sont des modèles pour
+    `format`, écrits avec `template`. Le code des équations et le contenu des
+    ROMs sont écrits tels quels avec `write`
+    """
+
+    def __init__(self, f, names):
+        self.f = f
+        self.names = names
+        self.size = 0  # Nombre de caractères écrits
+
+    def write(self, code):
+        self.size += len(code)
+        self.f.write(code)
+
+    def template(self, code):
+        self.write(code.format(**self.names))
+
+
+def transpile2C(
+    netlist_string,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    cache_file=None,
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    rom_output=None,
+    optimize=None,
+    trace=None,
+    sparse_ram=None,
+    share_cones=None,
+    hotspots=None,
+    hotspot_map=None,
+    profile=None,
+):
     """
     Renvoie un couple de strings correpondant au fichier headers et aux
     sources. Il comportent 3 placeholders compatibles avec la fonctions
@@ -253,70 +694,584 @@ def transpile2C(netlist_string, helper_functions=True, less_verbose=False):
       - filename: le nom prévu pour le fichier fichier source (dépourvu de
         l'extension .c (le fichier source contiendra un include vers
         `{filename}.h`
+
+    Le code est construit en mémoire: pour les grosses netlists,
+    `transpile2CFiles` écrit directement dans les fichiers. Les autres
+    paramètres sont ceux de `transpile2CFiles`.
     """
-    print("Generating AST")
-    netlist = getAST(netlist_string)
-    print("Topological sort")
-    ordered_eqns = utils.getOrderedNetList(netlist)
-    print("Genrating C code")
+    h_file = io.StringIO()
+    c_file = io.StringIO()
+    transpile2CFiles(
+        netlist_string,
+        h_file,
+        c_file,
+        _PLACEHOLDERS,
+        helper_functions=helper_functions,
+        less_verbose=less_verbose,
+        parser_algorithm=parser_algorithm,
+        cache_file=cache_file,
+        library=library,
+        binary_io=binary_io,
+        rom_contents=rom_contents,
+        rom_output=rom_output,
+        optimize=optimize,
+        trace=trace,
+        sparse_ram=sparse_ram,
+        share_cones=share_cones,
+        hotspots=hotspots,
+        hotspot_map=hotspot_map,
+        profile=profile,
+    )
+    return _withPlaceholders(h_file.getvalue()), _withPlaceholders(c_file.getvalue())
 
-    # Generating header file
-    h_file = "#ifndef {filename}_H\n#include <stdint.h>\n"
-    if helper_functions:
-        h_file += "#include <stdlib.h>\n#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n"
-    h_file += "\n#define {filename}_H\n"
-    # Input struct
-    h_file += _get_struct(netlist.inputs, "Input_{short_name}")
-    # output struct
-    h_file += _get_struct(netlist.outputs, "Output_{short_name}")
 
-    # Generating the C file
-    # String containing the C code file
-    c_file = '#include <stdint.h>\n#include "{filename}.h"\n\n'
-    if helper_functions:
-        c_file += "#include <stdlib.h>\n#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n\n"
-    c_file += "void {functionName}(Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms) {{\n"
+def transpile2CFiles(
+    netlist_string,
+    h_file,
+    c_file,
+    names,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    cache_file=None,
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    rom_output=None,
+    optimize=None,
+    trace=None,
+    sparse_ram=None,
+    share_cones=None,
+    hotspots=None,
+    hotspot_map=None,
+    profile=None,
+):
+    """
+    Écrit le header et les sources dans les fichiers texte `h_file` et
+    `c_file`, au fur et à mesure de la génération. `names` est un
+    dictionnaire donnant les noms `short_name`, `filename` et `functionName`
+    (voir `transpile2C`) : ils sont remplacés pendant l'écriture, le code
+    écrit est du C prêt à compiler (sans passer par `format`).
+
+    `parser_algorithm` permet de choisir l'algorithme de parsing (`"lalr"` ou
+    `"earley"`, voir `parser.parse`)
+
+    Si `cache_file` est fourni, la transpilation est incrémentale (voir le
+    module `incremental`): seules les équations modifiées depuis le dernier
+    appel avec le même fichier de cache sont re-parsées et re-générées. Le
+    résultat est identique à celui d'une transpilation complète.
+
+    L'état du circuit (registres et RAMs) est une structure
+    `State_{short_name}`, passée à la fonction de simulation et à toutes les
+    fonctions qui simulent des cycles: on peut simuler plusieurs instances
+    du circuit, y compris en même temps dans des threads différents. Les
+    fonctions `{short_name}_create`, `{short_name}_reset`,
+    `{short_name}_clone` et `{short_name}_free` (voir `_get_state_api`)
+    allouent, remettent à 0, copient et libèrent un état.
+
+    Avec `library`, le code est prévu pour être compilé en bibliothèque
+    partagée et chargé par `netlistSimulator.simulator.Simulator`: les
+    fonctions `{functionName}_step`, `{short_name}_snapshot`,
+    `{short_name}_restore`, `{short_name}_state_size` et
+    `{short_name}_interface` sont ajoutées.
+
+    La fonction `{functionName}_run` (voir `_get_run`) simule plusieurs
+    cycles d'affilée avec une entrée constante, jusqu'à une condition d'arrêt
+    sur les sorties.
+
+    Avec `binary_io`, les fonctions de `_get_binary_io` sont ajoutées: elles
+    lisent les entrées et écrivent les sorties sous forme d'enregistrements
+    binaires (les structures C telles quelles), par blocs, ce qui est bien
+    plus rapide que `prompt_{short_name}_input` et
+    `print_{short_name}_output` (voir aussi `netlistSimulator.records`).
+
+    `rom_contents` (une chaîne ou un fichier texte au format lu par
+    `fscan_rom`) permet de fixer le contenu des ROMs à la transpilation: il
+    est inclus dans le code sous forme de tableaux `static const` (voir le
+    module `roms`) et le paramètre `roms` de la fonction de simulation est
+    ignoré. Si `rom_output` (un fichier texte) est fourni, les tableaux y
+    sont écrits au fur et à mesure et le fichier source inclut
+    `{filename}_roms.h`, qui doit être le nom de ce fichier. Sinon, ils sont
+    ajoutés au fichier source.
+
+    `optimize` applique des passes d'optimisation à la netlist avant la
+    génération (voir le module `passes`): `True` pour les passes par défaut,
+    ou une liste de noms de passes. Ce n'est pas compatible avec la
+    transpilation incrémentale.
+
+    `trace` est une liste de motifs de noms de nappes (par exemple
+    `["pc", "alu_*"]`): les nappes choisies sont copiées dans l'état à
+    chaque cycle et les fonctions d'écriture de traces VCD sont ajoutées
+    (voir le module `trace`). Ce n'est pas compatible avec la transpilation
+    incrémentale.
+
+    Les RAMs de plus de `sparse_ram` bits d'adresse sont creuses: leurs pages
+    sont allouées à la première écriture (voir le module `sparse`). Ce n'est
+    pas compatible avec la transpilation incrémentale.
+
+    Avec `share_cones` (un nombre minimal d'équations, ou `True` pour
+    `cones.DEFAULT_MIN_SIZE`), les cônes combinatoires isomorphes qui
+    apparaissent plusieurs fois sont calculés par une seule fonction C
+    (voir le module `cones`). Ce n'est pas compatible avec la transpilation
+    incrémentale.
+
+    Avec `hotspots` (un nombre d'équations ou un séparateur, voir le module
+    `hotspots`), les équations sont groupées et la fonction de simulation
+    compte le temps passé dans chaque groupe. La description des groupes
+    (les labels de leurs nappes) est écrite dans le fichier texte
+    `hotspot_map` si il est fourni. Ce n'est pas compatible avec la
+    transpilation incrémentale.
+
+    Les durées, les compteurs et éventuellement les pics de mémoire de
+    chaque étape sont enregistrés dans `profile` (un `profiling.Profile`,
+    nouveau par défaut), qui est renvoyé.
+    """
+    if profile is None:
+        profile = profiling.Profile()
+    h = _CWriter(h_file, names)
+    c = _CWriter(c_file, names)
+    options = {
+        "helper_functions": helper_functions,
+        "less_verbose": less_verbose,
+        "library": library,
+        "binary_io": binary_io,
+        "rom_contents": rom_contents,
+        "rom_output": rom_output,
+    }
+    checkOptions(
+        {
+            "incremental": cache_file is not None,
+            "optimize": optimize,
+            "trace": trace,
+            "sparse_ram": sparse_ram,
+            "share_cones": share_cones,
+            "hotspots": hotspots,
+        }
+    )
+    if cache_file is not None:
+        _transpileIncremental(
+            netlist_string, cache_file, parser_algorithm, h, c, options, profile
+        )
+        return profile
+    netlist, ordered_eqns = getScheduledNetList(
+        netlist_string, parser_algorithm, optimize, profile
+    )
+    profile.stage("emit")
+    trace = tracer.selectSignals(netlist, ordered_eqns, trace) if trace else ()
+    getExpr = lambda eq: _getExpr(eq, sparse_ram)
+    fragments = (getExpr(eq) for eq in ordered_eqns)
+    functions = ""
+    if share_cones:
+        shared = cones.shareCones(
+            ordered_eqns,
+            netlist.outputs,
+            _getCombinational,
+            cones.DEFAULT_MIN_SIZE if share_cones is True else share_cones,
+            keep=[v.label for v in trace],
+        )
+        log.info("%s", shared.report())
+        profile.count("shared_cones", len(shared.functions))
+        profile.count("cone_instances", len(shared.calls))
+        fragments = shared.fragments(ordered_eqns, getExpr)
+        functions = shared.code()
+        getExpr = lambda eq, expr=getExpr: shared.fragment(eq, expr)
+    groups = ()
+    if hotspots is not None:
+        groups, fragments = timers.instrument(ordered_eqns, getExpr, hotspots)
+        functions += timers.getTimerCode(groups)
+        profile.count("hotspot_groups", len(groups))
+        if hotspot_map is not None:
+            timers.writeGroupMap(hotspot_map, groups)
+    _assemble(
+        h,
+        c,
+        netlist.inputs,
+        netlist.outputs,
+        fragments,
+        trace=trace,
+        sparse_ram=sparse_ram,
+        functions=functions,
+        hotspots=groups,
+        **options,
+    )
+    _countWritten(profile, h, c)
+    profile.finish()
+    return profile
+
+
+def _countWritten(profile, h, c):
+    profile.count("h_chars", h.size)
+    profile.count("c_chars", c.size)
+
+
+def _assemble(
+    h,
+    c,
+    inputs,
+    outputs,
+    fragments,
+    helper_functions,
+    less_verbose,
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    rom_output=None,
+    trace=(),
+    sparse_ram=None,
+    functions="",
+    hotspots=(),
+):
+    """
+    Écrit les fichiers header et source (avec les `_CWriter` `h` et `c`) à
+    partir des entrées/sorties de la netlist et des fragments renvoyés par
+    `_getExpr`, dans l'ordre topologique (`fragments` peut être un
+    générateur, il n'est parcouru qu'une fois).
+
+    Le corps de la fonction de simulation et les mises à jour de l'état sont
+    écrits dans des fichiers temporaires (en mémoire tant qu'ils sont petits)
+    pendant le parcours, puis recopiés après les déclarations, qui ne sont
+    connues qu'à la fin.
+
+    Avec `library`, les fonctions de `_get_library_api` sont ajoutées. Avec
+    `binary_io`, celles de `_get_binary_io` le sont. Voir `transpile2CFiles` pour
+    `rom_contents` et `rom_output`. `trace` est la liste des nappes tracées
+    (voir `trace.selectSignals`). Les RAMs de plus de `sparse_ram` bits
+    d'adresse sont creuses (les fragments doivent avoir été générés avec le
+    même `sparse_ram`). `functions` est du code C (prêt à compiler) écrit
+    avant la fonction de simulation, par exemple les fonctions des cônes
+    partagés (voir le module `cones`). `hotspots` sont les groupes
+    d'équations dont le temps est compté (voir `hotspots.instrument`)
+    """
+    inputs = sorted(inputs, key=lambda x: x.label)
+    outputs = sorted(outputs, key=lambda x: x.label)
 
-    c_func_prefix = ""
-    c_func_body = ""
-    c_func_suffix = ""
     roms = []  # Une liste qui stocke toute les roms
+    states = []  # Les variables d'état (registres et RAMs)
+    with tempfile.SpooledTemporaryFile(
+        SPOOL_SIZE, mode="w+"
+    ) as body, tempfile.SpooledTemporaryFile(SPOOL_SIZE, mode="w+") as suffix:
+        for exp, state, suf, r in fragments:
+            if r is not None:
+                roms.append(r)
+            if state is not None:
+                states.append(state)
+            body.write(exp)
+            suffix.write(suf)
+        roms.sort()
 
-    for v in netlist.inputs:
-        c_func_prefix += f"\t{utils.cTypeFromBusSize(v.length).value} {v.label} = input->{v.label};\n"
+        # Generating the C file
+        _write_includes(c, helper_functions, binary_io)
+        if rom_contents is not None:
+            contents = readHexRom(rom_contents, roms)
+            if rom_output is not None:
+                writeRomArrays(rom_output, roms, contents)
+                c.template('#include "{filename}_roms.h"\n')
+            else:
+                writeRomArrays(c, roms, contents)
 
-    for eq in ordered_eqns:
-        exp, pre, suf, r = _getExpr(eq)
-        if r is not None:
-            roms.append(r)
-        c_func_body += exp
-        c_func_prefix += pre
-        c_func_suffix += suf
+        if rom_contents is not None:
+            c.write("\n")
+        sparse_rams = sparse.sparseRams(states, sparse_ram)
+        if sparse_rams:
+            c.template(sparse.getAccessCode(sparse_rams))
+        c.write(functions)
+        c.template(
+            "void {functionName}(State_{short_name} *state, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms) {{\n"
+        )
+        for v in inputs:
+            c.write(
+                f"\t{utils.cTypeFromBusSize(v.length).value} {v.label} = input->{v.label};\n"
+            )
+        if rom_contents is None:
+            for label, _, word_size in roms:
+                c.write(
+                    f"\t{utils.cTypeFromBusSize(word_size).value} *ROM_{label} = roms->{label};\n"
+                )
+        c.write("\n")
+        body.seek(0)
+        shutil.copyfileobj(body, c)
+        c.write("\n")
+        c.write(tracer.getTraceStores(trace))
+        suffix.seek(0)
+        shutil.copyfileobj(suffix, c)
+    c.write("\tstate->cycle++;\n")
+    for v in outputs:
+        c.write(f"\toutput->{v.label} = {v.label};\n")
+    c.write("\n}\n")
 
-    for v in netlist.outputs:
-        c_func_suffix += f"\toutput->{v.label} = {v.label};\n"
+    _write_api(
+        h,
+        c,
+        inputs,
+        outputs,
+        states,
+        roms,
+        helper_functions,
+        less_verbose,
+        library,
+        binary_io,
+        trace=trace,
+        sparse_ram=sparse_ram,
+        hotspots=hotspots,
+    )
 
-    roms.sort(key=lambda x: x.var.label)
 
-    c_file += f"{c_func_prefix}\n{c_func_body}\n{c_func_suffix}\n"
-    c_file += "}}\n"
+def _write_includes(c, helper_functions, binary_io):
+    """
+    Écrit le début du fichier source: les `#include` nécessaires
+    """
+    c.template('#include <stdint.h>\n#include "{filename}.h"\n\n')
+    if helper_functions:
+        c.write(
+            "#include <stdlib.h>\n#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n"
+        )
+        c.write(
+            "#include <string.h>\n#include <fcntl.h>\n#include <unistd.h>\n#include <sys/mman.h>\n#include <sys/stat.h>\n\n"
+        )
+    else:
+        c.write("#include <stdlib.h>\n#include <stdio.h>\n#include <string.h>\n\n")
+    if binary_io:
+        c.write("#include <errno.h>\n#include <unistd.h>\n\n")
 
+
+def _write_api(
+    h,
+    c,
+    inputs,
+    outputs,
+    states,
+    roms,
+    helper_functions,
+    less_verbose,
+    library,
+    binary_io,
+    extra_state="",
+    invalidate="",
+    trace=(),
+    sparse_ram=None,
+    hotspots=(),
+):
+    """
+    Écrit la fin du fichier source (fonctions d'entrée/sortie, de la
+    bibliothèque, ...) et le fichier header. `inputs`, `outputs` et `roms`
+    sont triés. Voir `_get_state_struct` et `_get_state_api` pour
+    `extra_state` et `invalidate`, le module `trace` pour les nappes
+    tracées `trace`, le module `sparse` pour `sparse_ram` et le module
+    `hotspots` pour les groupes d'équations `hotspots`
+    """
+    sparse_rams = sparse.sparseRams(states, sparse_ram)
     if helper_functions:
-        c_file += _get_print_output(netlist.outputs)
-        c_file += _get_prompt_input(netlist.inputs, less_verbose)
-        c_file += _get_prompt_rom(roms, less_verbose)
+        c.template(_get_print_output(outputs))
+        c.template(_get_prompt_input(inputs, less_verbose))
+        c.template(_get_prompt_rom(roms, less_verbose))
+        c.template(_get_map_rom(roms))
+    c.template(_get_state_api(invalidate, sparse_rams))
+    c.template(checkpoint.getCheckpointCode(states, invalidate, sparse_ram))
+    c.template(_get_run(outputs))
+    if library:
+        c.template(
+            _get_library_api(inputs, outputs, roms, trace, sparse_rams, hotspots)
+        )
+    if binary_io:
+        c.template(_get_binary_io(outputs))
+    if trace:
+        c.template(tracer.getTraceCode(trace))
+        if library:
+            c.template(tracer.getTraceStep())
+    if hotspots:
+        c.template(timers.getReportCode(hotspots))
 
-    # On termine le fichier de headers
-    h_file += _get_rom_struct(roms)
-    h_file += "void {functionName}(Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms);\n"
+    # Generating header file
+    h.template("#ifndef {filename}_H\n#include <stdint.h>\n")
     if helper_functions:
-        h_file += "void print_{short_name}_output(Output_{short_name} *output);\n"
-        h_file += "bool prompt_{short_name}_input(Input_{short_name} *input);\n"
-        h_file += "void fscan_rom(FILE * f, Rom_{short_name} * roms);\n"
-    h_file += "\n#endif"
+        h.write(
+            "#include <stdlib.h>\n#include <stdio.h>\n#include <stdbool.h>\n#include <inttypes.h>\n"
+        )
+    h.write("#include <stddef.h>\n")
+    if binary_io and not helper_functions:
+        h.write("#include <stdbool.h>\n")
+    h.template("\n#define {filename}_H\n")
+    # Input struct
+    h.template(_get_struct(inputs, "Input_{short_name}"))
+    # output struct
+    h.template(_get_struct(outputs, "Output_{short_name}"))
+    h.template(_get_rom_struct(roms))
+    h.template(
+        _get_state_struct(
+            states, extra_state + tracer.getTraceFields(trace), sparse_ram
+        )
+    )
+    h.template(
+        "void {functionName}(State_{short_name} *state, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms);\n"
+        "State_{short_name} *{short_name}_create(void);\n"
+        "void {short_name}_reset(State_{short_name} *state);\n"
+        "State_{short_name} *{short_name}_clone(const State_{short_name} *state);\n"
+        "void {short_name}_free(State_{short_name} *state);\n"
+        "void {short_name}_invalidate(State_{short_name} *state);\n"
+    )
+    h.template(checkpoint.getCheckpointHeader(states))
+    h.template(
+        "typedef struct {{\n\tOutput_{short_name} mask;\n\tOutput_{short_name} value;\n}} Stop_{short_name};\n"
+        "typedef struct {{\n"
+        "\tconst Stop_{short_name} *stop;\n"
+        "\tsize_t n_stop;\n"
+        "\tuint64_t interval;\n"
+        "\tint (*observe)(uint64_t cycle, const Output_{short_name} *output, void *data);\n"
+        "\tvoid *data;\n"
+        "\tconst char *checkpoint_path;\n"
+        "\tuint64_t checkpoint_interval;\n"
+        "}} RunOptions_{short_name};\n"
+        "uint64_t {functionName}_run(State_{short_name} *state, uint64_t n, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms, const RunOptions_{short_name} *options);\n"
+    )
+    if helper_functions:
+        h.template(
+            "void print_{short_name}_output(Output_{short_name} *output);\n"
+            "bool prompt_{short_name}_input(Input_{short_name} *input);\n"
+            "void fscan_rom(FILE * f, Rom_{short_name} * roms);\n"
+            "int map_rom(const char *path, Rom_{short_name} * roms);\n"
+        )
+    if library:
+        h.template(
+            "size_t {functionName}_step(State_{short_name} *state, size_t n, Input_{short_name} *inputs, Output_{short_name} *outputs, Rom_{short_name}* roms);\n"
+            "size_t {short_name}_state_size(void);\n"
+            "uint64_t {short_name}_cycle(const State_{short_name} *state);\n"
+            "void {short_name}_snapshot(const State_{short_name} *state, uint8_t *buf);\n"
+            "void {short_name}_restore(State_{short_name} *state, const uint8_t *buf);\n"
+            "const char *{short_name}_interface(void);\n"
+        )
+        if sparse_rams:
+            h.template(
+                "uint64_t {short_name}_ram_pages(const State_{short_name} *state, size_t k);\n"
+            )
+    if binary_io:
+        h.template(
+            "#define {short_name}_BLOCK 4096\n"
+            "typedef struct {{\n\tuint64_t cycle;\n\tOutput_{short_name} output;\n}} Change_{short_name};\n"
+            "size_t read_{short_name}_inputs(int fd, Input_{short_name} *inputs, size_t n);\n"
+            "uint64_t run_{short_name}_binary(State_{short_name} *state, int in_fd, int out_fd, Rom_{short_name} *roms, bool changes_only);\n"
+            "uint64_t run_{short_name}_mapped(State_{short_name} *state, const Input_{short_name} *inputs, size_t n, int out_fd, Rom_{short_name} *roms, bool changes_only);\n"
+        )
+    if trace:
+        h.template(tracer.getTraceHeader(library))
+    if hotspots:
+        h.template(timers.getHeader())
+    h.write("\n#endif")
+
 
-    return h_file, c_file
+def _transpileIncremental(
+    netlist_string, cache_file, parser_algorithm, h, c, options, profile
+):
+    """
+    Version incrémentale de `transpile2CFiles`. Si le cache ne peut pas être
+    utilisé (premier appel, en-tête de la netlist modifié, nappe non déclarée
+    touchée par une modification, ...) on refait une transpilation complète
+    et on remplit le cache. `options` contient les options de `_assemble`.
+    Les étapes sont enregistrées dans `profile` (la mise à jour du cache est
+    l'étape `incremental`)
+    """
+    profile.stage("incremental")
+    cache_options = (options["helper_functions"], options["less_verbose"])
+    cache = incremental.TranspileCache.load(cache_file)
+    changed = None
+    if cache is not None and cache.unchanged(netlist_string, cache_options):
+        changed = 0
+    elif cache is not None:
+        split = incremental.splitNetlist(netlist_string)
+        if split is not None and cache.matches(split, cache_options):
+            changed = cache.update(
+                netlist_string, split, parser.parseEquations, _getExpr
+            )
+            if changed is not None:
+                cache.save(cache_file)
+    if changed is not None:
+        log.info("Incremental transpilation (%d lines changed)", changed)
+        profile.count("changed_lines", changed)
+        inputs, outputs = cache.interface()
+        profile.stage("emit")
+        _assemble(
+            h,
+            c,
+            inputs,
+            outputs,
+            cache.orderedFragments(),
+            **options,
+        )
+        _countWritten(profile, h, c)
+        profile.finish()
+        return
 
+    netlist, ordered_eqns = getScheduledNetList(
+        netlist_string, parser_algorithm, None, profile
+    )
+    profile.stage("emit")
+    fragments = {eq.var.label: _getExpr(eq) for eq in netlist.equations}
+    cache = incremental.TranspileCache.fromNetList(
+        netlist, netlist_string, cache_options, ordered_eqns, fragments
+    )
+    if cache is not None:
+        cache.save(cache_file)
+    _assemble(
+        h,
+        c,
+        netlist.inputs,
+        netlist.outputs,
+        (fragments[eq.var.label] for eq in ordered_eqns),
+        **options,
+    )
+    _countWritten(profile, h, c)
+    profile.finish()
+
+
+def optimizeNetList(netlist, optimize, profile=None):
+    """
+    Applique à `netlist` les passes demandées par `optimize` (voir
+    `transpile2C`) et journalise leurs statistiques. L'étape `optimize` est
+    enregistrée dans `profile` si il est fourni
+    """
+    if not optimize:
+        return netlist
+    manager = passes.PassManager(
+        passes.DEFAULT_PASSES if optimize is True else optimize
+    )
+    before = len(netlist.equations)
+    if profile is None:
+        log.info(profiling.STAGES["optimize"])
+    else:
+        profile.stage("optimize")
+    manager.run(netlist)
+    log.info("%d equations -> %d equations", before, len(netlist.equations))
+    log.info("%s", manager.report())
+    if profile is not None:
+        profile.count("equations", len(netlist.equations))
+        profile.count("removed", before - len(netlist.equations))
+    return netlist
 
-def getAST(code_string):
-    return parser.parse(code_string)
+
+def getAST(code_string, parser_algorithm="lalr", profile=None):
+    """
+    Parse la netlist (voir `parser.parse`). Les étapes du parsing et la
+    taille de la netlist sont enregistrées dans `profile` si il est fourni
+    """
+    netlist = parser.parse(code_string, parser_algorithm, profile)
+    if profile is not None:
+        profile.count("equations", len(netlist.equations))
+        profile.count("wires", len(netlist.equations.wires))
+        profile.count("constants", len(netlist.equations.constants))
+    return netlist
+
+
+def getScheduledNetList(
+    netlist_string, parser_algorithm, optimize, profile, registers_first=False
+):
+    """
+    Parse la netlist, l'optimise (voir `optimizeNetList`) et ordonne ses
+    équations (voir `utils.getOrderedNetList`). Renvoie le couple `(netlist,
+    équations dans l'ordre topologique)`. Les étapes `parse`, `optimize` et
+    `schedule` sont enregistrées dans `profile`
+    """
+    netlist = getAST(netlist_string, parser_algorithm, profile)
+    optimizeNetList(netlist, optimize, profile)
+    profile.stage("schedule")
+    ordered_eqns = utils.getOrderedNetList(netlist, registers_first)
+    profile.count("equations", len(ordered_eqns))
+    return netlist, ordered_eqns
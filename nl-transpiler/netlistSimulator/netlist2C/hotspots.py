@@ -0,0 +1,296 @@
+"""
+Mode instrumenté: compteurs de temps par groupe d'équations.
+
+Les équations ordonnées sont réparties en groupes, par morceaux de `n`
+équations consécutives (`by` est un entier) ou par préfixe hiérarchique du
+label de la nappe (`by` est le séparateur: le préfixe est ce qui précède sa
+première occurrence, les labels sans séparateur forment le groupe `""`).
+Les équations d'un même préfixe sont rapprochées autant que l'ordre
+topologique le permet (voir `_clusterOrder`).
+
+Dans la fonction de simulation, chaque suite d'équations consécutives d'un
+même groupe est suivie d'une lecture de l'horloge (`__rdtsc` sur x86,
+`clock_gettime` ailleurs) dont l'écart avec la lecture précédente est ajouté
+au compteur du groupe: une seule lecture à chaque changement de groupe. Les
+mises à jour de l'état en fin de cycle forment le groupe `UPDATE_GROUP`.
+
+Les compteurs sont des variables globales du fichier source, partagées par
+toutes les instances (et pas protégées entre threads). À la fin du
+programme, ils sont écrits dans le fichier `$NL_HOTSPOTS_FILE` (`-` pour la
+sortie d'erreur) si cette variable est définie: une ligne `# unité cycles`
+puis une ligne `numéro<TAB>nom<TAB>compte` par groupe. `readReport` lit ce
+fichier et `mapReport` relie chaque groupe aux labels de ses nappes.
+"""
+
+import heapq
+import json
+
+"""
+Variable d'environnement donnant le fichier du rapport écrit à la fin du
+programme
+"""
+REPORT_VARIABLE = "NL_HOTSPOTS_FILE"
+
+"""
+Nom du groupe des mises à jour de l'état (registres, RAMs) en fin de cycle
+"""
+UPDATE_GROUP = "(state updates)"
+
+
+def parseGroups(spec):
+    """
+    Lit la façon de grouper les équations donnée en ligne de commande: un
+    nombre d'équations par morceau, `prefix` (séparateur `_`) ou
+    `prefix:SÉPARATEUR`
+    """
+    if spec.isdigit() and int(spec) > 0:
+        return int(spec)
+    if spec == "prefix":
+        return "_"
+    if spec.startswith("prefix:") and len(spec) > len("prefix:"):
+        return spec[len("prefix:") :]
+    raise ValueError(
+        f"Invalid equation groups {spec!r} (expected a positive number of equations, prefix or prefix:SEPARATOR)"
+    )
+
+
+def _clusterOrder(ordered_eqns, indices):
+    """
+    Autre ordre topologique des équations `ordered_eqns` (dans l'ordre
+    topologique), dont la `i`-ième est dans le groupe `indices[i]`: on
+    continue le groupe en cours tant qu'une de ses équations est prête, puis
+    on passe au groupe de l'équation prête qui venait en premier. Renvoie la
+    liste des positions des équations dans `ordered_eqns`
+    """
+    position = {eq.var.label: i for i, eq in enumerate(ordered_eqns)}
+    waiting = [0] * len(ordered_eqns)  # Dépendances pas encore placées
+    readers = [[] for _ in ordered_eqns]
+    for i, eq in enumerate(ordered_eqns):
+        for label in set(v.label for v in eq.expr.getDeps()):
+            j = position.get(label)
+            if j is not None:
+                waiting[i] += 1
+                readers[j].append(i)
+    ready = [[] for _ in range(max(indices, default=-1) + 1)]  # Un tas par groupe
+    everything = []  # Toutes les équations prêtes, dont celles déjà placées
+    for i, w in enumerate(waiting):
+        if w == 0:
+            ready[indices[i]].append(i)
+            everything.append(i)
+    order = []
+    placed = [False] * len(ordered_eqns)
+    current = None
+    while len(order) < len(ordered_eqns):
+        if current is None or not ready[current]:
+            while placed[everything[0]]:
+                heapq.heappop(everything)
+            current = indices[everything[0]]
+        i = heapq.heappop(ready[current])
+        placed[i] = True
+        order.append(i)
+        for j in readers[i]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                heapq.heappush(ready[indices[j]], j)
+                heapq.heappush(everything, j)
+    return order
+
+
+def groupEquations(ordered_eqns, by):
+    """
+    Répartit les équations `ordered_eqns` (dans l'ordre topologique) en
+    groupes (voir le module). Renvoie la liste des groupes, des couples
+    `(nom, labels des nappes)` dans l'ordre de leur première équation, les
+    équations dans l'ordre où les écrire et le numéro du groupe de chacune
+    """
+    groups = []
+    indices = []
+    if isinstance(by, int):
+        for i, eq in enumerate(ordered_eqns):
+            if i % by == 0:
+                groups.append((f"chunk_{i // by}", []))
+            groups[-1][1].append(eq.var.label)
+            indices.append(len(groups) - 1)
+        return groups, list(ordered_eqns), indices
+    numbers = {}
+    for eq in ordered_eqns:
+        label = eq.var.label
+        prefix = label.split(by, 1)[0] if by in label else ""
+        if prefix not in numbers:
+            numbers[prefix] = len(groups)
+            groups.append((prefix, []))
+        groups[numbers[prefix]][1].append(label)
+        indices.append(numbers[prefix])
+    order = _clusterOrder(ordered_eqns, indices)
+    return groups, [ordered_eqns[i] for i in order], [indices[i] for i in order]
+
+
+def _stop(k):
+    """
+    Instructions C qui ajoutent au compteur `k` le temps écoulé depuis la
+    dernière lecture de l'horloge
+    """
+    return (
+        "\thotspot_u = HOTSPOT_NOW();\n"
+        f"\thotspot_ticks[{k}] += hotspot_u - hotspot_t;\n"
+        "\thotspot_t = hotspot_u;\n"
+    )
+
+
+def instrument(ordered_eqns, fragment, by):
+    """
+    Groupe les équations `ordered_eqns` (voir `groupEquations`) et renvoie
+    le couple `(groupes, fragments)`, où `fragments` sont ceux de
+    `fragment(eq)` (voir `generator._getExpr`, `None` si l'équation n'a pas
+    de code) entourés des lectures de l'horloge. Le dernier groupe est
+    `UPDATE_GROUP`
+    """
+    groups, ordered_eqns, indices = groupEquations(ordered_eqns, by)
+    update = len(groups)
+    groups.append((UPDATE_GROUP, []))
+
+    def fragments():
+        yield (
+            "\thotspot_cycles++;\n\tuint64_t hotspot_t = HOTSPOT_NOW(), hotspot_u;\n",
+            None,
+            "",
+            None,
+        )
+        current = None
+        for eq, k in zip(ordered_eqns, indices):
+            f = fragment(eq)
+            if f is None:
+                continue
+            if current is not None and k != current:
+                yield (_stop(current), None, "", None)
+            current = k
+            yield f
+        # Les mises à jour de l'état sont écrites après toutes les équations
+        yield (_stop(current) if current is not None else "", None, _stop(update), None)
+
+    return groups, fragments()
+
+
+def getTimerCode(groups):
+    """
+    Code C des compteurs et de la lecture de l'horloge, à écrire avant la
+    fonction de simulation (sans `format`)
+    """
+    return (
+        "#if defined(__x86_64__) || defined(__i386__)\n"
+        "#include <x86intrin.h>\n"
+        "#define HOTSPOT_NOW() __rdtsc()\n"
+        '#define HOTSPOT_UNIT "tsc"\n'
+        "#else\n"
+        "#include <time.h>\n"
+        "static inline uint64_t hotspot_now(void) {\n"
+        "\tstruct timespec t;\n"
+        "\tclock_gettime(CLOCK_MONOTONIC, &t);\n"
+        "\treturn (uint64_t) t.tv_sec * 1000000000 + t.tv_nsec;\n"
+        "}\n"
+        "#define HOTSPOT_NOW() hotspot_now()\n"
+        '#define HOTSPOT_UNIT "ns"\n'
+        "#endif\n"
+        f"static uint64_t hotspot_ticks[{len(groups)}];\n"
+        "static uint64_t hotspot_cycles;\n"
+        f"static const char *const hotspot_names[{len(groups)}] = {{\n"
+        + "".join(f"\t{json.dumps(name)},\n" for name, _ in groups)
+        + "};\n\n"
+    )
+
+
+def getReportCode(groups):
+    """
+    Fonctions C (modèles pour `format`) qui donnent les compteurs:
+      - `{short_name}_hotspots(ticks)` copie les compteurs dans `ticks` et
+        renvoie le nombre de cycles simulés
+      - `{short_name}_hotspots_reset()` les remet à 0
+      - `{short_name}_hotspots_unit()` est l'unité des compteurs (`"tsc"`
+        ou `"ns"`)
+    et écrivent le rapport à la fin du programme
+    """
+    n = len(groups)
+    return (
+        "uint64_t {short_name}_hotspots(uint64_t *ticks) {{\n"
+        f"\tmemcpy(ticks, hotspot_ticks, {n} * sizeof *ticks);\n"
+        "\treturn hotspot_cycles;\n"
+        "}}\n"
+        "void {short_name}_hotspots_reset(void) {{\n"
+        "\tmemset(hotspot_ticks, 0, sizeof hotspot_ticks);\n"
+        "\thotspot_cycles = 0;\n"
+        "}}\n"
+        "const char *{short_name}_hotspots_unit(void) {{\n"
+        "\treturn HOTSPOT_UNIT;\n"
+        "}}\n"
+        "__attribute__((destructor)) static void hotspot_report(void) {{\n"
+        f'\tconst char *path = getenv("{REPORT_VARIABLE}");\n'
+        "\tif (path == NULL) return;\n"
+        '\tFILE *f = strcmp(path, "-") == 0 ? stderr : fopen(path, "w");\n'
+        "\tif (f == NULL) return;\n"
+        '\tfprintf(f, "# %s %llu\\n", HOTSPOT_UNIT, (unsigned long long) hotspot_cycles);\n'
+        f"\tfor (size_t k = 0; k < {n}; k++)\n"
+        '\t\tfprintf(f, "%zu\\t%s\\t%llu\\n", k, hotspot_names[k], (unsigned long long) hotspot_ticks[k]);\n'
+        "\tif (f != stderr) fclose(f);\n"
+        "}}\n"
+    )
+
+
+def getHeader():
+    return (
+        "uint64_t {short_name}_hotspots(uint64_t *ticks);\n"
+        "void {short_name}_hotspots_reset(void);\n"
+        "const char *{short_name}_hotspots_unit(void);\n"
+    )
+
+
+def writeGroupMap(f, groups):
+    """
+    Écrit dans le fichier texte `f` la description JSON des groupes (leurs
+    noms et les labels de leurs nappes), lue par `readGroupMap`
+    """
+    json.dump({"groups": [{"name": n, "labels": l} for n, l in groups]}, f)
+    f.write("\n")
+
+
+def readGroupMap(f):
+    return [(g["name"], g["labels"]) for g in json.load(f)["groups"]]
+
+
+def readReport(f):
+    """
+    Lit le rapport écrit à la fin du programme (un fichier texte). Renvoie
+    le triplet `(unité, cycles simulés, comptes des groupes dans l'ordre)`
+    """
+    _, unit, cycles = f.readline().split()
+    ticks = []
+    for line in f:
+        k, _, count = line.rstrip("\n").split("\t")
+        if int(k) != len(ticks):
+            raise ValueError(f"Unexpected group {k} in the hotspot report")
+        ticks.append(int(count))
+    return unit, int(cycles), ticks
+
+
+def mapReport(groups, ticks, cycles):
+    """
+    Relie les comptes `ticks` aux groupes `groups` (voir `groupEquations`)
+    et renvoie une liste de dictionnaires (nom, labels, compte, part du
+    total et compte par cycle), du plus coûteux au moins coûteux
+    """
+    if len(ticks) != len(groups):
+        raise ValueError(
+            f"The hotspot report has {len(ticks)} groups, the group map {len(groups)}"
+        )
+    total = sum(ticks) or 1
+    rows = [
+        {
+            "name": name,
+            "labels": labels,
+            "ticks": t,
+            "share": t / total,
+            "ticks_per_cycle": t / cycles if cycles else 0.0,
+        }
+        for (name, labels), t in zip(groups, ticks)
+    ]
+    rows.sort(key=lambda row: row["ticks"], reverse=True)
+    return rows
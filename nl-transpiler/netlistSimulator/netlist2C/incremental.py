@@ -0,0 +1,444 @@
+"""
+Cache de transpilation incrémentale.
+
+Le texte de la netlist est découpé en un en-tête (sections `INPUT`, `OUTPUT`
+et `VAR`) et en lignes d'équations. Chaque équation est identifiée par son
+texte (qui sert de clef de hachage) : le cache associe à ce texte le code C
+généré pour l'équation, ses dépendances et les nappes qu'elle utilise. Il
+retient aussi l'ordre topologique de la transpilation précédente.
+
+Lors d'une nouvelle transpilation, seules les équations dont le texte a changé
+sont parsées et générées. Si la netlist n'a pas changé du tout, le code est
+réécrit depuis le cache sans la découper. Si les dépendances des équations
+modifiées n'ont pas changé, l'ordre précédent est réutilisé tel quel, sinon le
+tri est refait sur le graphe des labels du cache, sans repasser par l'AST
+(voir `_reschedule`). Dans tous les cas le code est identique à celui d'une
+transpilation complète : même ordre, et les équations qui ne servent plus
+disparaissent.
+
+On se rabat sur une transpilation complète dès que:
+  - l'en-tête a changé (tailles des nappes, entrées, sorties)
+  - une équation modifiée utilise une nappe qui n'est pas déclarée dans la
+    section `VAR` (sa taille est alors inférée à partir des autres équations)
+  - une ligne ne contient pas exactement une équation, ou une nappe est
+    définie deux fois
+  - le tri trouve un cycle ou une nappe sans valeur (la transpilation
+    complète signale l'erreur)
+
+Le cache est rangé par colonnes : chaque champ des équations est une liste de
+chaînes, écrite dans le fichier comme une seule chaîne. C'est bien plus
+rapide à écrire et à relire avec `pickle` que des centaines de milliers de
+tuples.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from array import array
+from itertools import compress, count
+from operator import ne
+
+from . import AST as ast
+from . import utils
+
+CACHE_VERSION = 8
+
+# `\bIN\b` en deux temps: un motif qui commence par un littéral est cherché
+# bien plus vite dans les longues sections `VAR`
+_HEADER_END = re.compile(r"IN\b")
+_WORD = re.compile(r"\w")
+
+"""
+Colonnes du cache. Pour chaque équation:
+ - texts: le texte de l'équation
+ - vars: le label de la nappe calculée
+ - deps: les labels des dépendances (voir `Expression.getDeps`)
+ - regs: les labels des nappes aboutissant dans un registre (voir
+   `utils.getRegisterArgs`)
+ - wires: les labels de toutes les nappes utilisées
+ - values, postambles: la valeur et le postambule de ce que renvoie
+   `generator._getExpr`
+Les listes de labels sont séparées par des espaces. L'état et la ROM du
+fragment, rarement présents, sont dans le dictionnaire `extras` (indice de
+l'équation -> `(état, rom)`)
+"""
+COLUMNS = ("texts", "vars", "deps", "regs", "wires", "values", "postambles")
+
+"""
+Séparateur des colonnes dans le fichier: le code C contient des retours à la
+ligne
+"""
+_SEPARATORS = {"values": "\0", "postambles": "\0"}
+
+
+def splitNetlist(netlist_string):
+    """
+    Découpe une netlist en `(en-tête, lignes)` où `lignes` est la liste des
+    lignes non vides de la section `IN`, sans les espaces aux extrémités.
+    Renvoie `None` si il n'y a pas de section `IN`, la netlist sera alors
+    analysée en entier par le parser qui signalera l'erreur.
+    """
+    for m in _HEADER_END.finditer(netlist_string):
+        if m.start() == 0 or not _WORD.match(netlist_string, m.start() - 1):
+            lines = netlist_string[m.end() :].splitlines()
+            header = netlist_string[: m.start()]
+            return header, list(filter(None, map(str.strip, lines)))
+    return None
+
+
+def defaultCacheFile(netlist_path):
+    """
+    Fichier de cache utilisé par `nl-transpile --incremental` pour la netlist
+    `netlist_path`
+    """
+    key = hashlib.sha256(os.path.abspath(netlist_path).encode()).hexdigest()
+    return os.path.join(utils.getCacheDir(), "incremental", f"{key}.cache")
+
+
+def _digest(s):
+    return hashlib.sha256(s.encode()).digest()
+
+
+def _join(labels):
+    return " ".join(labels)
+
+
+def _cachedEq(text, eq, fragment):
+    """
+    Ligne du cache (un tuple dans l'ordre de `COLUMNS`, suivi de l'état et de
+    la ROM du fragment) de l'équation `eq` de texte `text`
+    """
+    expr = eq.expr
+    value, state, postamble, rom = fragment
+    wires = [eq.var.label] + [a.label for a in expr.args if isinstance(a, ast.Var)]
+    return (
+        text,
+        eq.var.label,
+        _join(v.label for v in expr.getDeps()),
+        _join(v.label for v in utils.getRegisterArgs(expr)),
+        _join(wires),
+        value,
+        postamble,
+        state,
+        rom,
+    )
+
+
+class TranspileCache:
+    """
+    Contenu du cache de transpilation incrémentale
+    """
+
+    def __init__(
+        self,
+        options,
+        header_digest,
+        netlist_digest,
+        inputs,
+        outputs,
+        lengths,
+        columns,
+        extras,
+        order,
+    ):
+        self.options = options
+        self.header_digest = header_digest
+        self.netlist_digest = netlist_digest  # Netlist de la dernière mise à jour
+        self.inputs = inputs  # Couples `(label, taille)`
+        self.outputs = outputs
+        self.lengths = lengths  # Taille des nappes déclarées dans `VAR`
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self.extras = extras
+        # Indices des équations du code, dans l'ordre topologique: les autres
+        # ne servent pas
+        self.order = order
+        # Colonnes lues dans le fichier et pas encore découpées (voir
+        # `__getattr__`): nom -> (chaîne, nombre d'équations), et pour
+        # `lengths` les labels et les tailles
+        self._encoded = {}
+
+    def __getattr__(self, name):
+        # Les colonnes lues dans le fichier ne sont découpées qu'à leur
+        # première utilisation: une netlist inchangée n'a besoin que du code
+        encoded = self.__dict__.get("_encoded", {})
+        if name not in encoded:
+            raise AttributeError(name)
+        data, size = encoded.pop(name)
+        if name == "lengths":
+            sizes = array("I")
+            sizes.frombytes(size)
+            value = dict(zip(data.split("\n"), sizes)) if sizes else {}
+        else:
+            value = data.split(_SEPARATORS.get(name, "\n")) if size else []
+        setattr(self, name, value)
+        return value
+
+    def _encode(self, name):
+        """
+        Contenu de la colonne `name` (ou de `lengths`) dans le fichier
+        """
+        if name in self._encoded:
+            return self._encoded[name]
+        if name == "lengths":
+            lengths = self.lengths
+            return "\n".join(lengths), array("I", lengths.values()).tobytes()
+        values = getattr(self, name)
+        return _SEPARATORS.get(name, "\n").join(values), len(values)
+
+    @classmethod
+    def fromNetList(cls, netlist, netlist_string, options, ordered_eqns, fragments):
+        """
+        Construit le cache à partir d'une transpilation complète. Renvoie
+        `None` si la netlist n'a pas de section `IN` ou si les lignes ne
+        correspondent pas une à une aux équations parsées
+        """
+        split = splitNetlist(netlist_string)
+        if split is None:
+            return None
+        header, lines = split
+        texts = {}
+        for line in lines:
+            var = line.partition("=")[0].strip()
+            if var in texts:
+                return None
+            texts[var] = line
+        if len(texts) != len(netlist.equations):
+            return None
+        if any(eq.var.label not in texts for eq in netlist.equations):
+            return None
+        cache = cls(
+            options,
+            _digest(header),
+            _digest(netlist_string),
+            [(v.label, v.length) for v in netlist.inputs],
+            [(v.label, v.length) for v in netlist.outputs],
+            {v.label: v.length for v in netlist.vars},
+            {name: [] for name in COLUMNS},
+            {},
+            [],
+        )
+        index = {}
+        for eq in netlist.equations:
+            label = eq.var.label
+            index[label] = cache._append(
+                _cachedEq(texts[label], eq, fragments[label])
+            )
+        cache.order = [index[eq.var.label] for eq in ordered_eqns]
+        return cache
+
+    @classmethod
+    def load(cls, path):
+        """
+        Charge le cache depuis `path`. Renvoie `None` si il n'existe pas ou
+        n'est pas utilisable
+        """
+        try:
+            with open(path, "rb") as f:
+                version, state = pickle.load(f)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            return None
+        if version != CACHE_VERSION:
+            return None
+        *header, encoded, extras, order = state
+        cache = cls(*header, None, {}, extras, array("I", order).tolist())
+        del cache.lengths
+        cache._encoded = encoded
+        return cache
+
+    def save(self, path):
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        state = (
+            self.options,
+            self.header_digest,
+            self.netlist_digest,
+            self.inputs,
+            self.outputs,
+            {name: self._encode(name) for name in ("lengths",) + COLUMNS},
+            self.extras,
+            array("I", self.order).tobytes(),
+        )
+        # On écrit dans un fichier temporaire pour ne jamais laisser de cache
+        # à moitié écrit
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((CACHE_VERSION, state), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def unchanged(self, netlist_string, options):
+        """
+        Indique si le cache a été construit ou mis à jour avec exactement
+        cette netlist et ces options
+        """
+        return self.options == options and self.netlist_digest == _digest(
+            netlist_string
+        )
+
+    def matches(self, split, options):
+        """
+        Indique si le cache peut servir de base à la transpilation de la
+        netlist découpée en `split`
+        """
+        return self.options == options and self.header_digest == _digest(split[0])
+
+    def _replace(self, i, row):
+        """
+        Remplace l'équation d'indice `i` par la ligne `row` de `_cachedEq`
+        """
+        for name, value in zip(COLUMNS, row):
+            getattr(self, name)[i] = value
+        self.extras.pop(i, None)
+        if row[-2] is not None or row[-1] is not None:
+            self.extras[i] = row[-2:]
+
+    def _append(self, row):
+        """
+        Ajoute la ligne `row` de `_cachedEq` et renvoie son indice
+        """
+        i = len(self.texts)
+        for name, value in zip(COLUMNS, row):
+            getattr(self, name).append(value)
+        if row[-2] is not None or row[-1] is not None:
+            self.extras[i] = row[-2:]
+        return i
+
+    def _remove(self, removed):
+        """
+        Supprime les équations d'indices `removed`. Les indices des autres
+        équations changent, `order` n'est plus valable
+        """
+        kept = [i for i in range(len(self.texts)) if i not in removed]
+        for name in COLUMNS:
+            values = getattr(self, name)
+            setattr(self, name, [values[i] for i in kept])
+        extras = self.extras
+        self.extras = {k: extras[i] for k, i in enumerate(kept) if i in extras}
+
+    def update(self, netlist_string, split, parse_equations, get_expr):
+        """
+        Met à jour le cache avec les équations de `split` (la netlist
+        `netlist_string` découpée par `splitNetlist`). `parse_equations` et
+        `get_expr` sont `parser.parseEquations` et `generator._getExpr`.
+
+        Renvoie le nombre de lignes ajoutées ou supprimées, ou `None` si il
+        faut faire une transpilation complète (le cache ne doit alors plus
+        être utilisé)
+        """
+        lines = split[1]
+        texts = self.texts
+        if len(lines) == len(texts):
+            # En général les lignes modifiées n'ont pas bougé: on ne compare
+            # que les lignes qui diffèrent de celle du cache à la même place
+            diff = list(compress(count(), map(ne, lines, texts)))
+            new_lines = {lines[k]: k for k in diff}
+            old_lines = {texts[k]: k for k in diff}
+            if len(new_lines) != len(diff):
+                return None
+        else:
+            new_lines = dict.fromkeys(lines)
+            old_lines = dict(zip(texts, range(len(texts))))
+            if len(new_lines) != len(lines):
+                return None
+        added = sorted(new_lines.keys() - old_lines.keys())
+        removed = set(old_lines[t] for t in old_lines.keys() - new_lines.keys())
+        for i in removed:
+            if any(w not in self.lengths for w in self.wires[i].split()):
+                return None
+
+        try:
+            parsed = parse_equations(added, self.lengths)
+        except Exception:  # La transpilation complète signalera l'erreur
+            return None
+        by_var = None  # label -> indice de son équation, construit au besoin
+        replaced = {}  # indice de l'équation supprimée -> sa nouvelle version
+        fresh = {}  # label -> ligne des équations d'une nouvelle nappe
+        for t, eq in zip(added, parsed):
+            row = _cachedEq(t, eq, get_expr(eq))
+            var = row[1]
+            if any(w not in self.lengths for w in row[4].split()) or var in fresh:
+                return None
+            i = new_lines[t]  # L'équation qui était à la même place
+            if i is None or i not in removed or self.vars[i] != var:
+                if by_var is None:
+                    by_var = dict(zip(self.vars, range(len(self.vars))))
+                i = by_var.get(var)
+            if i is None:
+                fresh[var] = row
+            elif i not in removed or i in replaced:
+                return None  # Nappe définie deux fois
+            else:
+                replaced[i] = row
+
+        # Si les dépendances sont les mêmes, le graphe ne change pas et l'ordre
+        # précédent est toujours celui que donnerait `getOrderedNetList`
+        same_graph = not fresh and len(replaced) == len(removed)
+        same_graph = same_graph and all(
+            row[2:4] == (self.deps[i], self.regs[i]) for i, row in replaced.items()
+        )
+        for i, row in replaced.items():
+            self._replace(i, row)
+        if not same_graph:
+            for row in fresh.values():
+                self._append(row)
+            self._remove(removed.difference(replaced))
+            try:
+                self._reschedule()
+            except ValueError:
+                return None
+        self.netlist_digest = _digest(netlist_string)
+        return len(added) + len(removed)
+
+    def _reschedule(self):
+        """
+        Refait le tri topologique comme `utils.getOrderedNetList`, sur les
+        labels du cache. Les dépendances ne sont découpées que pour les
+        équations atteintes par le parcours (voir `_Graph`)
+        """
+        index = dict(zip(self.vars, range(len(self.vars))))
+        regs = set(" ".join(self.regs).split())
+        identity = lambda x: x
+        roots = utils.getRoots((label for label, _ in self.outputs), regs, identity)
+        inputs = {label for label, _ in self.inputs}
+        graph = _Graph(index, self.deps)
+        order = utils.topologicalSort(graph, roots, inputs, identity)
+        self.order = [index[v] for v in order]
+
+    def interface(self):
+        """
+        Renvoie les entrées et sorties de la netlist (listes de `Var`)
+        """
+        return (
+            [ast.Var(length, label) for label, length in self.inputs],
+            [ast.Var(length, label) for label, length in self.outputs],
+        )
+
+    def orderedFragments(self):
+        values, postambles, extras = self.values, self.postambles, self.extras
+        for i in self.order:
+            state, rom = extras.get(i, (None, None))
+            yield values[i], state, postambles[i], rom
+
+
+class _Graph:
+    """
+    Graphe de dépendances de `utils.topologicalSort` construit à la demande:
+    `index` associe à chaque label l'indice de son équation, et `deps` est la
+    colonne des dépendances du cache
+    """
+
+    def __init__(self, index, deps):
+        self.index = index
+        self.deps = deps
+
+    def __contains__(self, label):
+        return label in self.index
+
+    def __getitem__(self, label):
+        return self.deps[self.index[label]].split()
@@ -0,0 +1,55 @@
+"""
+Compatibilité des options de génération, vérifiée au même endroit pour
+`nl-transpile`, `nl-transpile run`, `transpile2CFiles`,
+`simulator.buildSimulator` et `runner.buildExecutable`.
+
+Les modes de `MODES` changent la forme du code généré et ne peuvent pas être
+utilisés ensemble. Les autres options ne sont disponibles que dans les modes
+donnés par `SUPPORTED_MODES` (`None` étant le mode par défaut).
+"""
+
+# Modes de génération, dans l'ordre où ils sont cités dans les messages
+MODES = ("incremental", "lanes", "chunk_size", "events", "threads")
+
+_ALL_MODES = frozenset((None,) + MODES)
+_DEFAULT_MODE = frozenset((None,))
+_NOT_BATCH = _ALL_MODES - {"lanes"}
+
+# Pour chaque option, les modes avec lesquels elle peut être utilisée
+SUPPORTED_MODES = {
+    "optimize": _ALL_MODES - {"incremental"},
+    "trace": _DEFAULT_MODE,
+    "sparse_ram": _DEFAULT_MODE,
+    "share_cones": _DEFAULT_MODE,
+    "hotspots": _DEFAULT_MODE,
+    "library": _NOT_BATCH,
+    "binary_io": _NOT_BATCH,
+    "rom_contents": _NOT_BATCH,
+}
+
+
+def _used(value):
+    """
+    Une option est utilisée quand elle n'a pas sa valeur par défaut: `None`,
+    `False` ou une liste vide (0 est une valeur, par exemple pour
+    `sparse_ram`)
+    """
+    if value is None or value is False:
+        return False
+    return not (isinstance(value, (list, tuple)) and not value)
+
+
+def checkOptions(options, name=str):
+    """
+    Lève une `ValueError` si les options `options` (un dictionnaire qui
+    associe à un nom de `MODES` ou de `SUPPORTED_MODES` sa valeur) ne peuvent
+    pas être utilisées ensemble. `name` donne le nom d'une option dans le
+    message (par exemple celui de l'option de la ligne de commande)
+    """
+    modes = [m for m in MODES if _used(options.get(m))]
+    if len(modes) > 1:
+        raise ValueError(f"{name(modes[1])} can't be used with {name(modes[0])}")
+    mode = modes[0] if modes else None
+    for option, supported in SUPPORTED_MODES.items():
+        if _used(options.get(option)) and mode not in supported:
+            raise ValueError(f"{name(option)} can't be used with {name(mode)}")
@@ -1,6 +1,11 @@
+import os
+import threading
+from functools import lru_cache
+
 from lark import Lark, Transformer
 
 from . import AST as ast
+from . import utils
 
 GRAMMAR = """
 netlist: input output vars code
@@ -63,9 +68,25 @@ class RawTreeToAST(Transformer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.reset()
+
+    def reset(self, lengths=None, packed=True):
+        """
+        Vide la table des symboles. Nécessaire pour réutiliser le transformer
+        lorsqu'il est branché directement sur le parser LALR (mode inline).
+
+        `lengths` donne la taille des nappes déjà connues (déclarées dans une
+        section `VAR` analysée précédemment)
+
+        Avec `packed`, chaque équation est rangée dans une table
+        `ast.Equations` dès qu'elle est analysée (les objets `Eq`
+        intermédiaires ne sont pas gardés) ; sinon `eq` renvoie l'objet `Eq`
+        """
         self.buses = (
             {}
         )  # Utilisé pour stocker les bus déjà inspectés (table de symboles)
+        self.lengths = {} if lengths is None else lengths
+        self.equations = ast.Equations() if packed else None
 
     CNAME = str
 
@@ -80,18 +101,22 @@ class RawTreeToAST(Transformer):
     def typedvar(self, args):
         l = 1 if args[1] is None else args[1]
         if args[0] not in self.buses:
-            self.buses[args[0]] = ast.Var(l, args[0])
+            self.buses[args[0]] = ast.Var(l, str(args[0]))
         elif self.buses[args[0]].length == -1:
             self.buses[args[0]].length = l
         return self.buses[args[0]]
 
     def var(self, args):
         if args[0] not in self.buses:
-            self.buses[args[0]] = ast.Var(-1, args[0])
+            l = self.lengths.get(args[0], -1)
+            self.buses[args[0]] = ast.Var(l, str(args[0]))
         return self.buses[args[0]]
 
     def eq(self, args):
-        return ast.Eq(args[0], args[1])
+        eq = ast.Eq(args[0], args[1])
+        if self.equations is None:
+            return eq
+        self.equations.append(eq)
 
     def op(self, args):
         return args[0]
@@ -154,13 +179,13 @@ class RawTreeToAST(Transformer):
         return args[0]
 
     def varlist(self, args):
-        return set(args)
+        return list(dict.fromkeys(args))
 
     def typedvarlist(self, args):
-        return set(args)
+        return list(dict.fromkeys(args))
 
     def eqlist(self, args):
-        return set(args)
+        return args if self.equations is None else self.equations
 
     def code(self, args):
         return args[0]
@@ -183,8 +208,85 @@ class RawTreeToAST(Transformer):
         return ast.Expression(t, dArgs, sArgs)
 
 
-def parse(s):
-    l = Lark(GRAMMAR, start="netlist")
-    parsed_tree = l.parse(s)
-    print(parsed_tree.pretty())
-    return RawTreeToAST().transform(parsed_tree)
+PARSER_ALGORITHMS = ("lalr", "earley")
+
+
+@lru_cache(maxsize=None)
+def _get_lalr_parser():
+    """
+    Construit (une seule fois par processus) le parser LALR. Les tables
+    d'analyse sont sérialisées sur le disque par Lark (option `cache`) ce qui
+    évite de recalculer la grammaire à chaque lancement.
+
+    Le transformer est branché directement sur le parser : l'AST est construit
+    au fil des réductions, sans jamais matérialiser l'arbre de Lark.
+    """
+    transformer = RawTreeToAST()
+    cache_dir = utils.getCacheDir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache = os.path.join(cache_dir, "grammar.lark")
+    except OSError:
+        cache = True  # Lark se rabat sur le dossier temporaire
+    l = Lark(
+        GRAMMAR,
+        start=["netlist", "eq"],
+        parser="lalr",
+        transformer=transformer,
+        cache=cache,
+    )
+    return l, transformer, threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _get_earley_parser():
+    return Lark(GRAMMAR, start="netlist")
+
+
+def parse(s, algorithm="lalr", profile=None):
+    """
+    Parse la netlist `s` et renvoie l'objet `NetList` correspondant.
+
+    `algorithm` vaut `"lalr"` (par défaut, rapide) ou `"earley"` (l'ancien
+    chemin, qui construit l'arbre complet avant de le transformer). Les
+    étapes `parse` et, avec Earley, `ast` sont enregistrées dans `profile`
+    (un `profiling.Profile`) si il est fourni
+    """
+    if profile is not None and algorithm in PARSER_ALGORITHMS:
+        profile.stage("parse")
+    match algorithm:
+        case "lalr":
+            l, transformer, lock = _get_lalr_parser()
+            with lock:  # Le transformer inline porte la table des symboles
+                transformer.reset()
+                try:
+                    return l.parse(s, start="netlist")
+                finally:
+                    transformer.reset()
+        case "earley":
+            parsed_tree = _get_earley_parser().parse(s)
+            if profile is not None:
+                profile.stage("ast")
+            return RawTreeToAST().transform(parsed_tree)
+        case _:
+            raise ValueError(
+                f"Unknown parser algorithm {algorithm} (expected one of {', '.join(PARSER_ALGORITHMS)})"
+            )
+
+
+def parseEquations(eqs, lengths):
+    """
+    Parse indépendamment chacune des équations de la liste `eqs` (des chaînes
+    de la forme `x = AND a b`) et renvoie la liste des objets `Eq`
+    correspondants. `lengths` associe leur taille aux nappes déclarées.
+    """
+    l, transformer, lock = _get_lalr_parser()
+    with lock:
+        try:
+            parsed = []
+            for e in eqs:
+                transformer.reset(lengths, packed=False)
+                parsed.append(l.parse(e, start="eq"))
+            return parsed
+        finally:
+            transformer.reset()
@@ -0,0 +1,417 @@
+"""
+Passes d'optimisation de la netlist, appliquées avant la génération du C.
+
+Chaque passe prend une `NetList` et la modifie en place. Les passes
+disponibles sont dans `PASSES`:
+  - constants: calcule les instructions dont tous les arguments sont
+    constants et propage les constantes obtenues
+  - simplify: simplifications locales (identités comme `AND x 1...1` ou
+    `NAND x x`, double `NOT`, `MUX` à sélecteur constant, `SELECT`/`SLICE`/
+    `SNIP` d'un `CONCAT`, ...)
+  - copies: remplace les nappes définies par un `COPY` par leur source
+  - cse: fusionne les instructions identiques (mêmes arguments)
+  - dce: supprime les nappes qui n'aboutissent ni à une sortie ni à un
+    registre ou une RAM (l'état reste donc le même)
+
+Les nappes de sortie ne sont jamais supprimées : si une sortie devient une
+copie ou une constante, son équation est gardée sous forme de `COPY`.
+
+Les valeurs sont calculées comme dans la spécification de la netlist, sur
+exactement `taille` bits.
+"""
+
+from . import AST as ast
+from . import utils
+
+"""
+Instructions sans état dont la valeur ne dépend que des arguments
+"""
+COMBINATIONAL = set(
+    (
+        ast.Exprs.NOT,
+        ast.Exprs.AND,
+        ast.Exprs.OR,
+        ast.Exprs.XOR,
+        ast.Exprs.NAND,
+        ast.Exprs.NXOR,
+        ast.Exprs.MUX,
+        ast.Exprs.CONCAT,
+        ast.Exprs.SNIP,
+        ast.Exprs.SLICE,
+        ast.Exprs.SELECT,
+        ast.Exprs.COPY,
+    )
+)
+
+COMMUTATIVE = set(
+    (
+        ast.Exprs.AND,
+        ast.Exprs.OR,
+        ast.Exprs.XOR,
+        ast.Exprs.NAND,
+        ast.Exprs.NXOR,
+    )
+)
+
+
+def _mask(length):
+    return (1 << length) - 1
+
+
+def _cst(length, value):
+    return ast.Cst(length, value & _mask(length))
+
+
+def _copy(arg):
+    return ast.Expression(ast.Exprs.COPY, [arg], [])
+
+
+def _isCst(arg, value=None):
+    return isinstance(arg, ast.Cst) and (value is None or arg.value == value)
+
+
+def evaluate(expr, length):
+    """
+    Valeur d'une instruction combinatoire dont tous les arguments sont
+    constants, sur `length` bits
+    """
+    v = [a.value & _mask(a.length) for a in expr.args]
+    s = expr.static_args
+    match expr.type:
+        case ast.Exprs.NOT:
+            r = ~v[0]
+        case ast.Exprs.AND:
+            r = v[0] & v[1]
+        case ast.Exprs.OR:
+            r = v[0] | v[1]
+        case ast.Exprs.XOR:
+            r = v[0] ^ v[1]
+        case ast.Exprs.NAND:
+            r = ~(v[0] & v[1])
+        case ast.Exprs.NXOR:
+            r = ~(v[0] ^ v[1])
+        case ast.Exprs.MUX:
+            r = v[1] if v[0] == 0 else v[2]
+        case ast.Exprs.CONCAT:
+            r = (v[1] << expr.args[0].length) | v[0]
+        case ast.Exprs.SNIP | ast.Exprs.SLICE | ast.Exprs.SELECT:
+            r = v[0] >> s[0]
+        case ast.Exprs.COPY:
+            r = v[0]
+        case _:
+            raise ValueError(f"Can't evaluate {expr.type}")
+    return r & _mask(length)
+
+
+class PassStats:
+    """
+    Statistiques d'une passe: nombre d'équations réécrites et supprimées
+    """
+
+    def __init__(self):
+        self.rewritten = 0
+        self.removed = 0
+
+    def __bool__(self):
+        return self.rewritten > 0 or self.removed > 0
+
+    def __iadd__(self, other):
+        self.rewritten += other.rewritten
+        self.removed += other.removed
+        return self
+
+    def __repr__(self):
+        return f"{self.rewritten} rewritten, {self.removed} removed"
+
+
+def _order(netlist):
+    """
+    Équations dans un ordre où les dépendances du cycle courant sont calculées
+    avant leur utilisation
+    """
+    graph = {}
+    var_to_eq = {}
+    for eq in netlist.equations:
+        graph[eq.var] = eq.expr.getDeps()
+        var_to_eq[eq.var] = eq
+    label = lambda x: x.label
+    order = utils.topologicalSort(
+        graph, sorted(graph, key=label), set(netlist.inputs), label
+    )
+    return [var_to_eq[v] for v in order]
+
+
+def _sweep(netlist, rule, propagate):
+    """
+    Parcourt les équations dans l'ordre topologique en leur appliquant
+    `rule(expr, defs)` (qui renvoie une nouvelle `Expression` ou `None`,
+    `defs` associe un label à son `Eq`). Une nappe définie par un `COPY`
+    d'un argument pour lequel `propagate(arg)` est vrai est remplacée par cet
+    argument dans toutes les équations.
+    """
+    stats = PassStats()
+    defs = {}
+    replace = {}  # label -> argument qui le remplace
+    outputs = set(v.label for v in netlist.outputs)
+
+    def substitute(expr):
+        args = [
+            replace.get(a.label, a) if isinstance(a, ast.Var) else a for a in expr.args
+        ]
+        if all(a is b for a, b in zip(args, expr.args)):
+            return expr
+        return ast.Expression(expr.type, args, expr.static_args)
+
+    for eq in _order(netlist):
+        expr = eq.expr
+        if expr.type in COMBINATIONAL:
+            expr = substitute(expr)
+            new = rule(expr, defs)
+            if new is not None:
+                expr = new
+        if expr is not eq.expr:
+            stats.rewritten += 1
+            eq = ast.Eq(eq.var, expr)
+        defs[eq.var.label] = eq
+        if expr.type == ast.Exprs.COPY and propagate(expr.args[0]):
+            replace[eq.var.label] = expr.args[0]
+
+    # Les arguments des registres ne sont pas des dépendances, ils n'ont pas
+    # forcément été vus avant le registre
+    equations = []
+    for label, eq in defs.items():
+        if label in replace and label not in outputs:
+            stats.removed += 1
+            continue
+        expr = substitute(eq.expr)
+        if expr is not eq.expr:
+            if eq.expr.type not in COMBINATIONAL:
+                stats.rewritten += 1
+            eq = ast.Eq(eq.var, expr)
+        equations.append(eq)
+    netlist.equations = equations
+    return stats
+
+
+def _constantsRule(expr, defs):
+    if expr.type == ast.Exprs.COPY or not all(_isCst(a) for a in expr.args):
+        return None
+    length = expr.out_length
+    return _copy(_cst(length, evaluate(expr, length)))
+
+
+def propagateConstants(netlist):
+    """
+    Calcule les instructions combinatoires dont les arguments sont constants
+    et remplace les nappes constantes par leur valeur
+    """
+    return _sweep(netlist, _constantsRule, _isCst)
+
+
+def _simplifyRule(expr, defs):
+    a = expr.args
+    s = expr.static_args
+    n = expr.out_length
+    ones = _mask(n)
+    match expr.type:
+        case ast.Exprs.NOT:
+            src = defs.get(a[0].label)
+            if src is not None and src.expr.type == ast.Exprs.NOT:
+                return _copy(src.expr.args[0])
+        case ast.Exprs.AND | ast.Exprs.OR | ast.Exprs.XOR:
+            for x, y in ((a[0], a[1]), (a[1], a[0])):
+                if not _isCst(x):
+                    continue
+                v = x.value & ones
+                match expr.type, v:
+                    case ast.Exprs.AND, 0:
+                        return _copy(_cst(n, 0))
+                    case (ast.Exprs.OR, 0) | (ast.Exprs.XOR, 0):
+                        return _copy(y)
+                    case ast.Exprs.AND, _ if v == ones:
+                        return _copy(y)
+                    case ast.Exprs.OR, _ if v == ones:
+                        return _copy(_cst(n, ones))
+                    case ast.Exprs.XOR, _ if v == ones:
+                        return ast.Expression(ast.Exprs.NOT, [y], [])
+            if a[0].label == a[1].label and isinstance(a[0], ast.Var):
+                if expr.type == ast.Exprs.XOR:
+                    return _copy(_cst(n, 0))
+                return _copy(a[0])
+        case ast.Exprs.NAND | ast.Exprs.NXOR:
+            if a[0].label == a[1].label and isinstance(a[0], ast.Var):
+                if expr.type == ast.Exprs.NXOR:
+                    return _copy(_cst(n, ones))
+                return ast.Expression(ast.Exprs.NOT, [a[0]], [])
+        case ast.Exprs.MUX:
+            if _isCst(a[0]):
+                return _copy(a[1] if a[0].value & _mask(a[0].length) == 0 else a[2])
+            if a[1].label == a[2].label:
+                return _copy(a[1])
+        case ast.Exprs.SELECT | ast.Exprs.SLICE | ast.Exprs.SNIP:
+            # Bits [low, high[ de l'argument
+            low = s[0]
+            high = low + n
+            if n == 0:
+                return None
+            if low == 0 and high == a[0].length:
+                return _copy(a[0])
+            src = defs.get(a[0].label)
+            if src is None or src.expr.type != ast.Exprs.CONCAT:
+                return None
+            first, second = src.expr.args
+            if high <= first.length:
+                part, offset = first, 0
+            elif low >= first.length:
+                part, offset = second, first.length
+            else:
+                return None
+            if _isCst(part):
+                return _copy(_cst(n, part.value >> (low - offset)))
+            if low - offset == 0 and n == part.length:
+                return _copy(part)
+            if expr.type == ast.Exprs.SELECT:
+                return ast.Expression(expr.type, [part], [low - offset])
+            if expr.type == ast.Exprs.SLICE:
+                return ast.Expression(
+                    expr.type, [part], [low - offset, high - offset - 1]
+                )
+            return ast.Expression(expr.type, [part], [low - offset, high - offset])
+    return None
+
+
+def simplify(netlist):
+    """
+    Simplifications locales des instructions combinatoires
+    """
+    return _sweep(netlist, _simplifyRule, lambda arg: False)
+
+
+def propagateCopies(netlist):
+    """
+    Remplace les nappes définies par un `COPY` par leur source
+    """
+    return _sweep(netlist, lambda expr, defs: None, lambda arg: True)
+
+
+def _key(eq, merged):
+    expr = eq.expr
+    args = []
+    for a in expr.args:
+        if isinstance(a, ast.Cst):
+            args.append(("cst", a.length, a.value & _mask(a.length)))
+        else:
+            args.append(merged.get(a.label, a).label)
+    if expr.type in COMMUTATIVE:
+        args.sort(key=repr)
+    return (expr.type, eq.var.length, tuple(args), tuple(expr.static_args))
+
+
+def eliminateCommonSubexpressions(netlist):
+    """
+    Fusionne les instructions qui calculent la même chose: la seconde devient
+    un `COPY` de la première. Deux registres (ou deux RAMs) ayant les mêmes
+    entrées ont toujours le même contenu et sont aussi fusionnés ; les ROMs
+    ne le sont pas (chacune a son propre contenu).
+    """
+    stats = PassStats()
+    while True:
+        # Les arguments d'un registre peuvent être définis après lui dans
+        # l'ordre topologique: une fusion peut en permettre d'autres au tour
+        # suivant
+        seen = {}
+        merged = {}  # label -> nappe qui calcule la même chose
+        for eq in _order(netlist):
+            if eq.expr.type in (ast.Exprs.ROM, ast.Exprs.COPY):
+                continue
+            key = _key(eq, merged)
+            if key in seen:
+                merged[eq.var.label] = seen[key]
+            else:
+                seen[key] = eq.var
+        if not merged:
+            return stats
+        netlist.equations = [
+            ast.Eq(eq.var, _copy(merged[eq.var.label]))
+            if eq.var.label in merged
+            else eq
+            for eq in netlist.equations
+        ]
+        stats.rewritten += len(merged)
+        stats += propagateCopies(netlist)
+
+
+def eliminateDeadCode(netlist):
+    """
+    Supprime les équations dont la nappe n'aboutit ni à une sortie, ni à un
+    registre ou une RAM
+    """
+    defs = {eq.var.label: eq for eq in netlist.equations}
+    live = set()
+    stack = [v.label for v in netlist.outputs]
+    stack += [l for l, eq in defs.items() if eq.expr.type in utils.REG_TYPES]
+    while stack:
+        label = stack.pop()
+        if label in live:
+            continue
+        live.add(label)
+        if label in defs:
+            stack += [a.label for a in defs[label].expr.args if isinstance(a, ast.Var)]
+    stats = PassStats()
+    equations = []
+    for eq in netlist.equations:
+        if eq.var.label in live:
+            equations.append(eq)
+        else:
+            stats.removed += 1
+    netlist.equations = equations
+    return stats
+
+
+PASSES = {
+    "constants": propagateConstants,
+    "simplify": simplify,
+    "copies": propagateCopies,
+    "cse": eliminateCommonSubexpressions,
+    "dce": eliminateDeadCode,
+}
+
+DEFAULT_PASSES = ("constants", "simplify", "copies", "cse", "dce")
+
+
+class PassManager:
+    """
+    Applique une suite de passes (des noms de `PASSES`) à une netlist, jusqu'à
+    ce qu'elles ne changent plus rien (au plus `max_iterations` fois).
+    `stats` associe à chaque passe ses statistiques cumulées
+    """
+
+    def __init__(self, passes=DEFAULT_PASSES, max_iterations=8):
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(
+                    f"Unknown optimization pass {name} (available: {', '.join(PASSES)})"
+                )
+        self.passes = list(passes)
+        self.max_iterations = max_iterations
+        self.stats = {name: PassStats() for name in self.passes}
+
+    def run(self, netlist):
+        for _ in range(self.max_iterations):
+            changed = False
+            for name in self.passes:
+                stats = PASSES[name](netlist)
+                self.stats[name] += stats
+                changed = changed or bool(stats)
+            if not changed:
+                break
+        used = set(v.label for v in netlist.inputs) | set(
+            v.label for v in netlist.outputs
+        )
+        for eq in netlist.equations:
+            used.add(eq.var.label)
+        netlist.vars = [v for v in netlist.vars if v.label in used]
+        return netlist
+
+    def report(self):
+        return "\n".join(f"  {name}: {self.stats[name]}" for name in self.passes)
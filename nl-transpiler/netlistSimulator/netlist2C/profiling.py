@@ -0,0 +1,138 @@
+"""
+Mesures de la transpilation, étape par étape.
+
+Les fonctions de transpilation découpent leur travail en étapes successives
+(`STAGES`) et, si on leur passe un `Profile`, y enregistrent la durée de
+chaque étape, des compteurs (nombre d'équations, octets écrits, ...) et,
+avec `memory`, le pic de mémoire allouée pendant l'étape (mesuré avec
+`tracemalloc`, ce qui ralentit nettement la transpilation).
+
+Le début de chaque étape est aussi annoncé au niveau `INFO` du module
+`logging` (logger `netlistSimulator.netlist2C.profiling`), et sa durée au
+niveau `DEBUG`.
+"""
+
+import logging
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+"""
+Étapes de la transpilation, avec le message annonçant chacune. `parse`
+construit aussi l'AST et vérifie les tailles des nappes avec le parser
+LALR, dont le transformer est branché sur les réductions ; avec Earley, ce
+travail est l'étape `ast`
+"""
+STAGES = {
+    "incremental": "Updating the incremental transpilation cache",
+    "parse": "Parsing netlist",
+    "ast": "Generating AST",
+    "optimize": "Optimizing netlist",
+    "schedule": "Topological sort",
+    "emit": "Generating C code",
+    "compile": "Compiling C code",
+}
+
+
+class Stage:
+    """
+    Mesures d'une étape: durée en secondes, pic de mémoire allouée pendant
+    l'étape en octets (`None` sans `memory`) et compteurs
+    """
+
+    __slots__ = ("name", "seconds", "peak_memory", "counters")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_memory = None
+        self.counters = {}
+
+    def asDict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "peak_memory": self.peak_memory,
+            "counters": dict(self.counters),
+        }
+
+
+class Profile:
+    """
+    Mesures d'une transpilation. Les étapes sont successives: `stage`
+    termine l'étape en cours et en commence une nouvelle, `finish` termine
+    la dernière (les fonctions de transpilation l'appellent avant de
+    rendre la main)
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = []
+        self._current = None
+        self._start = 0.0
+        self._base = 0
+        self._tracing = False
+
+    def stage(self, name):
+        self.finish()
+        log.info(STAGES.get(name, name))
+        self._current = Stage(name)
+        if self.memory:
+            # `tracemalloc` peut déjà tourner (par exemple dans un benchmark)
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+            self._base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+
+    def count(self, name, value):
+        """
+        Fixe le compteur `name` de l'étape en cours
+        """
+        if self._current is not None:
+            self._current.counters[name] = value
+
+    def finish(self):
+        current = self._current
+        if current is None:
+            return
+        current.seconds = time.perf_counter() - self._start
+        if self.memory:
+            current.peak_memory = tracemalloc.get_traced_memory()[1] - self._base
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+        log.debug("%s: %.3f s", current.name, current.seconds)
+        self.stages.append(current)
+        self._current = None
+
+    def get(self, name):
+        """
+        Dernière étape nommée `name` (`None` si il n'y en a pas)
+        """
+        for stage in reversed(self.stages):
+            if stage.name == name:
+                return stage
+        return None
+
+    @property
+    def seconds(self):
+        return sum(stage.seconds for stage in self.stages)
+
+    def asDict(self):
+        return {
+            "seconds": self.seconds,
+            "stages": [stage.asDict() for stage in self.stages],
+        }
+
+    def report(self):
+        lines = [f"{'stage':>10} {'seconds':>9} {'peak (B)':>12}  counters"]
+        for stage in self.stages:
+            peak = "-" if stage.peak_memory is None else stage.peak_memory
+            counters = ", ".join(f"{k}={v}" for k, v in stage.counters.items())
+            lines.append(
+                f"{stage.name:>10} {stage.seconds:>9.3f} {peak:>12}  {counters}"
+            )
+        return "\n".join(lines)
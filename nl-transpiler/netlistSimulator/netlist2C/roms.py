@@ -0,0 +1,84 @@
+"""
+Contenu des ROMs connu à la transpilation.
+
+Le contenu (au format texte lu par `fscan_rom`) est inclus dans le code C sous
+forme de tableaux `static const`, que le code généré lit directement. Les
+tableaux sont écrits par morceaux dans un fichier à part, inclus par le
+fichier source, pour ne pas construire une chaîne Python géante pour les
+grosses ROMs.
+"""
+
+import itertools
+
+from . import utils
+
+"""
+Nombre de mots par ligne dans les tableaux générés
+"""
+WORDS_PER_LINE = 16
+
+
+def _hexTokens(source):
+    if isinstance(source, str):
+        yield from source.split()
+    else:  # Fichier texte, lu ligne par ligne
+        for line in source:
+            yield from line.split()
+
+
+def readHexRom(source, roms):
+    """
+    Lit le contenu des ROMs `roms` (liste triée de triplets `(label, taille
+    d'adresse, taille de mot)`) dans le format texte lu par `fscan_rom`.
+    `source` est une chaîne ou un fichier texte.
+
+    Renvoie un dictionnaire `label -> liste de mots`. Comme pour `fscan_rom`,
+    les mots sont tronqués à la taille du type C de la ROM et les mots
+    manquants de la dernière ROM valent 0. Mais là où `fscan_rom` s'arrête
+    sans rien dire, une `ValueError` est levée pour une valeur invalide, un
+    fichier qui se termine avant la dernière ROM ou des valeurs en trop
+    """
+    tokens = _hexTokens(source)
+    contents = {}
+    for k, (label, addr_size, word_size) in enumerate(roms):
+        mask = (1 << utils.size_from_bus_size(word_size)) - 1
+        words = []
+        for token in itertools.islice(tokens, 1 << addr_size):
+            try:
+                words.append(int(token, 16) & mask)
+            except ValueError:
+                raise ValueError(
+                    f"Invalid hexadecimal value {token!r} at word {len(words)} of ROM {label}"
+                ) from None
+        if len(words) < 1 << addr_size and k + 1 < len(roms):
+            raise ValueError(
+                f"ROM file ends after {len(words)} of the {1 << addr_size} words of ROM {label}, before ROM {roms[k + 1][0]}"
+            )
+        contents[label] = words
+    if next(tokens, None) is not None:
+        total = sum(1 << addr_size for _, addr_size, _ in roms)
+        raise ValueError(f"ROM file has more than the {total} words of the ROMs")
+    return contents
+
+
+def writeRomArrays(f, roms, contents):
+    """
+    Écrit dans le fichier texte `f` les tableaux C `ROM_{label}` des ROMs
+    `roms` dont le contenu est donné par le dictionnaire `contents` (voir
+    `readHexRom`). Le texte écrit est du C (il n'est pas destiné à passer par
+    `format`)
+    """
+    for label, addr_size, word_size in roms:
+        t = utils.cTypeFromBusSize(word_size).value
+        words = contents.get(label, ())
+        if len(words) > 1 << addr_size:
+            raise ValueError(
+                f"ROM {label} has {1 << addr_size} words, got {len(words)} values"
+            )
+        f.write(f"static const {t} ROM_{label}[1 << {addr_size}] = {{\n")
+        if not words:
+            f.write("\t0\n")
+        for i in range(0, len(words), WORDS_PER_LINE):
+            line = ", ".join(map(hex, words[i : i + WORDS_PER_LINE]))
+            f.write(f"\t{line},\n")
+        f.write("};\n")
@@ -0,0 +1,270 @@
+"""
+RAMs creuses: une RAM dont l'adresse a plus de `threshold` bits n'est pas un
+tableau de l'état (qui ferait `1 << taille d'adresse` mots) mais une table
+des pages à deux niveaux, dont les pages sont allouées à la première
+écriture d'une valeur non nulle. Une lecture dans une page jamais écrite
+renvoie 0: une grande RAM presque vide ne coûte que les pages touchées.
+
+Les pages font `1 << checkpoint.PAGE_BITS` mots, comme celles des points de
+reprise. Les bits d'adresse restants sont partagés entre le répertoire, un
+tableau de l'état (`RAM_{label}`, des pointeurs vers des
+`RamTable_{label}_{short_name}`), et les tables, allouées comme les pages.
+Chaque table garde aussi les pages modifiées depuis le dernier point de
+reprise. Le nombre de pages allouées de chaque RAM est gardé dans le champ
+`PAGES_{label}` de l'état.
+
+Les points de reprise ne contiennent que les pages allouées, dont les
+numéros sont écrits sur `PAGE_NUMBER_BITS` bits: une RAM creuse a donc au
+plus `PAGE_NUMBER_BITS + checkpoint.PAGE_BITS` bits d'adresse.
+"""
+
+import re
+
+from . import checkpoint
+
+PAGE_NUMBER_BITS = 32
+
+"""
+Taille d'adresse à partir de laquelle une RAM est creuse, par défaut
+"""
+DEFAULT_THRESHOLD = 16
+
+
+def isSparse(addr_size, threshold):
+    return threshold is not None and addr_size > threshold
+
+
+def sparseRams(states, threshold):
+    """
+    Variables d'état (voir `generator._getExpr`) des RAMs creuses
+    """
+    return [
+        state
+        for state in states
+        if state[2] is not None and isSparse(state[2], threshold)
+    ]
+
+
+def _split(addr_size):
+    """
+    Nombre de bits d'adresse `(page, table, répertoire)`
+    """
+    page = min(addr_size, checkpoint.PAGE_BITS)
+    rest = addr_size - page
+    directory = (rest + 1) // 2
+    return page, rest - directory, directory
+
+
+def _label(name):
+    return name[len("RAM_") :]
+
+
+def readExpr(label, address):
+    """
+    Expression C qui lit le mot d'adresse `address` de la RAM creuse `label`
+    """
+    return f"sparse_read_{label}(state, {address})"
+
+
+def writeStatement(label, address, value):
+    return f"sparse_write_{label}(state, {address}, {value});"
+
+
+def checkAddressSize(label, addr_size):
+    max_bits = PAGE_NUMBER_BITS + checkpoint.PAGE_BITS
+    if addr_size > max_bits:
+        raise ValueError(
+            f"Sparse RAM {label} has {addr_size} address bits (at most {max_bits} are supported)"
+        )
+
+
+def getTypes(rams):
+    """
+    Types des tables de pages, à déclarer avant la structure de l'état
+    """
+    content = ""
+    for t, name, addr_size in rams:
+        _, table, _ = _split(addr_size)
+        content += (
+            "typedef struct {{\n"
+            f"\t{t} *page[{1 << table}];\n"
+            f"\tuint8_t dirty[{1 << table}];\n"
+            f"}}}} RamTable_{_label(name)}_{{short_name}};\n"
+        )
+    return content
+
+
+def getStateFields(t, name, addr_size):
+    """
+    Champs de l'état d'une RAM creuse: le répertoire et le nombre de pages
+    """
+    _, _, directory = _split(addr_size)
+    label = _label(name)
+    return (
+        f"\tRamTable_{label}_{{short_name}} *{name}[{1 << directory}];\n"
+        f"\tuint64_t PAGES_{label};\n"
+    )
+
+
+def getAccessCode(rams):
+    """
+    Fonctions C d'accès aux RAMs creuses, à écrire avant la fonction de
+    simulation:
+      - `sparse_page_{label}(state, p)` renvoie la page `p` (allouée si
+        besoin) et la marque comme modifiée
+      - `sparse_read_{label}(state, address)` lit un mot (0 si la page n'a
+        jamais été écrite)
+      - `sparse_write_{label}(state, address, value)` écrit un mot.
+        Écrire 0 dans une page absente ne l'alloue pas
+    Une allocation qui échoue arrête le programme
+    """
+    content = ""
+    for t, name, addr_size in rams:
+        page, table, _ = _split(addr_size)
+        label = _label(name)
+        table_type = f"RamTable_{label}_{{short_name}}"
+        content += (
+            f"static {t} *sparse_page_{label}(State_{{short_name}} *state, size_t p) {{{{\n"
+            f"\t{table_type} **t = &state->{name}[p >> {table}];\n"
+            "\tif (*t == NULL && (*t = calloc(1, sizeof **t)) == NULL) {{\n"
+            '\t\tfputs("Out of memory for a sparse RAM page\\n", stderr);\n'
+            "\t\tabort();\n"
+            "\t}}\n"
+            f"\t{t} **page = &(*t)->page[p & {(1 << table) - 1}];\n"
+            "\tif (*page == NULL) {{\n"
+            f"\t\tif ((*page = calloc({1 << page}, sizeof **page)) == NULL) {{{{\n"
+            '\t\t\tfputs("Out of memory for a sparse RAM page\\n", stderr);\n'
+            "\t\t\tabort();\n"
+            "\t\t}}\n"
+            f"\t\tstate->PAGES_{label}++;\n"
+            "\t}}\n"
+            f"\t(*t)->dirty[p & {(1 << table) - 1}] = 1;\n"
+            "\treturn *page;\n"
+            "}}\n"
+            f"static inline {t} sparse_read_{label}(const State_{{short_name}} *state, uint64_t address) {{{{\n"
+            f"\tconst {table_type} *t = state->{name}[address >> {page + table}];\n"
+            f"\tconst {t} *page = t == NULL ? NULL : t->page[(address >> {page}) & {(1 << table) - 1}];\n"
+            f"\treturn page == NULL ? 0 : page[address & {(1 << page) - 1}];\n"
+            "}}\n"
+            f"static inline void sparse_write_{label}(State_{{short_name}} *state, uint64_t address, {t} value) {{{{\n"
+            f"\tconst {table_type} *t = state->{name}[address >> {page + table}];\n"
+            f"\tif (value == 0 && (t == NULL || t->page[(address >> {page}) & {(1 << table) - 1}] == NULL))\n"
+            "\t\treturn;\n"
+            f"\tsparse_page_{label}(state, address >> {page})[address & {(1 << page) - 1}] = value;\n"
+            "}}\n"
+        )
+    return content
+
+
+def getStateCode(rams):
+    """
+    Fonctions de gestion des pages appelées par celles de l'état (voir
+    `generator._get_state_api`): `{short_name}_release_pages` libère toutes
+    les pages et les tables, `{short_name}_copy_pages` remplace les
+    pointeurs copiés avec l'état par des copies des pages (et renvoie 0, sans
+    rien garder, si la mémoire manque)
+    """
+    release = "static void {short_name}_release_pages(State_{short_name} *state) {{\n"
+    copy = (
+        "static int {short_name}_copy_pages(State_{short_name} *copy, const State_{short_name} *state) {{\n"
+    )
+    for _, name, addr_size in rams:
+        _, table, directory = _split(addr_size)
+        release += (
+            f"\tfor (size_t d = 0; d < {1 << directory}; d++) {{{{\n"
+            f"\t\tif (state->{name}[d] == NULL) continue;\n"
+            f"\t\tfor (size_t q = 0; q < {1 << table}; q++)\n"
+            f"\t\t\tfree(state->{name}[d]->page[q]);\n"
+            f"\t\tfree(state->{name}[d]);\n"
+            "\t}}\n"
+        )
+        copy += f"\tmemset(copy->{name}, 0, sizeof copy->{name});\n"
+    for t, name, addr_size in rams:
+        page, table, directory = _split(addr_size)
+        label = _label(name)
+        copy += (
+            f"\tfor (size_t d = 0; d < {1 << directory}; d++) {{{{\n"
+            f"\t\tconst RamTable_{label}_{{short_name}} *t = state->{name}[d];\n"
+            "\t\tif (t == NULL) continue;\n"
+            f"\t\tif ((copy->{name}[d] = malloc(sizeof *t)) == NULL) goto error;\n"
+            f"\t\t*copy->{name}[d] = *t;\n"
+            f"\t\tfor (size_t q = 0; q < {1 << table}; q++) {{{{\n"
+            "\t\t\tif (t->page[q] == NULL) continue;\n"
+            f"\t\t\t{t} *page = malloc({1 << page} * sizeof *page);\n"
+            f"\t\t\tcopy->{name}[d]->page[q] = page;\n"
+            "\t\t\tif (page == NULL) goto error;\n"
+            f"\t\t\tmemcpy(page, t->page[q], {1 << page} * sizeof *page);\n"
+            "\t\t}}\n"
+            "\t}}\n"
+        )
+    release += "}}\n"
+    copy += (
+        "\treturn 1;\n"
+        "error:\n"
+        # Les pages non copiées sont encore celles de `state`
+        + "".join(
+            f"\tfor (size_t d = 0; d < {1 << _split(addr_size)[2]}; d++)\n"
+            f"\t\tif (copy->{name}[d] != NULL)\n"
+            f"\t\t\tfor (size_t q = 0; q < {1 << _split(addr_size)[1]}; q++)\n"
+            f"\t\t\t\tif (copy->{name}[d]->page[q] == state->{name}[d]->page[q])\n"
+            f"\t\t\t\t\tcopy->{name}[d]->page[q] = NULL;\n"
+            for _, name, addr_size in rams
+        )
+        + "\t{short_name}_release_pages(copy);\n"
+        "\treturn 0;\n"
+        "}}\n"
+    )
+    return release + copy
+
+
+def forEachPage(t, name, addr_size, body, indent="\t", cond=""):
+    """
+    Boucle C sur les pages allouées de la RAM creuse `name` (de mots de type
+    `t`, voir `generator._getExpr`). Dans `body`
+    (des instructions, indentées de `indent`), `p` est le numéro de la page,
+    `page` un pointeur sur ses mots et `dirty` indique si elle a été
+    modifiée depuis le dernier point de reprise. `cond` est une condition
+    ajoutée au test de chaque boucle (par exemple `ok && `)
+    """
+    _, table, directory = _split(addr_size)
+    label = _label(name)
+    inner = "".join(f"\t\t{line}\n" for line in body.splitlines())
+    if re.search(r"\bp\b", body):
+        inner = f"\t\tsize_t p = d << {table} | q;\n" + inner
+    return "".join(
+        indent + line + "\n"
+        for line in (
+            f"for (size_t d = 0; {cond}d < {1 << directory}; d++) {{{{\n"
+            f"\tRamTable_{label}_{{short_name}} *t = state->{name}[d];\n"
+            f"\tfor (size_t q = 0; {cond}t != NULL && q < {1 << table}; q++) {{{{\n"
+            f"\t\t{t} *page = t->page[q];\n"
+            "\t\tuint8_t *dirty = &t->dirty[q];\n"
+            "\t\tif (page == NULL) continue;\n"
+            f"{inner}"
+            "\t}}\n"
+            "}}"
+        ).splitlines()
+    )
+
+
+def getLibraryCode(rams):
+    """
+    Fonction de la bibliothèque partagée qui renvoie le nombre de pages
+    allouées de la `k`-ième RAM creuse (dans l'ordre de l'interface)
+    """
+    content = (
+        "uint64_t {short_name}_ram_pages(const State_{short_name} *state, size_t k) {{\n"
+        "\tswitch (k) {{\n"
+    )
+    for k, (_, name, _) in enumerate(rams):
+        content += f"\tcase {k}: return state->PAGES_{_label(name)};\n"
+    content += "\tdefault: return 0;\n\t}}\n}}\n"
+    return content
+
+
+def interface(rams):
+    """
+    Description des RAMs creuses pour l'interface de la bibliothèque:
+    couples `(label, taille d'adresse)`
+    """
+    return [(_label(name), addr_size) for _, name, addr_size in rams]
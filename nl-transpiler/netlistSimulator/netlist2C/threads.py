@@ -0,0 +1,404 @@
+"""
+Mode de génération multi-thread, pour les très grandes netlists dont chaque
+profondeur du circuit contient beaucoup d'équations indépendantes.
+
+Les équations, dans l'ordre de `utils.getOrderedNetList`, sont rangées par
+niveau: 1 de plus que le plus haut niveau des nappes qu'elles lisent, les
+entrées, les constantes et les registres étant au niveau 0. Les équations
+d'un même niveau ne dépendent pas les unes des autres. Niveau par niveau,
+chaque équation est donnée au thread qui calcule la plupart des nappes
+qu'elle lit, pour que les cônes d'entrée indépendants restent sur un même
+thread. Dans un niveau dont le coût estimé (voir `COSTS`) est assez grand
+pour donner au moins `min_chunk_cost` à chaque thread, le coût de chaque
+thread est limité à une part équitable (à `BALANCE` près), et les équations
+qui ne lisent que des entrées ou des registres sont découpées en morceaux
+consécutifs de même coût. Les équations des petits niveaux qui ne lisent
+rien d'un autre thread vont au premier thread.
+
+Les niveaux consécutifs forment une étape tant qu'aucun thread ne lit une
+nappe calculée par un autre thread dans la même étape: les threads se
+synchronisent par une barrière entre deux étapes, et chaque thread calcule
+son morceau de l'étape (les équations de plusieurs niveaux) d'un seul
+tenant.
+
+La fonction de simulation est appelée par le premier thread. Les autres
+threads sont créés au premier appel et gardés ensuite: ils attendent le
+cycle suivant à une barrière (d'abord en boucle active, puis en rendant la
+main, puis en dormant). Les mises à jour des registres et des RAMs sont
+faites par le premier thread après la dernière barrière. S'il y a moins de
+processeurs que de threads, les morceaux sont calculés l'un après l'autre
+par le thread appelant.
+
+Les nappes lues par un autre morceau, les sorties et les nappes lues par
+les mises à jour de fin de cycle sont écrites dans l'état, dans les champs
+`WIRE_{label}`, rangés par morceau et séparés par une ligne de cache pour
+que les threads n'écrivent pas dans les mêmes lignes. Les registres sont lus
+directement dans l'état. Il n'y a qu'un groupe de threads par programme:
+les appels depuis plusieurs threads (sur des états différents) sont simulés
+l'un après l'autre.
+
+Le code doit être compilé avec `-pthread`. Le gain dépend de la largeur des
+niveaux, des dépendances entre threads et du nombre de cœurs, voir
+`benchmarks/bench_threads.py`.
+"""
+
+from . import AST as ast
+from . import generator, profiling, utils
+from .roms import readHexRom, writeRomArrays
+
+"""
+Coût estimé d'une équation selon son opération (1 par défaut)
+"""
+COSTS = {
+    ast.Exprs.MUX: 2,
+    ast.Exprs.CONCAT: 2,
+    ast.Exprs.SNIP: 2,
+    ast.Exprs.SLICE: 2,
+    ast.Exprs.RAM: 4,
+    ast.Exprs.ROM: 4,
+}
+
+DEFAULT_MIN_CHUNK_COST = 256
+
+"""
+Coût maximal d'un thread dans un niveau découpé, relatif à une part
+équitable
+"""
+BALANCE = 1.25
+
+"""
+Attente à une barrière: nombre de tours de boucle active, puis d'appels à
+`sched_yield`, avant de dormir `SLEEP_NS` nanosecondes entre deux tests
+"""
+SPINS = 1 << 10
+YIELDS = 1 << 14
+SLEEP_NS = 100_000
+
+"""
+Taille d'une ligne de cache, qui sépare les nappes de deux morceaux
+"""
+CACHE_LINE = 64
+
+
+def _cost(eq):
+    return COSTS.get(eq.expr.type, 1)
+
+
+def getStages(ordered_eqns, threads, min_chunk_cost=DEFAULT_MIN_CHUNK_COST):
+    """
+    Renvoie les étapes de la simulation: une liste d'étapes, chacune étant
+    une liste de `threads` listes d'équations (le morceau de chaque thread,
+    dans l'ordre topologique). Les lectures de registres n'en font pas partie
+    """
+    levels = {}
+    by_level = {}
+    for eq in ordered_eqns:
+        if eq.expr.type == ast.Exprs.REG:
+            continue
+        level = 1 + max((levels.get(v.label, 0) for v in eq.expr.getDeps()), default=0)
+        levels[eq.var.label] = level
+        by_level.setdefault(level, []).append(eq)
+    owner = {}  # Thread de chaque nappe calculée
+    stage_of = {}
+    stages = []
+    for level in sorted(by_level):
+        eqs = by_level[level]
+        total = sum(_cost(eq) for eq in eqs)
+        wide = threads > 1 and total >= min_chunk_cost * threads
+        cap = total / threads * BALANCE + max(_cost(eq) for eq in eqs)
+        load = [0] * threads
+        done = 0
+        assigned = []
+        for eq in eqs:
+            owners = [owner[v.label] for v in eq.expr.getDeps() if v.label in owner]
+            if owners:
+                t = max(sorted(set(owners)), key=lambda t: (owners.count(t), -load[t]))
+                if wide and load[t] + _cost(eq) > cap:
+                    t = load.index(min(load))
+            elif wide:
+                t = min(done * threads // total, threads - 1)
+            else:
+                t = 0
+            done += _cost(eq)
+            load[t] += _cost(eq)
+            owner[eq.var.label] = t
+            assigned.append((eq, t))
+        # Une barrière si un thread lit une nappe calculée par un autre thread
+        # dans l'étape en cours
+        current = len(stages) - 1
+        if not stages or any(
+            owner[v.label] != t and stage_of[v.label] == current
+            for eq, t in assigned
+            for v in eq.expr.getDeps()
+            if v.label in owner
+        ):
+            stages.append([[] for _ in range(threads)])
+        for eq, t in assigned:
+            stages[-1][t].append(eq)
+            stage_of[eq.var.label] = len(stages) - 1
+    return stages or [[[] for _ in range(threads)]]
+
+
+def _get_barrier(threads):
+    """
+    Barrière à inversion de sens entre les `threads` threads: `sense` est
+    propre à chaque thread
+    """
+    return (
+        "static atomic_uint {short_name}_arrived;\n"
+        "static atomic_uint {short_name}_released;\n"
+        "static void {short_name}_wait(unsigned *sense) {{\n"
+        "\tunsigned s = *sense = !*sense;\n"
+        f"\tif (atomic_fetch_add_explicit(&{{short_name}}_arrived, 1, memory_order_acq_rel) == {threads - 1}) {{{{\n"
+        "\t\tatomic_store_explicit(&{short_name}_arrived, 0, memory_order_relaxed);\n"
+        "\t\tatomic_store_explicit(&{short_name}_released, s, memory_order_release);\n"
+        "\t\treturn;\n"
+        "\t}}\n"
+        "\tfor (uint64_t i = 0; atomic_load_explicit(&{short_name}_released, memory_order_acquire) != s; i++) {{\n"
+        f"\t\tif (i >= {SPINS + YIELDS}) {{{{\n"
+        f"\t\t\tstruct timespec pause = {{{{0, {SLEEP_NS}}}}};\n"
+        "\t\t\tnanosleep(&pause, NULL);\n"
+        f"\t\t}}}} else if (i >= {SPINS})\n"
+        "\t\t\tsched_yield();\n"
+        "\t}}\n"
+        "}}\n"
+    )
+
+
+def _get_pool(stages, threads):
+    """
+    Groupe de threads: chaque thread attend le début d'un cycle, calcule ses
+    morceaux de chaque étape (`{short_name}_chunks`, `NULL` pour un morceau
+    vide) en attendant les autres threads entre deux étapes, puis attend la
+    fin du cycle. Le groupe n'est démarré que s'il y a au moins autant de
+    processeurs que de threads: sinon, ou si les threads ne peuvent pas être
+    créés, tous les morceaux sont calculés dans l'ordre par le thread
+    appelant
+    """
+    table = ",\n".join(
+        "\t{{"
+        + ", ".join(
+            f"{{functionName}}_chunk_{s}_{t}" if chunk else "NULL"
+            for t, chunk in enumerate(stage)
+        )
+        + "}}"
+        for s, stage in enumerate(stages)
+    )
+    return (
+        "typedef void (*Chunk_{short_name})(State_{short_name} *, Input_{short_name} *, Rom_{short_name} *);\n"
+        f"static const Chunk_{{short_name}} {{short_name}}_chunks[{len(stages)}][{threads}] = {{{{\n{table}\n}}}};\n"
+        "static struct {{\n"
+        "\tState_{short_name} *state;\n"
+        "\tInput_{short_name} *input;\n"
+        "\tRom_{short_name} *roms;\n"
+        "}} {short_name}_job;\n"
+        "static pthread_once_t {short_name}_once = PTHREAD_ONCE_INIT;\n"
+        "static pthread_mutex_t {short_name}_lock = PTHREAD_MUTEX_INITIALIZER;\n"
+        "static int {short_name}_parallel;\n"
+        "static unsigned {short_name}_sense;\n"
+        "static void {short_name}_thread(size_t t, unsigned *sense) {{\n"
+        f"\tfor (size_t s = 0; s < {len(stages)}; s++) {{{{\n"
+        "\t\tif (s > 0)\n"
+        "\t\t\t{short_name}_wait(sense);\n"
+        "\t\tif ({short_name}_chunks[s][t] != NULL)\n"
+        "\t\t\t{short_name}_chunks[s][t]({short_name}_job.state, {short_name}_job.input, {short_name}_job.roms);\n"
+        "\t}}\n"
+        "}}\n"
+        "static void *{short_name}_worker(void *arg) {{\n"
+        "\tunsigned sense = 0;\n"
+        "\twhile (1) {{\n"
+        "\t\t{short_name}_wait(&sense);\n"
+        "\t\t{short_name}_thread((size_t) arg, &sense);\n"
+        "\t\t{short_name}_wait(&sense);\n"
+        "\t}}\n"
+        "\treturn NULL;\n"
+        "}}\n"
+        "static void {short_name}_start(void) {{\n"
+        f"\tif ({threads} < 2 || sysconf(_SC_NPROCESSORS_ONLN) < {threads})\n"
+        "\t\treturn;\n"
+        f"\tfor (size_t t = 1; t < {threads}; t++) {{{{\n"
+        "\t\tpthread_t thread;\n"
+        "\t\tif (pthread_create(&thread, NULL, {short_name}_worker, (void *) t) != 0) {{\n"
+        '\t\t\tfprintf(stderr, "Could not start the simulation threads, simulating on one thread\\n");\n'
+        "\t\t\treturn;\n"
+        "\t\t}}\n"
+        "\t\tpthread_detach(thread);\n"
+        "\t}}\n"
+        "\t{short_name}_parallel = 1;\n"
+        "}}\n"
+    )
+
+
+def transpile2CThreads(
+    netlist_string,
+    h_file,
+    c_file,
+    names,
+    threads,
+    min_chunk_cost=DEFAULT_MIN_CHUNK_COST,
+    helper_functions=True,
+    less_verbose=False,
+    parser_algorithm="lalr",
+    library=False,
+    binary_io=False,
+    rom_contents=None,
+    rom_output=None,
+    optimize=None,
+    profile=None,
+):
+    """
+    Équivalent de `transpile2CFiles` qui génère une fonction de simulation
+    répartie sur `threads` threads (en comptant celui qui l'appelle). Un
+    niveau n'est découpé que si chaque thread en reçoit un coût d'au moins
+    `min_chunk_cost`. Le header et les fonctions annexes sont les mêmes, la
+    structure `State_{short_name}` contient en plus les nappes échangées
+    entre les threads.
+
+    Les étapes de la transpilation sont enregistrées dans `profile` (un
+    `profiling.Profile`, voir `transpile2CFiles`), qui est renvoyé
+    """
+    if threads < 1:
+        raise ValueError(f"The number of threads must be positive (got {threads})")
+    if profile is None:
+        profile = profiling.Profile()
+    netlist, ordered_eqns = generator.getScheduledNetList(
+        netlist_string, parser_algorithm, optimize, profile
+    )
+    profile.stage("emit")
+    inputs = sorted(netlist.inputs, key=lambda x: x.label)
+    outputs = sorted(netlist.outputs, key=lambda x: x.label)
+    input_labels = set(v.label for v in inputs)
+    reg_labels = set(
+        eq.var.label for eq in ordered_eqns if eq.expr.type == ast.Exprs.REG
+    )
+    stages = getStages(ordered_eqns, threads, min_chunk_cost)
+    chunks = [chunk for stage in stages for chunk in stage]
+    where = {eq.var.label: k for k, chunk in enumerate(chunks) for eq in chunk}
+
+    # Nappes écrites dans l'état: lues par un autre morceau, en sortie ou par
+    # les mises à jour de fin de cycle
+    kept = set(v.label for v in outputs)
+    for k, chunk in enumerate(chunks):
+        for eq in chunk:
+            kept.update(v.label for v in eq.expr.getDeps() if where.get(v.label) != k)
+    updated = set()
+    for eq in ordered_eqns:
+        if eq.expr.type in utils.REG_TYPES:
+            updated.update(a.label for a in eq.expr.args if isinstance(a, ast.Var))
+    kept = (kept | updated) - input_labels - reg_labels
+    variables = {v.label: v for v in inputs}
+    variables.update((eq.var.label, eq.var) for eq in ordered_eqns)
+
+    def ref(label):
+        if label in input_labels:
+            return f"input->{label}"
+        if label in reg_labels:
+            return f"state->REG_{label}"
+        return f"state->WIRE_{label}"
+
+    def load(label):
+        t = utils.cTypeFromBusSize(variables[label].length).value
+        return f"{t} {label} = {ref(label)};\n"
+
+    h = generator._CWriter(h_file, names)
+    c = generator._CWriter(c_file, names)
+    fragments = {eq.var.label: generator._getExpr(eq) for eq in ordered_eqns}
+    states = [state for _, state, _, _ in fragments.values() if state is not None]
+    roms = sorted(r for _, _, _, r in fragments.values() if r is not None)
+
+    generator._write_includes(c, helper_functions, binary_io)
+    c.write(
+        "#include <pthread.h>\n#include <sched.h>\n#include <stdatomic.h>\n#include <time.h>\n#include <unistd.h>\n\n"
+    )
+    if rom_contents is not None:
+        contents = readHexRom(rom_contents, roms)
+        if rom_output is not None:
+            writeRomArrays(rom_output, roms, contents)
+            c.template('#include "{filename}_roms.h"\n')
+        else:
+            writeRomArrays(c, roms, contents)
+        c.write("\n")
+    c.template(_get_barrier(threads))
+
+    # Une fonction par morceau non vide
+    for s, stage in enumerate(stages):
+        for t, chunk in enumerate(stage):
+            if not chunk:
+                continue
+            c.template(
+                f"static void {{functionName}}_chunk_{s}_{t}(State_{{short_name}} *state, Input_{{short_name}} *input, Rom_{{short_name}}* roms) {{{{\n"
+            )
+            defined = set(eq.var.label for eq in chunk)
+            if rom_contents is None:
+                for label, _, word_size in roms:
+                    if label in defined:
+                        rom_type = utils.cTypeFromBusSize(word_size).value
+                        c.write(f"\t{rom_type} *ROM_{label} = roms->{label};\n")
+            reads = set(v.label for eq in chunk for v in eq.expr.getDeps()) - defined
+            for label in sorted(reads):
+                c.write("\t" + load(label))
+            for eq in chunk:
+                c.write(fragments[eq.var.label][0])
+            for eq in chunk:
+                if eq.var.label in kept:
+                    c.write(f"\tstate->WIRE_{eq.var.label} = {eq.var.label};\n")
+            c.write("}\n")
+    c.template(_get_pool(stages, threads))
+
+    c.template(
+        "void {functionName}(State_{short_name} *state, Input_{short_name} *input, Output_{short_name} *output, Rom_{short_name}* roms) {{\n"
+        "\tpthread_once(&{short_name}_once, {short_name}_start);\n"
+        "\tif ({short_name}_parallel) {{\n"
+        "\t\tpthread_mutex_lock(&{short_name}_lock);\n"
+        "\t\t{short_name}_job.state = state;\n"
+        "\t\t{short_name}_job.input = input;\n"
+        "\t\t{short_name}_job.roms = roms;\n"
+        "\t\t{short_name}_wait(&{short_name}_sense);\n"
+        "\t\t{short_name}_thread(0, &{short_name}_sense);\n"
+        "\t\t{short_name}_wait(&{short_name}_sense);\n"
+        "\t\tpthread_mutex_unlock(&{short_name}_lock);\n"
+        "\t}} else {{\n"
+    )
+    c.template(
+        f"\t\tfor (size_t s = 0; s < {len(stages)}; s++)\n"
+        f"\t\t\tfor (size_t t = 0; t < {threads}; t++)\n"
+        "\t\t\t\tif ({short_name}_chunks[s][t] != NULL)\n"
+        "\t\t\t\t\t{short_name}_chunks[s][t](state, input, roms);\n"
+        "\t}}\n\n"
+    )
+    # Les sorties sont lues avant les mises à jour de fin de cycle, qui
+    # lisent les nappes dans l'état
+    for v in outputs:
+        c.write(f"\toutput->{v.label} = {ref(v.label)};\n")
+    for label in sorted(updated):
+        c.write("\t" + load(label))
+    for eq in ordered_eqns:
+        c.write(fragments[eq.var.label][2])
+    c.write("\tstate->cycle++;\n\n}\n")
+
+    # Les nappes de chaque morceau, séparées par une ligne de cache
+    extra_state = ""
+    for k, chunk in enumerate(chunks):
+        fields = "".join(
+            f"\t{utils.cTypeFromBusSize(eq.var.length).value} WIRE_{eq.var.label};\n"
+            for eq in chunk
+            if eq.var.label in kept
+        )
+        if fields:
+            extra_state += f"\tuint8_t PAD_{k}[{CACHE_LINE}];\n" + fields
+    generator._write_api(
+        h,
+        c,
+        inputs,
+        outputs,
+        states,
+        roms,
+        helper_functions,
+        less_verbose,
+        library,
+        binary_io,
+        extra_state=extra_state,
+    )
+    generator._countWritten(profile, h, c)
+    profile.finish()
+    return profile
@@ -0,0 +1,268 @@
+"""
+Traces de nappes internes du circuit, pour le débogage, au format VCD (lu
+par GTKWave et la plupart des visualiseurs de chronogrammes) ou dans un
+format binaire compact converti ensuite en VCD (voir
+`netlistSimulator.vcd`).
+
+Les nappes tracées sont choisies à la transpilation, par des motifs de noms
+(`fnmatch`, par exemple `alu_*`) comparés aux labels de `NetList.vars`. La
+fonction de simulation copie la valeur de chaque nappe tracée dans les
+champs `TRACE_{label}` de l'état; sans motif, rien n'est généré et le code
+est celui d'une netlist sans trace.
+
+Les traces sont écrites par les fonctions générées:
+  - `{short_name}_trace_open(path, binary)` crée le fichier `path` et
+    renvoie un `Trace_{short_name}`, ou `NULL` en cas d'erreur (avec
+    `errno`)
+  - `{short_name}_trace_sample(trace, state)` est à appeler après chaque
+    cycle: seules les nappes dont la valeur a changé depuis l'appel
+    précédent sont écrites, avec le numéro du cycle (celui de `state` avant
+    le cycle). Renvoie -1 si une écriture a échoué
+  - `{short_name}_trace_close(trace)` écrit la fin du tampon et ferme le
+    fichier, et renvoie -1 si une écriture a échoué
+Les changements sont écrits dans un tampon de `BUFFER_SIZE` octets, vidé
+quand il est plein.
+
+Le format binaire commence par un en-tête: `MAGIC`, la version et le nombre
+de nappes (deux entiers de 32 bits), puis pour chaque nappe sa taille et la
+longueur de son label (deux entiers de 32 bits) suivis du label. Viennent
+ensuite les enregistrements: l'indice de la nappe (32 bits) et sa nouvelle
+valeur, sur juste assez d'octets pour sa taille, ou `TIME_INDEX` et le
+numéro du cycle des changements suivants (64 bits). Les entiers sont en
+petit-boutiste.
+"""
+
+import fnmatch
+
+from . import utils
+
+MAGIC = b"NLSIMTRC"
+VERSION = 1
+
+"""
+Indice des enregistrements binaires qui donnent le numéro du cycle
+"""
+TIME_INDEX = 0xFFFFFFFF
+
+BUFFER_SIZE = 1 << 16
+
+"""
+Caractères des identifiants des nappes dans un fichier VCD: le numéro de la
+nappe est écrit en base 94, chiffre de poids faible en premier
+"""
+VCD_ID_FIRST = ord("!")
+VCD_ID_BASE = 94
+
+
+def vcdId(index):
+    """
+    Identifiant VCD de la `index`-ième nappe tracée
+    """
+    digits = ""
+    while True:
+        digits += chr(VCD_ID_FIRST + index % VCD_ID_BASE)
+        index //= VCD_ID_BASE
+        if index == 0:
+            return digits
+
+
+def selectSignals(netlist, ordered_eqns, patterns):
+    """
+    Renvoie la liste, triée par label, des nappes de `netlist.vars` dont le
+    label correspond à l'un des motifs `patterns`. Seules les entrées et les
+    nappes calculées à chaque cycle (par les équations `ordered_eqns`, voir
+    `utils.getOrderedNetList`) peuvent être tracées. Lève `ValueError` si
+    un motif ne correspond à aucune nappe
+    """
+    defined = set(eq.var.label for eq in ordered_eqns)
+    defined.update(v.label for v in netlist.inputs)
+    candidates = sorted(
+        (v for v in netlist.vars if v.label in defined), key=lambda v: v.label
+    )
+    selected = {}
+    for pattern in patterns:
+        matches = [v for v in candidates if fnmatch.fnmatchcase(v.label, pattern)]
+        if not matches:
+            raise ValueError(f"No signal matches the trace pattern {pattern!r}")
+        selected.update((v.label, v) for v in matches)
+    return [selected[label] for label in sorted(selected)]
+
+
+def getTraceFields(signals):
+    """
+    Champs de l'état qui gardent la valeur des nappes tracées au dernier
+    cycle
+    """
+    return "".join(
+        f"\t{utils.cTypeFromBusSize(v.length).value} TRACE_{v.label};\n"
+        for v in signals
+    )
+
+
+def getTraceStores(signals):
+    """
+    Instructions de la fonction de simulation qui copient les nappes tracées
+    dans l'état
+    """
+    return "".join(f"\tstate->TRACE_{v.label} = {v.label};\n" for v in signals)
+
+
+def getTraceCode(signals):
+    """
+    Fonctions C d'écriture des traces (voir la documentation du module)
+    """
+    n = len(signals)
+    labels = ", ".join(f'"{v.label}"' for v in signals)
+    widths = ", ".join(str(v.length) for v in signals)
+    content = (
+        f"static const char *const {{short_name}}_trace_labels[{n}] = {{{{{labels}}}}};\n"
+        f"static const uint8_t {{short_name}}_trace_widths[{n}] = {{{{{widths}}}}};\n"
+        "struct Trace_{short_name} {{\n"
+        "\tFILE *f;\n"
+        "\tint binary, started, timed, error;\n"
+        "\tuint64_t time;\n"
+        "\tsize_t pos;\n"
+        f"\tuint64_t last[{n}];\n"
+        f"\tchar buf[{BUFFER_SIZE}];\n"
+        "}};\n"
+        "static char *{short_name}_trace_id(char *p, uint32_t index) {{\n"
+        "\tdo {{\n"
+        f"\t\t*p++ = {VCD_ID_FIRST} + index % {VCD_ID_BASE};\n"
+        f"\t\tindex /= {VCD_ID_BASE};\n"
+        "\t}} while (index > 0);\n"
+        "\treturn p;\n"
+        "}}\n"
+        "static char *{short_name}_trace_le(char *p, uint64_t value, int bytes) {{\n"
+        "\tfor (int k = 0; k < bytes; k++)\n"
+        "\t\t*p++ = value >> 8 * k;\n"
+        "\treturn p;\n"
+        "}}\n"
+        "static void {short_name}_trace_flush(Trace_{short_name} *t) {{\n"
+        "\tif (t->pos > 0 && fwrite(t->buf, 1, t->pos, t->f) != t->pos)\n"
+        "\t\tt->error = 1;\n"
+        "\tt->pos = 0;\n"
+        "}}\n"
+        # Au plus 96 octets par enregistrement VCD: un numéro de cycle, ou une
+        # valeur de 64 bits et un identifiant
+        "static void {short_name}_trace_record(Trace_{short_name} *t, uint32_t index, uint64_t value) {{\n"
+        "\tif (t->pos > sizeof t->buf - 96)\n"
+        "\t\t{short_name}_trace_flush(t);\n"
+        "\tchar *p = t->buf + t->pos;\n"
+        "\tif (t->binary) {{\n"
+        "\t\tp = {short_name}_trace_le(p, index, 4);\n"
+        f"\t\tp = {{short_name}}_trace_le(p, value, index == {TIME_INDEX:#x} ? 8 : ({{short_name}}_trace_widths[index] + 7) / 8);\n"
+        f"\t}}}} else if (index == {TIME_INDEX:#x}) {{{{\n"
+        '\t\tp += sprintf(p, "#%llu\\n", (unsigned long long) value);\n'
+        "\t}} else {{\n"
+        "\t\tint bit = {short_name}_trace_widths[index] - 1;\n"
+        "\t\tif (bit == 0) {{\n"
+        "\t\t\t*p++ = '0' + (value & 1);\n"
+        "\t\t}} else {{\n"
+        "\t\t\t*p++ = 'b';\n"
+        "\t\t\twhile (bit > 0 && !(value >> bit & 1))\n"
+        "\t\t\t\tbit--;\n"
+        "\t\t\tfor (; bit >= 0; bit--)\n"
+        "\t\t\t\t*p++ = '0' + (value >> bit & 1);\n"
+        "\t\t\t*p++ = ' ';\n"
+        "\t\t}}\n"
+        "\t\tp = {short_name}_trace_id(p, index);\n"
+        "\t\t*p++ = '\\n';\n"
+        "\t}}\n"
+        "\tt->pos = p - t->buf;\n"
+        "}}\n"
+        "static inline void {short_name}_trace_change(Trace_{short_name} *t, uint32_t index, uint64_t value, uint64_t time) {{\n"
+        "\tif (t->started && t->last[index] == value)\n"
+        "\t\treturn;\n"
+        "\tif (!t->timed || t->time != time) {{\n"
+        f"\t\t{{short_name}}_trace_record(t, {TIME_INDEX:#x}, time);\n"
+        "\t\tt->time = time;\n"
+        "\t\tt->timed = 1;\n"
+        "\t}}\n"
+        "\t{short_name}_trace_record(t, index, value);\n"
+        "\tt->last[index] = value;\n"
+        "}}\n"
+        "Trace_{short_name} *{short_name}_trace_open(const char *path, int binary) {{\n"
+        "\tTrace_{short_name} *t = calloc(1, sizeof *t);\n"
+        "\tif (t == NULL) return NULL;\n"
+        '\tt->f = fopen(path, "wb");\n'
+        "\tif (t->f == NULL) {{\n"
+        "\t\tfree(t);\n"
+        "\t\treturn NULL;\n"
+        "\t}}\n"
+        "\tt->binary = binary;\n"
+        "\tif (binary) {{\n"
+        "\t\tchar header[8];\n"
+        f'\t\tfwrite("{MAGIC.decode()}", 1, {len(MAGIC)}, t->f);\n'
+        f"\t\t{{short_name}}_trace_le({{short_name}}_trace_le(header, {VERSION}, 4), {n}, 4);\n"
+        "\t\tfwrite(header, 1, 8, t->f);\n"
+        f"\t\tfor (uint32_t k = 0; k < {n}; k++) {{{{\n"
+        "\t\t\tsize_t length = strlen({short_name}_trace_labels[k]);\n"
+        "\t\t\t{short_name}_trace_le({short_name}_trace_le(header, {short_name}_trace_widths[k], 4), length, 4);\n"
+        "\t\t\tfwrite(header, 1, 8, t->f);\n"
+        "\t\t\tfwrite({short_name}_trace_labels[k], 1, length, t->f);\n"
+        "\t\t}}\n"
+        "\t}} else {{\n"
+        '\t\tfprintf(t->f, "$timescale 1 ns $end\\n$scope module {short_name} $end\\n");\n'
+        f"\t\tfor (uint32_t k = 0; k < {n}; k++) {{{{\n"
+        "\t\t\tchar id[8] = {{0}};\n"
+        "\t\t\t{short_name}_trace_id(id, k);\n"
+        '\t\t\tfprintf(t->f, "$var wire %d %s %s $end\\n", {short_name}_trace_widths[k], id, {short_name}_trace_labels[k]);\n'
+        "\t\t}}\n"
+        '\t\tfprintf(t->f, "$upscope $end\\n$enddefinitions $end\\n");\n'
+        "\t}}\n"
+        "\tif (ferror(t->f)) {{\n"
+        "\t\tfclose(t->f);\n"
+        "\t\tfree(t);\n"
+        "\t\treturn NULL;\n"
+        "\t}}\n"
+        "\treturn t;\n"
+        "}}\n"
+        "int {short_name}_trace_sample(Trace_{short_name} *t, const State_{short_name} *state) {{\n"
+        "\tuint64_t time = state->cycle - 1;\n"
+    )
+    for k, v in enumerate(signals):
+        content += f"\t{{short_name}}_trace_change(t, {k}, state->TRACE_{v.label} & (UINT64_MAX >> {64 - v.length}), time);\n"
+    content += (
+        "\tt->started = 1;\n"
+        "\treturn t->error ? -1 : 0;\n"
+        "}}\n"
+        "int {short_name}_trace_close(Trace_{short_name} *t) {{\n"
+        "\t{short_name}_trace_flush(t);\n"
+        "\tint error = t->error;\n"
+        "\tif (fclose(t->f) != 0) error = 1;\n"
+        "\tfree(t);\n"
+        "\treturn error ? -1 : 0;\n"
+        "}}\n"
+    )
+    return content
+
+
+def getTraceStep():
+    """
+    Équivalent de `{functionName}_step` (voir `generator._get_library_api`)
+    qui écrit la trace de chaque cycle
+    """
+    return (
+        "size_t {functionName}_step_traced(State_{short_name} *state, size_t n, Input_{short_name} *inputs, Output_{short_name} *outputs, Rom_{short_name}* roms, Trace_{short_name} *trace) {{\n"
+        "\tfor (size_t i = 0; i < n; i++) {{\n"
+        "\t\tif ({functionName}_step(state, 1, inputs + i, outputs + i, roms) != 1 || {short_name}_trace_sample(trace, state) < 0)\n"
+        "\t\t\treturn i;\n"
+        "\t}}\n"
+        "\treturn n;\n"
+        "}}\n"
+    )
+
+
+def getTraceHeader(library):
+    """
+    Déclarations du header pour les traces
+    """
+    content = (
+        "typedef struct Trace_{short_name} Trace_{short_name};\n"
+        "Trace_{short_name} *{short_name}_trace_open(const char *path, int binary);\n"
+        "int {short_name}_trace_sample(Trace_{short_name} *trace, const State_{short_name} *state);\n"
+        "int {short_name}_trace_close(Trace_{short_name} *trace);\n"
+    )
+    if library:
+        content += "size_t {functionName}_step_traced(State_{short_name} *state, size_t n, Input_{short_name} *inputs, Output_{short_name} *outputs, Rom_{short_name}* roms, Trace_{short_name} *trace);\n"
+    return content
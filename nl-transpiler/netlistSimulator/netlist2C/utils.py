@@ -1,6 +1,7 @@
+import os
 from enum import Enum
 
-from .AST import Exprs
+from .AST import Exprs, Var
 
 
 class CTypes(Enum):
@@ -29,6 +30,33 @@ def size_from_bus_size(size):
     raise ValueError
 
 
+def cMask(length, ctype=None):
+    """
+    Expression C du masque des `length` bits de poids faible, du type C
+    `ctype` (par défaut celui d'une nappe de `length` bits). Le masque est
+    pris dans `UINT64_MAX`: `((T) 1 << length) - 1` est indéfini quand
+    `length` est la taille du type
+    """
+    if ctype is None:
+        ctype = cTypeFromBusSize(length).value
+    if length <= 0:
+        return f"(({ctype}) 0)"
+    return f"(({ctype}) (UINT64_MAX >> {64 - length}))"
+
+
+def getCacheDir():
+    """
+    Dossier où sont stockés les fichiers de cache (tables du parser, ...).
+    Peut être changé avec la variable d'environnement `NL_SIM_CACHE_DIR`
+    """
+    if "NL_SIM_CACHE_DIR" in os.environ:
+        return os.environ["NL_SIM_CACHE_DIR"]
+    xdg = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    return os.path.join(xdg, "netlistSimulator")
+
+
 """
 Dictionnaire indiquant les nappes aboutissant dans des registres
 """
@@ -38,48 +66,106 @@ REG_TYPES = {
 }
 
 
-def getOrderedNetList(netlist):
+def getRegisterArgs(expr):
+    """
+    Nappes (des `Var`) lues par la mise à jour de fin de cycle de
+    l'instruction `expr` (voir `REG_TYPES`): les constantes n'en font pas
+    partie
+    """
+    return [
+        expr.args[i]
+        for i in sorted(REG_TYPES.get(expr.type, ()))
+        if isinstance(expr.args[i], Var)
+    ]
+
+
+def getRoots(outputs, regs, label, registers_first=False):
+    """
+    Points de départ du tri topologique (voir `getOrderedNetList`): les
+    sorties `outputs` puis les nappes `regs` lues par les registres et les
+    RAMs (voir `getRegisterArgs`), ou dans l'autre sens avec
+    `registers_first`, chacune triée selon `label`
+    """
+    outputs = sorted(outputs, key=label)
+    regs = sorted(set(regs), key=label)
+    return regs + outputs if registers_first else outputs + regs
+
+
+def getOrderedNetList(netlist, registers_first=False):
     """
     Fonction qui fait le tri topologique à partir d'un objet `NetList`.
     Renvoie une liste d'objet `Eq`
+
+    L'ordre obtenu ne dépend que de la netlist (pas de l'ordre d'itération des
+    `set`), deux transpilations de la même netlist donnent donc le même code
+
+    Le parcours part des sorties puis des nappes lues par les registres et
+    les RAMs, ou dans l'autre sens avec `registers_first`: une sortie qui
+    est un registre est alors placée juste avant la logique qui le lit
     """
     var_to_eq = {}
     graph = {}  # Dictionnaire du graph de dépendance des composants
-    sorted_list = []  # composants triés
-    explored = set()
     regs = set()  # Nappes aboutissant à un registre, on doit les calculer aussi
     for e in netlist.equations:
         var_to_eq[e.var] = e
         graph[e.var] = e.expr.getDeps()
-        if e.expr.type in REG_TYPES:
-            for i in REG_TYPES[e.expr.type]:
-                regs.add(e.expr.args[i])
-
-    def explore(v):
-        if v in path:
-            raise ValueError(
-                f"Cyclic netlist. Path is made of {[i.label for i in path]}"
-            )
-        explored.add(v)
-        if v in netlist.inputs:
-            return
-        path.add(v)
-        if v not in graph:
-            raise ValueError(
-                f"{v.label} have no value. Please add {v.label} to inputs or provide a '{v.label} = ...' statement'"
-            )
-        for new in graph[v]:
-            if new not in explored:
-                explore(new)
-        path.remove(v)
-        if var_to_eq[v] not in sorted_list:
-            sorted_list.append(var_to_eq[v])
-            print(f"{len(sorted_list)}/{len(graph)}")
-
-    for v in netlist.outputs:
-        path = set()  # Ensembles des points du chemin en court d'exploration
-        explore(v)
-    for v in regs:
-        path = set()
-        explore(v)
+        regs.update(getRegisterArgs(e.expr))
+
+    label = lambda x: x.label
+    roots = getRoots(netlist.outputs, regs, label, registers_first)
+    order = topologicalSort(graph, roots, set(netlist.inputs), label)
+    return [var_to_eq[v] for v in order]
+
+
+def topologicalSort(graph, roots, inputs, label):
+    """
+    Tri topologique (parcours en profondeur, ordre suffixe) du graphe `graph`
+    (dictionnaire qui associe à chaque nappe la liste de ses dépendances) à
+    partir des nappes `roots`. `label` donne le nom d'une nappe pour les
+    messages d'erreur.
+
+    Le parcours est itératif (pile explicite) pour ne pas dépendre de la
+    limite de récursion de python sur les longues chaînes combinatoires, et se
+    fait en O(V+E)
+    """
+    sorted_list = []  # composants triés
+    explored = set()
+
+    def explore(root):
+        path = []  # Chemin en cours d'exploration, dans l'ordre
+        on_path = set()  # Les mêmes points, pour tester l'appartenance en O(1)
+        stack = []  # Pour chaque point du chemin, ses dépendances restantes
+
+        def enter(v):
+            if v in on_path:
+                cycle = path[path.index(v) :] + [v]
+                raise ValueError(
+                    f"Cyclic netlist. Path is made of {[label(i) for i in cycle]}"
+                )
+            explored.add(v)
+            if v in inputs:
+                return
+            if v not in graph:
+                raise ValueError(
+                    f"{label(v)} has no value. Please add {label(v)} to inputs or provide a '{label(v)} = ...' statement"
+                )
+            path.append(v)
+            on_path.add(v)
+            stack.append(iter(graph[v]))
+
+        enter(root)
+        while stack:
+            for new in stack[-1]:
+                if new in on_path or new not in explored:
+                    enter(new)
+                    break
+            else:  # Toutes les dépendances sont calculées
+                stack.pop()
+                v = path.pop()
+                on_path.remove(v)
+                sorted_list.append(v)
+
+    for v in roots:
+        if v not in explored:
+            explore(v)
     return sorted_list
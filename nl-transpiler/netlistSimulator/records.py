@@ -0,0 +1,94 @@
+"""
+Enregistrements binaires échangés avec le code C généré.
+
+Les entrées et les sorties d'un cycle sont les structures C `Input_netlist` et
+`Output_netlist` telles quelles (champs triés par label, alignement du
+compilateur C). Un flux d'enregistrements est simplement une suite de ces
+structures, sans en-tête. Ce module donne les dtypes NumPy correspondants et
+de quoi écrire et relire ces flux (voir `transpile2C(binary_io=True)` et
+`main_binary_example.c`).
+
+Nécessite `numpy`.
+"""
+
+import numpy as np
+
+from .netlist2C import parser, utils
+
+
+def structDtype(varset):
+    """
+    dtype NumPy ayant la même disposition que la structure C des nappes
+    `varset` (couples `(label, taille)`)
+    """
+    varset = sorted(varset)
+    return np.dtype(
+        {
+            "names": [label for label, _ in varset],
+            "formats": [
+                np.dtype(utils.cTypeFromBusSize(n).value[:-2]) for _, n in varset
+            ],
+        },
+        align=True,
+    )
+
+
+def changeDtype(output_dtype):
+    """
+    dtype de la structure `Change_netlist` écrite quand seules les sorties
+    qui changent sont enregistrées
+    """
+    return np.dtype([("cycle", np.uint64), ("output", output_dtype)], align=True)
+
+
+def netlistDtypes(netlist_string):
+    """
+    Renvoie le couple `(dtype des entrées, dtype des sorties)` de la netlist
+    """
+    netlist = parser.parse(netlist_string)
+    return (
+        structDtype((v.label, v.length) for v in netlist.inputs),
+        structDtype((v.label, v.length) for v in netlist.outputs),
+    )
+
+
+def packRecords(dtype, n_records, **values):
+    """
+    Renvoie un tableau de `n_records` enregistrements, les champs donnés en
+    argument nommé étant remplis avec la valeur (ou le tableau de valeurs)
+    correspondante, les autres à 0. `records.tobytes()` ou
+    `records.tofile(f)` donnent le flux binaire
+    """
+    records = np.zeros(n_records, dtype=dtype)
+    for label, v in values.items():
+        records[label] = v
+    return records
+
+
+def unpackRecords(data, dtype):
+    """
+    Interprète le contenu de `data` (`bytes`, ou tout objet supportant le
+    protocole buffer) comme un flux d'enregistrements, sans copie
+    """
+    data = memoryview(data).cast("B")
+    if dtype.itemsize == 0 or len(data) % dtype.itemsize != 0:
+        raise ValueError(
+            f"Stream of {len(data)} bytes is not made of {dtype.itemsize} bytes records"
+        )
+    return np.frombuffer(data, dtype=dtype)
+
+
+def readRecords(path, dtype):
+    """
+    Projette en mémoire le fichier d'enregistrements `path` (en lecture
+    seule, sans le charger entièrement)
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+    if dtype.itemsize == 0 or size % dtype.itemsize != 0:
+        raise ValueError(
+            f"{path} ({size} bytes) is not made of {dtype.itemsize} bytes records"
+        )
+    if size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
@@ -0,0 +1,135 @@
+"""
+Images binaires de ROM, projetées en mémoire par la fonction `map_rom` du code
+généré au lieu d'être relues valeur par valeur par `fscan_rom`.
+
+Format (entiers dans l'ordre des octets de la machine):
+  - en-tête de 16 octets: `b"NLSIMROM"`, version (uint32, vaut 1), nombre de
+    ROMs (uint32)
+  - pour chaque ROM, une entrée de 24 octets: position des données dans le
+    fichier (uint64), taille d'adresse, taille de mot, longueur du label
+    (uint32), un uint32 réservé, puis le label complété par des octets nuls
+    jusqu'à un multiple de 8 octets
+  - les données de chaque ROM: `2 ** taille d'adresse` mots, chacun de la
+    taille du type C utilisé pour la ROM (8, 16, 32 ou 64 bits), à une
+    position multiple de 64
+"""
+
+import argparse
+import struct
+import sys
+from array import array
+
+from .netlist2C import AST as ast
+from .netlist2C import parser, utils
+from .netlist2C.roms import readHexRom
+
+ROM_MAGIC = b"NLSIMROM"
+ROM_VERSION = 1
+_HEADER = struct.Struct("=8sII")
+_ENTRY = struct.Struct("=QIIII")
+_ALIGN = 64
+
+_ARRAY_CODES = {8: "B", 16: "H", 32: "I", 64: "Q"}
+
+
+def _wordArray(word_size, values=()):
+    return array(_ARRAY_CODES[utils.size_from_bus_size(word_size)], values)
+
+
+def netlistRoms(netlist_string):
+    """
+    Renvoie la liste triée des ROMs de la netlist, sous forme de triplets
+    `(label, taille d'adresse, taille de mot)`
+    """
+    netlist = parser.parse(netlist_string)
+    return sorted(
+        (eq.var.label, eq.expr.static_args[0], eq.expr.static_args[1])
+        for eq in netlist.equations
+        if eq.expr.type == ast.Exprs.ROM
+    )
+
+
+def writeRomImage(f, roms, contents):
+    """
+    Écrit dans le fichier binaire `f` l'image des ROMs `roms` (voir
+    `netlistRoms`) dont le contenu est donné par le dictionnaire `contents`
+    (`label -> suite de mots`, complétée par des 0)
+    """
+    entries = b""
+    data = []
+    pos = _HEADER.size + sum(
+        _ENTRY.size + (len(label.encode()) + 7) // 8 * 8 for label, _, _ in roms
+    )
+    for label, addr_size, word_size in roms:
+        words = _wordArray(word_size, contents.get(label, ()))
+        if len(words) > 1 << addr_size:
+            raise ValueError(
+                f"ROM {label} has {1 << addr_size} words, got {len(words)} values"
+            )
+        words.frombytes(bytes(((1 << addr_size) - len(words)) * words.itemsize))
+        pos += -pos % _ALIGN
+        name = label.encode()
+        entries += _ENTRY.pack(pos, addr_size, word_size, len(name), 0)
+        entries += name + bytes(-len(name) % 8)
+        data.append((pos, words))
+        pos += len(words) * words.itemsize
+
+    f.write(_HEADER.pack(ROM_MAGIC, ROM_VERSION, len(roms)))
+    f.write(entries)
+    written = _HEADER.size + len(entries)
+    for pos, words in data:
+        f.write(bytes(pos - written))
+        words.tofile(f)
+        written = pos + len(words) * words.itemsize
+
+
+def readRomImage(path):
+    """
+    Relit une image de ROM. Renvoie un dictionnaire
+    `label -> (taille d'adresse, taille de mot, mots)`
+    """
+    with open(path, "rb") as f:
+        image = f.read()
+    magic, version, count = _HEADER.unpack_from(image)
+    if magic != ROM_MAGIC:
+        raise ValueError(f"{path} is not a ROM image")
+    if version != ROM_VERSION:
+        raise ValueError(f"Unsupported ROM image version {version}")
+    roms = {}
+    pos = _HEADER.size
+    for _ in range(count):
+        offset, addr_size, word_size, length, _ = _ENTRY.unpack_from(image, pos)
+        pos += _ENTRY.size
+        label = image[pos : pos + length].decode()
+        pos += (length + 7) // 8 * 8
+        words = _wordArray(word_size)
+        words.frombytes(image[offset : offset + (words.itemsize << addr_size)])
+        roms[label] = (addr_size, word_size, words)
+    return roms
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Convert a hexadecimal ROM file (as read by fscan_rom) to a binary ROM image (as mapped by map_rom)"
+    )
+    argparser.add_argument("netlist", help="Netlist file using the ROMs")
+    argparser.add_argument("rom", help="Hexadecimal ROM file ('-' for stdin)")
+    argparser.add_argument("image", help="Binary ROM image to write")
+    args = argparser.parse_args()
+    with open(args.netlist) as f:
+        roms = netlistRoms(f.read())
+    if args.rom == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.rom) as f:
+            text = f.read()
+    try:
+        contents = readHexRom(text, roms)
+    except ValueError as e:
+        argparser.exit(1, f"{e}\n")
+    with open(args.image, "wb") as f:
+        writeRomImage(f, roms, contents)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Construction d'un simulateur exécutable (la netlist transpilée et le
+programme de `main_example.c`), pour `nl-transpile run`. Les exécutables
+sont gardés dans le cache de constructions (voir `buildcache`).
+"""
+
+import os
+import tempfile
+
+from . import build, buildcache
+from .netlist2C import (
+    transpile2CChunks,
+    transpile2CEvents,
+    transpile2CFiles,
+    transpile2CThreads,
+)
+from .netlist2C.options import checkOptions
+
+EXECUTABLE = "sim"
+
+# Programme principal du simulateur, l'exemple `main_example.c` (livré avec le
+# paquet): lit la ROM (image binaire ou fichier hexadécimal) donnée en
+# argument, puis les entrées de chaque cycle sur l'entrée standard
+MAIN_EXAMPLE = os.path.join(os.path.dirname(__file__), "main_example.c")
+
+# Variables d'environnement lues par le programme principal quand des nappes
+# sont tracées: le fichier de la trace (pas de trace si elle n'est pas
+# définie), et le choix du format binaire (VCD si elle n'est pas définie)
+TRACE_FILE_VARIABLE = "NL_TRACE_FILE"
+TRACE_BINARY_VARIABLE = "NL_TRACE_BINARY"
+
+
+def _mainProgram():
+    """
+    Texte du programme de `MAIN_EXAMPLE`, qui inclut le header `netlist.h`
+    """
+    with open(MAIN_EXAMPLE) as f:
+        return f.read().replace("%headername%", "netlist.h")
+
+
+def _tracedProgram(program):
+    """
+    Ajoute à `program` (le programme de `MAIN_EXAMPLE`) l'écriture de la
+    trace des nappes tracées (voir `netlist2C.trace`) dans le fichier donné
+    par la variable d'environnement `TRACE_FILE_VARIABLE`
+    """
+    replacements = [
+        (
+            "\tState_netlist *state = netlist_create();\n",
+            "\tState_netlist *state = netlist_create();\n"
+            f'\tconst char *trace_path = getenv("{TRACE_FILE_VARIABLE}");\n'
+            "\tTrace_netlist *trace = NULL;\n"
+            "\tif (trace_path != NULL) {\n"
+            f'\t\ttrace = netlist_trace_open(trace_path, getenv("{TRACE_BINARY_VARIABLE}") != NULL);\n'
+            "\t\tif (trace == NULL) {\n"
+            "\t\t\tperror(trace_path);\n"
+            "\t\t\treturn 1;\n"
+            "\t\t}\n"
+            "\t}\n",
+        ),
+        (
+            "\t\tif (!prompt_netlist_input(&input))\n\t\t\treturn 0;\n",
+            "\t\tif (!prompt_netlist_input(&input)) {\n"
+            "\t\t\tif (trace != NULL && netlist_trace_close(trace) < 0) {\n"
+            "\t\t\t\tperror(trace_path);\n"
+            "\t\t\t\treturn 1;\n"
+            "\t\t\t}\n"
+            "\t\t\treturn 0;\n"
+            "\t\t}\n",
+        ),
+        (
+            "\t\tsimulateNetlist(state, &input, &output, &rom);\n",
+            "\t\tsimulateNetlist(state, &input, &output, &rom);\n"
+            "\t\tif (trace != NULL)\n"
+            "\t\t\tnetlist_trace_sample(trace, state);\n",
+        ),
+    ]
+    for old, new in replacements:
+        if old not in program:
+            raise ValueError(f"{MAIN_EXAMPLE} doesn't contain {old!r}")
+        program = program.replace(old, new)
+    return program
+
+
+def buildExecutable(
+    netlist_string,
+    cache=None,
+    compiler=None,
+    cflags=("-O2",),
+    parser_algorithm="lalr",
+    optimize=None,
+    chunk_size=None,
+    jobs=None,
+    events=None,
+    threads=None,
+    trace=None,
+    sparse_ram=None,
+):
+    """
+    Renvoie le chemin de l'exécutable simulant la netlist, construit dans
+    le cache de constructions `cache` (un `buildcache.BuildCache`, celui par
+    défaut si `None`) si il n'y est pas déjà.
+
+    Les options sont celles de `simulator.buildSimulator`. Les messages de la
+    génération passent par le module `logging`. Avec `trace`, le
+    programme écrit la trace des nappes choisies dans le fichier donné par
+    la variable d'environnement `TRACE_FILE_VARIABLE`.
+    """
+    checkOptions(
+        {
+            "chunk_size": chunk_size,
+            "events": events,
+            "threads": threads,
+            "optimize": optimize,
+            "trace": trace,
+            "sparse_ram": sparse_ram,
+        }
+    )
+    program = _mainProgram()
+    if trace:
+        program = _tracedProgram(program)
+    if cache is None:
+        cache = buildcache.BuildCache()
+    compiler = compiler or build.defaultCompiler()
+    key = buildcache.cacheKey(
+        netlist_string,
+        kind="executable",
+        main=program,
+        compiler=compiler,
+        cflags=list(cflags),
+        optimize=optimize,
+        chunk_size=chunk_size,
+        events=events,
+        threads=threads,
+        trace=list(trace or ()),
+        sparse_ram=sparse_ram,
+    )
+    form = {
+        "short_name": "netlist",
+        "filename": "netlist",
+        "functionName": "simulateNetlist",
+    }
+    options = {
+        "less_verbose": True,
+        "parser_algorithm": parser_algorithm,
+        "optimize": optimize,
+    }
+
+    def builder(directory):
+        # Les sources et les objets ne sont pas gardés dans le cache
+        with tempfile.TemporaryDirectory() as work:
+            if events is not None:
+                sources = [os.path.join(work, "netlist.c")]
+                with open(os.path.join(work, "netlist.h"), "w") as h, open(
+                    sources[0], "w"
+                ) as c:
+                    transpile2CEvents(netlist_string, h, c, form, events, **options)
+            elif threads is not None:
+                sources = [os.path.join(work, "netlist.c")]
+                with open(os.path.join(work, "netlist.h"), "w") as h, open(
+                    sources[0], "w"
+                ) as c:
+                    transpile2CThreads(netlist_string, h, c, form, threads, **options)
+            elif chunk_size is None:
+                sources = [os.path.join(work, "netlist.c")]
+                with open(os.path.join(work, "netlist.h"), "w") as h, open(
+                    sources[0], "w"
+                ) as c:
+                    transpile2CFiles(
+                        netlist_string,
+                        h,
+                        c,
+                        form,
+                        trace=trace,
+                        sparse_ram=sparse_ram,
+                        **options,
+                    )
+            else:
+                sources = transpile2CChunks(
+                    netlist_string, work, form, chunk_size, **options
+                )
+            main = os.path.join(work, "main.c")
+            with open(main, "w") as f:
+                f.write(program)
+            build.compileSources(
+                [main] + sources,
+                os.path.join(directory, EXECUTABLE),
+                compiler=compiler,
+                cflags=list(cflags) + (["-pthread"] if threads is not None else []),
+                jobs=jobs,
+            )
+
+    return os.path.join(cache.build(key, builder), EXECUTABLE)
@@ -0,0 +1,780 @@
+"""
+Simulation d'une netlist depuis Python, sans passer par l'entrée et la sortie
+standard du programme C.
+
+La netlist est transpilée en mode bibliothèque (voir `transpile2CFiles`), compilée
+en bibliothèque partagée puis chargée avec `ctypes`. Les entrées et les
+sorties de plusieurs cycles sont échangées sous forme de tableaux NumPy
+structurés dont la disposition en mémoire est celle des structures
+`Input_netlist` et `Output_netlist` : ils sont passés au code C sans copie.
+
+Nécessite `numpy`.
+"""
+
+import copy
+import ctypes
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from . import build, buildcache, records
+from .netlist2C import (
+    transpile2CChunks,
+    transpile2CEvents,
+    transpile2CFiles,
+    transpile2CThreads,
+    utils,
+)
+from .netlist2C import hotspots as timers
+from .netlist2C.options import checkOptions
+
+SHORT_NAME = "netlist"
+FUNCTION_NAME = "simulateNetlist"
+
+
+def buildSimulator(
+    netlist_string,
+    directory=None,
+    compiler=None,
+    cflags=("-O2",),
+    parser_algorithm="lalr",
+    optimize=None,
+    chunk_size=None,
+    jobs=None,
+    cache=None,
+    events=None,
+    threads=None,
+    trace=None,
+    sparse_ram=None,
+    share_cones=None,
+    hotspots=None,
+    profile=None,
+):
+    """
+    Transpile et compile la netlist, et renvoie le `Simulator` correspondant.
+
+    La bibliothèque est construite dans `directory` (un dossier temporaire
+    par défaut). Le compilateur est `compiler`, ou à défaut la variable
+    d'environnement `CC`, ou `cc`. `optimize` est passé à `transpile2CFiles`.
+
+    Avec `chunk_size`, le code est découpé en morceaux de `chunk_size`
+    équations (voir `transpile2CChunks`), compilés par `jobs` processus en
+    parallèle. Avec `events`, la fonction de simulation est guidée par les
+    évènements, avec des partitions de `events` équations (voir
+    `transpile2CEvents`), ce qui n'est pas compatible avec `chunk_size`. Avec
+    `threads`, chaque cycle est réparti sur `threads` threads (voir
+    `transpile2CThreads`), ce qui n'est compatible ni avec `chunk_size` ni
+    avec `events`. `trace` est une liste de motifs de noms de nappes à
+    tracer (voir `transpile2CFiles` et `Simulator.openTrace`), qui n'est
+    compatible avec aucun de ces trois modes, pas plus que `sparse_ram` (les
+    RAMs de plus de `sparse_ram` bits d'adresse sont creuses, voir
+    `transpile2CFiles` et `Simulator.ramPages`), `share_cones` (voir
+    `transpile2CFiles`) et `hotspots` (le temps passé dans chaque groupe
+    d'équations est compté, voir `transpile2CFiles` et
+    `Simulator.hotspots`).
+
+    Avec `cache` (un `buildcache.BuildCache`), la bibliothèque est prise dans
+    le cache si la même netlist y a déjà été construite avec les mêmes
+    options, sans rien générer ni compiler.
+
+    Avec `profile` (un `netlist2C.Profile`), les étapes de la transpilation
+    et la compilation (l'étape `compile`) y sont mesurées, sauf si la
+    bibliothèque est prise dans le cache.
+    """
+    checkOptions(
+        {
+            "chunk_size": chunk_size,
+            "events": events,
+            "threads": threads,
+            "optimize": optimize,
+            "trace": trace,
+            "sparse_ram": sparse_ram,
+            "share_cones": share_cones,
+            "hotspots": hotspots,
+        }
+    )
+    if cache is not None:
+        compiler = compiler or build.defaultCompiler()
+        key = buildcache.cacheKey(
+            netlist_string,
+            kind="library",
+            compiler=compiler,
+            cflags=list(cflags),
+            optimize=optimize,
+            chunk_size=chunk_size,
+            events=events,
+            threads=threads,
+            trace=list(trace or ()),
+            sparse_ram=sparse_ram,
+            share_cones=share_cones,
+            hotspots=hotspots,
+        )
+        name = f"lib{SHORT_NAME}-{key}.so"
+
+        def builder(directory):
+            # Les sources et les objets ne sont pas gardés dans le cache
+            with tempfile.TemporaryDirectory() as work:
+                library = _buildLibrary(
+                    netlist_string,
+                    work,
+                    compiler,
+                    cflags,
+                    parser_algorithm,
+                    optimize,
+                    chunk_size,
+                    jobs,
+                    events,
+                    threads,
+                    trace,
+                    sparse_ram,
+                    share_cones,
+                    hotspots,
+                    profile,
+                )
+                shutil.move(library, os.path.join(directory, name))
+
+        return Simulator(os.path.join(cache.build(key, builder), name))
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="netlistSimulator-")
+    os.makedirs(directory, exist_ok=True)
+    return Simulator(
+        _buildLibrary(
+            netlist_string,
+            directory,
+            compiler,
+            cflags,
+            parser_algorithm,
+            optimize,
+            chunk_size,
+            jobs,
+            events,
+            threads,
+            trace,
+            sparse_ram,
+            share_cones,
+            hotspots,
+            profile,
+        )
+    )
+
+
+def _buildLibrary(
+    netlist_string,
+    directory,
+    compiler,
+    cflags,
+    parser_algorithm,
+    optimize,
+    chunk_size,
+    jobs,
+    events=None,
+    threads=None,
+    trace=None,
+    sparse_ram=None,
+    share_cones=None,
+    hotspots=None,
+    profile=None,
+):
+    """
+    Transpile et compile la netlist en bibliothèque partagée dans
+    `directory`, et renvoie son chemin
+    """
+    form = {
+        "short_name": SHORT_NAME,
+        "filename": SHORT_NAME,
+        "functionName": FUNCTION_NAME,
+    }
+    options = {
+        "helper_functions": False,
+        "less_verbose": True,
+        "parser_algorithm": parser_algorithm,
+        "library": True,
+        "optimize": optimize,
+        "profile": profile,
+    }
+    headers = [os.path.join(directory, f"{SHORT_NAME}.h")]
+    if events is not None:
+        sources = [os.path.join(directory, f"{SHORT_NAME}.c")]
+        with open(headers[0], "w") as h, open(sources[0], "w") as c:
+            transpile2CEvents(netlist_string, h, c, form, events, **options)
+    elif threads is not None:
+        sources = [os.path.join(directory, f"{SHORT_NAME}.c")]
+        with open(headers[0], "w") as h, open(sources[0], "w") as c:
+            transpile2CThreads(netlist_string, h, c, form, threads, **options)
+    elif chunk_size is None:
+        sources = [os.path.join(directory, f"{SHORT_NAME}.c")]
+        with open(headers[0], "w") as h, open(sources[0], "w") as c:
+            transpile2CFiles(
+                netlist_string,
+                h,
+                c,
+                form,
+                trace=trace,
+                sparse_ram=sparse_ram,
+                share_cones=share_cones,
+                hotspots=hotspots,
+                **options,
+            )
+    else:
+        sources = transpile2CChunks(
+            netlist_string, directory, form, chunk_size, **options
+        )
+        headers.append(os.path.join(directory, f"{SHORT_NAME}_chunks.h"))
+
+    # Une bibliothèque déjà chargée n'est pas relue si on la recharge avec le
+    # même chemin: le nom dépend donc du code
+    digest = hashlib.sha256()
+    for path in headers + sources:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    key = digest.hexdigest()[:16]
+    library = os.path.join(directory, f"lib{SHORT_NAME}-{key}.so")
+    if profile is not None:
+        profile.stage("compile")
+        profile.count("sources", len(sources))
+    build.compileSources(
+        sources,
+        library,
+        compiler=compiler,
+        cflags=list(cflags) + ["-fPIC"] + (["-pthread"] if threads is not None else []),
+        ldflags=["-shared"],
+        jobs=jobs,
+    )
+    if profile is not None:
+        profile.finish()
+    return library
+
+
+_Observer = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_uint64, ctypes.c_void_p, ctypes.c_void_p)
+
+
+class _RunOptions(ctypes.Structure):
+    """
+    Structure `RunOptions_netlist` de `simulateNetlist_run`
+    """
+
+    _fields_ = [
+        ("stop", ctypes.c_void_p),
+        ("n_stop", ctypes.c_size_t),
+        ("interval", ctypes.c_uint64),
+        ("observe", _Observer),
+        ("data", ctypes.c_void_p),
+        ("checkpoint_path", ctypes.c_char_p),
+        ("checkpoint_interval", ctypes.c_uint64),
+    ]
+
+
+class Simulator:
+    """
+    Simulateur chargé depuis une bibliothèque produite par `buildSimulator`
+    (ou par `nl-transpile --library` puis compilée avec `-shared -fPIC`).
+
+    Chaque `Simulator` a son propre état (registres et RAMs, une structure
+    `State_netlist` allouée par la bibliothèque) : plusieurs simulateurs
+    d'une même netlist, par exemple obtenus avec `clone`, sont indépendants
+    et peuvent être utilisés en même temps dans des threads différents
+    (`ctypes` relâche le GIL pendant la simulation).
+
+    L'état peut être sauvegardé dans un fichier de points de reprise (voir
+    `netlist2C.checkpoint`) avec `checkpoint`, éventuellement tous les N
+    cycles pendant la simulation avec `autoCheckpoint`, et relu avec
+    `loadCheckpoint`.
+
+    Si des nappes sont tracées (`trace_signals`, voir `buildSimulator`),
+    leurs changements sont écrits pendant `step` dans le fichier ouvert par
+    `openTrace`.
+
+    Les RAMs creuses (`sparse_rams`, voir `buildSimulator`) ne font pas
+    partie de la copie de l'état du code C: `snapshot` et `restore` passent
+    alors par un point de reprise (dont la taille dépend des pages allouées).
+    """
+
+    def __init__(self, library_path):
+        lib = ctypes.CDLL(os.path.abspath(library_path), use_errno=True)
+        interface = lib[f"{SHORT_NAME}_interface"]
+        interface.restype = ctypes.c_char_p
+        interface = json.loads(interface())
+
+        self.input_dtype = records.structDtype(interface["inputs"])
+        self.output_dtype = records.structDtype(interface["outputs"])
+
+        # Les ROMs sont des tableaux NumPy, la structure `Rom_netlist` ne
+        # contient que des pointeurs vers leurs données
+        self.roms = {}
+        fields = []
+        for label, addr_size, word_size in interface["roms"]:
+            t = np.dtype(utils.cTypeFromBusSize(word_size).value[:-2])
+            self.roms[label] = np.zeros(1 << addr_size, dtype=t)
+            fields.append((label, ctypes.c_void_p))
+
+        class Rom(ctypes.Structure):
+            _fields_ = fields
+
+        self._rom_struct = Rom(*(a.ctypes.data for a in self.roms.values()))
+
+        self._step = lib[f"{FUNCTION_NAME}_step"]
+        self._step.restype = ctypes.c_size_t
+        self._step.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_size_t,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+        ]
+        self._run = lib[f"{FUNCTION_NAME}_run"]
+        self._run.restype = ctypes.c_uint64
+        self._run.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_uint64,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.POINTER(_RunOptions),
+        ]
+        self.trace_signals = interface.get("trace", [])
+        if self.trace_signals:
+            self._trace_open = lib[f"{SHORT_NAME}_trace_open"]
+            self._trace_open.restype = ctypes.c_void_p
+            self._trace_open.argtypes = [ctypes.c_char_p, ctypes.c_int]
+            self._trace_close = lib[f"{SHORT_NAME}_trace_close"]
+            self._trace_close.restype = ctypes.c_int
+            self._trace_close.argtypes = [ctypes.c_void_p]
+            self._step_traced = lib[f"{FUNCTION_NAME}_step_traced"]
+            self._step_traced.restype = ctypes.c_size_t
+            self._step_traced.argtypes = self._step.argtypes + [ctypes.c_void_p]
+        # Couple (trace ouverte, fichier)
+        self._trace = None
+        self._output_sizes = dict(
+            (label, length) for label, length in interface["outputs"]
+        )
+        self._reset = lib[f"{SHORT_NAME}_reset"]
+        self._free = lib[f"{SHORT_NAME}_free"]
+        self._invalidate = lib[f"{SHORT_NAME}_invalidate"]
+        self._reset.argtypes = self._free.argtypes = [ctypes.c_void_p]
+        self._invalidate.argtypes = [ctypes.c_void_p]
+        self._create = lib[f"{SHORT_NAME}_create"]
+        self._clone = lib[f"{SHORT_NAME}_clone"]
+        self._create.restype = self._clone.restype = ctypes.c_void_p
+        self._clone.argtypes = [ctypes.c_void_p]
+        self._snapshot = lib[f"{SHORT_NAME}_snapshot"]
+        self._restore = lib[f"{SHORT_NAME}_restore"]
+        self._snapshot.argtypes = self._restore.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+        ]
+        self.sparse_rams = [label for label, _ in interface.get("sparse_rams", [])]
+        if self.sparse_rams:
+            self._ram_pages = lib[f"{SHORT_NAME}_ram_pages"]
+            self._ram_pages.restype = ctypes.c_uint64
+            self._ram_pages.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        self.hotspot_groups = [
+            (name, labels) for name, labels in interface.get("hotspots", [])
+        ]
+        if self.hotspot_groups:
+            self._hotspots = lib[f"{SHORT_NAME}_hotspots"]
+            self._hotspots.restype = ctypes.c_uint64
+            self._hotspots.argtypes = [ctypes.c_void_p]
+            self._hotspots_reset = lib[f"{SHORT_NAME}_hotspots_reset"]
+            unit = lib[f"{SHORT_NAME}_hotspots_unit"]
+            unit.restype = ctypes.c_char_p
+            self.hotspot_unit = unit().decode()
+        state_size = lib[f"{SHORT_NAME}_state_size"]
+        state_size.restype = ctypes.c_size_t
+        self.state_size = state_size()
+        self._cycle = lib[f"{SHORT_NAME}_cycle"]
+        self._cycle.restype = ctypes.c_uint64
+        self._cycle.argtypes = [ctypes.c_void_p]
+        self._checkpoint = lib[f"{SHORT_NAME}_checkpoint"]
+        self._checkpoint.restype = ctypes.c_int
+        self._checkpoint.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_char_p,
+            ctypes.c_int,
+            ctypes.c_int,
+        ]
+        self._load_checkpoint = lib[f"{SHORT_NAME}_load_checkpoint"]
+        self._load_checkpoint.restype = ctypes.c_int64
+        self._load_checkpoint.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_char_p,
+            ctypes.c_uint64,
+        ]
+        # Fichier auquel les pages modifiées sont relatives, et couple
+        # (fichier, intervalle) des points de reprise automatiques
+        self._checkpoint_path = None
+        self._auto = None
+        self._lib = lib
+        self._state = self._create()
+        if not self._state:
+            raise MemoryError("Can't allocate the simulator state")
+
+    def __del__(self):
+        if getattr(self, "_trace", None) is not None:
+            self._trace_close(self._trace[0])
+            self._trace = None
+        if getattr(self, "_state", None):
+            self._free(self._state)
+            self._state = None
+
+    def clone(self):
+        """
+        Renvoie un nouveau `Simulator` de la même netlist, dont l'état est une
+        copie de celui-ci. Les ROMs sont partagées
+        """
+        other = copy.copy(self)
+        other._state = self._clone(self._state)
+        if not other._state:
+            raise MemoryError("Can't allocate the simulator state")
+        # Les pages modifiées sont copiées, mais pas le fichier associé
+        other._checkpoint_path = None
+        other._auto = None
+        other._trace = None
+        return other
+
+    def loadRom(self, label, values):
+        """
+        Copie `values` au début de la ROM `label`, le reste est mis à 0.
+        Les clones qui partagent la ROM doivent appeler `invalidate`
+        """
+        rom = self.roms[label]
+        values = np.asarray(values)
+        if len(values) > len(rom):
+            raise ValueError(
+                f"ROM {label} has {len(rom)} words, got {len(values)} values"
+            )
+        rom[: len(values)] = values
+        rom[len(values) :] = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        À appeler après avoir modifié directement le contenu des ROMs (dans
+        `roms`): avec le mode guidé par les évènements (voir
+        `transpile2CEvents`), tout est recalculé au cycle suivant
+        """
+        self._invalidate(self._state)
+
+    def inputs(self, n_cycles, **values):
+        """
+        Renvoie un tableau d'entrées pour `n_cycles` cycles, les nappes
+        données en argument nommé étant remplies avec la valeur (ou le tableau
+        de valeurs) correspondante, les autres à 0
+        """
+        return records.packRecords(self.input_dtype, n_cycles, **values)
+
+    def step(self, n_cycles, inputs=None, out=None):
+        """
+        Simule `n_cycles` cycles et renvoie le tableau des sorties de chaque
+        cycle (de dtype `output_dtype`, les nappes sont masquées à leur
+        taille).
+
+        `inputs` est un tableau de dtype `input_dtype` d'au moins `n_cycles`
+        éléments (voir `inputs`), ou `None` si la netlist n'a pas d'entrée.
+        Les sorties sont écrites dans `out` si il est fourni. Aucune copie
+        n'est faite si les tableaux sont contigus et du bon dtype. Avec
+        `autoCheckpoint`, la simulation est découpée aux points de reprise.
+        Avec `openTrace`, les changements des nappes tracées sont écrits.
+        """
+        if inputs is None:
+            inputs = np.zeros(n_cycles, dtype=self.input_dtype)
+        inputs = np.ascontiguousarray(inputs, dtype=self.input_dtype)
+        if len(inputs) < n_cycles:
+            raise ValueError(f"{n_cycles} cycles requested, got {len(inputs)} inputs")
+        if out is None:
+            out = np.empty(n_cycles, dtype=self.output_dtype)
+        elif (
+            out.dtype != self.output_dtype
+            or not out.flags.c_contiguous
+            or not out.flags.writeable
+            or len(out) < n_cycles
+        ):
+            raise ValueError(
+                "out must be a writeable contiguous array of output_dtype with at least n_cycles elements"
+            )
+        done = 0
+        while done < n_cycles:
+            n = n_cycles - done
+            if self._auto is not None:
+                every = self._auto[1]
+                n = min(n, every - self.cycle % every)
+            args = (
+                self._state,
+                n,
+                inputs[done:].ctypes.data,
+                out[done:].ctypes.data,
+                ctypes.addressof(self._rom_struct),
+            )
+            if self._trace is None:
+                self._step(*args)
+            elif self._step_traced(*args, self._trace[0]) < n:
+                raise OSError(f"Can't write the trace to {self._trace[1]}")
+            done += n
+            if self._auto is not None and self.cycle % self._auto[1] == 0:
+                self.checkpoint(self._auto[0], append=True)
+        return out
+
+    def run(self, n_cycles, input=None, until=None, every=None, callback=None):
+        """
+        Simule au plus `n_cycles` cycles avec la même entrée à chaque cycle,
+        sans repasser par Python entre deux cycles, et renvoie le couple
+        (nombre de cycles simulés, sorties du dernier cycle).
+
+        `input` est un dictionnaire donnant la valeur des nappes d'entrée
+        (les autres sont à 0), ou un enregistrement de dtype `input_dtype`.
+        `until` est un dictionnaire donnant la valeur de sorties (par exemple
+        `{"halt": 1}`), ou une liste de tels dictionnaires: la simulation
+        s'arrête après le premier cycle où toutes les sorties de l'un d'eux
+        ont la valeur donnée. Si `callback` est fourni, il est appelé tous
+        les `every` cycles (1 par défaut) avec le numéro du cycle (à partir
+        de 1) et une copie des sorties: la simulation s'arrête après ce
+        cycle si il renvoie une valeur vraie ou lève une exception (qui est
+        levée à nouveau par `run`). Avec `autoCheckpoint`, les points de
+        reprise sont écrits pendant la simulation. Les traces ne sont pas
+        écrites: avec `openTrace`, il faut utiliser `step`.
+        """
+        if self._trace is not None:
+            raise ValueError("run doesn't write traces, use step")
+        if input is None:
+            input = {}
+        if isinstance(input, dict):
+            input = self.inputs(1, **input)
+        else:
+            input = np.array([input], dtype=self.input_dtype)
+        output = np.zeros(1, dtype=self.output_dtype)
+
+        if isinstance(until, dict):
+            until = [until]
+        stop_dtype = np.dtype(
+            [("mask", self.output_dtype), ("value", self.output_dtype)]
+        )
+        stop = np.zeros(len(until or ()), dtype=stop_dtype)
+        for condition, values in zip(stop, until or ()):
+            for label, value in values.items():
+                if label not in self._output_sizes:
+                    raise ValueError(f"Unknown output {label}")
+                mask = (1 << self._output_sizes[label]) - 1
+                condition["mask"][label] = mask
+                condition["value"][label] = value & mask
+
+        errors = []
+        halted = []
+
+        def observe(cycle, sample, data):
+            try:
+                halt = callback(
+                    cycle,
+                    np.frombuffer(
+                        ctypes.string_at(sample, self.output_dtype.itemsize),
+                        dtype=self.output_dtype,
+                    )[0],
+                )
+            except BaseException as e:
+                # Une exception ne peut pas remonter à travers le code C
+                errors.append(e)
+                return 1
+            if halt:
+                halted.append(cycle)
+                return 1
+            return 0
+
+        observer = _Observer(observe) if callback is not None else _Observer()
+        options = _RunOptions(
+            stop.ctypes.data,
+            len(stop),
+            (every or 1) if callback is not None else 0,
+            observer,
+            None,
+            os.fsencode(self._auto[0]) if self._auto is not None else None,
+            self._auto[1] if self._auto is not None else 0,
+        )
+        ctypes.set_errno(0)
+        cycles = self._run(
+            self._state,
+            n_cycles,
+            input.ctypes.data,
+            output.ctypes.data,
+            ctypes.addressof(self._rom_struct),
+            options,
+        )
+        if errors:
+            raise errors[0]
+        if self._auto is not None and cycles < n_cycles and not halted:
+            stopped = any(
+                all(
+                    (int(output[0][label]) ^ int(c["value"][label]))
+                    & int(c["mask"][label])
+                    == 0
+                    for label in self._output_sizes
+                )
+                for c in stop
+            )
+            if not stopped:
+                # La simulation s'est arrêtée sur l'échec d'un point de reprise
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), self._auto[0])
+        return cycles, output[0]
+
+    def reset(self):
+        """
+        Remet les registres et les RAMs à 0
+        """
+        self._reset(self._state)
+        self._checkpoint_path = None
+
+    def snapshot(self):
+        """
+        Renvoie une copie de l'état (registres et RAMs), sous forme d'un
+        tableau d'octets
+        """
+        if self.sparse_rams:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "state")
+                if self._checkpoint(self._state, os.fsencode(path), False, True) < 0:
+                    error = ctypes.get_errno()
+                    raise OSError(error, os.strerror(error), path)
+                # Les pages ont été marquées comme non modifiées
+                self._checkpoint_path = None
+                return np.fromfile(path, dtype=np.uint8)
+        state = np.empty(self.state_size, dtype=np.uint8)
+        self._snapshot(self._state, state.ctypes.data)
+        return state
+
+    def restore(self, state):
+        """
+        Restaure un état renvoyé par `snapshot`
+        """
+        state = np.ascontiguousarray(state, dtype=np.uint8)
+        if self.sparse_rams:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "state")
+                state.tofile(path)
+                if self._load_checkpoint(self._state, os.fsencode(path), 0) != 1:
+                    raise ValueError("Not a state of this simulator")
+            self._checkpoint_path = None
+            return
+        if state.size != self.state_size:
+            raise ValueError(
+                f"State has {self.state_size} bytes, got {state.size} bytes"
+            )
+        self._restore(self._state, state.ctypes.data)
+        self._checkpoint_path = None
+
+    def ramPages(self):
+        """
+        Nombre de pages allouées de chaque RAM creuse (dictionnaire label ->
+        nombre de pages de `1 << netlist2C.checkpoint.PAGE_BITS` mots)
+        """
+        return {
+            label: self._ram_pages(self._state, k)
+            for k, label in enumerate(self.sparse_rams)
+        }
+
+    def hotspots(self):
+        """
+        Temps passé dans chaque groupe d'équations (voir `buildSimulator`),
+        en unités `hotspot_unit` (`"tsc"`, les cycles du compteur du
+        processeur, ou `"ns"`), depuis le chargement de la bibliothèque ou
+        le dernier `resetHotspots`: une liste de dictionnaires, du groupe le
+        plus coûteux au moins coûteux (voir `netlist2C.hotspots.mapReport`).
+        Les compteurs sont partagés par tous les simulateurs chargés depuis
+        la même bibliothèque
+        """
+        if not self.hotspot_groups:
+            return []
+        ticks = (ctypes.c_uint64 * len(self.hotspot_groups))()
+        cycles = self._hotspots(ticks)
+        return timers.mapReport(self.hotspot_groups, list(ticks), cycles)
+
+    def resetHotspots(self):
+        if self.hotspot_groups:
+            self._hotspots_reset()
+
+    @property
+    def cycle(self):
+        """
+        Nombre de cycles simulés depuis la création ou la remise à 0 de
+        l'état (restauré par `restore` et `loadCheckpoint`)
+        """
+        return self._cycle(self._state)
+
+    def checkpoint(self, path, append=False):
+        """
+        Écrit l'état dans le fichier de points de reprise `path`: un nouveau
+        fichier ne contenant que l'état actuel (qui remplace `path` de façon
+        atomique), ou, avec `append`, une trame ajoutée à la fin du fichier.
+        La trame ajoutée ne contient que les pages de RAM modifiées depuis le
+        point de reprise précédent si celui-ci a été écrit dans (ou relu
+        depuis) le même fichier, et est complète sinon.
+        """
+        full = append and path != self._checkpoint_path
+        if self._checkpoint(self._state, os.fsencode(path), append, full) < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self._checkpoint_path = path
+
+    def loadCheckpoint(self, path, frames=None):
+        """
+        Restaure l'état depuis le fichier de points de reprise `path`, en
+        appliquant ses `frames` premières trames (toutes par défaut), et
+        renvoie le nombre de trames appliquées. Une dernière trame incomplète
+        est ignorée. Le numéro du cycle est restauré, voir `cycle`.
+        """
+        if frames is not None and frames < 1:
+            raise ValueError("At least one frame must be loaded")
+        if not os.path.exists(path):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        applied = self._load_checkpoint(self._state, os.fsencode(path), frames or 0)
+        if applied < 0:
+            raise ValueError(f"{path} is not a checkpoint of this netlist")
+        # Les trames suivantes ne peuvent pas être ajoutées aux premières
+        self._checkpoint_path = path if frames is None else None
+        return applied
+
+    def autoCheckpoint(self, path, every):
+        """
+        Ajoute un point de reprise au fichier `path` tous les `every` cycles
+        (quand `cycle` est un multiple de `every`) pendant `step` et `run`,
+        après avoir écrit l'état actuel. `every=None` désactive les points de
+        reprise automatiques.
+        """
+        if every is None:
+            self._auto = None
+            return
+        if every < 1:
+            raise ValueError("The checkpoint interval must be positive")
+        self.checkpoint(path, append=True)
+        self._auto = (path, every)
+
+    def openTrace(self, path, binary=False):
+        """
+        Écrit dans le fichier `path` les changements des nappes tracées
+        pendant `step`, au format VCD ou, avec `binary`, au format binaire
+        du module `netlist2C.trace` (à convertir avec `vcd.traceToVcd`). Une
+        trace déjà ouverte est fermée
+        """
+        if not self.trace_signals:
+            raise ValueError("The simulator was built without traced signals")
+        self.closeTrace()
+        ctypes.set_errno(0)
+        trace = self._trace_open(os.fsencode(path), binary)
+        if not trace:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self._trace = (trace, path)
+
+    def closeTrace(self):
+        """
+        Écrit la fin de la trace ouverte par `openTrace` et ferme le fichier
+        """
+        if self._trace is None:
+            return
+        trace, path = self._trace
+        self._trace = None
+        if self._trace_close(trace) < 0:
+            raise OSError(f"Can't write the trace to {path}")
@@ -0,0 +1,100 @@
+"""
+Conversion des traces binaires écrites par le code C généré (voir le module
+`netlist2C.trace`) au format VCD, et relecture de ces traces.
+
+Les enregistrements sont lus par blocs, sans tout charger en mémoire. Le
+fichier VCD est le même que celui qu'écrit directement le code C.
+"""
+
+import struct
+
+from .netlist2C import trace
+
+"""
+Taille des blocs lus dans les traces
+"""
+BLOCK = 1 << 20
+
+
+def readTraceHeader(f):
+    """
+    Lit l'en-tête de la trace binaire `f` (un fichier binaire) et renvoie la
+    liste des nappes tracées, des couples `(label, taille)`. Lève
+    `ValueError` si le fichier n'est pas une trace
+    """
+    if f.read(len(trace.MAGIC)) != trace.MAGIC:
+        raise ValueError("Not a netlist trace")
+    version, count = struct.unpack("<II", f.read(8))
+    if version != trace.VERSION:
+        raise ValueError(f"Unsupported trace version {version}")
+    signals = []
+    for _ in range(count):
+        width, length = struct.unpack("<II", f.read(8))
+        signals.append((f.read(length).decode(), width))
+    return signals
+
+
+def readTraceChanges(f, signals):
+    """
+    Générateur des changements de la trace binaire `f` des nappes `signals`,
+    dont l'en-tête a été lu par `readTraceHeader`: des triplets `(cycle,
+    indice de la nappe, valeur)`. Un dernier enregistrement incomplet est
+    ignoré
+    """
+    sizes = [(width + 7) // 8 for _, width in signals]
+    cycle = 0
+    data = b""
+    while block := f.read(BLOCK):
+        data += block
+        pos = 0
+        while pos + 4 <= len(data):
+            index = int.from_bytes(data[pos : pos + 4], "little")
+            if index == trace.TIME_INDEX:
+                size = 8
+            elif index < len(sizes):
+                size = sizes[index]
+            else:
+                raise ValueError(f"Invalid signal index {index} in the trace")
+            if pos + 4 + size > len(data):
+                break
+            value = int.from_bytes(data[pos + 4 : pos + 4 + size], "little")
+            pos += 4 + size
+            if index == trace.TIME_INDEX:
+                cycle = value
+            else:
+                yield cycle, index, value
+        data = data[pos:]
+
+
+def writeVcdHeader(out, signals, module="netlist"):
+    """
+    Écrit dans le fichier texte `out` l'en-tête VCD des nappes `signals`
+    (couples `(label, taille)`)
+    """
+    out.write(f"$timescale 1 ns $end\n$scope module {module} $end\n")
+    for k, (label, width) in enumerate(signals):
+        out.write(f"$var wire {width} {trace.vcdId(k)} {label} $end\n")
+    out.write("$upscope $end\n$enddefinitions $end\n")
+
+
+def traceToVcd(trace_path, vcd_path, module="netlist"):
+    """
+    Convertit la trace binaire `trace_path` en fichier VCD `vcd_path`, et
+    renvoie le nombre de changements écrits
+    """
+    written = 0
+    with open(trace_path, "rb") as f, open(vcd_path, "w") as out:
+        signals = readTraceHeader(f)
+        writeVcdHeader(out, signals, module)
+        ids = [trace.vcdId(k) for k in range(len(signals))]
+        last = None
+        for cycle, index, value in readTraceChanges(f, signals):
+            if cycle != last:
+                out.write(f"#{cycle}\n")
+                last = cycle
+            if signals[index][1] == 1:
+                out.write(f"{value & 1}{ids[index]}\n")
+            else:
+                out.write(f"b{value:b} {ids[index]}\n")
+            written += 1
+    return written
@@ -4,12 +4,18 @@ setup(
     name="netlistSimulator",
     version="1.0",
     packages=["netlistSimulator", "netlistSimulator.netlist2C"],
+    package_data={"netlistSimulator": ["main_example.c"]},
     install_requires=[
         "Lark",
     ],
+    extras_require={
+        "simulator": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "nl-transpile = netlistSimulator:main",
+            "nl-rom-image = netlistSimulator.romimage:main",
+            "nl-build = netlistSimulator.build:main",
         ]
     },
 )
@@ -0,0 +1,32 @@
+"""
+Tests du simulateur, à lancer depuis le dossier `nl-transpiler`:
+
+    python -m pytest tests
+
+Les tests qui compilent du C ou utilisent le simulateur nécessitent un
+compilateur C et `numpy`.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Le paquet et les générateurs de `benchmarks` ne sont pas installés
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cacheDir(tmp_path_factory):
+    """
+    Les caches (tables du parser, transpilation incrémentale) vont dans un
+    dossier temporaire
+    """
+    path = tmp_path_factory.mktemp("cache")
+    previous = os.environ.get("NL_SIM_CACHE_DIR")
+    os.environ["NL_SIM_CACHE_DIR"] = str(path)
+    yield path
+    if previous is None:
+        del os.environ["NL_SIM_CACHE_DIR"]
+    else:
+        os.environ["NL_SIM_CACHE_DIR"] = previous
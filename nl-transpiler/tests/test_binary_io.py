@@ -0,0 +1,123 @@
+"""
+Entrées et sorties binaires (`binary_io`): le programme de
+`main_binary_example.c` écrit les mêmes sorties que `Simulator.step`, que
+les entrées soient lues sur l'entrée standard (`run_netlist_binary`) ou
+projetées en mémoire (`run_netlist_mapped`)
+"""
+
+import os
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from netlistSimulator import build, records
+from netlistSimulator.netlist2C import transpile2CFiles
+from netlistSimulator.simulator import buildSimulator
+
+MAIN = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "main_binary_example.c"
+)
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+# `o` garde sa valeur tant que `s` vaut 0: peu de cycles changent les sorties
+NETLIST = """INPUT a, s
+OUTPUT o, p
+VAR a:8, s, r:8, o:8, p
+IN
+r = REG o
+o = MUX s r a
+p = SELECT 0 o
+"""
+
+# Plus de deux blocs de `netlist_BLOCK` cycles
+CYCLES = 2 * 4096 + 7
+
+
+def buildProgram(netlist, directory):
+    with open(directory / "netlist.h", "w") as h, open(directory / "netlist.c", "w") as c:
+        transpile2CFiles(netlist, h, c, NAMES, binary_io=True, less_verbose=True)
+    with open(MAIN) as f:
+        (directory / "main.c").write_text(f.read().replace("%headername%", "netlist.h"))
+    executable = str(directory / "sim")
+    build.compileSources(
+        [str(directory / "main.c"), str(directory / "netlist.c")],
+        executable,
+        cflags=["-O1", "-Wall", "-Werror=div-by-zero"],
+    )
+    return executable
+
+
+@pytest.fixture(scope="module")
+def program(tmp_path_factory):
+    return buildProgram(NETLIST, tmp_path_factory.mktemp("build"))
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    input_dtype, _ = records.netlistDtypes(NETLIST)
+    rng = np.random.default_rng(6)
+    return records.packRecords(
+        input_dtype,
+        CYCLES,
+        a=rng.integers(0, 256, CYCLES),
+        s=rng.random(CYCLES) < 0.1,
+    )
+
+
+@pytest.fixture(scope="module")
+def expected(inputs, tmp_path_factory):
+    sim = buildSimulator(NETLIST, directory=str(tmp_path_factory.mktemp("sim")))
+    values = {label: inputs[label] for label in inputs.dtype.names}
+    return sim.step(CYCLES, sim.inputs(CYCLES, **values))
+
+
+@pytest.mark.parametrize("mapped", [False, True], ids=["stream", "mapped"])
+@pytest.mark.parametrize("changes_only", [False, True], ids=["all", "changes"])
+def test_binary_io(program, inputs, expected, tmp_path, mapped, changes_only):
+    args = [program, "/dev/null"]
+    if mapped:
+        inputs.tofile(tmp_path / "inputs")
+        args.append(str(tmp_path / "inputs"))
+    if changes_only:
+        args.append("-c")
+    result = subprocess.run(
+        args,
+        input=None if mapped else inputs.tobytes(),
+        capture_output=True,
+        check=True,
+    )
+    assert result.stderr.decode().split()[0] == str(CYCLES)
+
+    _, output_dtype = records.netlistDtypes(NETLIST)
+    labels = output_dtype.names
+    if not changes_only:
+        outputs = records.unpackRecords(result.stdout, output_dtype)
+        for label in labels:
+            assert outputs[label].tolist() == expected[label].tolist(), label
+        return
+
+    changes = records.unpackRecords(result.stdout, records.changeDtype(output_dtype))
+    changed = np.ones(CYCLES, dtype=bool)
+    changed[1:] = np.logical_or.reduce(
+        [expected[label][1:] != expected[label][:-1] for label in labels]
+    )
+    assert 0 < len(changes) < CYCLES // 2
+    assert changes["cycle"].tolist() == np.flatnonzero(changed).tolist()
+    for label in labels:
+        assert changes["output"][label].tolist() == expected[label][changed].tolist()
+
+
+def test_no_inputs(tmp_path):
+    # La structure d'entrée est vide: pas de division par sa taille
+    program = buildProgram(
+        "INPUT\nOUTPUT o\nVAR r:4, o:4\nIN\nr = REG o\no = NOT r\n", tmp_path
+    )
+    (tmp_path / "inputs").write_bytes(b"")
+    for args in ([], [str(tmp_path / "inputs")]):
+        result = subprocess.run(
+            [program, "/dev/null"] + args, input=b"", capture_output=True, check=True
+        )
+        assert result.stdout == b""
+        assert result.stderr.decode().split()[0] == "0"
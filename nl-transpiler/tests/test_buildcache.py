@@ -0,0 +1,69 @@
+import os
+import subprocess
+
+from netlistSimulator import build, buildcache, runner
+
+NETLIST = "INPUT a\nOUTPUT o\nVAR a:4, r:4, o:4\nIN\nr = REG a\no = XOR r a\n"
+
+
+def counted(monkeypatch, module, name):
+    """
+    Remplace `module.name` par une fonction qui compte ses appels
+    """
+    calls = []
+    function = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, wrapper)
+    return calls
+
+
+def test_cache_hit(tmp_path, monkeypatch):
+    generated = counted(monkeypatch, runner, "transpile2CFiles")
+    compiled = counted(monkeypatch, build, "compileSources")
+    cache = buildcache.BuildCache(str(tmp_path / "builds"))
+
+    executable = runner.buildExecutable(NETLIST, cache=cache)
+    assert (len(generated), len(compiled)) == (1, 1)
+    assert runner.buildExecutable(NETLIST, cache=cache) == executable
+    assert (len(generated), len(compiled)) == (1, 1)
+    result = subprocess.run(
+        [executable, "/dev/zero"], input="3\n5\n", capture_output=True, text=True
+    )
+    assert result.stdout.split() == ["o=3", "o=6"]
+
+    # Une autre option est une autre construction
+    assert runner.buildExecutable(NETLIST, cache=cache, cflags=("-O1",)) != executable
+    assert (len(generated), len(compiled)) == (2, 2)
+    assert len(cache.entries()) == 2
+
+
+def fill(size):
+    def builder(directory):
+        with open(os.path.join(directory, "data"), "wb") as f:
+            f.write(bytes(size))
+
+    return builder
+
+
+def test_lru_eviction(tmp_path):
+    cache = buildcache.BuildCache(str(tmp_path / "builds"), max_size=250)
+    cache.build("a", fill(100))
+    cache.build("b", fill(100))
+    # Dates d'utilisation distinctes, "a" étant la plus ancienne...
+    os.utime(cache.path("a"), (1000, 1000))
+    os.utime(cache.path("b"), (2000, 2000))
+    # ...jusqu'à ce qu'elle soit réutilisée
+    assert cache.get("a") == cache.path("a")
+    assert [key for key, _ in cache.entries()] == ["b", "a"]
+
+    cache.build("c", fill(100))
+    assert [key for key, _ in cache.entries()] == ["a", "c"]
+    assert cache.get("b") is None
+
+    # La construction qui vient d'être faite est gardée même trop grande
+    cache.build("d", fill(300))
+    assert [key for key, _ in cache.entries()] == ["d"]
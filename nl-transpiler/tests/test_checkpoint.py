@@ -0,0 +1,168 @@
+"""
+Points de reprise: un état écrit par `Simulator.checkpoint` (trames
+complètes ou incrémentales) et relu par `Simulator.loadCheckpoint` est
+l'état de la simulation au moment de l'écriture
+"""
+
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from netlistSimulator.netlist2C import checkpoint
+from netlistSimulator.simulator import buildSimulator
+
+# 16 pages de RAM et un registre
+NETLIST = """INPUT ra, we, wa, d
+OUTPUT o, r
+VAR ra:12, we, wa:12, d:8, o:8, r:8
+IN
+o = RAM 12 8 ra we wa d
+r = REG d
+"""
+
+# En-tête d'une trame (`CheckpointHeader_{short_name}`)
+HEADER = struct.Struct("=IIQQQQ")
+
+
+def frames(path):
+    """
+    En-têtes (full, cycle, n_pages) des trames du fichier `path`
+    """
+    data = path.read_bytes()
+    headers = []
+    while len(data) >= HEADER.size:
+        _, full, _, cycle, n_pages, size = HEADER.unpack_from(data)
+        headers.append((full, cycle, n_pages))
+        data = data[HEADER.size + size :]
+    return headers
+
+
+def writes(sim, n_cycles, seed, pages=None):
+    """
+    Simule `n_cycles` cycles d'écritures aléatoires dans la RAM, dans les
+    pages `pages` (toutes par défaut)
+    """
+    rng = np.random.default_rng(seed)
+    pages = range(1 << (12 - checkpoint.PAGE_BITS)) if pages is None else pages
+    wa = (rng.choice(pages, n_cycles) << checkpoint.PAGE_BITS) | rng.integers(
+        0, 1 << checkpoint.PAGE_BITS, n_cycles
+    )
+    sim.step(
+        n_cycles,
+        sim.inputs(
+            n_cycles, we=1, wa=wa, d=rng.integers(0, 256, n_cycles), ra=0
+        ),
+    )
+
+
+def history(sim, path, steps):
+    """
+    Simule deux fois les étapes `steps` (arguments de `writes`) depuis
+    l'état nul: en relevant l'état après chaque étape (voir `state`), puis
+    en ajoutant une trame au fichier `path` après chaque étape. Les deux
+    passes sont séparées car relever l'état écrit un point de reprise, ce
+    qui rend complète la trame suivante. Renvoie les états
+    """
+    sim.reset()
+    states = []
+    for step in steps:
+        writes(sim, *step)
+        states.append(state(sim, path.with_suffix(".tmp")))
+    sim.reset()
+    for step in steps:
+        writes(sim, *step)
+        sim.checkpoint(str(path), append=True)
+    return states
+
+
+def state(sim, path):
+    """
+    Cycle et `snapshot` de `sim`, relevés après l'écriture d'un point de
+    reprise dans `path`: les pages sont alors marquées comme non modifiées,
+    comme dans un état relu
+    """
+    sim.checkpoint(str(path))
+    return sim.cycle, sim.snapshot()
+
+
+def assertState(sim, expected):
+    cycle, snapshot = expected
+    assert sim.cycle == cycle
+    assert sim.snapshot().tolist() == snapshot.tolist()
+
+
+@pytest.fixture(scope="module", params=[{}, {"sparse_ram": 1}], ids=["dense", "sparse"])
+def sim(request, tmp_path_factory):
+    return buildSimulator(
+        NETLIST, directory=str(tmp_path_factory.mktemp("build")), **request.param
+    )
+
+
+def test_full_frame(sim, tmp_path):
+    path = tmp_path / "state.ckpt"
+    sim.reset()
+    writes(sim, 500, 1)
+    expected = state(sim, path)
+    writes(sim, 100, 2)
+
+    sim.reset()
+    assert sim.loadCheckpoint(str(path)) == 1
+    assertState(sim, expected)
+    assert frames(path) == [(1, 500, 16)]
+
+
+def test_incremental_frames(sim, tmp_path):
+    path = tmp_path / "state.ckpt"
+    steps = [(500, 3), (20, 4, [3]), (20, 5, [3]), (20, 6, [7])]
+    states = history(sim, path, steps)
+
+    # Seule la page écrite est dans les trames suivantes
+    assert frames(path) == [(1, 500, 16), (0, 520, 1), (0, 540, 1), (0, 560, 1)]
+
+    sim.reset()
+    assert sim.loadCheckpoint(str(path)) == 4
+    assertState(sim, states[-1])
+
+
+def test_limited_load(sim, tmp_path):
+    path = tmp_path / "state.ckpt"
+    states = history(sim, path, [(50, seed, [seed]) for seed in range(3)])
+
+    for n in (1, 2):
+        sim.reset()
+        assert sim.loadCheckpoint(str(path), frames=n) == n
+        assertState(sim, states[n - 1])
+    with pytest.raises(ValueError):
+        sim.loadCheckpoint(str(path), frames=0)
+
+
+def test_truncated_frame(sim, tmp_path):
+    path = tmp_path / "state.ckpt"
+    states = history(sim, path, [(200, 4), (20, 5, [1])])
+
+    data = path.read_bytes()
+    first = HEADER.size + HEADER.unpack_from(data)[-1]
+    for cut in (1, 100, len(data) - first - 1):
+        path.write_bytes(data[: len(data) - cut])
+        sim.reset()
+        assert sim.loadCheckpoint(str(path)) == 1
+        assertState(sim, states[0])
+
+
+def test_auto_checkpoint(sim, tmp_path):
+    path = tmp_path / "state.ckpt"
+    sim.reset()
+    sim.autoCheckpoint(str(path), 5)
+    try:
+        writes(sim, 10, 6)
+        expected = state(sim, tmp_path / "state.tmp")
+        writes(sim, 2, 7)
+    finally:
+        sim.autoCheckpoint(str(path), None)
+    assert [f[1] for f in frames(path)] == [0, 5, 10]
+
+    sim.reset()
+    assert sim.loadCheckpoint(str(path)) == 3
+    assertState(sim, expected)
@@ -0,0 +1,18 @@
+import json
+import sys
+
+from netlistSimulator import main
+
+NETLIST = "INPUT a, b\nOUTPUT o\nVAR a:4, b:4, c:4, o:4\nIN\nc = AND a b\no = XOR c a\n"
+
+
+def test_chunks_profile_on_stdout(tmp_path, monkeypatch, capsys):
+    netlist = tmp_path / "netlist.net"
+    netlist.write_text(NETLIST)
+    arguments = [str(netlist), str(tmp_path / "sim"), "--chunk-size", "1", "--profile"]
+    monkeypatch.setattr(sys, "argv", ["nl-transpile"] + arguments)
+    main()
+    out, err = capsys.readouterr()
+    # Seul le profil est sur la sortie standard
+    assert isinstance(json.loads(out), dict)
+    assert "Wrote" in err
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from netlistSimulator.netlist2C import generator, parser
+from netlistSimulator.simulator import buildSimulator
+
+# Nappes qui remplissent leur type C: les masques ne doivent pas décaler de
+# la taille du type
+NETLIST = """INPUT a, b, s
+OUTPUT c, l, h, m
+VAR a:32, b:32, s:8, c:64, l:32, h:32, m:32
+IN
+c = CONCAT a b
+l = SLICE 0 31 c
+h = SLICE 32 63 c
+m = MUX s a b
+"""
+
+
+def test_full_width_masks(tmp_path):
+    sim = buildSimulator(
+        NETLIST,
+        directory=str(tmp_path),
+        cflags=["-O2", "-Werror=shift-count-overflow"],
+    )
+    a = [0xFFFFFFFF, 0x12345678]
+    b = [0x89ABCDEF, 0xFFFFFFFF]
+    s = [0x80, 0]
+    out = sim.step(2, sim.inputs(2, a=a, b=b, s=s))
+    assert out["c"].tolist() == [x | y << 32 for x, y in zip(a, b)]
+    assert out["l"].tolist() == a
+    assert out["h"].tolist() == b
+    assert out["m"].tolist() == [b[0], a[1]]
+
+
+def test_unknown_expression():
+    eq = parser.parse(NETLIST).equations[0]
+    eq.expr.type = None
+    with pytest.raises(NotImplementedError, match="No C code for None"):
+        generator._getExpr(eq)
@@ -0,0 +1,94 @@
+import io
+
+import pytest
+
+from netlistSimulator.netlist2C import transpile2CFiles
+
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+NETLIST = """INPUT a, wa, d
+OUTPUT o, r, q
+VAR a:4, wa:4, d:8, o:8, r:4, q:4
+IN
+r = REG 0000
+o = RAM 4 8 a 1 wa d
+q = NOT a
+"""
+
+
+def transpile(netlist, cache_file=None):
+    h, c = io.StringIO(), io.StringIO()
+    transpile2CFiles(netlist, h, c, NAMES, cache_file=cache_file)
+    return h.getvalue(), c.getvalue()
+
+
+def test_same_code_as_full_transpilation(tmp_path):
+    cache = str(tmp_path / "netlist.cache")
+    assert transpile(NETLIST, cache) == transpile(NETLIST)
+    edited = NETLIST.replace("q = NOT a", "q = NOT r")
+    assert transpile(edited, cache) == transpile(edited)
+
+
+def test_constant_register_args_after_dependency_change(tmp_path):
+    # Les constantes lues par REG et RAM ne sont pas des racines du tri
+    cache = str(tmp_path / "netlist.cache")
+    transpile(NETLIST, cache)
+    edited = NETLIST.replace("q = NOT a", "q = NOT r").replace(
+        "o = RAM 4 8 a 1 wa d", "o = RAM 4 8 q 1 wa d"
+    )
+    assert transpile(edited, cache) == transpile(edited)
+
+
+def chains(edit=None):
+    """
+    Trois chaînes de `NOT`: `a` (sortie `o`), `c` (sortie `p`, placée après
+    `a`) et `d`, qui ne sert pas. `edit` remplace l'équation de `a_10`
+    """
+    eqs = ["a_0 = NOT i", "c_0 = NOT i", "d_0 = NOT i"]
+    for k in range(1, 100):
+        for x in "acd":
+            eqs.append(f"{x}_{k} = NOT {x}_{k - 1}")
+    eqs += ["o = NOT a_99", "p = NOT c_99"]
+    if edit is not None:
+        eqs[eqs.index("a_10 = NOT a_9")] = f"a_10 = {edit}"
+    wires = ["i", "o", "p"] + [f"{x}_{k}" for x in "acd" for k in range(100)]
+    return (
+        "INPUT i\nOUTPUT o, p\n"
+        + "VAR "
+        + ", ".join(f"{w}:4" for w in wires)
+        + "\nIN\n"
+        + "\n".join(eqs)
+        + "\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "edit",
+    ["NOT i", "MUX a_9 c_50 d_20"],
+    ids=["dead_code", "later_dependency"],
+)
+def test_dependency_change(tmp_path, edit):
+    # `a_0..a_9` ne servent plus, ou `a_10` lit une nappe placée après elle
+    # et une nappe qui ne servait pas: le code est celui d'une transpilation
+    # complète, à l'octet près
+    cache = str(tmp_path / "netlist.cache")
+    transpile(chains(), cache)
+    edited = chains(edit)
+    assert transpile(edited, cache) == transpile(edited)
+    # Avec un cycle, la transpilation complète signale l'erreur
+    with pytest.raises(ValueError, match="Cyclic"):
+        transpile(chains("XOR a_9 a_50"), cache)
+
+
+def test_removed_equation(tmp_path):
+    cache = str(tmp_path / "netlist.cache")
+    transpile(chains(), cache)
+    edited = chains("NOT i").replace("d_0 = NOT i\n", "").replace(
+        "d_1 = NOT d_0", "d_1 = NOT i"
+    )
+    assert transpile(edited, cache) == transpile(edited)
+
+
+def test_unchanged_netlist(tmp_path):
+    cache = str(tmp_path / "netlist.cache")
+    assert transpile(chains(), cache) == transpile(chains(), cache)
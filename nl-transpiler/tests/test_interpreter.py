@@ -0,0 +1,16 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from netlistSimulator.interpreter import Interpreter
+
+
+def test_constant_arguments():
+    sim = Interpreter(
+        "INPUT a, b, wa, d\nOUTPUT m, o, r\nVAR a:4, b:4, wa:4, d:8, m:4, o:8, r:4\nIN\n"
+        "m = MUX 1 a b\nr = REG 0000\no = RAM 4 8 a 1 wa d\n"
+    )
+    out = sim.step(2, sim.inputs(2, a=3, b=5, wa=3, d=9))
+    assert out["m"].tolist() == [5, 5]
+    assert out["r"].tolist() == [0, 0]
+    assert out["o"].tolist() == [0, 9]
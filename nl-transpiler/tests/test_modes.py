@@ -0,0 +1,162 @@
+"""
+Tous les modes de génération simulent la même chose: sur les netlists de
+`benchmarks.netlists`, avec des entrées aléatoires, les sorties de chaque
+mode sont celles de l'interpréteur
+"""
+
+import functools
+import os
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from benchmarks import netlists
+from netlistSimulator.interpreter import Interpreter
+from netlistSimulator.netlist2C import generator, transpile2CBatchFiles
+from netlistSimulator.simulator import buildSimulator
+
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+CYCLES = 40
+LANES = 64
+
+NETLISTS = {
+    "ripple": netlists.rippleAdder(8),
+    "counters": netlists.counterBank(4),
+    "random": netlists.randomNetlist(300),
+    "redundant": netlists.redundantNetlist(4),
+    "lookahead": netlists.lookaheadAdder(16),
+    "multiplier": netlists.multiplier(8),
+    "regfile": netlists.registerFile(3),
+    "ram": netlists.ramPort(4),
+    "cpu": netlists.toyCPU(),
+    "layered": netlists.layeredNetlist(6, 8),
+    "layered_bits": netlists.layeredNetlist(6, 16, bus=1),
+}
+
+ROMS = {"cpu": {"instr": netlists.toyProgram(10)}}
+
+MODES = {
+    "scalar": {},
+    "optimize": {"optimize": True},
+    "events": {"events": 16},
+    "threads": {"threads": 2},
+    "chunks": {"chunk_size": 50},
+    "trace": {"trace": ["*"]},
+    "sparse": {"sparse_ram": 1},
+    "cones": {"share_cones": 2},
+    "hotspots": {"hotspots": 10},
+}
+
+# Programme de test du mode par lots: lit la ROM (premier argument), puis
+# simule le nombre de cycles donné en second argument, les entrées de
+# chaque instance étant lues sur l'entrée standard
+BATCH_DRIVER = """#include <stdio.h>
+#include <stdlib.h>
+#include "netlist.h"
+
+int main(int argc, char *argv[]) {
+	static Input_netlist_batch batch_input;
+	static Output_netlist_batch batch_output;
+	Input_netlist input;
+	Output_netlist output;
+	Rom_netlist rom;
+	FILE *f = fopen(argv[1], "r");
+	fscan_rom(f, &rom);
+	State_netlist_batch *state = netlist_batch_create();
+	for (long cycle = atol(argv[2]); cycle > 0; cycle--) {
+		for (size_t lane = 0; lane < netlist_LANES; lane++) {
+			if (!prompt_netlist_input(&input))
+				return 1;
+			set_netlist_batch_input(&batch_input, lane, &input);
+		}
+		simulateNetlist_batch(state, &batch_input, &batch_output, &rom);
+		for (size_t lane = 0; lane < netlist_LANES; lane++) {
+			get_netlist_batch_output(&batch_output, lane, &output);
+			print_netlist_output(&output);
+		}
+	}
+	netlist_batch_free(state);
+	return 0;
+}
+"""
+
+
+def randomInputs(name, shape):
+    """
+    Valeurs aléatoires (masquées à la taille de chaque nappe) des entrées de
+    la netlist `name`, de forme `shape`
+    """
+    rng = np.random.default_rng(len(name))
+    values = {}
+    for v in generator.getAST(NETLISTS[name]).inputs:
+        mask = np.uint64((1 << v.length) - 1)
+        words = rng.integers(0, np.iinfo(np.uint64).max, shape, np.uint64, endpoint=True)
+        values[v.label] = words & mask
+    return values
+
+
+def simulate(sim, name, shape):
+    for label, words in ROMS.get(name, {}).items():
+        sim.loadRom(label, words)
+    return sim.step(CYCLES, sim.inputs(CYCLES, **randomInputs(name, shape)))
+
+
+@functools.cache
+def expected(name, lanes=None):
+    shape = CYCLES if lanes is None else (CYCLES, lanes)
+    return simulate(Interpreter(NETLISTS[name], lanes=lanes), name, shape)
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("name", NETLISTS)
+def test_mode_matches_interpreter(tmp_path, name, mode):
+    sim = buildSimulator(
+        NETLISTS[name], directory=str(tmp_path), cflags=("-O1",), **MODES[mode]
+    )
+    out = simulate(sim, name, CYCLES)
+    reference = expected(name)
+    for label in reference.dtype.names:
+        assert out[label].tolist() == reference[label].tolist(), label
+
+
+@pytest.mark.parametrize("name", NETLISTS)
+def test_batch_matches_interpreter(tmp_path, name):
+    with open(tmp_path / "netlist.h", "w") as h, open(tmp_path / "netlist.c", "w") as c:
+        transpile2CBatchFiles(NETLISTS[name], h, c, NAMES, LANES, less_verbose=True)
+    (tmp_path / "main.c").write_text(BATCH_DRIVER)
+    executable = str(tmp_path / "sim")
+    subprocess.run(
+        [os.environ.get("CC", "cc"), "-O1", "-o", executable, "main.c", "netlist.c"],
+        cwd=tmp_path,
+        check=True,
+    )
+    rom = tmp_path / "rom.txt"
+    rom.write_text("".join(f"{w:x}\n" for w in ROMS.get(name, {}).get("instr", ())))
+
+    inputs = randomInputs(name, (CYCLES, LANES))
+    labels = sorted(inputs)
+    lines = "".join(
+        "".join(f"{int(inputs[label][i, lane]):x}\n" for label in labels)
+        for i in range(CYCLES)
+        for lane in range(LANES)
+    )
+    result = subprocess.run(
+        [executable, str(rom), str(CYCLES)],
+        input=lines,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split("\n")
+
+    reference = expected(name, LANES)
+    for i in range(CYCLES):
+        for lane in range(LANES):
+            values = dict(v.split("=") for v in result[i * LANES + lane].split(", "))
+            for label in reference.dtype.names:
+                assert int(values[label], 16) == int(reference[label][i, lane]), (
+                    i,
+                    lane,
+                    label,
+                )
@@ -0,0 +1,31 @@
+import pytest
+
+from netlistSimulator.netlist2C.options import checkOptions
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"events": 128, "optimize": ["dce"]},
+        {"incremental": True, "library": True},
+        {"trace": ["pc"], "sparse_ram": 0, "share_cones": 2, "hotspots": 10},
+        {"lanes": 64, "incremental": False, "trace": []},
+    ],
+)
+def test_compatible_options(options):
+    checkOptions(options)
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        ({"chunk_size": 10, "events": 128}, "events can't be used with chunk_size"),
+        ({"incremental": True, "optimize": True}, "optimize can't be used with incremental"),
+        ({"threads": 2, "sparse_ram": 0}, "sparse_ram can't be used with threads"),
+        ({"lanes": 64, "rom_contents": "rom.txt"}, "rom_contents can't be used with lanes"),
+    ],
+)
+def test_incompatible_options(options, message):
+    with pytest.raises(ValueError, match=message):
+        checkOptions(options)
@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+from netlistSimulator.netlist2C import AST as ast
+from netlistSimulator.netlist2C import parser, passes, transpile2CFiles
+
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+
+def optimize(netlist_string):
+    netlist = parser.parse(netlist_string)
+    passes.PassManager(passes.DEFAULT_PASSES).run(netlist)
+    return {eq.var.label: eq.expr for eq in netlist.equations}
+
+
+def test_constant_mux_selector_is_folded():
+    exprs = optimize("INPUT a, b\nOUTPUT o\nVAR a:4, b:4, o:4\nIN\no = MUX 1 a b\n")
+    assert exprs["o"].type == ast.Exprs.COPY
+    assert exprs["o"].args[0].label == "b"
+
+
+def test_constant_ram_arguments():
+    exprs = optimize(
+        "INPUT wa, d\nOUTPUT o\nVAR wa:4, d:8, o:8\nIN\no = RAM 4 8 0000 1 wa d\n"
+    )
+    read_address, write_enable = exprs["o"].args[:2]
+    assert (read_address.length, write_enable.length) == (4, 1)
+
+
+def test_constant_too_wide_for_its_argument():
+    with pytest.raises(ast.BusTooShort):
+        parser.parse("INPUT d\nOUTPUT o\nVAR d:8, o:8\nIN\no = RAM 2 8 001 0 00 d\n")
+
+
+def test_optimized_code_with_constant_arguments():
+    netlist = "INPUT a, b, wa, d\nOUTPUT o, m\nVAR a:4, b:4, wa:4, d:8, o:8, m:4\nIN\nm = MUX 1 a b\no = RAM 4 8 a 1 wa d\n"
+    h, c = io.StringIO(), io.StringIO()
+    transpile2CFiles(netlist, h, c, NAMES, optimize=True)
+    assert "m = b;" in c.getvalue()
@@ -0,0 +1,84 @@
+import os
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from netlistSimulator.interpreter import Interpreter
+from netlistSimulator.netlist2C import transpile2CBatch
+from netlistSimulator.simulator import buildSimulator
+
+# L'écriture a 2 bits: la RAM est écrite si l'un d'eux est à 1
+NETLIST = """INPUT ra, we, wa, d
+OUTPUT o
+VAR ra:4, we:2, wa:4, d:4, o:4
+IN
+o = RAM 4 4 ra we wa d
+"""
+INPUTS = {"ra": [3, 3, 3], "we": [2, 0, 1], "wa": [3, 3, 3], "d": [15, 0, 7]}
+EXPECTED = [0, 15, 15]
+
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+BATCH_DRIVER = """#include <stdio.h>
+#include "netlist.h"
+
+int main(void) {
+	static Input_netlist_batch batch_input;
+	static Output_netlist_batch batch_output;
+	Input_netlist input;
+	Output_netlist output;
+	State_netlist_batch *state = netlist_batch_create();
+	unsigned ra, we, wa, d;
+	while (scanf("%u %u %u %u", &ra, &we, &wa, &d) == 4) {
+		input.ra = ra; input.we = we; input.wa = wa; input.d = d;
+		for (size_t lane = 0; lane < netlist_LANES; lane++)
+			set_netlist_batch_input(&batch_input, lane, &input);
+		simulateNetlist_batch(state, &batch_input, &batch_output, NULL);
+		for (size_t lane = 0; lane < netlist_LANES; lane++) {
+			get_netlist_batch_output(&batch_output, lane, &output);
+			printf("%u ", (unsigned) output.o);
+		}
+		printf("\\n");
+	}
+	netlist_batch_free(state);
+	return 0;
+}
+"""
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"events": 1}, {"threads": 2}, {"chunk_size": 1}, {"sparse_ram": 2}],
+    ids=["scalar", "events", "threads", "chunks", "sparse"],
+)
+def test_multi_bit_write_enable(tmp_path, options):
+    sim = buildSimulator(NETLIST, directory=str(tmp_path), **options)
+    out = sim.step(3, sim.inputs(3, **INPUTS))
+    assert out["o"].tolist() == EXPECTED
+
+
+def test_multi_bit_write_enable_interpreter():
+    sim = Interpreter(NETLIST)
+    assert sim.step(3, sim.inputs(3, **INPUTS))["o"].tolist() == EXPECTED
+
+
+def test_multi_bit_write_enable_batch(tmp_path):
+    h, c = transpile2CBatch(NETLIST, lanes=64, helper_functions=False)
+    (tmp_path / "netlist.h").write_text(h.format(**NAMES))
+    (tmp_path / "netlist.c").write_text(c.format(**NAMES))
+    (tmp_path / "main.c").write_text(BATCH_DRIVER)
+    executable = str(tmp_path / "sim")
+    subprocess.run(
+        [os.environ.get("CC", "cc"), "-O1", "-o", executable, "main.c", "netlist.c"],
+        cwd=tmp_path,
+        check=True,
+    )
+    lines = "".join(
+        f"{ra} {we} {wa} {d}\n" for ra, we, wa, d in zip(*INPUTS.values())
+    )
+    result = subprocess.run(
+        [executable], input=lines, capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    assert [set(map(int, line.split())) for line in result[:3]] == [{v} for v in EXPECTED]
@@ -0,0 +1,87 @@
+"""
+Images de ROM: un fichier hexadécimal converti par `nl-rom-image` et
+projeté par `map_rom` donne la même simulation que le fichier relu par
+`fscan_rom`
+"""
+
+import random
+import subprocess
+import sys
+
+import pytest
+
+from netlistSimulator import buildcache, romimage, runner
+
+# Deux ROMs de tailles de mot différentes (types C de 8 et 16 bits)
+NETLIST = """INPUT a
+OUTPUT x, y
+VAR a:6, b:4, x:8, y:12
+IN
+b = SLICE 0 3 a
+x = ROM 6 8 a
+y = ROM 4 12 b
+"""
+
+
+@pytest.fixture(scope="module")
+def executable(tmp_path_factory):
+    cache = buildcache.BuildCache(str(tmp_path_factory.mktemp("builds")))
+    return runner.buildExecutable(NETLIST, cache=cache)
+
+
+def simulate(executable, rom, addresses):
+    result = subprocess.run(
+        [executable, str(rom)],
+        input="".join(f"{a:x}\n" for a in addresses),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split("\n")[: len(addresses)]
+
+
+def convert(monkeypatch, tmp_path, netlist, hex_path):
+    """
+    Convertit `hex_path` avec la commande `nl-rom-image`
+    """
+    (tmp_path / "netlist.net").write_text(netlist)
+    image = tmp_path / "rom.img"
+    arguments = [str(tmp_path / "netlist.net"), str(hex_path), str(image)]
+    monkeypatch.setattr(sys, "argv", ["nl-rom-image"] + arguments)
+    romimage.main()
+    return image
+
+
+def test_image_matches_hex(executable, tmp_path, monkeypatch):
+    rng = random.Random(7)
+    # `x` entière, puis `y` incomplète: les mots manquants valent 0
+    x = [rng.randrange(256) for _ in range(64)]
+    y = [rng.randrange(1 << 12) for _ in range(10)]
+    hex_path = tmp_path / "rom.hex"
+    hex_path.write_text(
+        " ".join(f"{w:x}" for w in x) + "\n" + "\n".join(f"{w:x}" for w in y)
+    )
+    image = convert(monkeypatch, tmp_path, NETLIST, hex_path)
+    y += [0] * 6
+
+    assert {
+        label: (addr_size, word_size, list(words))
+        for label, (addr_size, word_size, words) in romimage.readRomImage(image).items()
+    } == {"x": (6, 8, x), "y": (4, 12, y)}
+
+    addresses = [rng.randrange(64) for _ in range(200)]
+    mapped = simulate(executable, image, addresses)
+    assert mapped == simulate(executable, hex_path, addresses)
+    assert mapped == [f"x={x[a]:x}, y={y[a & 15]:x}" for a in addresses]
+
+
+def test_image_of_other_netlist(executable, tmp_path, monkeypatch):
+    hex_path = tmp_path / "rom.hex"
+    hex_path.write_text("1 " * 64 + "2 3\n")
+    other = NETLIST.replace("x:8", "x:16").replace("ROM 6 8", "ROM 6 16")
+    image = convert(monkeypatch, tmp_path, other, hex_path)
+    result = subprocess.run(
+        [executable, str(image)], input="0\n", capture_output=True, text=True
+    )
+    assert result.returncode == 1
+    assert "ROM x has 6 bits addresses and 16 bits words" in result.stderr
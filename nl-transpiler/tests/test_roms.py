@@ -0,0 +1,122 @@
+"""
+ROMs incluses dans le code (`rom_contents`, `nl-transpile --embed-rom`): même
+simulation qu'avec la ROM relue par `fscan_rom` au lancement
+"""
+
+import io
+import os
+import random
+import subprocess
+
+import pytest
+
+from netlistSimulator import build, buildcache, runner
+from netlistSimulator.netlist2C import transpile2CFiles
+from netlistSimulator.netlist2C.roms import readHexRom
+
+MAIN = os.path.join(os.path.dirname(runner.__file__), "main_example.c")
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+NETLIST = """INPUT a
+OUTPUT x, y
+VAR a:6, b:4, x:8, y:12
+IN
+b = SLICE 0 3 a
+x = ROM 6 8 a
+y = ROM 4 12 b
+"""
+
+ROMS = [("x", 6, 8), ("y", 4, 12)]
+
+
+def embeddedProgram(directory, rom_text, rom_output):
+    with open(directory / "netlist.h", "w") as h, open(directory / "netlist.c", "w") as c:
+        if rom_output:
+            with open(directory / "netlist_roms.h", "w") as r:
+                transpile2CFiles(
+                    NETLIST,
+                    h,
+                    c,
+                    NAMES,
+                    less_verbose=True,
+                    rom_contents=rom_text,
+                    rom_output=r,
+                )
+        else:
+            transpile2CFiles(
+                NETLIST,
+                h,
+                c,
+                NAMES,
+                less_verbose=True,
+                rom_contents=io.StringIO(rom_text),
+            )
+    with open(MAIN) as f:
+        (directory / "main.c").write_text(f.read().replace("%headername%", "netlist.h"))
+    executable = str(directory / "sim")
+    build.compileSources(
+        [str(directory / "main.c"), str(directory / "netlist.c")], executable
+    )
+    return executable
+
+
+@pytest.mark.parametrize("rom_output", [False, True], ids=["source", "header"])
+def test_embedded_matches_runtime(tmp_path, rom_output):
+    rng = random.Random(8)
+    words = [rng.randrange(1 << 16) for _ in range(64 + 12)]
+    rom_text = "\n".join(f"{w:x}" for w in words) + "\n"
+    (tmp_path / "rom.txt").write_text(rom_text)
+    runtime = runner.buildExecutable(
+        NETLIST, cache=buildcache.BuildCache(str(tmp_path / "builds"))
+    )
+    embedded = embeddedProgram(tmp_path, rom_text, rom_output)
+
+    addresses = [rng.randrange(64) for _ in range(200)]
+    outputs = [
+        subprocess.run(
+            [executable, rom],
+            input="".join(f"{a:x}\n" for a in addresses),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for executable, rom in (
+            (runtime, str(tmp_path / "rom.txt")),
+            (embedded, "/dev/null"),
+        )
+    ]
+    assert outputs[0] == outputs[1]
+    # `y` est incomplète: ses mots manquants valent 0
+    x = [w & 0xFF for w in words[:64]]
+    y = [w & 0xFFF for w in words[64:]] + [0] * 4
+    assert outputs[1].splitlines() == [
+        f"x={x[a]:x}, y={y[a & 15]:x}" for a in addresses
+    ]
+
+
+def test_short_last_rom():
+    assert readHexRom("1 2 3", ROMS[1:]) == {"y": [1, 2, 3]}
+    assert readHexRom("1ff " * 64 + "0x12345", ROMS) == {
+        "x": [0xFF] * 64,
+        "y": [0x2345],
+    }
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("1 2 zz 4", "Invalid hexadecimal value 'zz' at word 2 of ROM x"),
+        ("1\n2\n3\n", "ROM file ends after 3 of the 64 words of ROM x, before ROM y"),
+        ("", "ROM file ends after 0 of the 64 words of ROM x, before ROM y"),
+        ("0 " * 81, "ROM file has more than the 80 words of the ROMs"),
+    ],
+    ids=["malformed", "short", "empty", "long"],
+)
+def test_invalid_rom_file(text, message):
+    with pytest.raises(ValueError) as error:
+        readHexRom(io.StringIO(text), ROMS)
+    assert str(error.value) == message
+
+    # Rien n'est compilé avec un contenu invalide
+    with pytest.raises(ValueError, match=message):
+        transpile2CFiles(NETLIST, io.StringIO(), io.StringIO(), NAMES, rom_contents=text)
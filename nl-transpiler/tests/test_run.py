@@ -0,0 +1,133 @@
+"""
+`run` (`{functionName}_run` du code généré, et la même méthode de
+l'interpréteur): conditions d'arrêt, observateur et arrêt demandé par
+l'observateur, comparés aux sorties de `step` cycle par cycle
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from benchmarks import netlists
+from netlistSimulator.interpreter import Interpreter
+from netlistSimulator.simulator import buildSimulator
+
+NETLIST = netlists.counterBank(2, 8)
+CYCLES = 300
+INPUT = {"en": 1, "sel": 0}
+
+
+@pytest.fixture(scope="module")
+def library(tmp_path_factory):
+    return buildSimulator(NETLIST, directory=str(tmp_path_factory.mktemp("build")))
+
+
+@pytest.fixture(params=["compiled", "interpreter"])
+def sim(request, library):
+    if request.param == "interpreter":
+        return Interpreter(NETLIST)
+    library.reset()
+    return library
+
+
+@pytest.fixture(scope="module")
+def reference():
+    """
+    Sorties de chaque cycle: `reference[i]` est celle du cycle `i + 1`
+    """
+    sim = Interpreter(NETLIST)
+    return sim.step(CYCLES, sim.inputs(CYCLES, **INPUT))
+
+
+def first(reference, condition):
+    """
+    Numéro du premier cycle (à partir de 1) où `condition` est vraie
+    """
+    return int(np.flatnonzero(condition(reference))[0]) + 1
+
+
+def test_cycle_limit(sim, reference):
+    cycles, out = sim.run(100, INPUT)
+    assert cycles == sim.cycle == 100
+    assert out.tolist() == reference[99].tolist()
+    cycles, out = sim.run(CYCLES - 100, INPUT)
+    assert cycles == CYCLES - 100
+    assert out.tolist() == reference[-1].tolist()
+
+
+@pytest.mark.parametrize(
+    "until, condition",
+    [
+        ({"k0_c": 37}, lambda r: r["k0_c"] == 37),
+        # Les autres sorties ne comptent pas (masque nul)
+        ({"k0_c": 37, "k1_c": 0}, lambda r: r["k0_c"] == 37),
+        # La valeur est restreinte aux bits de la sortie
+        ({"k0_c": 0x100 | 37}, lambda r: r["k0_c"] == 37),
+        # La première condition vraie
+        (
+            [{"k0_c": 200}, {"k0_c": 50}],
+            lambda r: (r["k0_c"] == 50) | (r["k0_c"] == 200),
+        ),
+    ],
+    ids=["value", "mask", "width", "any"],
+)
+def test_until(sim, reference, until, condition):
+    expected = first(reference, condition)
+    cycles, out = sim.run(CYCLES, INPUT, until=until)
+    assert cycles == sim.cycle == expected
+    assert out.tolist() == reference[expected - 1].tolist()
+
+
+def test_never_true(sim, reference):
+    cycles, _ = sim.run(CYCLES, INPUT, until={"k1_c": 1})
+    assert cycles == CYCLES
+
+
+def test_observer(sim, reference):
+    calls = []
+    cycles, _ = sim.run(
+        100, INPUT, every=7, callback=lambda i, o: calls.append((i, o.tolist()))
+    )
+    assert cycles == 100
+    assert calls == [(i, reference[i - 1].tolist()) for i in range(7, 101, 7)]
+
+
+def test_observer_until(sim, reference):
+    calls = []
+    expected = first(reference, lambda r: r["k0_c"] == 37)
+    cycles, _ = sim.run(
+        CYCLES,
+        INPUT,
+        until={"k0_c": 37},
+        every=10,
+        callback=lambda i, o: calls.append(i),
+    )
+    assert cycles == expected
+    assert calls == list(range(10, expected + 1, 10))
+
+
+def test_observer_stops(sim, reference):
+    calls = []
+
+    def callback(i, out):
+        calls.append(i)
+        return i == 30
+
+    cycles, out = sim.run(CYCLES, INPUT, every=10, callback=callback)
+    assert cycles == sim.cycle == 30
+    assert calls == [10, 20, 30]
+    assert out.tolist() == reference[29].tolist()
+
+
+def test_observer_raises(sim):
+    calls = []
+
+    def callback(i, out):
+        calls.append(i)
+        if i == 20:
+            raise KeyError(i)
+
+    with pytest.raises(KeyError):
+        sim.run(CYCLES, INPUT, every=5, callback=callback)
+    assert sim.cycle == 20
+    assert calls == [5, 10, 15, 20]
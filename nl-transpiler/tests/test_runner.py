@@ -0,0 +1,64 @@
+import subprocess
+
+from netlistSimulator import buildcache, runner, vcd
+
+NETLIST = "INPUT a\nOUTPUT o\nVAR a:4, r:4, o:4\nIN\nr = REG a\no = XOR r a\n"
+
+
+def vcdChanges(text):
+    """
+    Changements d'un fichier VCD: dictionnaire `instant -> {label: valeur}`
+    """
+    names = {}
+    changes = {}
+    for line in text.splitlines():
+        if line.startswith("$var"):
+            _, _, _, identifier, label, _ = line.split()
+            names[identifier] = label
+        elif line.startswith("#"):
+            current = changes.setdefault(int(line[1:]), {})
+        elif line.startswith("b"):
+            value, identifier = line[1:].split()
+            current[names[identifier]] = int(value, 2)
+        elif line[:1] in ("0", "1"):
+            current[names[line[1:]]] = int(line[0])
+    return changes
+
+
+def test_executable_from_main_example(tmp_path):
+    cache = buildcache.BuildCache(str(tmp_path / "builds"))
+    executable = runner.buildExecutable(NETLIST, cache=cache)
+    result = subprocess.run(
+        [executable, "/dev/zero"], input="3\n5\n", capture_output=True, text=True
+    )
+    assert result.returncode == 0
+    assert result.stdout.split() == ["o=3", "o=6"]
+
+    # Une trace VCD écrite directement, et la même en binaire
+    traced = runner.buildExecutable(NETLIST, cache=cache, trace=["r", "o"])
+    for name, binary in (("trace.vcd", False), ("trace.bin", True)):
+        env = {runner.TRACE_FILE_VARIABLE: str(tmp_path / name)}
+        if binary:
+            env[runner.TRACE_BINARY_VARIABLE] = "1"
+        subprocess.run(
+            [traced, "/dev/zero"],
+            input="3\n5\n5\n0\n",
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+    direct = (tmp_path / "trace.vcd").read_text()
+    # Seules les valeurs qui changent sont écrites, au cycle où elles changent
+    assert vcdChanges(direct) == {
+        0: {"o": 3, "r": 0},
+        1: {"o": 6, "r": 3},
+        2: {"o": 0, "r": 5},
+        3: {"o": 5},
+    }
+
+    trace_bin = tmp_path / "trace.bin"
+    assert not trace_bin.read_bytes().startswith(b"$")
+    assert vcd.traceToVcd(str(trace_bin), str(tmp_path / "converted.vcd")) == 7
+    assert (tmp_path / "converted.vcd").read_text() == direct
+
@@ -0,0 +1,58 @@
+import io
+import sys
+
+import pytest
+
+from netlistSimulator.netlist2C import parser, transpile2CFiles, utils
+
+NAMES = {"short_name": "netlist", "filename": "netlist", "functionName": "simulateNetlist"}
+
+
+def identity(x):
+    return x
+
+
+def test_cycle_path():
+    # Le cycle est atteint par une dépendance qui n'en fait pas partie
+    graph = {"o": ["a"], "a": ["i", "b"], "b": ["c"], "c": ["a"]}
+    with pytest.raises(ValueError) as error:
+        utils.topologicalSort(graph, ["o"], {"i"}, identity)
+    assert str(error.value) == "Cyclic netlist. Path is made of ['a', 'b', 'c', 'a']"
+
+
+def test_self_loop():
+    with pytest.raises(ValueError, match=r"\['a', 'a'\]"):
+        utils.topologicalSort({"a": ["a"]}, ["a"], set(), identity)
+
+
+def test_netlist_cycle():
+    netlist = "INPUT i\nOUTPUT o\nVAR i, o, x, y\nIN\no = AND i x\nx = NOT y\ny = XOR i x\n"
+    with pytest.raises(ValueError) as error:
+        utils.getOrderedNetList(parser.parse(netlist))
+    assert str(error.value) == "Cyclic netlist. Path is made of ['x', 'y', 'x']"
+
+
+def test_undefined_wire():
+    with pytest.raises(ValueError) as error:
+        utils.topologicalSort({"o": ["a"], "a": ["w"]}, ["o"], set(), identity)
+    assert str(error.value).startswith("w has no value.")
+    assert "'w = ...'" in str(error.value)
+
+    netlist = "INPUT i\nOUTPUT o\nVAR i, o, w\nIN\no = AND i w\n"
+    with pytest.raises(ValueError, match="^w has no value"):
+        transpile2CFiles(netlist, io.StringIO(), io.StringIO(), NAMES)
+
+
+def test_chain_longer_than_recursion_limit():
+    n = 3 * sys.getrecursionlimit()
+    graph = {f"w{k}": [f"w{k - 1}"] for k in range(1, n)}
+    order = utils.topologicalSort(graph, [f"w{n - 1}"], {"w0"}, identity)
+    assert order == [f"w{k}" for k in range(1, n)]
+
+    # Toute la transpilation
+    equations = "".join(f"w{k} = NOT w{k - 1}\n" for k in range(1, n))
+    wires = ", ".join(f"w{k}" for k in range(n))
+    netlist = f"INPUT w0\nOUTPUT w{n - 1}\nVAR {wires}\nIN\n{equations}"
+    c = io.StringIO()
+    transpile2CFiles(netlist, io.StringIO(), c, NAMES)
+    assert c.getvalue().index("w1 =") < c.getvalue().index(f"w{n - 1} =")